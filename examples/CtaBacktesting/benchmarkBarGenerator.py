@@ -0,0 +1,84 @@
+# encoding: UTF-8
+
+"""
+K线合成器的性能测试：100万个Tick同时合成5个周期的K线。
+"""
+
+from __future__ import division
+
+from time import time
+from datetime import datetime, timedelta
+
+from vnpy.trader.vtObject import VtTickData
+from vnpy.trader.app.ctaStrategy.ctaTemplate import BarManager
+from vnpy.trader.app.ctaStrategy.ctaBarGenerator import (BarGenerator, TradingSession,
+                                                         INTERVAL_SECOND, INTERVAL_MINUTE,
+                                                         INTERVAL_HOUR, INTERVAL_DAILY)
+
+
+#----------------------------------------------------------------------
+def generateTicks(count):
+    """生成测试用的Tick数据，每个交易日的日盘时段内每秒2个Tick"""
+    sessionList = [('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')]
+    
+    tickList = []
+    date = datetime(2017, 6, 1)
+    step = timedelta(milliseconds=500)
+    volume = 0
+    
+    while len(tickList) < count:
+        for start, end in sessionList:
+            dt = datetime.strptime(date.strftime('%Y%m%d') + start, '%Y%m%d%H:%M')
+            endDt = datetime.strptime(date.strftime('%Y%m%d') + end, '%Y%m%d%H:%M')
+            
+            while dt < endDt and len(tickList) < count:
+                volume += 1
+                
+                tick = VtTickData()
+                tick.vtSymbol = 'rb1710'
+                tick.symbol = 'rb1710'
+                tick.datetime = dt
+                tick.lastPrice = 3000 + (len(tickList) % 100)
+                tick.volume = volume
+                tickList.append(tick)
+                
+                dt += step
+        
+        date += timedelta(1)
+    
+    return tickList
+
+
+#----------------------------------------------------------------------
+def onBar(bar):
+    """K线回调"""
+    pass
+
+
+if __name__ == '__main__':
+    count = 1000000
+    
+    print u'生成Tick数据'
+    tickList = generateTicks(count)
+    
+    # BarManager，只能合成1分钟和能被60整除的X分钟（这里X分钟需要另外用1分钟K线驱动，不计入）
+    bm = BarManager(onBar)
+    
+    start = time()
+    for tick in tickList:
+        bm.updateTick(tick)
+    print u'BarManager合成1分钟K线，耗时：%.2f秒' %(time() - start)
+    
+    # BarGenerator，同时合成5个周期
+    bg = BarGenerator(TradingSession.fromTemplate('COMMODITY_DAY'))
+    bg.addBar(INTERVAL_SECOND, 30, onBar)
+    bg.addBar(INTERVAL_MINUTE, 1, onBar)
+    bg.addBar(INTERVAL_MINUTE, 7, onBar)
+    bg.addBar(INTERVAL_HOUR, 1, onBar)
+    bg.addBar(INTERVAL_DAILY, 1, onBar)
+    
+    start = time()
+    for tick in tickList:
+        bg.updateTick(tick)
+    bg.flush()
+    print u'BarGenerator合成5个周期K线，耗时：%.2f秒' %(time() - start)
@@ -0,0 +1,131 @@
+# encoding: UTF-8
+
+"""
+使用本地的模拟通联数据服务器测试HistoryDataEngine的并行下载：
+1. 模拟服务器对每个请求延时REQUEST_DELAY秒，并以FAIL_RATE的概率返回503，用于测试重试
+2. 分别使用单线程和线程池下载全部主力合约日行情，比较耗时
+3. 第二次下载时只会请求数据库中最后日期之后的数据
+
+运行前需要启动MongoDB，测试会写入日线数据库中的模拟合约（代码以TEST开头）。
+"""
+
+import json
+import random
+from time import sleep, time
+from datetime import datetime, timedelta
+from threading import Thread
+from urlparse import urlparse, parse_qs
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from vnpy.trader.app.ctaStrategy.ctaBase import DAILY_DB_NAME
+from vnpy.trader.app.ctaStrategy.ctaHistoryData import HistoryDataEngine
+
+
+HOST = 'localhost'
+PORT = 18765
+
+PRODUCT_COUNT = 40          # 模拟的品种数量
+DAY_COUNT = 1000            # 每个品种的日K线数量
+REQUEST_DELAY = 0.2         # 模拟的请求延时（秒）
+FAIL_RATE = 0.1             # 返回503的概率
+
+
+########################################################################
+class StandInHandler(BaseHTTPRequestHandler):
+    """模拟通联数据的getMktMFutd.json接口"""
+
+    #----------------------------------------------------------------------
+    def do_GET(self):
+        """处理GET请求"""
+        sleep(REQUEST_DELAY)
+
+        if random.random() < FAIL_RATE:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        params = parse_qs(urlparse(self.path).query)
+        product = params['contractObject'][0]
+        startDate = params.get('startDate', ['19000101'])[0]
+
+        data = []
+        day = datetime(2014, 1, 1)
+        for i in range(DAY_COUNT):
+            date = (day + timedelta(i)).strftime('%Y-%m-%d')
+            if date.replace('-', '') < startDate:
+                continue
+            data.append({
+                'exchangeCD': 'XSGE',
+                'tradeDate': date,
+                'openPrice': 100.0 + i,
+                'highestPrice': 101.0 + i,
+                'lowestPrice': 99.0 + i,
+                'closePrice': 100.5 + i,
+                'turnoverVol': 1000,
+                'openInt': 5000
+            })
+
+        content = json.dumps({'retMsg': 'Success', 'data': data})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    #----------------------------------------------------------------------
+    def log_message(self, format, *args):
+        """不输出访问日志"""
+        pass
+
+
+########################################################################
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """多线程http服务器"""
+    daemon_threads = True
+
+
+#----------------------------------------------------------------------
+def startStandIn():
+    """在后台线程中启动模拟服务器"""
+    server = ThreadingHTTPServer((HOST, PORT), StandInHandler)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+#----------------------------------------------------------------------
+def runBenchmark(threadCount):
+    """清空模拟合约后下载两次（全量和增量），返回耗时"""
+    engine = HistoryDataEngine('token', 'http://%s:%s' %(HOST, PORT), rateLimit=50, maxRetry=5)
+    engine.datayesClient.retryInterval = 0.1
+
+    productList = ['TEST%02d' %i for i in range(PRODUCT_COUNT)]
+    for product in productList:
+        engine.dbClient[DAILY_DB_NAME].drop_collection(product + '0000')
+
+    # 只下载模拟的品种
+    engine.readFuturesProductSymbol = lambda: set(productList)
+
+    start = time()
+    engine.downloadAllFuturesDailyBar(threadCount)
+    fullCost = time() - start
+
+    start = time()
+    engine.downloadAllFuturesDailyBar(threadCount)
+    incrementalCost = time() - start
+
+    return fullCost, incrementalCost
+
+
+if __name__ == '__main__':
+    startStandIn()
+
+    resultList = []
+    for threadCount in [1, 4, 16]:
+        resultList.append((threadCount, runBenchmark(threadCount)))
+
+    print u'线程数\t全量下载耗时\t增量下载耗时'
+    for threadCount, (fullCost, incrementalCost) in resultList:
+        print u'%s\t%.2f秒\t%.2f秒' %(threadCount, fullCost, incrementalCost)
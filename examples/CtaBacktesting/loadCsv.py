@@ -1,14 +1,16 @@
 # encoding: UTF-8
 
 """
-导入MC导出的CSV历史数据到MongoDB中
+导入MC导出的CSV历史数据到MongoDB中，多个文件使用多进程并行导入
 """
 
 from vnpy.trader.app.ctaStrategy.ctaBase import MINUTE_DB_NAME
-from vnpy.trader.app.ctaStrategy.ctaHistoryData import loadMcCsv
+from vnpy.trader.app.ctaStrategy.ctaHistoryData import loadMcCsv, loadCsvFiles
 
 
 if __name__ == '__main__':
-    loadMcCsv('IF0000_1min.csv', MINUTE_DB_NAME, 'IF0000')
-    loadMcCsv('rb0000_1min.csv', MINUTE_DB_NAME, 'rb0000')
-
+    taskList = [
+        (loadMcCsv, 'IF0000_1min.csv', MINUTE_DB_NAME, 'IF0000'),
+        (loadMcCsv, 'rb0000_1min.csv', MINUTE_DB_NAME, 'rb0000')
+    ]
+    loadCsvFiles(taskList, processes=2)
@@ -0,0 +1,26 @@
+# encoding: UTF-8
+
+"""
+展示如何执行批量回测，适合每日收盘后定时运行。
+"""
+
+from __future__ import division
+
+import os
+
+from vnpy.trader.app.ctaStrategy.ctaBatchBacktesting import BatchBacktestingRunner
+
+
+if __name__ == '__main__':
+    # 创建批量回测运行器，结果保存在temp目录下的BacktestingResult.db中
+    runner = BatchBacktestingRunner()
+
+    # 读取任务清单
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'batchJobs.json')
+    jobList = runner.loadManifest(path)
+
+    # 运行批量回测，输入未变化的任务会被跳过
+    runner.run(jobList)
+
+    # 和上一次运行的夏普比率对比
+    runner.compareResult(jobList, 'sharpeRatio')
@@ -0,0 +1,57 @@
+# encoding: UTF-8
+
+"""
+展示如何在Tick模式的长时间回测中保存断点，并从断点恢复或分叉回测。
+"""
+
+from __future__ import division
+
+
+from vnpy.trader.app.ctaStrategy.ctaBacktesting import BacktestingEngine, TICK_DB_NAME
+
+
+#----------------------------------------------------------------------
+def createEngine():
+    """创建并设置回测引擎"""
+    engine = BacktestingEngine()
+    
+    # 设置引擎的回测模式为Tick
+    engine.setBacktestingMode(engine.TICK_MODE)
+    
+    # 设置回测用的数据起始日期
+    engine.setStartDate('20170101', 1)
+    engine.setEndDate('20171231')
+    
+    # 设置产品相关参数
+    engine.setSlippage(1)       # 螺纹1跳
+    engine.setRate(1/10000)     # 万1
+    engine.setSize(10)          # 螺纹合约大小
+    engine.setPriceTick(1)      # 螺纹最小价格变动
+    
+    # 设置使用的历史数据库
+    engine.setDatabase(TICK_DB_NAME, 'rb1801')
+    
+    return engine
+
+
+if __name__ == '__main__':
+    from vnpy.trader.app.ctaStrategy.strategy.strategyDoubleMa import DoubleMaStrategy
+    
+    # 正常运行回测，每回放100万个Tick保存一次断点
+    engine = createEngine()
+    engine.setCheckpoint('checkpoint', 1000000)
+    engine.initStrategy(DoubleMaStrategy, {})
+    engine.runBacktesting()
+    engine.showDailyResult()
+    
+    # 进程中断后，从目录中最新的断点恢复回测
+    engine = createEngine()
+    engine.initStrategy(DoubleMaStrategy, {})
+    engine.resumeBacktesting('checkpoint')
+    engine.showDailyResult()
+    
+    # 使用不同的参数，从指定的断点分叉回测
+    engine = createEngine()
+    engine.initStrategy(DoubleMaStrategy, {'fastWindow': 5})
+    engine.resumeBacktesting('checkpoint/checkpoint_000001000000.pkl')
+    engine.showDailyResult()
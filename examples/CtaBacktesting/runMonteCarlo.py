@@ -0,0 +1,44 @@
+# encoding: UTF-8
+
+"""
+展示如何对回测结果进行蒙特卡洛稳健性分析。
+"""
+
+from __future__ import division
+
+
+from vnpy.trader.app.ctaStrategy.ctaBacktesting import BacktestingEngine, MINUTE_DB_NAME
+from vnpy.trader.app.ctaStrategy.ctaMonteCarlo import MonteCarloAnalyzer
+
+
+if __name__ == '__main__':
+    from vnpy.trader.app.ctaStrategy.strategy.strategyAtrRsi import AtrRsiStrategy
+    
+    # 创建回测引擎并运行回测
+    engine = BacktestingEngine()
+    engine.setBacktestingMode(engine.BAR_MODE)
+    engine.setStartDate('20120101')
+    engine.setSlippage(0.2)     # 股指1跳
+    engine.setRate(0.3/10000)   # 万0.3
+    engine.setSize(300)         # 股指合约大小 
+    engine.setPriceTick(0.2)    # 股指最小价格变动
+    engine.setDatabase(MINUTE_DB_NAME, 'IF0000')
+    
+    engine.initStrategy(AtrRsiStrategy, {})
+    engine.runBacktesting()
+    
+    # 创建分析器，固定随机数种子以便结果可以重复
+    analyzer = MonteCarloAnalyzer(seed=0)
+    analyzer.setBacktestingEngine(engine)
+    
+    # 打乱交易顺序
+    result = analyzer.runTradeShuffle(10000)
+    analyzer.showResult(result, 'Trade Shuffle')
+    
+    # 逐日盈亏分块自助抽样，每块5个交易日
+    result = analyzer.runBlockBootstrap(10000, blockSize=5)
+    analyzer.showResult(result, 'Block Bootstrap')
+    
+    # 滑点成本随机扰动
+    result = analyzer.runSlippageJitter(10000, jitter=0.5)
+    analyzer.showResult(result, 'Slippage Jitter')
@@ -31,6 +31,9 @@ if __name__ == '__main__':
     # 设置使用的历史数据库
     engine.setDatabase(MINUTE_DB_NAME, 'IF0000')
     
+    # 启用回测结果缓存，重复运行时已计算过的参数组合直接使用保存的结果
+    engine.setResultStore()
+    
     # 跑优化
     setting = OptimizationSetting()                 # 新建一个优化任务设置对象
     setting.setOptimizeTarget('capital')            # 设置优化排序的目标是策略净盈利
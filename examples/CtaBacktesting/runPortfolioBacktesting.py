@@ -0,0 +1,43 @@
+# encoding: UTF-8
+
+"""
+展示如何执行多合约组合回测。
+"""
+
+from __future__ import division
+
+
+from vnpy.trader.app.ctaStrategy.ctaPortfolioBacktesting import PortfolioBacktestingEngine, MINUTE_DB_NAME
+
+
+if __name__ == '__main__':
+    from vnpy.trader.app.ctaStrategy.strategy.strategyAtrRsi import AtrRsiStrategy
+    from vnpy.trader.app.ctaStrategy.strategy.strategyBollChannel import BollChannelStrategy
+
+    # 创建组合回测引擎
+    engine = PortfolioBacktestingEngine()
+
+    # 设置引擎的回测模式为K线
+    engine.setBacktestingMode(engine.BAR_MODE)
+
+    # 设置回测用的数据起始日期和组合资金
+    engine.setStartDate('20120101')
+    engine.setEndDate('20170630')
+    engine.setCapital(1000000)
+
+    # 添加合约，每个合约使用独立的产品参数
+    engine.addSymbol('IF0000', MINUTE_DB_NAME, size=300, rate=0.3/10000,
+                     slippage=0.2, priceTick=0.2)
+    engine.addSymbol('rb0000', MINUTE_DB_NAME, size=10, rate=1/10000,
+                     slippage=1, priceTick=1)
+
+    # 在引擎中创建策略对象，IF交易1手，rb交易16手
+    engine.addStrategy(AtrRsiStrategy, {'name': 'atrRsiIF', 'vtSymbol': 'IF0000'})
+    engine.addStrategy(BollChannelStrategy, {'name': 'bollRb', 'vtSymbol': 'rb0000',
+                                             'fixedSize': 16})
+
+    # 开始跑回测
+    engine.runBacktesting()
+
+    # 显示组合的逐日回测结果
+    engine.showDailyResult()
@@ -0,0 +1,155 @@
+# encoding: UTF-8
+
+"""
+对比目标持仓模板在Tick回测中的委托数量：
+1. 之前的版本：每个tick撤销全部委托后重新发单
+2. 当前的版本：保留仍然满足目标仓位的委托，只撤销多余或价格偏离的委托，并按tick数量节流重新报价
+"""
+
+from __future__ import division
+
+from vnpy.trader.vtConstant import STATUS_CANCELLED
+from vnpy.trader.app.ctaStrategy.ctaBacktesting import BacktestingEngine, TICK_DB_NAME
+from vnpy.trader.app.ctaStrategy.ctaTemplate import TargetPosTemplate, BarManager, ArrayManager
+
+
+########################################################################
+class TargetPosDemoStrategy(TargetPosTemplate):
+    """基于均线方向设置目标仓位的演示策略"""
+    className = 'TargetPosDemoStrategy'
+    author = u'用Python的交易员'
+
+    fixedSize = 1           # 目标仓位的大小
+    maWindow = 20           # 均线窗口
+
+    paramList = ['name',
+                 'className',
+                 'author',
+                 'vtSymbol',
+                 'fixedSize',
+                 'maWindow',
+                 'tickAdd',
+                 'requoteTicks',
+                 'requoteSeconds']
+
+    #----------------------------------------------------------------------
+    def __init__(self, ctaEngine, setting):
+        """Constructor"""
+        super(TargetPosDemoStrategy, self).__init__(ctaEngine, setting)
+
+        self.bm = BarManager(self.onBar)
+        self.am = ArrayManager(self.maWindow)
+
+    #----------------------------------------------------------------------
+    def onInit(self):
+        """初始化策略"""
+        self.putEvent()
+
+    #----------------------------------------------------------------------
+    def onStart(self):
+        """启动策略"""
+        self.putEvent()
+
+    #----------------------------------------------------------------------
+    def onStop(self):
+        """停止策略"""
+        self.putEvent()
+
+    #----------------------------------------------------------------------
+    def onTick(self, tick):
+        """收到行情推送"""
+        super(TargetPosDemoStrategy, self).onTick(tick)
+
+        self.bm.updateTick(tick)
+
+    #----------------------------------------------------------------------
+    def onBar(self, bar):
+        """收到K线推送"""
+        super(TargetPosDemoStrategy, self).onBar(bar)
+
+        self.am.updateBar(bar)
+        if not self.am.inited:
+            return
+
+        if bar.close > self.am.sma(self.maWindow):
+            self.setTargetPos(self.fixedSize)
+        else:
+            self.setTargetPos(-self.fixedSize)
+
+    #----------------------------------------------------------------------
+    def onOrder(self, order):
+        """收到委托推送"""
+        super(TargetPosDemoStrategy, self).onOrder(order)
+
+    #----------------------------------------------------------------------
+    def onTrade(self, trade):
+        """收到成交推送"""
+        pass
+
+    #----------------------------------------------------------------------
+    def onStopOrder(self, so):
+        """停止单推送"""
+        pass
+
+
+########################################################################
+class LegacyTargetPosDemoStrategy(TargetPosDemoStrategy):
+    """使用之前版本委托逻辑（每次撤销全部委托后重新发单，回测模式）的演示策略"""
+    className = 'LegacyTargetPosDemoStrategy'
+
+    #----------------------------------------------------------------------
+    def trade(self):
+        """执行交易"""
+        for vtOrderID in self.orderList:
+            self.cancelOrder(vtOrderID)
+
+        posChange = self.targetPos - self.pos
+        if not posChange:
+            return
+
+        if posChange > 0:
+            price = self.lastTick.askPrice1 + self.tickAdd
+            l = self.buy(price, abs(posChange))
+        else:
+            price = self.lastTick.bidPrice1 - self.tickAdd
+            l = self.short(price, abs(posChange))
+
+        for vtOrderID in l:
+            self.orderDict[vtOrderID] = [None, price, abs(posChange)]
+
+
+#----------------------------------------------------------------------
+def runBacktesting(strategyClass, setting):
+    """运行回测，返回(委托数量, 撤单数量, 成交数量)"""
+    engine = BacktestingEngine()
+    engine.setBacktestingMode(engine.TICK_MODE)
+    engine.setStartDate('20170101', 1)
+    engine.setEndDate('20170131')
+
+    engine.setSlippage(0.2)
+    engine.setRate(0.3/10000)
+    engine.setSize(300)
+    engine.setPriceTick(0.2)
+    engine.setDatabase(TICK_DB_NAME, 'IF0000')
+
+    engine.initStrategy(strategyClass, setting)
+    engine.runBacktesting()
+
+    orderCount = len(engine.limitOrderDict)
+    cancelCount = len([order for order in engine.limitOrderDict.values()
+                       if order.status == STATUS_CANCELLED])
+    tradeCount = len(engine.tradeDict)
+
+    return orderCount, cancelCount, tradeCount
+
+
+if __name__ == '__main__':
+    l = [
+        (u'之前的版本', LegacyTargetPosDemoStrategy, {}),
+        (u'当前的版本', TargetPosDemoStrategy, {}),
+        (u'当前的版本（每5个tick重新报价）', TargetPosDemoStrategy, {'requoteTicks': 5})
+    ]
+
+    for name, strategyClass, setting in l:
+        orderCount, cancelCount, tradeCount = runBacktesting(strategyClass, setting)
+        print u'%s\t委托：%s\t撤单：%s\t成交：%s' %(name, orderCount, cancelCount, tradeCount)
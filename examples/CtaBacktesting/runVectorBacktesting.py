@@ -0,0 +1,52 @@
+# encoding: UTF-8
+
+"""
+展示如何使用向量化回测快速粗筛参数，再用事件驱动回测确认。
+"""
+
+from __future__ import division
+
+
+from vnpy.trader.app.ctaStrategy.ctaBacktesting import BacktestingEngine, MINUTE_DB_NAME, OptimizationSetting
+from vnpy.trader.app.ctaStrategy.ctaVectorBacktesting import VectorBacktestingEngine
+
+
+if __name__ == '__main__':
+    from vnpy.trader.app.ctaStrategy.strategy.strategyDoubleMa import DoubleMaStrategy
+    
+    # 创建向量化回测引擎，设置方法和BacktestingEngine相同
+    engine = VectorBacktestingEngine()
+    engine.setBacktestingMode(engine.BAR_MODE)
+    engine.setStartDate('20120101')
+    engine.setSlippage(0.2)     # 股指1跳
+    engine.setRate(0.3/10000)   # 万0.3
+    engine.setSize(300)         # 股指合约大小 
+    engine.setPriceTick(0.2)    # 股指最小价格变动
+    engine.setDatabase(MINUTE_DB_NAME, 'IF0000')
+    
+    # 向量化优化，历史数据只载入一次
+    setting = OptimizationSetting()
+    setting.setOptimizeTarget('sharpeRatio')
+    setting.addParameter('fastWindow', 5, 30, 5)
+    setting.addParameter('slowWindow', 40, 120, 10)
+    
+    import time
+    start = time.time()
+    resultList = engine.runOptimization(DoubleMaStrategy, setting)
+    print u'向量化优化耗时：%s' %(time.time()-start)
+    
+    # 使用最优参数进行事件驱动回测确认
+    bestSetting = eval(resultList[0][0][0])
+    
+    confirmEngine = BacktestingEngine()
+    confirmEngine.setBacktestingMode(confirmEngine.BAR_MODE)
+    confirmEngine.setStartDate('20120101')
+    confirmEngine.setSlippage(0.2)
+    confirmEngine.setRate(0.3/10000)
+    confirmEngine.setSize(300)
+    confirmEngine.setPriceTick(0.2)
+    confirmEngine.setDatabase(MINUTE_DB_NAME, 'IF0000')
+    
+    confirmEngine.initStrategy(DoubleMaStrategy, bestSetting)
+    confirmEngine.runBacktesting()
+    confirmEngine.showDailyResult()
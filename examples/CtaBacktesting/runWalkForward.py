@@ -0,0 +1,48 @@
+# encoding: UTF-8
+
+"""
+展示如何执行滚动窗口（Walk-Forward）优化。
+"""
+
+from __future__ import division
+
+
+from vnpy.trader.app.ctaStrategy.ctaBacktesting import MINUTE_DB_NAME, OptimizationSetting
+from vnpy.trader.app.ctaStrategy.ctaWalkForward import WalkForwardEngine
+
+
+if __name__ == '__main__':
+    from vnpy.trader.app.ctaStrategy.strategy.strategyAtrRsi import AtrRsiStrategy
+    
+    # 创建滚动窗口优化引擎
+    engine = WalkForwardEngine()
+    
+    # 设置引擎的回测模式为K线
+    engine.setBacktestingMode(engine.BAR_MODE)
+
+    # 设置回测用的数据起止日期，每个窗口使用之前10天的数据初始化
+    engine.setStartDate('20120101', 10)
+    engine.setEndDate('20170630')
+    
+    # 设置产品相关参数
+    engine.setSlippage(0.2)     # 股指1跳
+    engine.setRate(0.3/10000)   # 万0.3
+    engine.setSize(300)         # 股指合约大小 
+    engine.setPriceTick(0.2)    # 股指最小价格变动
+    
+    # 设置使用的历史数据库
+    engine.setDatabase(MINUTE_DB_NAME, 'IF0000')
+    
+    # 样本内一年，样本外三个月，每次向后滚动三个月
+    engine.setWindow(365, 90)
+    
+    # 优化设置
+    setting = OptimizationSetting()
+    setting.setOptimizeTarget('sharpeRatio')
+    setting.addParameter('atrLength', 12, 20, 2)
+    setting.addParameter('atrMa', 20, 30, 5)
+    setting.addParameter('rsiLength', 5)
+    
+    # 运行并显示结果
+    engine.runWalkForward(AtrRsiStrategy, setting)
+    engine.showWalkForwardResult()
@@ -0,0 +1,108 @@
+# encoding: UTF-8
+
+"""
+行情记录引擎写入线程数量的吞吐量测试：
+分别使用1/2/4/8个写入线程，将100个合约共20万个Tick写入MongoDB，统计每秒写入的数据量。
+
+测试数据写入单独的VnTrader_Benchmark_Db数据库，测试结束后删除。
+"""
+
+from __future__ import division
+
+import os
+import json
+import tempfile
+from time import time, sleep
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+
+from vnpy.event import EventEngine2
+from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtObject import VtTickData
+from vnpy.trader.vtEngine import MainEngine
+from vnpy.trader.app.dataRecorder.drEngine import DrEngine
+
+
+BENCHMARK_DB_NAME = 'VnTrader_Benchmark_Db'
+
+
+#----------------------------------------------------------------------
+def generateTicks(symbolCount, count):
+    """生成测试用的Tick数据，多个合约交替推送，每个合约每秒2个Tick"""
+    tickList = []
+    start = datetime(2017, 6, 1, 9, 0, 0)
+    step = timedelta(milliseconds=500)
+
+    for i in range(count):
+        symbol = 'rb%04d' %(i % symbolCount)
+
+        tick = VtTickData()
+        tick.vtSymbol = symbol
+        tick.symbol = symbol
+        tick.datetime = start + step * (i // symbolCount)
+        tick.lastPrice = 3000 + (i % 100)
+        tick.volume = i
+        tickList.append(tick)
+
+    return tickList
+
+
+#----------------------------------------------------------------------
+def runBenchmark(mainEngine, dbClient, tickList, writerCount):
+    """使用指定数量的写入线程写入全部Tick，返回每秒写入的数据量"""
+    # 通过临时的配置文件设置写入线程数量，不订阅任何行情
+    setting = {
+        'working': False,
+        'writerCount': writerCount,
+        'batchSize': 1000,
+        'batchLatency': 0.5
+    }
+
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(setting, f)
+
+    class BenchmarkDrEngine(DrEngine):
+        settingFilePath = path
+
+    drEngine = BenchmarkDrEngine(mainEngine, mainEngine.eventEngine)
+
+    start = time()
+    for tick in tickList:
+        drEngine.insertData(BENCHMARK_DB_NAME, tick.vtSymbol, tick)
+
+    while drEngine.getMetrics()['writeCount'] < len(tickList):
+        sleep(0.01)
+    cost = time() - start
+
+    drEngine.stop()
+    os.remove(path)
+
+    # 清空本轮写入的数据，保证每轮测试都是插入新数据
+    dbClient.drop_database(BENCHMARK_DB_NAME)
+
+    return len(tickList) / cost
+
+
+if __name__ == '__main__':
+    dbClient = MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'],
+                           connectTimeoutMS=500, serverSelectionTimeoutMS=1000)
+    try:
+        dbClient.server_info()
+    except ConnectionFailure:
+        print u'MongoDB连接失败，无法运行测试'
+        exit()
+
+    ee = EventEngine2()
+    me = MainEngine(ee)
+
+    dbClient.drop_database(BENCHMARK_DB_NAME)
+    tickList = generateTicks(100, 200000)
+
+    for writerCount in [1, 2, 4, 8]:
+        speed = runBenchmark(me, dbClient, tickList, writerCount)
+        print u'写入线程：%s\t每秒写入：%.0f' %(writerCount, speed)
+
+    me.exit()
@@ -0,0 +1,58 @@
+# encoding: UTF-8
+
+"""
+高周期K线合成服务：
+根据DR_setting.json中记录K线的合约（包括主力合约），定期从1分钟K线数据库增量合成
+以下周期的K线，策略和回测引擎可以直接读取对应周期的数据库（见getBarDbName）。
+"""
+
+import json
+from time import sleep, time
+from datetime import datetime
+
+from vnpy.trader.app.ctaStrategy.ctaBarGenerator import (INTERVAL_MINUTE, INTERVAL_HOUR,
+                                                         INTERVAL_DAILY)
+from vnpy.trader.app.ctaStrategy.ctaBarAggregator import BarAggregator
+
+
+# 需要合成的周期，(周期类型, 窗口)
+TIMEFRAME_LIST = [
+    (INTERVAL_MINUTE, 5),
+    (INTERVAL_MINUTE, 15),
+    (INTERVAL_MINUTE, 30),
+    (INTERVAL_HOUR, 1),
+    (INTERVAL_DAILY, 1)
+]
+
+# 合成间隔（秒）
+AGGREGATE_INTERVAL = 60
+
+
+#----------------------------------------------------------------------
+def runBarAggregation():
+    """运行K线合成服务"""
+    with open("DR_setting.json") as f:
+        setting = json.load(f)
+
+    symbolList = [l[0] for l in setting.get('bar', [])]
+    symbolList.extend(setting.get('active', {}).keys())
+
+    aggregator = BarAggregator()
+    for symbol in sorted(set(symbolList)):
+        for interval, window in TIMEFRAME_LIST:
+            aggregator.addTask(symbol, interval, window)
+
+    print u'启动K线合成服务，合约数量：%s，周期数量：%s' %(len(set(symbolList)), len(TIMEFRAME_LIST))
+
+    while True:
+        start = time()
+        resultList = aggregator.processAll()
+        count = sum([n for dbName, collectionName, n in resultList])
+
+        print u'%s\t合成完成，写入K线：%s，耗时：%.2f秒' %(datetime.now().strftime('%H:%M:%S'),
+                                                    count, time() - start)
+        sleep(AGGREGATE_INTERVAL)
+
+
+if __name__ == '__main__':
+    runBarAggregation()
@@ -1,84 +1,149 @@
 # encoding: UTF-8
 
-import json
-from datetime import datetime, timedelta, time
+"""
+清洗行情记录中交易时段以外的数据：
+1. 根据合约代码的品种部分找到交易时段模板（见ctaBarGenerator中的SESSION_DICT），
+   跨越午夜的夜盘按照周一至周五的夜盘、周二至周六的凌晨处理，未知品种不清洗
+2. 计算清洗区间内全部无效时间段，每个集合通过历史数据存储（HistoryStore）一次删除，
+   MongoDB和本地列式存储均适用
+3. 多个集合并行清洗，输出每个集合删除的数据量和耗时
+
+注意：只处理了周末，未处理节假日；时段开始前和结束后SESSION_GRACE秒内的数据
+（集合竞价和收盘Tick）视为有效数据；压缩数据块（带codec字段的文档）不清洗。
+"""
 
-from pymongo import MongoClient
+import json
+from time import time
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
 
+from vnpy.trader.vtHistoryStore import createHistoryStore
 from vnpy.trader.app.ctaStrategy.ctaBase import MINUTE_DB_NAME, TICK_DB_NAME
+from vnpy.trader.app.ctaStrategy.ctaBarGenerator import SESSION_DICT, getSessionName, parseTime
+
+
+# 时段开始前和结束后视为有效数据的秒数
+SESSION_GRACE = 60
+
+# 并行清洗的线程数量
+THREAD_COUNT = 8
+
+
+#----------------------------------------------------------------------
+def getValidRanges(sessionList, date):
+    """计算某一自然日内的有效时间段列表[(开始datetime, 结束datetime)]"""
+    day = datetime(date.year, date.month, date.day)
+    weekday = date.weekday()
+    grace = timedelta(seconds=SESSION_GRACE)
+
+    l = []
+    for start, end in sessionList:
+        startTime = day + timedelta(seconds=parseTime(start))
+        endTime = day + timedelta(seconds=parseTime(end))
+
+        # 不跨越午夜的时段，只在周一至周五有效
+        if endTime > startTime:
+            if weekday < 5:
+                l.append((startTime - grace, endTime + grace))
+        # 跨越午夜的夜盘，午夜前的部分为周一至周五，午夜后的部分为周二至周六
+        else:
+            if weekday < 5:
+                l.append((startTime - grace, day + timedelta(1)))
+            if 0 < weekday < 6:
+                l.append((day, endTime + grace))
+    return l
+
+
+#----------------------------------------------------------------------
+def getInvalidRanges(sessionList, start, end):
+    """计算[start, end)内的无效时间段列表"""
+    validList = []
+    date = start.date()
+    while date <= end.date():
+        validList.extend(getValidRanges(sessionList, date))
+        date += timedelta(1)
+    validList.sort()
 
+    # 合并重叠的有效时间段后取补集
+    invalidList = []
+    cursor = start
+    for validStart, validEnd in validList:
+        if validStart > cursor:
+            invalidList.append((cursor, min(validStart, end)))
+        cursor = max(cursor, validEnd)
+        if cursor >= end:
+            break
 
-# 这里以商品期货为例
-MORNING_START = time(9, 0)
-MORNING_REST = time(10, 15)
-MORNING_RESTART = time(10, 30)
-MORNING_END = time(11, 30)
-AFTERNOON_START = time(13, 30)
-AFTERNOON_END = time(15, 0)
-NIGHT_START = time(21, 0)
-NIGHT_END = time(2, 30)
+    if cursor < end:
+        invalidList.append((cursor, end))
+
+    return [(s, e) for s, e in invalidList if s < e]
 
 
 #----------------------------------------------------------------------
-def cleanData(dbName, collectionName, start):
-    """清洗数据"""
-    print u'\n清洗数据库：%s, 集合：%s, 起始日：%s' %(dbName, collectionName, start)
-    
-    mc = MongoClient('localhost', 27017)    # 创建MongoClient
-    cl = mc[dbName][collectionName]         # 获取数据集合
-    d = {'datetime':{'$gte':start}}         # 只过滤从start开始的数据
-    cx = cl.find(d)                         # 获取数据指针
-    
-    # 遍历数据
-    for data in cx:
-        # 获取时间戳对象
-        dt = data['datetime'].time()
-        
-        # 默认需要清洗
-        cleanRequired = True
-        
-        # 如果在交易事件内，则为有效数据，无需清洗
-        if ((MORNING_START <= dt < MORNING_REST) or
-            (MORNING_RESTART <= dt < MORNING_END) or
-            (AFTERNOON_START <= dt < AFTERNOON_END) or
-            (dt >= NIGHT_START) or
-            (dt < NIGHT_END)):
-            cleanRequired = False
-        
-        # 如果需要清洗
-        if cleanRequired:
-            print u'删除无效数据，时间戳：%s' %data['datetime']
-            cl.delete_one(data)
-    
-    print u'清洗完成，数据库：%s, 集合：%s' %(dbName, collectionName)
-    
+def cleanData(historyStore, dbName, collectionName, start, end):
+    """清洗数据，返回(集合名, 删除数量, 耗时)"""
+    startTime = time()
+
+    sessionName = getSessionName(collectionName)
+    if not sessionName:
+        return collectionName, -1, 0
+
+    sessionList = SESSION_DICT[sessionName][0]
+    invalidList = getInvalidRanges(sessionList, start, end)
+    if not invalidList:
+        return collectionName, 0, 0
+
+    count = historyStore.deleteRanges(dbName, collectionName, invalidList)
+
+    return collectionName, count, time() - startTime
 
 
 #----------------------------------------------------------------------
 def runDataCleaning():
     """运行数据清洗"""
     print u'开始数据清洗工作'
-    
+
     # 加载配置
     setting = {}
     with open("DR_setting.json") as f:
         setting = json.load(f)
-        
-    # 遍历执行清洗
-    today = datetime.now()
-    start = today - timedelta(10)   # 清洗过去10天数据
-    start.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    for l in setting['tick']:
-        symbol = l[0]
-        cleanData(TICK_DB_NAME, symbol, start)
-        
-    for l in setting['bar']:
-        symbol = l[0]
-        cleanData(MINUTE_DB_NAME, symbol, start)
-    
-    print u'数据清洗工作完成'
-    
+
+    # 清洗过去10天的数据
+    end = datetime.now()
+    start = (end - timedelta(10)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # 需要清洗的数据库和集合，主力合约的集合也一并清洗
+    activeList = setting.get('active', {}).keys()
+    taskList = []
+    for dbName, key in [(TICK_DB_NAME, 'tick'), (MINUTE_DB_NAME, 'bar')]:
+        symbolList = [l[0] for l in setting.get(key, [])]
+        for collectionName in sorted(set(symbolList + activeList)):
+            taskList.append((dbName, collectionName))
+
+    # 历史数据存储是线程安全的，多个线程共用
+    historyStore = createHistoryStore()
+    pool = ThreadPool(THREAD_COUNT)
+
+    startTime = time()
+    resultList = [pool.apply_async(cleanData, (historyStore, dbName, collectionName, start, end))
+                  for dbName, collectionName in taskList]
+
+    total = 0
+    for (dbName, collectionName), result in zip(taskList, resultList):
+        collectionName, count, cost = result.get()
+        if count < 0:
+            print u'%s\t%s\t未知品种的交易时段，跳过' %(dbName, collectionName)
+        else:
+            print u'%s\t%s\t删除：%s\t耗时：%.2f秒' %(dbName, collectionName, count, cost)
+            total += count
+
+    pool.close()
+    pool.join()
+    historyStore.close()
+
+    print u'数据清洗工作完成，删除：%s，耗时：%.2f秒' %(total, time() - startTime)
+
 
 if __name__ == '__main__':
     runDataCleaning()
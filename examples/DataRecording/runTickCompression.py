@@ -0,0 +1,71 @@
+# encoding: UTF-8
+
+"""
+将数据库中的普通Tick数据转换为压缩数据块格式，写入另一个数据库。
+
+转换后回测引擎和CTA引擎可以直接读取目标数据库（setDatabase中使用目标数据库名即可），
+确认数据无误后可以删除原有的数据库以节省空间。
+"""
+
+from __future__ import division
+
+from datetime import timedelta
+
+import bson
+from pymongo import MongoClient, ASCENDING, ReplaceOne
+
+from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtTickCodec import encodeTicks, BLOCK_MINUTE, BLOCK_HOUR
+from vnpy.trader.app.ctaStrategy.ctaBase import TICK_DB_NAME
+
+
+#----------------------------------------------------------------------
+def compressCollection(dbClient, sourceDbName, targetDbName, collectionName, blockSpan=BLOCK_MINUTE):
+    """按日转换一个集合，返回(原始大小, 压缩后大小)，单位为字节"""
+    source = dbClient[sourceDbName][collectionName]
+    target = dbClient[targetDbName][collectionName]
+    target.create_index([('datetime', ASCENDING)])
+
+    # 数据块按照第一个Tick的时间替换（重新转换时块内的最后一个Tick可能变化），需要索引避免全表扫描
+    target.create_index([('startDatetime', ASCENDING)], unique=True)
+
+    first = source.find_one(sort=[('datetime', ASCENDING)])
+    last = source.find_one(sort=[('datetime', -1)])
+    if not first:
+        return 0, 0
+
+    rawSize = 0
+    compressedSize = 0
+
+    date = first['datetime'].replace(hour=0, minute=0, second=0, microsecond=0)
+    while date <= last['datetime']:
+        flt = {'datetime': {'$gte': date, '$lt': date + timedelta(1)}}
+        dataList = list(source.find(flt, {'_id': False}).sort('datetime'))
+        date += timedelta(1)
+
+        if not dataList:
+            continue
+
+        docList = encodeTicks(dataList, blockSpan)
+        requests = [ReplaceOne({'startDatetime': doc['startDatetime']}, doc, upsert=True)
+                    for doc in docList]
+        target.bulk_write(requests, ordered=False)
+
+        rawSize += sum([len(bson.BSON.encode(d)) for d in dataList])
+        compressedSize += sum([len(bson.BSON.encode(doc)) for doc in docList])
+
+    return rawSize, compressedSize
+
+
+if __name__ == '__main__':
+    dbClient = MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
+
+    sourceDbName = TICK_DB_NAME
+    targetDbName = TICK_DB_NAME + '_Compressed'
+
+    for collectionName in dbClient[sourceDbName].collection_names():
+        rawSize, compressedSize = compressCollection(dbClient, sourceDbName, targetDbName,
+                                                     collectionName, BLOCK_HOUR)
+        if compressedSize:
+            print u'%s\t原始：%s字节\t压缩后：%s字节\t压缩比：%.1f' %(collectionName, rawSize,
+                                                              compressedSize, rawSize / compressedSize)
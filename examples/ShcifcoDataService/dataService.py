@@ -5,11 +5,11 @@ import time
 import datetime
 import random
 
-from pymongo import MongoClient, ASCENDING
+import pandas as pd
 
 from vnpy.data.shcifco.vnshcifco import ShcifcoApi, PERIOD_1MIN
-from vnpy.trader.vtObject import VtBarData
-from vnpy.trader.app.ctaStrategy.ctaBase import MINUTE_DB_NAME
+from vnpy.data.dataService import DataService
+from vnpy.trader.vtHistoryStore import createHistoryStore
 
 
 # 加载配置
@@ -18,74 +18,58 @@ setting = json.load(config)
 
 MONGO_HOST = setting['MONGO_HOST']
 MONGO_PORT = setting['MONGO_PORT']
+HISTORY_STORE = setting.get('HISTORY_STORE', 'mongo')  # 历史数据存储：mongo或local
+HISTORY_PATH = setting.get('HISTORY_PATH', 'history')  # 使用local时的数据目录
 SHCIFCO_IP = setting['SHCIFCO_IP']
 SHCIFCO_PORT  = setting['SHCIFCO_PORT']
 SHCIFCO_TOKEN = setting['SHCIFCO_TOKEN']
 SYMBOLS = setting['SYMBOLS']
+THREAD_COUNT = setting.get('THREAD_COUNT', 4)      # 并行下载的线程数
+RATE_LIMIT = setting.get('RATE_LIMIT', 1)          # 每秒最多请求次数
 
 api = ShcifcoApi(SHCIFCO_IP, SHCIFCO_PORT, SHCIFCO_TOKEN)       # 历史行情服务API对象
-mc = MongoClient(MONGO_HOST, MONGO_PORT)                        # Mongo连接
-db = mc[MINUTE_DB_NAME]                                         # 数据库
 
 
-#----------------------------------------------------------------------
-def generateVtBar(d):
-    """生成K线"""
-    bar = VtBarData()
-    
-    bar.symbol = d['symbol']
-    bar.vtSymbol = d['symbol']
-    bar.date = d['date']
-    bar.time = ':'.join([d['time'][:2], d['time'][2:]])
-    bar.open = d['open']
-    bar.high = d['high']
-    bar.low = d['low']
-    bar.close = d['close']
-    bar.volume = d['volume']
-    bar.openInterest = d['openInterest']
-    bar.datetime = datetime.datetime.strptime(' '.join([bar.date, bar.time]), '%Y%m%d %H:%M')    
-    
-    return bar
+########################################################################
+class ShcifcoDataService(DataService):
+    """上海中期数据服务"""
+
+    name = u'上海中期'
+
+    #----------------------------------------------------------------------
+    def __init__(self, num, *args, **kwargs):
+        """Constructor，num为每个合约下载的K线数量"""
+        super(ShcifcoDataService, self).__init__(*args, **kwargs)
+        self.num = num
+
+    #----------------------------------------------------------------------
+    def downloadFrame(self, symbol):
+        """下载某一合约的分钟线数据"""
+        l = api.getHisBar(symbol, self.num, period=PERIOD_1MIN)
+        if not l:
+            return None
+
+        df = pd.DataFrame(l)
+        df['datetime'] = pd.to_datetime(df['date'] + df['time'].str.zfill(4), format='%Y%m%d%H%M')
+        return df
+
+
+historyStore = createHistoryStore({'historyStore': HISTORY_STORE,
+                                   'historyPath': HISTORY_PATH,
+                                   'mongoHost': MONGO_HOST,
+                                   'mongoPort': MONGO_PORT})
+service = ShcifcoDataService(0, historyStore, threadCount=THREAD_COUNT,
+                             rateLimit=RATE_LIMIT)
+
 
 #----------------------------------------------------------------------
 def downMinuteBarBySymbol(symbol, num):
     """下载某一合约的分钟线数据"""
-    start = time.time()
-    
-    cl = db[symbol]                                                 # 集合
-    cl.ensure_index([('datetime', ASCENDING)], unique=True)         # 添加索引
-    
-    l = api.getHisBar(symbol, num, period=PERIOD_1MIN)
-    if not l:
-        print u'%s数据下载失败' %symbol
-        return
-    
-    for d in l:
-        bar = generateVtBar(d)
-        d = bar.__dict__
-        flt = {'datetime': bar.datetime}
-        cl.replace_one(flt, d, True)
-
-    end = time.time()
-    cost = (end - start) * 1000
-
-    print u'合约%s数据下载完成%s - %s，耗时%s毫秒' %(symbol, generateVtBar(l[0]).datetime,
-                                                  generateVtBar(l[-1]).datetime, cost)
+    service.num = num
+    service.downloadSymbol(symbol)
 
 #----------------------------------------------------------------------
 def downloadAllMinuteBar(num):
     """下载所有配置中的合约的分钟线数据"""
-    print '-' * 50
-    print u'开始下载合约分钟线数据'
-    print '-' * 50
-    
-    for symbol in SYMBOLS:
-        downMinuteBarBySymbol(symbol, num)
-        time.sleep(1)
-
-    print '-' * 50
-    print u'合约分钟线数据下载完成'
-    print '-' * 50
-
-
-    
\ No newline at end of file
+    service.num = num
+    service.downloadAll(SYMBOLS)
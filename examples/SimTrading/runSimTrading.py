@@ -0,0 +1,65 @@
+# encoding: UTF-8
+
+"""
+使用模拟交易所接口回放录制的Tick数据，对主引擎、风控引擎和CTA引擎组成的交易链路进行压力测试，
+回放结束后输出Tick吞吐量和从Tick推送到委托发出的延时统计，以及全链路各阶段的延时统计。
+"""
+
+from time import sleep
+
+from vnpy.event import EventEngine2
+from vnpy.trader.vtEvent import EVENT_LOG
+from vnpy.trader.vtEngine import MainEngine, LogEngine
+from vnpy.trader.vtLatency import latencyTracer
+from vnpy.trader.gateway import simGateway
+from vnpy.trader.app import riskManager, ctaStrategy
+from vnpy.trader.app.ctaStrategy.ctaBase import EVENT_CTA_LOG
+
+
+#----------------------------------------------------------------------
+def main():
+    """主程序入口"""
+    # 创建日志引擎
+    le = LogEngine()
+    le.setLogLevel(le.LEVEL_INFO)
+    le.addConsoleHandler()
+    
+    ee = EventEngine2()
+    
+    me = MainEngine(ee)
+    me.addGateway(simGateway)
+    me.addApp(riskManager)
+    me.addApp(ctaStrategy)
+    
+    ee.register(EVENT_LOG, le.processLogEvent)
+    ee.register(EVENT_CTA_LOG, le.processLogEvent)
+    
+    # 开启全链路延时追踪，每10秒输出一次统计
+    latencyTracer.start(ee, interval=10)
+    
+    # 连接模拟交易所，开始回放行情
+    me.connect(simGateway.gatewayName)
+    
+    cta = me.getApp(ctaStrategy.appName)
+    cta.loadSetting()
+    cta.initAll()
+    cta.startAll()
+    le.info(u'CTA策略启动成功')
+    
+    # 等待回放结束
+    gateway = me.getGateway(simGateway.gatewayName)
+    while gateway.active:
+        sleep(1)
+    
+    for k, v in gateway.getStatistics().items():
+        le.info(u'%s：%s' %(k, v))
+    
+    for k, v in latencyTracer.getStatistics().items():
+        le.info(u'%s：%s' %(k, dict(v)))
+    latencyTracer.stop()
+    
+    me.exit()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,13 @@
 import sys
 import json
 from datetime import datetime
-from time import sleep
+from threading import Event
 
-from pymongo import MongoClient, ASCENDING
+import pandas as pd
 
 from vnpy.data.tq.vntq import TqApi
-from vnpy.trader.vtObject import VtBarData
-from vnpy.trader.app.ctaStrategy.ctaBase import MINUTE_DB_NAME
+from vnpy.data.dataService import DataService
+from vnpy.trader.vtHistoryStore import createHistoryStore
 
 
 # 加载配置
@@ -18,90 +18,74 @@ setting = json.load(config)
 
 MONGO_HOST = setting['MONGO_HOST']
 MONGO_PORT = setting['MONGO_PORT']
+HISTORY_STORE = setting.get('HISTORY_STORE', 'mongo')  # 历史数据存储：mongo或local
+HISTORY_PATH = setting.get('HISTORY_PATH', 'history')  # 使用local时的数据目录
 SYMBOLS = setting['SYMBOLS']
-
-mc = MongoClient(MONGO_HOST, MONGO_PORT)        # Mongo连接
-db = mc[MINUTE_DB_NAME]                         # 数据库
+THREAD_COUNT = setting.get('THREAD_COUNT', 4)      # 并行下载的线程数
+RATE_LIMIT = setting.get('RATE_LIMIT', 0)          # 每秒最多请求次数，0代表不限制
+TIMEOUT = setting.get('TIMEOUT', 30)               # 等待K线推送的超时秒数
 
 api = TqApi()   # 历史行情服务API对象
 api.connect()   # 连接
-taskList = []   # 下载任务列表
 
 
-#----------------------------------------------------------------------
-def generateVtBar(symbol, d):
-    """生成K线"""
-    bar = VtBarData()
-    
-    bar.symbol = symbol
-    bar.vtSymbol = symbol
-    bar.open = d['open']
-    bar.high = d['high']
-    bar.low = d['low']
-    bar.close = d['close']
-    bar.volume = d['volume']
-    bar.openInterest = d['open_oi']
-    bar.datetime = datetime.fromtimestamp(d['datetime']/1000000000)
-    bar.date = bar.datetime.strftime("%Y%m%d")
-    bar.time = bar.datetime.strftime("%H:%M:%S")
-    
-    return bar
+########################################################################
+class TqDataService(DataService):
+    """天勤数据服务"""
+
+    name = u'天勤'
+
+    #----------------------------------------------------------------------
+    def __init__(self, num, *args, **kwargs):
+        """Constructor，num为每个合约下载的K线数量"""
+        super(TqDataService, self).__init__(*args, **kwargs)
+        self.num = num
+        self.eventDict = {}     # 合约代码:收到K线推送的事件
+
+    #----------------------------------------------------------------------
+    def onChart(self, symbol, seconds):
+        """K线更新处理函数"""
+        if symbol in self.eventDict:
+            self.eventDict[symbol].set()
+
+    #----------------------------------------------------------------------
+    def downloadFrame(self, symbol):
+        """订阅某一合约的分钟线数据，等待推送完成后读取"""
+        event = self.eventDict.setdefault(symbol, Event())
+        event.clear()
+
+        api.subscribe_chart(symbol, 60, self.num, self.onChart)
+        event.wait(TIMEOUT)
+
+        serial = api.get_kline_serial(symbol, 60)
+        if not serial:
+            return None
+
+        df = pd.DataFrame(list(serial.values()))
+        df = df.rename(columns={'open_oi': 'openInterest'})
+
+        # 和datetime.fromtimestamp一致，转换为本地时间
+        t = df['datetime'].iloc[0] / 1000000000
+        offset = datetime.fromtimestamp(t) - datetime.utcfromtimestamp(t)
+        df['datetime'] = pd.to_datetime(df['datetime'], unit='ns') + offset
+        return df
+
+
+historyStore = createHistoryStore({'historyStore': HISTORY_STORE,
+                                   'historyPath': HISTORY_PATH,
+                                   'mongoHost': MONGO_HOST,
+                                   'mongoPort': MONGO_PORT})
+service = TqDataService(0, historyStore, threadCount=THREAD_COUNT, rateLimit=RATE_LIMIT)
 
-#----------------------------------------------------------------------
-def onChart(symbol, seconds):
-    """K线更新处理函数"""    
-    # 避免重复记录已经完成的任务
-    if symbol not in taskList:
-        return 
-    
-    serial = api.get_kline_serial(symbol, seconds)
-    
-    cl = db[symbol]                                                 # 集合
-    cl.ensure_index([('datetime', ASCENDING)], unique=True)         # 添加索引
-    
-    l = serial.values()
-    for d in l:
-        bar = generateVtBar(symbol, d)
-        d = bar.__dict__
-        flt = {'datetime': bar.datetime}
-        cl.replace_one(flt, d, True)
-    
-    start = datetime.fromtimestamp(l[0]['datetime']/1000000000)
-    end = datetime.fromtimestamp(l[-1]['datetime']/1000000000)
-    print u'合约%s下载完成%s - %s' %(symbol, start, end)
-    
-    # 移除已经完成的任务
-    if symbol in taskList:
-        taskList.remove(symbol)
 
 #----------------------------------------------------------------------
 def downMinuteBarBySymbol(symbol, num):
     """下载某一合约的分钟线数据"""
-    api.subscribe_chart(symbol, 60, num, onChart)
-    
+    service.num = num
+    service.downloadSymbol(symbol)
+
 #----------------------------------------------------------------------
 def downloadAllMinuteBar(num):
     """下载所有配置中的合约的分钟线数据"""
-    print '-' * 50
-    print u'开始下载合约分钟线数据'
-    print '-' * 50
-    
-    # 添加下载任务
-    taskList.extend(SYMBOLS)
-    
-    for symbol in SYMBOLS:
-        downMinuteBarBySymbol(str(symbol), num)
-    
-    while True:
-        sleep(2)
-
-        # 如果任务列表为空，则说明数据已经全部下载完成
-        if not taskList:
-            print '-' * 50
-            print u'合约分钟线数据下载完成'
-            print '-' * 50
-            return       
-    
-
-
-    
\ No newline at end of file
+    service.num = num
+    service.downloadAll([str(symbol) for symbol in SYMBOLS])
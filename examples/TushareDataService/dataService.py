@@ -2,13 +2,9 @@
 
 import sys
 import json
-from datetime import datetime
-from time import time, sleep
 
-from pymongo import MongoClient, ASCENDING
-
-from vnpy.trader.vtObject import VtBarData
-from vnpy.trader.app.ctaStrategy.ctaBase import MINUTE_DB_NAME
+from vnpy.data.dataService import DataService
+from vnpy.trader.vtHistoryStore import createHistoryStore
 
 import tushare as ts
 
@@ -18,10 +14,11 @@ setting = json.load(config)
 
 MONGO_HOST = setting['MONGO_HOST']
 MONGO_PORT = setting['MONGO_PORT']
+HISTORY_STORE = setting.get('HISTORY_STORE', 'mongo')  # 历史数据存储：mongo或local
+HISTORY_PATH = setting.get('HISTORY_PATH', 'history')  # 使用local时的数据目录
 SYMBOLS = setting['SYMBOLS']
-
-mc = MongoClient(MONGO_HOST, MONGO_PORT)        # Mongo连接
-db = mc[MINUTE_DB_NAME]                         # 数据库
+THREAD_COUNT = setting.get('THREAD_COUNT', 4)      # 并行下载的线程数
+RATE_LIMIT = setting.get('RATE_LIMIT', 0)          # 每秒最多请求次数，0代表不限制
 
 
 #----------------------------------------------------------------------
@@ -33,63 +30,45 @@ def generateExchange(symbol):
         exchange = 'SZSE'
     return exchange
 
-#----------------------------------------------------------------------
-def generateVtBar(row):
-    """生成K线"""
-    bar = VtBarData()
-    
-    bar.symbol = row['code']
-    bar.exchange = generateExchange(bar.symbol)
-    bar.vtSymbol = '.'.join([bar.symbol, bar.exchange])
-    bar.open = row['open']
-    bar.high = row['high']
-    bar.low = row['low']
-    bar.close = row['close']
-    bar.volume = row['vol']
-    bar.datetime = row.name
-    bar.date = bar.datetime.strftime("%Y%m%d")
-    bar.time = bar.datetime.strftime("%H:%M:%S")
-    
-    return bar
+
+########################################################################
+class TushareDataService(DataService):
+    """Tushare数据服务"""
+
+    name = 'Tushare'
+
+    #----------------------------------------------------------------------
+    def downloadFrame(self, symbol):
+        """下载某一合约的分钟线数据"""
+        df = ts.bar(symbol, ktype='1min')
+        if df is None:
+            return None
+
+        df = df.rename(columns={'vol': 'volume'})
+        df['datetime'] = df.index
+        return df
+
+    #----------------------------------------------------------------------
+    def getContractInfo(self, symbol):
+        """返回(symbol, vtSymbol, exchange)"""
+        exchange = generateExchange(symbol)
+        return symbol, '.'.join([symbol, exchange]), exchange
+
+
+historyStore = createHistoryStore({'historyStore': HISTORY_STORE,
+                                   'historyPath': HISTORY_PATH,
+                                   'mongoHost': MONGO_HOST,
+                                   'mongoPort': MONGO_PORT})
+service = TushareDataService(historyStore, threadCount=THREAD_COUNT, rateLimit=RATE_LIMIT)
+
 
 #----------------------------------------------------------------------
 def downMinuteBarBySymbol(symbol):
     """下载某一合约的分钟线数据"""
-    start = time()
-
-    cl = db[symbol]
-    cl.ensure_index([('datetime', ASCENDING)], unique=True)         # 添加索引
-    
-    df = ts.bar(symbol, ktype='1min')
-    df = df.sort_index()
-    
-    for ix, row in df.iterrows():
-        bar = generateVtBar(row)
-        d = bar.__dict__
-        flt = {'datetime': bar.datetime}
-        cl.replace_one(flt, d, True)            
-
-    end = time()
-    cost = (end - start) * 1000
-
-    print u'合约%s数据下载完成%s - %s，耗时%s毫秒' %(symbol, df.index[0], df.index[-1], cost)
-
-    
+    service.downloadSymbol(symbol)
+
+
 #----------------------------------------------------------------------
 def downloadAllMinuteBar():
     """下载所有配置中的合约的分钟线数据"""
-    print '-' * 50
-    print u'开始下载合约分钟线数据'
-    print '-' * 50
-    
-    # 添加下载任务
-    for symbol in SYMBOLS:
-        downMinuteBarBySymbol(str(symbol))
-    
-    print '-' * 50
-    print u'合约分钟线数据下载完成'
-    print '-' * 50
-    
-
-
-    
\ No newline at end of file
+    service.downloadAll([str(symbol) for symbol in SYMBOLS])
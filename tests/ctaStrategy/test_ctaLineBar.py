@@ -0,0 +1,478 @@
+# encoding: UTF-8
+
+'''
+CtaLineBar增量计算的回归测试：
+将固定的1分钟K线序列（data/rb1801_1min.csv，Multicharts导出格式）通过addBar回放，
+比较CtaLineBar的增量计算结果和逐根K线重新计算全部指标（原先的列表实现）的结果，
+两者必须完全一致，包括K线周期参数在运行中被修改的情况。
+'''
+
+import os
+import sys
+import csv
+import unittest
+from datetime import datetime
+
+import numpy
+
+try:
+    import talib as ta
+except ImportError:
+    ta = None
+
+# tools目录不是Python包，ctaLineBar使用from vtConstant import *，需要将这两个目录加入搜索路径
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'vnpy', 'trader'))
+sys.path.insert(0, os.path.join(ROOT, 'vnpy', 'trader', 'app', 'ctaStrategy', 'tools'))
+
+from vnpy.trader.vtObject import VtBarData, VtTickData
+
+if ta:
+    from ctaLineBar import CtaLineBar
+
+
+DATA_FILE = os.path.join(os.path.dirname(__file__), 'data', 'rb1801_1min.csv')
+
+SETTING = {
+    'name': u'M5',
+    'barTimeInterval': 300,
+    'inputPreLen': 5,
+    'inputEma1Len': 7,
+    'inputEma2Len': 21,
+    'inputDmiLen': 14,
+    'inputDmiMax': 30,
+    'inputAtr1Len': 10,
+    'inputAtr2Len': 26,
+    'inputAtr3Len': 50,
+    'inputVolLen': 14,
+    'inputRsiLen': 7,
+    'inputCmiLen': 12,
+    'inputBollLen': 20,
+    'inputBollStdRate': 2,
+    'minDiff': 1,
+    'shortSymbol': 'rb'
+}
+
+# 需要比较的指标序列
+LINE_NAMES = ['preHigh', 'preLow', 'lineEma1', 'lineEma2',
+              'linePdi', 'lineMdi', 'lineDx', 'lineAdx', 'lineAdxr',
+              'lineAtr1', 'lineAtr2', 'lineAtr3', 'lineAvgVol',
+              'lineRsi', 'lineRsiTop', 'lineRsiButtom', 'lineCmi',
+              'lineUpperBand', 'lineMiddleBand', 'lineLowerBand']
+
+# 需要比较的K线内指标
+VALUE_NAMES = ['barPdi', 'barMdi', 'barAdx', 'barAdxr', 'barAdxTrend', 'barAdxrTrend',
+               'buyFilterCond', 'sellFilterCond', 'barAtr1', 'barAtr2', 'barAtr3']
+
+
+#----------------------------------------------------------------------
+def loadBars():
+    """读取测试用的1分钟K线，每次调用都创建新的K线对象（addBar会修改K线）"""
+    barList = []
+    with open(DATA_FILE) as f:
+        for d in csv.DictReader(f):
+            bar = VtBarData()
+            bar.vtSymbol = 'rb1801'
+            bar.symbol = 'rb1801'
+            bar.open = float(d['Open'])
+            bar.high = float(d['High'])
+            bar.low = float(d['Low'])
+            bar.close = float(d['Close'])
+            bar.volume = float(d['TotalVolume'])
+            bar.openInterest = float(d['OpenInterest'])
+            bar.datetime = datetime.strptime(d['Date'] + ' ' + d['Time'], '%Y/%m/%d %H:%M:%S')
+            bar.date = bar.datetime.strftime('%Y%m%d')
+            bar.time = bar.datetime.strftime('%H:%M:%S')
+            barList.append(bar)
+    return barList
+
+
+#----------------------------------------------------------------------
+def trim(l, maxLen):
+    """保留列表最后maxLen个元素"""
+    while len(l) > maxLen:
+        del l[0]
+
+
+########################################################################
+class DummyStrategy(object):
+    """只接收日志的策略"""
+
+    #----------------------------------------------------------------------
+    def writeCtaLog(self, content):
+        """忽略日志"""
+        pass
+
+
+########################################################################
+class FullRecomputeLineBar(object):
+    """
+    逐根K线重新计算全部指标的参考实现，和改为增量计算之前的CtaLineBar一致：
+    每根K线都从lineBar列表重建收盘价、成交量列表，并重新累加DMI周期内的TR、PDM、MDM
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, setting):
+        """Constructor"""
+        self.barTimeInterval = 300
+        self.inputPreLen = 0
+        self.inputEma1Len = 0
+        self.inputEma2Len = 0
+        self.inputDmiLen = 0
+        self.inputDmiMax = 0
+        self.inputAtr1Len = 0
+        self.inputAtr2Len = 0
+        self.inputAtr3Len = 0
+        self.inputVolLen = 0
+        self.inputRsiLen = 0
+        self.inputCmiLen = 0
+        self.inputBollLen = 0
+        self.inputBollStdRate = 1.5
+
+        self.lineBar = []
+        for name in LINE_NAMES:
+            setattr(self, name, [])
+
+        self.barPdi = 0
+        self.barMdi = 0
+        self.barAdx = 0
+        self.barAdxr = 0
+        self.barAdxTrend = False
+        self.barAdxrTrend = False
+        self.buyFilterCond = False
+        self.sellFilterCond = False
+        self.barAtr1 = 0
+        self.barAtr2 = 0
+        self.barAtr3 = 0
+
+        self.setParam(setting)
+
+    #----------------------------------------------------------------------
+    def setParam(self, setting):
+        """设置参数，指标列表按新的参数截断"""
+        self.__dict__.update(setting)
+
+        trim(self.preHigh, self.inputPreLen * 8 + 1)
+        trim(self.preLow, self.inputPreLen * 8 + 1)
+        trim(self.lineEma1, self.inputEma1Len * 8 + 1)
+        trim(self.lineEma2, self.inputEma1Len * 8 + 1)
+        for name in ['linePdi', 'lineMdi', 'lineDx', 'lineAdx', 'lineAdxr']:
+            trim(getattr(self, name), self.inputDmiLen + 2)
+        trim(self.lineAtr1, self.inputAtr1Len + 2)
+        trim(self.lineAtr2, self.inputAtr2Len + 2)
+        trim(self.lineAtr3, self.inputAtr3Len + 2)
+        trim(self.lineRsi, self.inputRsiLen * 8 + 1)
+        trim(self.lineRsiTop, self.inputRsiLen + 1)
+        trim(self.lineRsiButtom, self.inputRsiLen + 1)
+        trim(self.lineCmi, self.inputCmiLen + 1)
+
+    #----------------------------------------------------------------------
+    def addBar(self, bar):
+        """和CtaLineBar.addBar相同的K线合成"""
+        if self.lineBar:
+            lastBar = self.lineBar[-1]
+            if (bar.datetime - lastBar.datetime).seconds < self.barTimeInterval:
+                lastBar.close = bar.close
+                lastBar.high = max(lastBar.high, bar.high)
+                lastBar.low = min(lastBar.low, bar.low)
+                lastBar.volume = lastBar.volume + bar.volume
+                return
+
+        self.lineBar.append(bar)
+        self.onBar()
+
+    #----------------------------------------------------------------------
+    def onBar(self):
+        """重新计算全部指标"""
+        self.recountPreHighLow()
+        self.recountEma()
+        self.recountDmi()
+        self.recountAtr()
+        self.recountAvgVol()
+        self.recountRsi()
+        self.recountCmi()
+        self.recountBoll()
+
+    #----------------------------------------------------------------------
+    def append(self, l, value, maxLen):
+        """添加指标值，超过长度后移除最早的值"""
+        l.append(value)
+        trim(l, maxLen)
+
+    #----------------------------------------------------------------------
+    def calcTr(self, i):
+        """计算lineBar[i]的TR、PDM、MDM（i为0时上一根K线为lineBar[-1]）"""
+        bar = self.lineBar[i]
+        preBar = self.lineBar[i - 1]
+
+        tr = float(max(bar.high - bar.low,
+                       abs(bar.high - preBar.close),
+                       abs(bar.low - preBar.close)))
+
+        highSpread = bar.high - preBar.high
+        lowSpread = preBar.low - bar.low
+
+        pdm = highSpread if highSpread > 0 and highSpread > lowSpread else 0
+        mdm = lowSpread if lowSpread > 0 and lowSpread > highSpread else 0
+        return tr, pdm, mdm
+
+    #----------------------------------------------------------------------
+    def recountPreHighLow(self):
+        """前inputPreLen根K线（不包含当前K线）的最高价和最低价"""
+        if self.inputPreLen <= 0 or len(self.lineBar) < self.inputPreLen:
+            return
+
+        # K线数量等于inputPreLen时，最早的一根为lineBar[-1]
+        barList = [self.lineBar[i] for i in range(len(self.lineBar) - 2,
+                                                  len(self.lineBar) - 2 - self.inputPreLen, -1)]
+        self.append(self.preHigh, max([bar.high for bar in barList]), self.inputPreLen * 8 + 1)
+        self.append(self.preLow, min([bar.low for bar in barList]), self.inputPreLen * 8 + 1)
+
+    #----------------------------------------------------------------------
+    def recountEma(self):
+        """EMA"""
+        l = len(self.lineBar)
+        if l < max(7, self.inputEma1Len, self.inputEma2Len) + 2:
+            return
+
+        for n, line in [(self.inputEma1Len, self.lineEma1), (self.inputEma2Len, self.lineEma2)]:
+            if n <= 0:
+                continue
+            n = min(n, l)
+            listClose = [bar.close for bar in self.lineBar[-n - 1:-1]]
+            ema = ta.EMA(numpy.array(listClose, dtype=float), n)[-1]
+            self.append(line, round(float(ema), 3), self.inputEma1Len * 8 + 1)
+
+    #----------------------------------------------------------------------
+    def recountDmi(self):
+        """DMI"""
+        n = self.inputDmiLen
+        if n <= 0 or len(self.lineBar) < n + 1:
+            return
+
+        barTr = barPdm = barMdm = 0.0
+        for i in range(len(self.lineBar) - 2, len(self.lineBar) - 2 - n, -1):
+            tr, pdm, mdm = self.calcTr(i)
+            barTr += tr
+            barPdm += pdm
+            barMdm += mdm
+
+        self.barPdi = barPdm * 100 / barTr if barTr else 0
+        self.barMdi = barMdm * 100 / barTr if barTr else 0
+
+        if self.barMdi + self.barPdi == 0:
+            dx = 0
+        else:
+            dx = 100 * abs(self.barMdi - self.barPdi) / (self.barMdi + self.barPdi)
+
+        self.append(self.linePdi, self.barPdi, n + 2)
+        self.append(self.lineMdi, self.barMdi, n + 2)
+        self.append(self.lineDx, dx, n + 2)
+
+        if len(self.lineDx) < n + 1:
+            self.barAdx = dx
+        else:
+            self.barAdx = ta.EMA(numpy.array(self.lineDx, dtype=float), n)[-1]
+        self.append(self.lineAdx, self.barAdx, n + 2)
+
+        if len(self.lineAdx) == 1:
+            self.barAdxr = self.lineAdx[-1]
+        else:
+            self.barAdxr = (self.lineAdx[-1] + self.lineAdx[-2]) / 2
+        self.append(self.lineAdxr, self.barAdxr, n + 2)
+
+        self.barAdxTrend = len(self.lineAdx) >= 2 and self.lineAdx[-1] > self.lineAdx[-2]
+        self.barAdxrTrend = len(self.lineAdxr) >= 2 and self.lineAdxr[-1] > self.lineAdxr[-2]
+
+        trend = self.barAdxTrend and self.barAdxrTrend
+        self.buyFilterCond = bool(self.barPdi > self.barMdi and trend and self.barPdi >= self.inputDmiMax)
+        self.sellFilterCond = bool(self.barPdi < self.barMdi and trend and self.barMdi >= self.inputDmiMax)
+
+    #----------------------------------------------------------------------
+    def recountAtr(self):
+        """ATR"""
+        maxLen = max(self.inputAtr1Len, self.inputAtr2Len, self.inputAtr3Len)
+        if maxLen <= 0 or len(self.lineBar) < maxLen + 1:
+            return
+
+        atrList = [(self.inputAtr1Len, self.lineAtr1, 'barAtr1'),
+                   (self.inputAtr2Len, self.lineAtr2, 'barAtr2'),
+                   (self.inputAtr3Len, self.lineAtr3, 'barAtr3')]
+
+        first = [n > 0 and not line for n, line, name in atrList]
+        if any(first):
+            trList = [self.calcTr(i)[0] for i in range(len(self.lineBar) - 2,
+                                                       len(self.lineBar) - 2 - maxLen, -1)]
+        else:
+            trList = [self.calcTr(len(self.lineBar) - 2)[0]]
+
+        for n, line, name in atrList:
+            if n <= 0:
+                continue
+
+            barTr = 0.0
+            for tr in trList[:n]:
+                barTr += tr
+
+            if not line:
+                atr = round(barTr / n, 3)
+            else:
+                atr = round((line[-1] * (n - 1) + barTr) / n, 3)
+
+            setattr(self, name, atr)
+            self.append(line, atr, n + 2)
+
+    #----------------------------------------------------------------------
+    def recountAvgVol(self):
+        """平均成交量"""
+        n = self.inputVolLen
+        if n <= 0 or len(self.lineBar) < n + 1:
+            return
+
+        listVol = [bar.volume for bar in self.lineBar[-n - 1:-1]]
+        sumVol = ta.SUM(numpy.array(listVol, dtype=float), timeperiod=n)[-1]
+        self.lineAvgVol.append(round(sumVol / n, 0))
+
+    #----------------------------------------------------------------------
+    def recountRsi(self):
+        """RSI及其峰谷"""
+        n = self.inputRsiLen
+        if n <= 0 or len(self.lineBar) < n + 2:
+            return
+
+        listClose = [bar.close for bar in self.lineBar[-n - 2:]]
+        rsi = round(float(ta.RSI(numpy.array(listClose, dtype=float), n)[-1]), 3)
+
+        l = len(self.lineRsi)
+        self.append(self.lineRsi, rsi, n * 8 + 1)
+
+        if l > 3:
+            d = {'RSI': self.lineRsi[-2], 'Close': self.lineBar[-2].close}
+            if self.lineRsi[-1] < self.lineRsi[-2] and self.lineRsi[-3] < self.lineRsi[-2]:
+                d['Type'] = u'T'
+                self.append(self.lineRsiTop, d, n + 1)
+            elif self.lineRsi[-1] > self.lineRsi[-2] and self.lineRsi[-3] > self.lineRsi[-2]:
+                d['Type'] = u'B'
+                self.append(self.lineRsiButtom, d, n + 1)
+
+    #----------------------------------------------------------------------
+    def recountCmi(self):
+        """CMI"""
+        n = self.inputCmiLen
+        if n <= 0 or len(self.lineBar) < n:
+            return
+
+        listClose = [bar.close for bar in self.lineBar[-n:]]
+        hhv = max(listClose)
+        llv = min(listClose)
+
+        if hhv == llv:
+            cmi = 100
+        else:
+            cmi = abs(self.lineBar[-1].close - self.lineBar[-2].close) * 100 / (hhv - llv)
+
+        self.append(self.lineCmi, round(cmi, 2), n + 1)
+
+    #----------------------------------------------------------------------
+    def recountBoll(self):
+        """布林线"""
+        l = len(self.lineBar)
+        if self.inputBollLen < 0 or l < min(7, self.inputBollLen) + 1:
+            return
+
+        if l < self.inputBollLen + 2:
+            n = l - 1
+        else:
+            n = self.inputBollLen
+
+        listClose = [bar.close for bar in self.lineBar[-n - 1:-1]]
+        upper, middle, lower = ta.BBANDS(numpy.array(listClose, dtype=float),
+                                         timeperiod=n, nbdevup=self.inputBollStdRate,
+                                         nbdevdn=self.inputBollStdRate, matype=0)
+
+        self.lineUpperBand.append(upper[-1])
+        self.lineMiddleBand.append(middle[-1])
+        self.lineLowerBand.append(lower[-1])
+
+
+########################################################################
+@unittest.skipIf(ta is None, u'需要安装TA-Lib')
+class CtaLineBarTest(unittest.TestCase):
+    """CtaLineBar增量计算和逐根重新计算的结果比较"""
+
+    #----------------------------------------------------------------------
+    def snapshot(self, lineBar):
+        """获取全部指标的当前值"""
+        d = {}
+        for name in LINE_NAMES:
+            d[name] = list(getattr(lineBar, name))
+        for name in VALUE_NAMES:
+            d[name] = getattr(lineBar, name)
+        d['bar'] = [(bar.datetime, bar.open, bar.high, bar.low, bar.close, bar.volume)
+                    for bar in list(lineBar.lineBar)[-3:]]
+        return d
+
+    #----------------------------------------------------------------------
+    def replay(self, setting, changeDict=None):
+        """
+        将K线分别回放给CtaLineBar和参考实现，每根K线推送后比较全部指标
+        changeDict为{K线序号: 参数字典}，在回放到该K线前修改两者的参数
+        """
+        changeDict = changeDict or {}
+
+        resultList = []
+        lineBar = CtaLineBar(DummyStrategy(), lambda bar: resultList.append(self.snapshot(lineBar)),
+                             dict(setting))
+
+        # DMI产生信号时会记录当前Tick的时间
+        lineBar.curTick = VtTickData()
+        lineBar.curTick.datetime = datetime(2017, 10, 16)
+
+        refBar = FullRecomputeLineBar(dict(setting))
+
+        barList = loadBars()
+        refList = loadBars()
+        count = 0
+
+        for i, (bar, refBarData) in enumerate(zip(barList, refList)):
+            if i in changeDict:
+                lineBar.setParam(changeDict[i])
+                refBar.setParam(changeDict[i])
+
+            n = len(resultList)
+            lineBar.addBar(bar)
+            refBar.addBar(refBarData)
+
+            if len(resultList) > n:
+                count += 1
+                self.assertEqual(resultList[-1], self.snapshot(refBar),
+                                 u'第%s根K线（%s）的指标不一致' %(count, bar.datetime))
+
+        self.assertGreater(count, max(SETTING['inputAtr3Len'], SETTING['inputEma2Len']) + 2)
+
+    #----------------------------------------------------------------------
+    def testOneMinute(self):
+        """1分钟K线"""
+        setting = dict(SETTING)
+        setting['barTimeInterval'] = 60
+        self.replay(setting)
+
+    #----------------------------------------------------------------------
+    def testFiveMinute(self):
+        """合成5分钟K线"""
+        self.replay(SETTING)
+
+    #----------------------------------------------------------------------
+    def testSetParam(self):
+        """运行中修改周期参数，队列和缓存按新的长度重建"""
+        changeDict = {
+            400: {'inputDmiLen': 20, 'inputEma1Len': 10, 'inputAtr1Len': 14, 'inputRsiLen': 9},
+            900: {'inputDmiLen': 8, 'inputEma1Len': 5, 'inputPreLen': 3, 'inputCmiLen': 6},
+            1300: {'inputDmiLen': 30, 'inputVolLen': 60, 'inputBollLen': 55}
+        }
+        self.replay(SETTING, changeDict)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+# encoding: UTF-8
+
+'''
+VectorBacktestingEngine并行优化的回归测试：
+使用固定随机种子生成的1分钟K线，比较并行优化（子进程）和单进程优化的结果，
+两者必须一致，且保存到回测结果缓存中的必须是向量化回测的统计结果（不含逐笔统计字段）。
+'''
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, ROOT)
+
+try:
+    from vnpy.trader.app.ctaStrategy.ctaTemplate import CtaTemplate
+    from vnpy.trader.app.ctaStrategy.ctaBacktesting import OptimizationSetting
+    from vnpy.trader.app.ctaStrategy.ctaVectorBacktesting import VectorBacktestingEngine
+    from vnpy.trader.app.ctaStrategy.ctaResultStore import ResultStore
+except ImportError:
+    VectorBacktestingEngine = None
+
+
+BAR_COUNT = 20000
+
+if VectorBacktestingEngine:
+    ########################################################################
+    class MaCrossStrategy(CtaTemplate):
+        """收盘价在均线上方持有1手多头，下方持有1手空头"""
+        className = 'MaCrossStrategy'
+        window = 10
+        paramList = CtaTemplate.paramList + ['window']
+
+        #----------------------------------------------------------------------
+        @classmethod
+        def calculateTargetPos(cls, data, setting):
+            """计算目标仓位"""
+            window = setting.get('window', cls.window)
+            close = data['close']
+
+            cumsum = np.cumsum(np.insert(close, 0, 0))
+            ma = np.full(len(close), np.nan)
+            ma[window-1:] = (cumsum[window:] - cumsum[:-window]) / window
+
+            pos = np.zeros(len(close))
+            pos[window-1:] = np.where(close[window-1:] > ma[window-1:], 1, -1)
+            return pos
+
+
+    ########################################################################
+    class SyntheticStore(object):
+        """只用于计算数据指纹的历史数据存储"""
+
+        #----------------------------------------------------------------------
+        def summarizeRange(self, dbName, symbol, start=None, end=None):
+            """统计数据"""
+            return BAR_COUNT, start + timedelta(minutes=BAR_COUNT-1)
+
+
+    ########################################################################
+    class SyntheticVectorEngine(VectorBacktestingEngine):
+        """使用固定随机种子生成K线的向量化回测引擎"""
+
+        #----------------------------------------------------------------------
+        def __init__(self):
+            """Constructor"""
+            super(SyntheticVectorEngine, self).__init__()
+            self.setHistoryStore(SyntheticStore())
+
+        #----------------------------------------------------------------------
+        def loadHistoryData(self):
+            """生成K线数据"""
+            rs = np.random.RandomState(0)
+            close = 3000 + np.cumsum(rs.normal(0, 2, BAR_COUNT))
+            openPrice = close + rs.normal(0, 1, BAR_COUNT)
+
+            self.data = {
+                'open': openPrice,
+                'high': np.maximum(openPrice, close) + 1,
+                'low': np.minimum(openPrice, close) - 1,
+                'close': close,
+                'volume': np.full(BAR_COUNT, 10.0),
+                'datetime': (np.datetime64(self.dataStartDate, 'us') +
+                             np.arange(BAR_COUNT) * np.timedelta64(60, 's'))
+            }
+
+        #----------------------------------------------------------------------
+        def output(self, content):
+            """不输出日志"""
+            pass
+
+
+########################################################################
+@unittest.skipIf(VectorBacktestingEngine is None, u'缺少回测引擎的依赖')
+class VectorParallelOptimizationTest(unittest.TestCase):
+    """向量化回测的并行优化"""
+
+    #----------------------------------------------------------------------
+    def setUp(self):
+        """创建临时的回测结果缓存目录"""
+        self.path = tempfile.mkdtemp()
+
+    #----------------------------------------------------------------------
+    def tearDown(self):
+        """删除临时目录"""
+        shutil.rmtree(self.path, True)
+
+    #----------------------------------------------------------------------
+    def createEngine(self):
+        """创建并设置引擎"""
+        engine = SyntheticVectorEngine()
+        engine.setBacktestingMode(engine.BAR_MODE)
+        engine.setStartDate('20170103', 1)
+        engine.setSlippage(1)
+        engine.setRate(1.0/10000)
+        engine.setSize(10)
+        engine.setPriceTick(1)
+        engine.setDatabase('VnTrader_1Min_Db', 'rb1801')
+        return engine
+
+    #----------------------------------------------------------------------
+    def testParallelOptimization(self):
+        """并行优化的结果和缓存内容都来自向量化回测"""
+        setting = OptimizationSetting()
+        setting.setOptimizeTarget('totalNetPnl')
+        setting.addParameter('window', 10, 50, 10)
+
+        # 单进程向量化优化作为参照
+        serialDict = {s[0]: v for s, v in self.createEngine().runOptimization(MaCrossStrategy, setting)}
+
+        engine = self.createEngine()
+        engine.setResultStore(os.path.join(self.path, 'result.db'))
+        parallelDict = dict(engine.runParallelOptimization(MaCrossStrategy, setting))
+        self.assertEqual(parallelDict, serialDict)
+
+        # 缓存中的结果没有逐笔统计字段，且和单进程计算的向量化统计结果一致
+        settingList = setting.generateSetting()
+        keyList = engine.getResultKeyList(MaCrossStrategy, settingList)
+        store = ResultStore(engine.resultStorePath)
+        for s, key in zip(settingList, keyList):
+            d = store.getResult(key)
+            self.assertNotIn('winningRate', d)
+
+            expected = self.createEngine()
+            expected.initStrategy(MaCrossStrategy, s)
+            expected.runBacktesting()
+            result = expected.calculateResultStatistics()
+            self.assertEqual(d, json.loads(json.dumps(result, default=str)))
+        store.close()
+
+        # 再次优化时全部使用缓存中的结果
+        cachedDict = {s[0]: v for s, v in engine.runOptimization(MaCrossStrategy, setting)}
+        self.assertEqual(cachedDict, serialDict)
+
+
+if __name__ == '__main__':
+    unittest.main()
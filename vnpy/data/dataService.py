@@ -0,0 +1,160 @@
+# encoding: UTF-8
+
+'''
+历史数据下载服务的通用框架，Tushare、天勤、上海中期等数据服务均在此基础上实现：
+1. 每个合约的下载作为一个任务，使用线程池并行执行，请求频率受数据源的rateLimit限制，
+   下载失败时按指数退避重试
+2. 数据源只需实现downloadFrame，返回K线DataFrame，转换为数据库文档使用向量化操作
+3. 通过历史数据存储（HistoryStore，MongoDB或本地列式文件）批量写入，按datetime替换
+'''
+
+from time import time, sleep
+from multiprocessing.pool import ThreadPool
+
+import pandas as pd
+from vnpy.data.datayes import RateLimiter
+from vnpy.trader.vtObject import VtBarData
+from vnpy.trader.vtHistoryStore import createHistoryStore
+from vnpy.trader.app.ctaStrategy.ctaBase import MINUTE_DB_NAME
+
+
+# K线DataFrame中的数值字段，缺少的字段写入0
+BAR_FIELDS = ['open', 'high', 'low', 'close', 'volume', 'openInterest']
+
+
+#----------------------------------------------------------------------
+def frameToDocuments(df, symbol, vtSymbol='', exchange=''):
+    """
+    将K线DataFrame转换为数据库文档列表，df中必须包含datetime列，
+    数值字段见BAR_FIELDS，整列转换后再逐行组装，不逐行访问DataFrame
+    """
+    if df is None or df.empty:
+        return []
+
+    df = df.sort_values('datetime').drop_duplicates('datetime', keep='last')
+    dtSeries = pd.to_datetime(df['datetime'])
+
+    template = VtBarData().__dict__
+    template['symbol'] = symbol
+    template['vtSymbol'] = vtSymbol or symbol
+    template['exchange'] = exchange
+
+    columnList = [df[field].tolist() if field in df else [0] * len(df) for field in BAR_FIELDS]
+    dtList = dtSeries.dt.to_pydatetime().tolist()
+    dateList = dtSeries.dt.strftime('%Y%m%d').tolist()
+    timeList = dtSeries.dt.strftime('%H:%M:%S').tolist()
+
+    docList = []
+    for values in zip(dtList, dateList, timeList, *columnList):
+        d = template.copy()
+        d['datetime'], d['date'], d['time'] = values[:3]
+        d.update(zip(BAR_FIELDS, values[3:]))
+        docList.append(d)
+    return docList
+
+
+########################################################################
+class DataService(object):
+    """
+    历史数据下载服务基类
+
+    子类需要实现：
+    downloadFrame(symbol)：下载合约的K线数据，返回DataFrame，失败返回None
+    可选实现：
+    getContractInfo(symbol)：返回(symbol, vtSymbol, exchange)，默认均使用合约代码
+    """
+
+    name = ''       # 数据源名称
+
+    #----------------------------------------------------------------------
+    def __init__(self, historyStore=None, dbName=MINUTE_DB_NAME,
+                 threadCount=4, rateLimit=0, maxRetry=2, retryInterval=1.0):
+        """
+        Constructor
+        historyStore为历史数据存储，不传入时根据VT_setting.json创建，
+        threadCount为并行下载的线程数，rateLimit为数据源每秒最多请求次数（0代表不限制），
+        maxRetry为下载失败后的最大重试次数，retryInterval为第一次重试前的等待秒数
+        """
+        if not historyStore:
+            historyStore = createHistoryStore()
+        self.historyStore = historyStore
+        self.dbName = dbName
+
+        self.threadCount = threadCount
+        self.limiter = RateLimiter(rateLimit)
+        self.maxRetry = maxRetry
+        self.retryInterval = retryInterval
+
+    #----------------------------------------------------------------------
+    def downloadFrame(self, symbol):
+        """下载合约的K线数据，返回包含datetime和BAR_FIELDS列的DataFrame，失败返回None"""
+        raise NotImplementedError
+
+    #----------------------------------------------------------------------
+    def getContractInfo(self, symbol):
+        """返回(symbol, vtSymbol, exchange)"""
+        return symbol, symbol, ''
+
+    #----------------------------------------------------------------------
+    def downloadWithRetry(self, symbol):
+        """下载数据，失败后按指数退避重试，全部失败返回None"""
+        for n in range(self.maxRetry + 1):
+            if n:
+                sleep(self.retryInterval * 2 ** (n - 1))
+
+            self.limiter.wait()
+            try:
+                df = self.downloadFrame(symbol)
+            except Exception as e:
+                print u'合约%s数据下载异常：%s' %(symbol, e)
+                continue
+
+            if df is not None:
+                return df
+
+        return None
+
+    #----------------------------------------------------------------------
+    def downloadSymbol(self, symbol):
+        """下载某一合约的数据并写入数据库，返回写入的数量，下载失败返回-1"""
+        start = time()
+
+        df = self.downloadWithRetry(symbol)
+        if df is None:
+            print u'合约%s数据下载失败' %symbol
+            return -1
+
+        symbol, vtSymbol, exchange = self.getContractInfo(symbol)
+        docList = frameToDocuments(df, symbol, vtSymbol, exchange)
+
+        count = self.historyStore.saveBars(self.dbName, symbol, docList)
+
+        if docList:
+            print u'合约%s数据下载完成%s - %s，数量%s，耗时%.2f秒' %(symbol, docList[0]['datetime'],
+                                                             docList[-1]['datetime'], count, time()-start)
+        return count
+
+    #----------------------------------------------------------------------
+    def downloadAll(self, symbolList):
+        """并行下载所有合约的数据，返回下载失败的合约列表"""
+        start = time()
+
+        print '-' * 50
+        print u'开始下载%s数据，合约数量：%s，线程数量：%s' %(self.name, len(symbolList), self.threadCount)
+        print '-' * 50
+
+        pool = ThreadPool(self.threadCount)
+        countList = pool.map(self.downloadSymbol, symbolList)
+        pool.close()
+        pool.join()
+
+        failedList = [symbol for symbol, count in zip(symbolList, countList) if count < 0]
+        total = sum([count for count in countList if count > 0])
+
+        print '-' * 50
+        print u'%s数据下载完成，数据量：%s，耗时：%.2f秒' %(self.name, total, time()-start)
+        if failedList:
+            print u'下载失败的合约：%s' %failedList
+        print '-' * 50
+
+        return failedList
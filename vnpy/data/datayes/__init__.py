@@ -1 +1 @@
-from vndatayes import DatayesApi
\ No newline at end of file
+from vndatayes import DatayesApi, RateLimiter, DATAYES_DOMAIN
\ No newline at end of file
@@ -5,19 +5,55 @@
 import os
 import requests
 import json
+from time import time, sleep
+from threading import Lock, local
 
 
 HTTP_OK = 200
 
+# 需要重试的http状态代码（请求过于频繁、服务器错误）
+RETRY_STATUS = set([429, 500, 502, 503, 504])
+
+DATAYES_DOMAIN = "http://api.wmcloud.com/data"
+
+
+########################################################################
+class RateLimiter(object):
+    """请求频率限制，多线程共享，保证相邻两次请求的间隔不小于1/rate秒"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, rate=0):
+        """Constructor，rate为每秒最多请求次数，0代表不限制"""
+        self.interval = 1.0 / rate if rate else 0
+        self.nextTime = 0
+        self.lock = Lock()
+        
+    #----------------------------------------------------------------------
+    def wait(self):
+        """等待直到可以发出下一次请求"""
+        if not self.interval:
+            return
+        
+        with self.lock:
+            now = time()
+            waitTime = self.nextTime - now
+            self.nextTime = max(now, self.nextTime) + self.interval
+        
+        if waitTime > 0:
+            sleep(waitTime)
+
 
 ########################################################################
 class DatayesApi(object):
-    """通联数据API"""
+    """通联数据API，可以在多个线程中同时使用"""
 
     #----------------------------------------------------------------------
     def __init__(self, token, 
-                 domain="http://api.wmcloud.com/data",
-                 version="v1"):
+                 domain=DATAYES_DOMAIN,
+                 version="v1",
+                 rateLimit=0,
+                 maxRetry=3,
+                 retryInterval=1.0):
         """Constructor"""
         self.domain = domain        # 主域名
         self.version = version      # API版本
@@ -26,14 +62,53 @@ class DatayesApi(object):
         self.header = {}            # http请求头部
         self.header['Connection'] = 'keep_alive'
         self.header['Authorization'] = 'Bearer ' + self.token                
+        
+        self.limiter = RateLimiter(rateLimit)   # 该主机的请求频率限制（每秒请求次数）
+        self.maxRetry = maxRetry                # 失败后的最大重试次数
+        self.retryInterval = retryInterval      # 第一次重试前的等待秒数，之后每次翻倍
+        
+        self.local = local()        # 每个线程使用自己的Session以复用连接
+    
+    #----------------------------------------------------------------------
+    def getSession(self):
+        """获取当前线程的Session"""
+        session = getattr(self.local, 'session', None)
+        if not session:
+            session = requests.Session()
+            session.headers.update(self.header)
+            self.local.session = session
+        return session
+    
+    #----------------------------------------------------------------------
+    def request(self, url, params):
+        """发出http请求，网络错误或服务器错误时按指数退避重试，返回Response，全部失败返回None"""
+        for n in range(self.maxRetry + 1):
+            if n:
+                sleep(self.retryInterval * 2 ** (n - 1))
+            
+            self.limiter.wait()
+            try:
+                r = self.getSession().get(url=url, params=params, timeout=30)
+            except requests.RequestException as e:
+                print u'http请求异常：%s' %e
+                continue
+            
+            if r.status_code not in RETRY_STATUS:
+                return r
+            print u'http请求失败，状态代码%s，准备重试' %r.status_code
+        
+        return None
     
     #----------------------------------------------------------------------
     def downloadData(self, path, params):
         """下载数据"""
         url = '/'.join([self.domain, self.version, path])
-        r = requests.get(url=url, headers=self.header, params=params)
+        r = self.request(url, params)
         
-        if r.status_code != HTTP_OK:
+        if r is None:
+            print u'http请求失败，重试次数已用完'
+            return None
+        elif r.status_code != HTTP_OK:
             print u'http请求失败，状态代码%s' %r.status_code
             return None
         else:
@@ -46,7 +121,3 @@ class DatayesApi(object):
                 elif 'message' in result:
                     print u'查询失败，返回信息%s' %result['message']
                 return None
-                    
-                    
-    
-    
\ No newline at end of file
@@ -73,6 +73,9 @@ class EventEngine(object):
         # __generalHandlers是一个列表，用来保存通用回调函数（所有事件均调用）
         self.__generalHandlers = []
         
+        # 延时追踪器，设置后在事件入队和出队时调用（见vnpy.trader.vtLatency）
+        self.__tracer = None
+        
     #----------------------------------------------------------------------
     def __run(self):
         """引擎运行"""
@@ -86,6 +89,9 @@ class EventEngine(object):
     #----------------------------------------------------------------------
     def __process(self, event):
         """处理事件"""
+        if self.__tracer:
+            self.__tracer.onEventProcess(event)
+        
         # 检查是否存在对该事件进行监听的处理函数
         if event.type_ in self.__handlers:
             # 若存在，则按顺序将事件传递给处理函数执行
@@ -163,8 +169,15 @@ class EventEngine(object):
     #----------------------------------------------------------------------
     def put(self, event):
         """向事件队列中存入事件"""
+        if self.__tracer:
+            self.__tracer.onEventPut(event)
         self.__queue.put(event)
         
+    #----------------------------------------------------------------------
+    def setTracer(self, tracer):
+        """设置延时追踪器，传入None则取消"""
+        self.__tracer = tracer
+        
     #----------------------------------------------------------------------
     def registerGeneralHandler(self, handler):
         """注册通用事件处理函数监听"""
@@ -207,7 +220,10 @@ class EventEngine2(object):
         self.__handlers = defaultdict(list)
         
         # __generalHandlers是一个列表，用来保存通用回调函数（所有事件均调用）
-        self.__generalHandlers = []        
+        self.__generalHandlers = []
+        
+        # 延时追踪器，设置后在事件入队和出队时调用（见vnpy.trader.vtLatency）
+        self.__tracer = None
         
     #----------------------------------------------------------------------
     def __run(self):
@@ -222,6 +238,9 @@ class EventEngine2(object):
     #----------------------------------------------------------------------
     def __process(self, event):
         """处理事件"""
+        if self.__tracer:
+            self.__tracer.onEventProcess(event)
+        
         # 检查是否存在对该事件进行监听的处理函数
         if event.type_ in self.__handlers:
             # 若存在，则按顺序将事件传递给处理函数执行
@@ -305,8 +324,15 @@ class EventEngine2(object):
     #----------------------------------------------------------------------
     def put(self, event):
         """向事件队列中存入事件"""
+        if self.__tracer:
+            self.__tracer.onEventPut(event)
         self.__queue.put(event)
 
+    #----------------------------------------------------------------------
+    def setTracer(self, tracer):
+        """设置延时追踪器，传入None则取消"""
+        self.__tracer = tracer
+        
     #----------------------------------------------------------------------
     def registerGeneralHandler(self, handler):
         """注册通用事件处理函数监听"""
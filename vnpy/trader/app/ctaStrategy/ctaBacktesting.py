@@ -8,9 +8,12 @@ from __future__ import division
 
 from datetime import datetime, timedelta
 from collections import OrderedDict
-from itertools import product
+from itertools import product, islice
 import multiprocessing
 import copy
+import cPickle
+import glob
+import os
 
 import pymongo
 import pandas as pd
@@ -28,8 +31,23 @@ from vnpy.trader.vtGlobal import globalSetting
 from vnpy.trader.vtObject import VtTickData, VtBarData
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtGateway import VtOrderData, VtTradeData
+from vnpy.trader.vtFunction import getTempPath
+from vnpy.trader.vtJournal import loadJournalData
+from vnpy.trader.vtHistoryStore import createHistoryStore, INCLUSIVE_DELTA
 
 from .ctaBase import *
+from .ctaResultStore import (ResultStore, getStrategyHash, getDataFingerprint, getInputKey,
+                             ENGINE_SETTING_KEYS)
+
+
+# 逐日统计中和逐笔统计同名的字段，保存统计结果时增加daily_前缀
+DAILY_PREFIXED_KEYS = ['totalCommission', 'totalSlippage', 'totalTurnover']
+
+# 回测断点中保存的引擎状态
+CHECKPOINT_KEYS = ['stopOrderCount', 'stopOrderDict', 'workingStopOrderDict',
+                   'limitOrderCount', 'limitOrderDict', 'workingLimitOrderDict',
+                   'tradeCount', 'tradeDict', 'logList', 
+                   'tick', 'bar', 'dt', 'dailyResultDict', 'dataCount']
 
 
 ########################################################################
@@ -70,10 +88,12 @@ class BacktestingEngine(object):
         
         self.dbClient = None        # 数据库客户端
         self.dbCursor = None        # 数据库指针
+        self.historyStore = None    # 历史数据存储，未设置时根据VT_setting.json创建
         
         self.initData = []          # 初始化用的数据
         self.dbName = ''            # 回测数据库名
         self.symbol = ''            # 回测集合名
+        self.journalPath = ''       # 行情记录本地日志文件的根目录，设置后从日志文件读取数据
         
         self.dataStartDate = None       # 回测数据开始日期，datetime对象
         self.dataEndDate = None         # 回测数据结束日期，datetime对象
@@ -95,6 +115,15 @@ class BacktestingEngine(object):
         
         # 日线回测结果计算用
         self.dailyResultDict = OrderedDict()
+        
+        # 回测结果缓存，用于跳过已经计算过的参数组合
+        self.resultStorePath = ''
+        self.resultStore = None
+        
+        # 回测断点，用于长时间回测的中断恢复和分叉
+        self.checkpointPath = ''        # 断点文件保存目录
+        self.checkpointInterval = 0     # 断点保存间隔（数据条数），0表示不保存
+        self.dataCount = 0              # 已回放的数据条数
     
     #------------------------------------------------
     # 通用功能
@@ -151,6 +180,23 @@ class BacktestingEngine(object):
         self.dbName = dbName
         self.symbol = symbol
     
+    #----------------------------------------------------------------------
+    def setJournalPath(self, journalPath):
+        """设置从行情记录的本地日志文件读取数据，数据库名和集合名仍然通过setDatabase设置"""
+        self.journalPath = journalPath
+    
+    #----------------------------------------------------------------------
+    def setHistoryStore(self, historyStore):
+        """设置历史数据存储（如本地列式文件LocalHistoryStore），不设置时根据VT_setting.json创建"""
+        self.historyStore = historyStore
+    
+    #----------------------------------------------------------------------
+    def getHistoryStore(self):
+        """获取历史数据存储"""
+        if not self.historyStore:
+            self.historyStore = createHistoryStore()
+        return self.historyStore
+    
     #----------------------------------------------------------------------
     def setCapital(self, capital):
         """设置资本金"""
@@ -175,6 +221,30 @@ class BacktestingEngine(object):
     def setPriceTick(self, priceTick):
         """设置价格最小变动"""
         self.priceTick = priceTick
+        
+    #----------------------------------------------------------------------
+    def setResultStore(self, path=''):
+        """启用回测结果缓存，优化时输入未变化的参数组合直接使用保存的结果"""
+        if not path:
+            path = getTempPath('BacktestingResult.db')
+        
+        self.resultStorePath = path
+        self.resultStore = ResultStore(path)
+        
+    #----------------------------------------------------------------------
+    def setCheckpoint(self, path='', interval=1000000):
+        """
+        启用回测断点，回放数据时每隔interval条数据保存一次断点
+        path：断点文件保存目录，为空则使用temp目录下的BacktestingCheckpoint
+        """
+        if not path:
+            path = getTempPath('BacktestingCheckpoint')
+        
+        if not os.path.exists(path):
+            os.makedirs(path)
+        
+        self.checkpointPath = path
+        self.checkpointInterval = interval
     
     #------------------------------------------------
     # 数据回放相关
@@ -183,9 +253,10 @@ class BacktestingEngine(object):
     #----------------------------------------------------------------------
     def loadHistoryData(self):
         """载入历史数据"""
-        self.dbClient = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
-        collection = self.dbClient[self.dbName][self.symbol]          
-
+        if self.journalPath:
+            self.loadJournalHistoryData()
+            return
+        
         self.output(u'开始载入数据')
       
         # 首先根据回测模式，确认要使用的数据类
@@ -197,43 +268,67 @@ class BacktestingEngine(object):
             func = self.newTick
 
         # 载入初始化需要用的数据
-        flt = {'datetime':{'$gte':self.dataStartDate,
-                           '$lt':self.strategyStartDate}}        
-        initCursor = collection.find(flt).sort('datetime')
-        
-        # 将数据从查询指针中读取出，并生成列表
         self.initData = []              # 清空initData列表
-        for d in initCursor:
+        for d in self.getHistoryStore().loadRange(self.dbName, self.symbol, 
+                                                  self.dataStartDate, self.strategyStartDate):
             data = dataClass()
             data.__dict__ = d
             self.initData.append(data)      
         
-        # 载入回测数据
+        # 载入回测数据，回放时才逐条读取
         if not self.dataEndDate:
-            flt = {'datetime':{'$gte':self.strategyStartDate}}   # 数据过滤条件
+            end = None
         else:
-            flt = {'datetime':{'$gte':self.strategyStartDate,
-                               '$lte':self.dataEndDate}}  
-        self.dbCursor = collection.find(flt).sort('datetime')
+            end = self.dataEndDate + INCLUSIVE_DELTA
+        self.dbCursor = self.getHistoryStore().loadRange(self.dbName, self.symbol, 
+                                                         self.strategyStartDate, end)
         
-        self.output(u'载入完成，数据量：%s' %(initCursor.count() + self.dbCursor.count()))
+        self.output(u'载入完成，初始化数据量：%s' %len(self.initData))
         
     #----------------------------------------------------------------------
-    def runBacktesting(self):
-        """运行回测"""
-        # 载入历史数据
-        self.loadHistoryData()
+    def loadJournalHistoryData(self):
+        """从行情记录的本地日志文件载入历史数据"""
+        self.output(u'开始从日志文件载入数据')
         
-        # 首先根据回测模式，确认要使用的数据类
         if self.mode == self.BAR_MODE:
             dataClass = VtBarData
-            func = self.newBar
         else:
             dataClass = VtTickData
-            func = self.newTick
-
+        
+        dataList = loadJournalData(self.journalPath, self.dbName, self.symbol,
+                                   self.dataStartDate, self.dataEndDate)
+        
+        self.initData = []
+        n = 0
+        for d in dataList:
+            if d['datetime'] >= self.strategyStartDate:
+                break
+            data = dataClass()
+            data.__dict__ = d
+            self.initData.append(data)
+            n += 1
+        
+        self.dbCursor = dataList[n:]
+        
+        self.output(u'载入完成，数据量：%s' %len(dataList))
+        
+    #----------------------------------------------------------------------
+    def runBacktesting(self):
+        """运行回测"""
+        # 载入历史数据
+        self.loadHistoryData()
+        
         self.output(u'开始回测')
+        self.startStrategy()
+        
+        self.output(u'开始回放数据')
+        self.dataCount = 0
+        self.replayData()
+        self.output(u'数据回放结束')
         
+    #----------------------------------------------------------------------
+    def startStrategy(self):
+        """初始化并启动策略"""
         self.strategy.inited = True
         self.strategy.onInit()
         self.output(u'策略初始化完成')
@@ -242,14 +337,31 @@ class BacktestingEngine(object):
         self.strategy.onStart()
         self.output(u'策略启动完成')
         
-        self.output(u'开始回放数据')
-
+    #----------------------------------------------------------------------
+    def replayData(self):
+        """回放回测数据，启用断点时每隔一定数据条数保存一次断点"""
+        # 首先根据回测模式，确认要使用的数据类
+        if self.mode == self.BAR_MODE:
+            dataClass = VtBarData
+            func = self.newBar
+        else:
+            dataClass = VtTickData
+            func = self.newTick
+        
+        interval = self.checkpointInterval
+        count = self.dataCount
+        
         for d in self.dbCursor:
             data = dataClass()
             data.__dict__ = d
-            func(data)     
+            func(data)
             
-        self.output(u'数据回放结束')
+            count += 1
+            if interval and not count % interval:
+                self.dataCount = count
+                self.saveCheckpoint()
+        
+        self.dataCount = count
         
     #----------------------------------------------------------------------
     def newBar(self, bar):
@@ -538,8 +650,20 @@ class BacktestingEngine(object):
     
     #----------------------------------------------------------------------
     def loadBar(self, dbName, collectionName, startDate):
-        """直接返回初始化数据列表中的Bar"""
-        return self.initData
+        """
+        读取策略默认的K线数据库时直接返回初始化数据列表中的Bar，
+        读取其他周期的数据库时（见CtaTemplate.loadBar），从数据库读取初始化时间段内的K线
+        """
+        if dbName in (self.dbName, self.strategy.barDbName):
+            return self.initData
+        
+        l = []
+        for d in self.getHistoryStore().loadRange(dbName, collectionName, 
+                                                  self.dataStartDate, self.strategyStartDate):
+            bar = VtBarData()
+            bar.__dict__ = d
+            l.append(bar)
+        return l
     
     #----------------------------------------------------------------------
     def loadTick(self, dbName, collectionName, startDate):
@@ -563,6 +687,116 @@ class BacktestingEngine(object):
         for stopOrderID in self.workingStopOrderDict.keys():
             self.cancelStopOrder(stopOrderID)
 
+    #------------------------------------------------
+    # 断点保存相关
+    #------------------------------------------------
+    
+    #----------------------------------------------------------------------
+    def getCheckpointSetting(self):
+        """获取断点对应的数据和引擎设置，用于恢复时检查"""
+        d = self.getEngineSetting()
+        d['dbName'] = self.dbName
+        d['symbol'] = self.symbol
+        return d
+    
+    #----------------------------------------------------------------------
+    def getCheckpointState(self):
+        """获取断点状态字典（引擎状态、数据回放位置和策略状态）"""
+        state = {k: getattr(self, k) for k in CHECKPOINT_KEYS}
+        state['setting'] = self.getCheckpointSetting()
+        state['strategy'] = self.strategy.getCheckpointState()
+        return state
+    
+    #----------------------------------------------------------------------
+    def saveCheckpoint(self, path=''):
+        """保存回测断点，返回断点文件路径"""
+        if not path:
+            if not self.checkpointPath:
+                self.setCheckpoint(interval=self.checkpointInterval)
+            path = os.path.join(self.checkpointPath, 'checkpoint_%012d.pkl' %self.dataCount)
+        
+        # 停止单中保存了策略对象的引用，保存时暂时去除
+        soList = self.stopOrderDict.values()
+        for so in soList:
+            so.strategy = None
+        
+        try:
+            state = self.getCheckpointState()
+            
+            # 先写入临时文件再重命名，避免进程中断时留下不完整的断点
+            tempPath = path + '.tmp'
+            with open(tempPath, 'wb') as f:
+                cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+            
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tempPath, path)
+        finally:
+            for so in soList:
+                so.strategy = self.strategy
+        
+        self.output(u'保存回测断点：%s，已回放数据量：%s' %(path, self.dataCount))
+        return path
+    
+    #----------------------------------------------------------------------
+    def loadCheckpoint(self, path):
+        """
+        读取回测断点
+        path：断点文件路径，或断点目录（使用其中最新的断点）
+        """
+        if os.path.isdir(path):
+            fileList = sorted(glob.glob(os.path.join(path, 'checkpoint_*.pkl')))
+            if not fileList:
+                raise IOError(u'断点目录中没有断点文件：%s' %path)
+            path = fileList[-1]
+        
+        with open(path, 'rb') as f:
+            state = cPickle.load(f)
+        
+        self.output(u'读取回测断点：%s' %path)
+        return state
+    
+    #----------------------------------------------------------------------
+    def restoreCheckpoint(self, state):
+        """恢复断点中的引擎状态和策略状态"""
+        for k in CHECKPOINT_KEYS:
+            setattr(self, k, state[k])
+        
+        for so in self.stopOrderDict.values():
+            so.strategy = self.strategy
+        
+        self.strategy.setCheckpointState(state['strategy'])
+    
+    #----------------------------------------------------------------------
+    def resumeBacktesting(self, path):
+        """
+        从断点恢复回测
+        path：断点文件路径，或断点目录（使用其中最新的断点）
+        恢复前需要先调用initStrategy创建策略，使用和断点时不同的参数即可从断点分叉运行
+        """
+        state = self.loadCheckpoint(path)
+        
+        if state['setting'] != self.getCheckpointSetting():
+            self.output(u'注意：引擎设置和断点不一致，断点设置：%s' %state['setting'])
+        
+        # 载入历史数据
+        self.loadHistoryData()
+        
+        # 策略正常初始化后，使用断点中的状态覆盖
+        self.output(u'开始回测')
+        self.startStrategy()
+        self.restoreCheckpoint(state)
+        
+        # 跳过断点前已经回放的数据
+        if isinstance(self.dbCursor, pymongo.cursor.Cursor):
+            self.dbCursor = self.dbCursor.skip(self.dataCount)
+        else:
+            self.dbCursor = islice(self.dbCursor, self.dataCount, None)
+        
+        self.output(u'从断点恢复，开始回放数据，跳过数据量：%s' %self.dataCount)
+        self.replayData()
+        self.output(u'数据回放结束')
+
     #------------------------------------------------
     # 结果计算相关
     #------------------------------------------------      
@@ -575,6 +809,21 @@ class BacktestingEngine(object):
         self.output(u'计算回测结果')
         
         # 首先基于回测后的成交记录，计算每笔交易的盈亏
+        if self.mode == self.BAR_MODE:
+            endPrice = self.bar.close
+        else:
+            endPrice = self.tick.lastPrice
+        
+        resultList, posList, tradeTimeList = self.matchTrades(self.tradeDict.values(), endPrice, 
+                                                              self.size, self.rate, self.slippage)
+        return self.summarizeTradingResult(resultList, posList, tradeTimeList)
+    
+    #----------------------------------------------------------------------
+    def matchTrades(self, tradeList, endPrice, size, rate, slippage):
+        """
+        按先开先平的顺序配对开平仓成交，计算每笔交易的盈亏，
+        到最后尚未平仓的交易以endPrice平仓，返回(交易结果列表, 持仓列表, 时间戳列表)
+        """
         resultList = []             # 交易结果列表
         
         longTrade = []              # 未平仓的多头交易
@@ -583,7 +832,7 @@ class BacktestingEngine(object):
         tradeTimeList = []          # 每笔成交时间戳
         posList = [0]               # 每笔成交后的持仓情况        
 
-        for trade in self.tradeDict.values():
+        for trade in tradeList:
             # 复制成交对象，因为下面的开平仓交易配对涉及到对成交数量的修改
             # 若不进行复制直接操作，则计算完后所有成交的数量会变成0
             trade = copy.copy(trade)
@@ -603,7 +852,7 @@ class BacktestingEngine(object):
                         closedVolume = min(exitTrade.volume, entryTrade.volume)
                         result = TradingResult(entryTrade.price, entryTrade.dt, 
                                                exitTrade.price, exitTrade.dt,
-                                               -closedVolume, self.rate, self.slippage, self.size)
+                                               -closedVolume, rate, slippage, size)
                         resultList.append(result)
                         
                         posList.extend([-1,0])
@@ -647,7 +896,7 @@ class BacktestingEngine(object):
                         closedVolume = min(exitTrade.volume, entryTrade.volume)
                         result = TradingResult(entryTrade.price, entryTrade.dt, 
                                                exitTrade.price, exitTrade.dt,
-                                               closedVolume, self.rate, self.slippage, self.size)
+                                               closedVolume, rate, slippage, size)
                         resultList.append(result)
                         
                         posList.extend([1,0])
@@ -677,21 +926,21 @@ class BacktestingEngine(object):
                                 pass                    
         
         # 到最后交易日尚未平仓的交易，则以最后价格平仓
-        if self.mode == self.BAR_MODE:
-            endPrice = self.bar.close
-        else:
-            endPrice = self.tick.lastPrice
-            
         for trade in longTrade:
             result = TradingResult(trade.price, trade.dt, endPrice, self.dt, 
-                                   trade.volume, self.rate, self.slippage, self.size)
+                                   trade.volume, rate, slippage, size)
             resultList.append(result)
             
         for trade in shortTrade:
             result = TradingResult(trade.price, trade.dt, endPrice, self.dt, 
-                                   -trade.volume, self.rate, self.slippage, self.size)
+                                   -trade.volume, rate, slippage, size)
             resultList.append(result)            
         
+        return resultList, posList, tradeTimeList
+    
+    #----------------------------------------------------------------------
+    def summarizeTradingResult(self, resultList, posList, tradeTimeList):
+        """基于每笔交易的结果计算资金曲线、最大回撤等统计数据"""
         # 检查是否有交易
         if not resultList:
             self.output(u'无交易结果')
@@ -772,6 +1021,7 @@ class BacktestingEngine(object):
         d['profitLossRatio'] = profitLossRatio
         d['posList'] = posList
         d['tradeTimeList'] = tradeTimeList
+        d['resultList'] = resultList
         
         return d
         
@@ -845,6 +1095,62 @@ class BacktestingEngine(object):
         self.tradeCount = 0
         self.tradeDict.clear()
         
+        # 清空逐日结果
+        self.dailyResultDict.clear()
+        
+        # 清空数据回放位置
+        self.dataCount = 0
+        
+    #----------------------------------------------------------------------
+    def getEngineSetting(self):
+        """获取影响回测结果的引擎参数"""
+        return {k: getattr(self, k) for k in ENGINE_SETTING_KEYS}
+    
+    #----------------------------------------------------------------------
+    def getResultKeyList(self, strategyClass, settingList):
+        """计算每个参数组合的回测输入键"""
+        strategyHash = getStrategyHash(strategyClass)
+        dataFingerprint = getDataFingerprint(self.dbName, self.symbol, 
+                                             self.dataStartDate, self.dataEndDate,
+                                             self.getHistoryStore())
+        engineSetting = self.getEngineSetting()
+        
+        return [getInputKey(strategyHash, setting, engineSetting, dataFingerprint)
+                for setting in settingList]
+    
+    #----------------------------------------------------------------------
+    def calculateResultStatistics(self):
+        """计算回测统计结果（逐笔统计和逐日统计中的数值部分），用于保存和优化"""
+        result = OrderedDict()
+        
+        d = self.calculateBacktestingResult()
+        for k, v in d.items():
+            if not isinstance(v, list):
+                result[k] = v
+        
+        if self.dailyResultDict:
+            df = self.calculateDailyResult()
+            df, d = self.calculateDailyStatistics(df)
+            self.mergeDailyStatistics(result, d)
+        
+        # 将numpy类型转换为Python原生类型，便于保存为JSON
+        for k, v in result.items():
+            if isinstance(v, np.generic):
+                result[k] = v.item()
+        
+        return result
+        
+    #----------------------------------------------------------------------
+    def mergeDailyStatistics(self, result, d):
+        """
+        将逐日统计结果合并到result中，和逐笔统计同名的字段（手续费、滑点、成交金额）
+        增加daily_前缀保存，原字段名保持逐笔统计的含义
+        """
+        for k, v in d.items():
+            if k in DAILY_PREFIXED_KEYS:
+                k = 'daily_' + k
+            result[k] = v
+        
     #----------------------------------------------------------------------
     def runOptimization(self, strategyClass, optimizationSetting):
         """优化参数"""
@@ -856,15 +1162,35 @@ class BacktestingEngine(object):
         if not settingList or not targetName:
             self.output(u'优化设置有问题，请检查')
         
+        # 计算回测输入键
+        if self.resultStore:
+            keyList = self.getResultKeyList(strategyClass, settingList)
+        else:
+            keyList = [''] * len(settingList)
+        
         # 遍历优化
         resultList = []
-        for setting in settingList:
-            self.clearBacktestingResult()
+        cachedCount = 0
+        for setting, key in zip(settingList, keyList):
             self.output('-' * 30)
             self.output('setting: %s' %str(setting))
-            self.initStrategy(strategyClass, setting)
-            self.runBacktesting()
-            d = self.calculateBacktestingResult()
+            
+            d = None
+            if key:
+                d = self.resultStore.getResult(key)
+            
+            if d is not None:
+                cachedCount += 1
+                self.output(u'使用已保存的回测结果')
+            else:
+                self.clearBacktestingResult()
+                self.initStrategy(strategyClass, setting)
+                self.runBacktesting()
+                d = self.calculateResultStatistics()
+                
+                if key:
+                    self.resultStore.saveResult(key, strategyClass.__name__, d)
+            
             try:
                 targetValue = d[targetName]
             except KeyError:
@@ -874,10 +1200,12 @@ class BacktestingEngine(object):
         # 显示结果
         resultList.sort(reverse=True, key=lambda result:result[1])
         self.output('-' * 30)
+        if self.resultStore:
+            self.output(u'使用已保存结果的参数组合：%s/%s' %(cachedCount, len(settingList)))
         self.output(u'优化结果：')
         for result in resultList:
             self.output(u'%s: %s' %(result[0], result[1]))
-        return result
+        return resultList
             
     #----------------------------------------------------------------------
     def runParallelOptimization(self, strategyClass, optimizationSetting):
@@ -890,26 +1218,61 @@ class BacktestingEngine(object):
         if not settingList or not targetName:
             self.output(u'优化设置有问题，请检查')
         
+        # 计算回测输入键，已保存结果的参数组合无需启动子进程计算
+        resultList = []
+        runList = []
+        
+        if self.resultStore:
+            keyList = self.getResultKeyList(strategyClass, settingList)
+        else:
+            keyList = [''] * len(settingList)
+        
+        for setting, key in zip(settingList, keyList):
+            d = None
+            if key:
+                d = self.resultStore.getResult(key)
+            
+            if d is None:
+                runList.append((setting, key))
+                continue
+            
+            try:
+                targetValue = d[targetName]
+            except KeyError:
+                targetValue = 0
+            resultList.append((str(setting), targetValue))
+        
+        if self.resultStore:
+            self.output(u'使用已保存结果的参数组合：%s/%s' %(len(resultList), len(settingList)))
+        
         # 多进程优化，启动一个对应CPU核心数量的进程池
         pool = multiprocessing.Pool(multiprocessing.cpu_count())
         l = []
 
-        for setting in settingList:
+        for setting, key in runList:
             l.append(pool.apply_async(optimize, (strategyClass, setting,
                                                  targetName, self.mode, 
                                                  self.startDate, self.initDays, self.endDate,
                                                  self.slippage, self.rate, self.size, self.priceTick,
-                                                 self.dbName, self.symbol)))
+                                                 self.dbName, self.symbol,
+                                                 self.capital, self.resultStorePath, key,
+                                                 self.getOptimizeEngineClass())))
         pool.close()
         pool.join()
         
         # 显示结果
-        resultList = [res.get() for res in l]
+        resultList.extend([res.get() for res in l])
         resultList.sort(reverse=True, key=lambda result:result[1])
         self.output('-' * 30)
         self.output(u'优化结果：')
         for result in resultList:
             self.output(u'%s: %s' %(result[0], result[1]))    
+        return resultList
+    
+    #----------------------------------------------------------------------
+    def getOptimizeEngineClass(self):
+        """并行优化时子进程中创建的回测引擎类"""
+        return BacktestingEngine
 
     #----------------------------------------------------------------------
     def updateDailyClose(self, dt, price):
@@ -926,7 +1289,10 @@ class BacktestingEngine(object):
         """计算按日统计的交易结果"""
         self.output(u'计算按日统计结果')
         
-        # 将成交添加到每日交易结果中
+        # 将成交添加到每日交易结果中（先清空，以便重复调用时结果一致）
+        for dailyResult in self.dailyResultDict.values():
+            dailyResult.tradeList = []
+        
         for trade in self.tradeDict.values():
             date = trade.dt.date()
             dailyResult = self.dailyResultDict[date]
@@ -956,11 +1322,8 @@ class BacktestingEngine(object):
         return resultDf
     
     #----------------------------------------------------------------------
-    def showDailyResult(self, df=None):
-        """显示按日统计的交易结果"""
-        if df is None:
-            df = self.calculateDailyResult()
-
+    def calculateDailyStatistics(self, df):
+        """基于按日统计的交易结果，计算资金曲线和统计指标，返回(df, 统计字典)"""
         df['balance'] = df['netPnl'].cumsum() + self.capital
         df['return'] = (np.log(df['balance']) - np.log(df['balance'].shift(1))).fillna(0)
         df['highlevel'] = df['balance'].rolling(min_periods=1,window=len(df),center=False).max()
@@ -1001,36 +1364,70 @@ class BacktestingEngine(object):
         else:
             sharpeRatio = 0
         
+        # 返回统计结果
+        d = OrderedDict()
+        d['startDate'] = startDate
+        d['endDate'] = endDate
+        d['totalDays'] = totalDays
+        d['profitDays'] = profitDays
+        d['lossDays'] = lossDays
+        d['endBalance'] = endBalance
+        d['maxDrawdown'] = maxDrawdown
+        d['totalNetPnl'] = totalNetPnl
+        d['dailyNetPnl'] = dailyNetPnl
+        d['totalCommission'] = totalCommission
+        d['dailyCommission'] = dailyCommission
+        d['totalSlippage'] = totalSlippage
+        d['dailySlippage'] = dailySlippage
+        d['totalTurnover'] = totalTurnover
+        d['dailyTurnover'] = dailyTurnover
+        d['totalTradeCount'] = totalTradeCount
+        d['dailyTradeCount'] = dailyTradeCount
+        d['totalReturn'] = totalReturn
+        d['dailyReturn'] = dailyReturn
+        d['returnStd'] = returnStd
+        d['sharpeRatio'] = sharpeRatio
+        
+        return df, d
+    
+    #----------------------------------------------------------------------
+    def showDailyResult(self, df=None):
+        """显示按日统计的交易结果"""
+        if df is None:
+            df = self.calculateDailyResult()
+        
+        df, d = self.calculateDailyStatistics(df)
+        
         # 输出统计结果
         self.output('-' * 30)
-        self.output(u'首个交易日：\t%s' % startDate)
-        self.output(u'最后交易日：\t%s' % endDate)
+        self.output(u'首个交易日：\t%s' % d['startDate'])
+        self.output(u'最后交易日：\t%s' % d['endDate'])
         
-        self.output(u'总交易日：\t%s' % totalDays)
-        self.output(u'盈利交易日\t%s' % profitDays)
-        self.output(u'亏损交易日：\t%s' % lossDays)
+        self.output(u'总交易日：\t%s' % d['totalDays'])
+        self.output(u'盈利交易日\t%s' % d['profitDays'])
+        self.output(u'亏损交易日：\t%s' % d['lossDays'])
         
         self.output(u'起始资金：\t%s' % self.capital)
-        self.output(u'结束资金：\t%s' % formatNumber(endBalance))
+        self.output(u'结束资金：\t%s' % formatNumber(d['endBalance']))
     
-        self.output(u'总收益率：\t%s' % formatNumber(totalReturn))
-        self.output(u'总盈亏：\t%s' % formatNumber(totalNetPnl))
-        self.output(u'最大回撤: \t%s' % formatNumber(maxDrawdown))      
+        self.output(u'总收益率：\t%s' % formatNumber(d['totalReturn']))
+        self.output(u'总盈亏：\t%s' % formatNumber(d['totalNetPnl']))
+        self.output(u'最大回撤: \t%s' % formatNumber(d['maxDrawdown']))      
         
-        self.output(u'总手续费：\t%s' % formatNumber(totalCommission))
-        self.output(u'总滑点：\t%s' % formatNumber(totalSlippage))
-        self.output(u'总成交金额：\t%s' % formatNumber(totalTurnover))
-        self.output(u'总成交笔数：\t%s' % formatNumber(totalTradeCount))
+        self.output(u'总手续费：\t%s' % formatNumber(d['totalCommission']))
+        self.output(u'总滑点：\t%s' % formatNumber(d['totalSlippage']))
+        self.output(u'总成交金额：\t%s' % formatNumber(d['totalTurnover']))
+        self.output(u'总成交笔数：\t%s' % formatNumber(d['totalTradeCount']))
         
-        self.output(u'日均盈亏：\t%s' % formatNumber(dailyNetPnl))
-        self.output(u'日均手续费：\t%s' % formatNumber(dailyCommission))
-        self.output(u'日均滑点：\t%s' % formatNumber(dailySlippage))
-        self.output(u'日均成交金额：\t%s' % formatNumber(dailyTurnover))
-        self.output(u'日均成交笔数：\t%s' % formatNumber(dailyTradeCount))
+        self.output(u'日均盈亏：\t%s' % formatNumber(d['dailyNetPnl']))
+        self.output(u'日均手续费：\t%s' % formatNumber(d['dailyCommission']))
+        self.output(u'日均滑点：\t%s' % formatNumber(d['dailySlippage']))
+        self.output(u'日均成交金额：\t%s' % formatNumber(d['dailyTurnover']))
+        self.output(u'日均成交笔数：\t%s' % formatNumber(d['dailyTradeCount']))
         
-        self.output(u'日均收益率：\t%s%%' % formatNumber(dailyReturn))
-        self.output(u'收益标准差：\t%s%%' % formatNumber(returnStd))
-        self.output(u'Sharpe Ratio：\t%s' % formatNumber(sharpeRatio))
+        self.output(u'日均收益率：\t%s%%' % formatNumber(d['dailyReturn']))
+        self.output(u'收益标准差：\t%s%%' % formatNumber(d['returnStd']))
+        self.output(u'Sharpe Ratio：\t%s' % formatNumber(d['sharpeRatio']))
         
         # 绘图
         fig = plt.figure(figsize=(10, 16))
@@ -1123,6 +1520,10 @@ class DailyResult(object):
         
         # 交易部分
         self.tradeCount = len(self.tradeList)
+        self.tradingPnl = 0
+        self.turnover = 0
+        self.commission = 0
+        self.slippage = 0
         
         for trade in self.tradeList:
             if trade.direction == DIRECTION_LONG:
@@ -1211,21 +1612,43 @@ def formatNumber(n):
 def optimize(strategyClass, setting, targetName,
              mode, startDate, initDays, endDate,
              slippage, rate, size, priceTick,
-             dbName, symbol):
-    """多进程优化时跑在每个进程中运行的函数"""
-    engine = BacktestingEngine()
-    engine.setBacktestingMode(mode)
-    engine.setStartDate(startDate, initDays)
-    engine.setEndDate(endDate)
-    engine.setSlippage(slippage)
-    engine.setRate(rate)
-    engine.setSize(size)
-    engine.setPriceTick(priceTick)
-    engine.setDatabase(dbName, symbol)
+             dbName, symbol,
+             capital=1000000, storePath='', resultKey='', engineClass=None):
+    """
+    多进程优化时跑在每个进程中运行的函数
+    传入storePath和resultKey时，优先使用回测结果缓存中保存的结果，
+    未找到时运行回测并将结果保存到缓存中
+    engineClass为运行回测的引擎类，默认为BacktestingEngine
+    """
+    store = None
+    if storePath and resultKey:
+        store = ResultStore(storePath)
+        d = store.getResult(resultKey)
+    else:
+        d = None
+    
+    if d is None:
+        engine = (engineClass or BacktestingEngine)()
+        engine.setBacktestingMode(mode)
+        engine.setStartDate(startDate, initDays)
+        engine.setEndDate(endDate)
+        engine.setCapital(capital)
+        engine.setSlippage(slippage)
+        engine.setRate(rate)
+        engine.setSize(size)
+        engine.setPriceTick(priceTick)
+        engine.setDatabase(dbName, symbol)
+        
+        engine.initStrategy(strategyClass, setting)
+        engine.runBacktesting()
+        d = engine.calculateResultStatistics()
+        
+        if store:
+            store.saveResult(resultKey, strategyClass.__name__, d)
+    
+    if store:
+        store.close()
     
-    engine.initStrategy(strategyClass, setting)
-    engine.runBacktesting()
-    d = engine.calculateBacktestingResult()
     try:
         targetValue = d[targetName]
     except KeyError:
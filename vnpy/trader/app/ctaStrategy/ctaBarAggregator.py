@@ -0,0 +1,257 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了高周期K线的增量合成服务BarAggregator：
+1. 从1分钟K线数据库读取数据，按照交易时段（TradingSession）合成N分钟、N小时和交易日K线，
+   K线的切分规则和BarGenerator.updateBar完全一致（夜盘、午休、跨午夜的时段均可正确处理）
+2. 合成结果保存到各周期对应的数据库（见getBarDbName），集合名和1分钟K线相同，
+   策略设置barDbName、回测引擎调用setDatabase即可直接读取对应周期的K线
+3. 每个合成任务在数据库中保存水位（最后一根合成K线的第一根1分钟K线的时间），
+   再次运行时只读取水位之后的1分钟K线，重新合成最后一根（可能尚未走完的）K线及之后的K线
+4. K线的datetime为该周期在交易时段中的开始时间（和BarGenerator一致），尚未走完的K线
+   保存时finished字段为False，CtaTemplate.loadBar读取时会将其过滤
+5. 使用numpy计算时段位置，pandas按照(交易日, K线序号)分组聚合，不逐根回放K线
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient, ASCENDING, ReplaceOne
+
+from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtObject import VtBarData
+
+from .ctaBase import SETTING_DB_NAME, MINUTE_DB_NAME
+from .ctaBarGenerator import (TradingSession, getSessionName, getBarDbName,
+                              INTERVAL_MINUTE, INTERVAL_DAILY, INTERVAL_SECONDS)
+
+
+# 保存合成水位的集合
+WATERMARK_COLLECTION_NAME = 'BarAggregatorWatermark'
+
+# 从1分钟K线读取的字段
+MINUTE_FIELDS = ['datetime', 'open', 'high', 'low', 'close', 'volume', 'openInterest']
+
+# 分组聚合的方式
+AGG_DICT = {
+    'datetime': 'first',
+    'tradingDay': 'first',
+    'index': 'first',
+    'elapsed': 'last',
+    'open': 'first',
+    'high': 'max',
+    'low': 'min',
+    'close': 'last',
+    'volume': 'sum',
+    'openInterest': 'last'
+}
+
+
+########################################################################
+class AggregateTask(object):
+    """单个合约、单个周期的合成任务"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, symbol, interval, window, session):
+        """Constructor"""
+        self.symbol = symbol
+        self.interval = interval
+        self.window = window
+        self.session = session
+        self.dbName = getBarDbName(interval, window)
+
+        if interval == INTERVAL_DAILY:
+            self.seconds = 0
+        else:
+            self.seconds = INTERVAL_SECONDS[interval] * window
+
+
+########################################################################
+class BarAggregator(object):
+    """
+    高周期K线增量合成服务
+
+    使用方法：
+    aggregator = BarAggregator()
+    aggregator.addTask('rb0000', INTERVAL_MINUTE, 15)
+    aggregator.addTask('rb0000', INTERVAL_DAILY)
+    aggregator.processAll()     # 可以定期调用
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, dbClient=None):
+        """Constructor"""
+        if not dbClient:
+            dbClient = MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
+        self.dbClient = dbClient
+
+        self.taskList = []
+
+        # 写入的K线数据模板
+        self.barTemplate = VtBarData().__dict__
+
+    #----------------------------------------------------------------------
+    def addTask(self, symbol, interval, window=1, session=None):
+        """增加合成任务，session为None时根据合约品种选择交易时段模板，未知品种按全天交易处理"""
+        if interval == INTERVAL_MINUTE and window == 1:
+            return
+
+        if session is None:
+            sessionName = getSessionName(symbol)
+            if sessionName:
+                session = TradingSession.fromTemplate(sessionName)
+            else:
+                session = TradingSession()
+
+        self.taskList.append(AggregateTask(symbol, interval, window, session))
+
+    #----------------------------------------------------------------------
+    def getWatermark(self, task):
+        """读取合成水位，尚未合成过返回None"""
+        collection = self.dbClient[SETTING_DB_NAME][WATERMARK_COLLECTION_NAME]
+        d = collection.find_one({'dbName': task.dbName, 'collectionName': task.symbol})
+        if d:
+            return d['datetime']
+        return None
+
+    #----------------------------------------------------------------------
+    def setWatermark(self, task, dt):
+        """保存合成水位"""
+        collection = self.dbClient[SETTING_DB_NAME][WATERMARK_COLLECTION_NAME]
+        flt = {'dbName': task.dbName, 'collectionName': task.symbol}
+        d = {'dbName': task.dbName, 'collectionName': task.symbol, 'datetime': dt}
+        collection.replace_one(flt, d, upsert=True)
+
+    #----------------------------------------------------------------------
+    def loadMinuteBars(self, symbol, watermark):
+        """读取水位之后的1分钟K线，返回DataFrame"""
+        flt = {}
+        if watermark:
+            flt = {'datetime': {'$gte': watermark}}
+
+        projection = {'_id': False}
+        for field in MINUTE_FIELDS + ['vtSymbol', 'symbol', 'exchange']:
+            projection[field] = True
+
+        collection = self.dbClient[MINUTE_DB_NAME][symbol]
+        dataList = list(collection.find(flt, projection).sort('datetime', ASCENDING))
+        return pd.DataFrame(dataList)
+
+    #----------------------------------------------------------------------
+    def aggregate(self, task, df):
+        """
+        将1分钟K线合成为任务周期的K线，返回DataFrame，datetime列为每根K线第一根1分钟K线的时间，
+        index列为K线在交易日内的序号，finished列为K线是否已经走完
+        """
+        df = df.reindex(columns=MINUTE_FIELDS).fillna(0)
+
+        tradingDay, elapsed = task.session.locateArray(df['datetime'].values)
+        if task.seconds:
+            index = elapsed // task.seconds
+        else:
+            index = np.zeros(len(df), dtype=np.int64)
+
+        # 和BarGenerator逐根合成的逻辑一致，(交易日, K线序号)变化时开始新的K线
+        df['tradingDay'] = tradingDay
+        df['index'] = index
+        df['elapsed'] = elapsed
+        key = tradingDay.astype(np.int64) * 1000000 + index
+        changed = np.ones(len(key), dtype=bool)
+        changed[1:] = key[1:] != key[:-1]
+        result = df.groupby(np.cumsum(changed), sort=False).agg(AGG_DICT)
+
+        # 和BarGenerator.updateBar一致，最后一根1分钟K线结束于周期末尾或交易日收盘时K线走完，
+        # 之后已有数据的K线也视为走完（如数据缺失），因此只有最后一根K线可能尚未走完
+        barEnd = result['elapsed'].values + 60
+        finished = barEnd >= task.session.totalSeconds
+        if task.seconds:
+            finished |= barEnd % task.seconds == 0
+        finished[:-1] = True
+        result['finished'] = finished
+        return result
+
+    #----------------------------------------------------------------------
+    def saveBars(self, task, result, first):
+        """保存合成的K线，first为1分钟K线中的第一条数据，用于获取合约代码等信息"""
+        collection = self.dbClient[task.dbName][task.symbol]
+        collection.create_index([('datetime', ASCENDING)])
+
+        # K线时间戳为周期在交易时段中的开始时间
+        dayList = [dt.to_pydatetime() for dt in pd.to_datetime(result['tradingDay'])]
+        if task.interval == INTERVAL_DAILY:
+            dtList = dayList
+        else:
+            dtList = [task.session.toDatetime(day, index * task.seconds)
+                      for day, index in zip(dayList, result['index'].tolist())]
+
+        requests = []
+        for dt, o, h, l, c, v, oi, finished in zip(dtList,
+                                                   result['open'].tolist(),
+                                                   result['high'].tolist(),
+                                                   result['low'].tolist(),
+                                                   result['close'].tolist(),
+                                                   result['volume'].tolist(),
+                                                   result['openInterest'].tolist(),
+                                                   result['finished'].tolist()):
+
+            d = self.barTemplate.copy()
+            d['vtSymbol'] = first.get('vtSymbol', task.symbol)
+            d['symbol'] = first.get('symbol', task.symbol)
+            d['exchange'] = first.get('exchange', '')
+            d['open'] = o
+            d['high'] = h
+            d['low'] = l
+            d['close'] = c
+            d['volume'] = v
+            d['openInterest'] = oi
+            d['datetime'] = dt
+            d['date'] = dt.strftime('%Y%m%d')
+            d['time'] = '%02d:%02d:%02d.000000' %(dt.hour, dt.minute, dt.second)
+            d['finished'] = finished
+
+            requests.append(ReplaceOne({'datetime': dt}, d, upsert=True))
+
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+
+    #----------------------------------------------------------------------
+    def processTask(self, task, df):
+        """执行合成任务，df为从水位开始的1分钟K线，返回本次写入的K线数量"""
+        if df.empty:
+            return 0
+
+        first = df.iloc[0].to_dict()
+        result = self.aggregate(task, df)
+        self.saveBars(task, result, first)
+
+        # 最后一根K线可能尚未走完，下次从它的第一根1分钟K线开始重新合成
+        lastDatetime = pd.Timestamp(result['datetime'].iloc[-1]).to_pydatetime()
+        self.setWatermark(task, lastDatetime)
+
+        return len(result)
+
+    #----------------------------------------------------------------------
+    def processAll(self):
+        """执行全部合成任务，返回[(数据库名, 集合名, 写入K线数量)]"""
+        # 同一合约的多个周期只读取一次1分钟K线，从最早的水位开始读取
+        symbolDict = OrderedDict()
+        for task in self.taskList:
+            symbolDict.setdefault(task.symbol, []).append((task, self.getWatermark(task)))
+
+        resultList = []
+        for symbol, l in symbolDict.items():
+            watermarkList = [watermark for task, watermark in l]
+            if None in watermarkList:
+                df = self.loadMinuteBars(symbol, None)
+            else:
+                df = self.loadMinuteBars(symbol, min(watermarkList))
+
+            for task, watermark in l:
+                if watermark and not df.empty:
+                    taskDf = df[df['datetime'] >= watermark].reset_index(drop=True)
+                else:
+                    taskDf = df
+                resultList.append((task.dbName, task.symbol, self.processTask(task, taskDf)))
+
+        return resultList
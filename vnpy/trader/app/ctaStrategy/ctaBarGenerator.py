@@ -0,0 +1,478 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了通用的K线合成器BarGenerator，相比BarManager：
+1. 支持N秒、N分钟、N小时和交易日K线，N不要求能被60整除
+2. 基于交易时段（TradingSession）计算K线的归属，夜盘、午休、跨午夜的时段均可正确处理
+3. 一个Tick只计算一次时段位置，然后分发到多个周期的K线
+4. K线的date、time字符串只在K线结束时生成一次，日期字符串有缓存
+
+K线的归属通过“交易日内已经过的交易时间（秒）”计算，例如1小时K线从每个交易日的
+第一个时段开始、按交易时间每3600秒切分，因此跨越午休的K线也是完整的1小时交易时间。
+K线的时间戳为该周期在交易时段中的开始时间（如15分钟K线的第一个Tick在09:02:13，时间戳为09:00）。
+
+注意：交易日只处理了周末，未处理节假日，节假日前后的夜盘请自行检查。
+'''
+
+from datetime import datetime, timedelta
+from bisect import bisect_right
+
+import numpy as np
+
+from vnpy.trader.vtObject import VtBarData
+
+from .ctaBase import MINUTE_DB_NAME, DAILY_AGG_DB_NAME
+
+
+# K线周期类型
+INTERVAL_SECOND = 'second'
+INTERVAL_MINUTE = 'minute'
+INTERVAL_HOUR = 'hour'
+INTERVAL_DAILY = 'daily'
+
+INTERVAL_SECONDS = {
+    INTERVAL_SECOND: 1,
+    INTERVAL_MINUTE: 60,
+    INTERVAL_HOUR: 3600
+}
+
+# 常用的交易时段模板，时段按照交易日内的先后顺序排列，value为(时段列表, 交易日切换时间)
+SESSION_DICT = {
+    # 股指期货
+    'CFFEX_INDEX': ([('09:30', '11:30'), ('13:00', '15:00')], None),
+    # 国债期货
+    'CFFEX_BOND': ([('09:15', '11:30'), ('13:00', '15:15')], None),
+    # 无夜盘的商品期货
+    'COMMODITY_DAY': ([('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')], None),
+    # 夜盘到23:00的商品期货，如螺纹钢、橡胶
+    'COMMODITY_NIGHT_2300': ([('21:00', '23:00'), ('09:00', '10:15'), ('10:30', '11:30'),
+                              ('13:30', '15:00')], '20:00'),
+    # 夜盘到23:30的商品期货，如大商所、郑商所的夜盘品种
+    'COMMODITY_NIGHT_2330': ([('21:00', '23:30'), ('09:00', '10:15'), ('10:30', '11:30'),
+                              ('13:30', '15:00')], '20:00'),
+    # 夜盘到01:00的商品期货，如铜、铝、锌
+    'COMMODITY_NIGHT_0100': ([('21:00', '01:00'), ('09:00', '10:15'), ('10:30', '11:30'),
+                              ('13:30', '15:00')], '20:00'),
+    # 夜盘到02:30的商品期货，如黄金、白银
+    'COMMODITY_NIGHT_0230': ([('21:00', '02:30'), ('09:00', '10:15'), ('10:30', '11:30'),
+                              ('13:30', '15:00')], '20:00')
+}
+
+# 各交易时段模板包含的期货品种，品种为合约代码的字母部分
+SESSION_PRODUCT_DICT = {
+    'CFFEX_INDEX': ['IF', 'IH', 'IC'],
+    'CFFEX_BOND': ['T', 'TF'],
+    'COMMODITY_DAY': ['c', 'cs', 'l', 'v', 'pp', 'jd', 'fb', 'bb', 'fu', 'wr',
+                      'WH', 'PM', 'RI', 'JR', 'LR', 'SF', 'SM'],
+    'COMMODITY_NIGHT_2300': ['rb', 'hc', 'bu', 'ru'],
+    'COMMODITY_NIGHT_2330': ['a', 'b', 'm', 'y', 'p', 'j', 'jm', 'i',
+                             'SR', 'CF', 'RM', 'MA', 'TA', 'ZC', 'FG', 'OI'],
+    'COMMODITY_NIGHT_0100': ['cu', 'al', 'zn', 'pb', 'ni', 'sn'],
+    'COMMODITY_NIGHT_0230': ['au', 'ag']
+}
+
+# 期货品种对应的交易时段模板名称
+PRODUCT_SESSION_DICT = {product: name for name, productList in SESSION_PRODUCT_DICT.items()
+                        for product in productList}
+
+# 时段之间的间隔内，距离上一时段结束不超过该秒数的Tick归入上一时段（收盘Tick），否则归入下一时段（集合竞价Tick）
+SESSION_END_GRACE = 60
+
+
+#----------------------------------------------------------------------
+def parseTime(s):
+    """将HH:MM或HH:MM:SS字符串转换为当日的秒数"""
+    l = [int(x) for x in s.split(':')]
+    l.extend([0] * (3 - len(l)))
+    return l[0] * 3600 + l[1] * 60 + l[2]
+
+
+#----------------------------------------------------------------------
+def getProduct(symbol):
+    """获取合约代码的品种部分，如rb1801.SHFE返回rb"""
+    n = 0
+    for c in symbol:
+        if not c.isalpha():
+            break
+        n += 1
+    return symbol[:n]
+
+
+#----------------------------------------------------------------------
+def getSessionName(symbol):
+    """获取合约对应的交易时段模板名称，未知品种返回None"""
+    return PRODUCT_SESSION_DICT.get(getProduct(symbol), None)
+
+
+#----------------------------------------------------------------------
+def getBarDbName(interval, window=1):
+    """
+    获取某一周期K线的数据库名称（由BarAggregator从1分钟K线合成），
+    交易日K线使用单独的数据库，不覆盖DAILY_DB_NAME中下载的日线数据
+    """
+    if interval == INTERVAL_DAILY:
+        return DAILY_AGG_DB_NAME
+    elif interval == INTERVAL_HOUR:
+        return 'VnTrader_%sHour_Db' %window
+    elif interval == INTERVAL_MINUTE and window == 1:
+        return MINUTE_DB_NAME
+    else:
+        return 'VnTrader_%sMin_Db' %window
+
+
+########################################################################
+class TradingSession(object):
+    """
+    交易时段，负责计算某一时间点所属的交易日和交易日内已经过的交易时间
+    sessionList为[(开始时间, 结束时间)]，按照交易日内的先后顺序排列，可以跨越午夜
+    dayStart为交易日切换时间，晚于该时间的数据属于下一个交易日（用于夜盘），为None时使用自然日
+    sessionList为空时，视为全天24小时交易
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, sessionList=None, dayStart=None):
+        """Constructor"""
+        if dayStart:
+            self.dayStart = parseTime(dayStart)
+        else:
+            self.dayStart = None
+
+        self.startList = []         # 各时段开始的交易日时钟秒数
+        self.endList = []           # 各时段结束的交易日时钟秒数
+        self.cumList = []           # 各时段开始前累计的交易秒数
+
+        total = 0
+        for start, end in sessionList or []:
+            startClock = self.toClock(parseTime(start))
+            endClock = self.toClock(parseTime(end))
+
+            self.startList.append(startClock)
+            self.endList.append(endClock)
+            self.cumList.append(total)
+            total += endClock - startClock
+
+        if not self.startList:
+            total = 86400
+        self.totalSeconds = total   # 交易日内的总交易秒数
+
+        self.lastDate = None        # 缓存上一次计算的自然日和交易日
+        self.lastNight = False
+        self.lastTradingDay = None
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def fromTemplate(cls, name):
+        """基于交易时段模板创建对象"""
+        sessionList, dayStart = SESSION_DICT[name]
+        return cls(sessionList, dayStart)
+
+    #----------------------------------------------------------------------
+    def toClock(self, seconds):
+        """将当日秒数转换为交易日时钟秒数（属于下一交易日的夜盘时间为负数）"""
+        if self.dayStart is not None and seconds >= self.dayStart:
+            return seconds - 86400
+        return seconds
+
+    #----------------------------------------------------------------------
+    def getTradingDay(self, date, night):
+        """计算交易日，night表示是否晚于交易日切换时间"""
+        # 同一自然日的数据直接使用缓存
+        if date == self.lastDate and night == self.lastNight:
+            return self.lastTradingDay
+
+        tradingDay = date
+        if self.dayStart is not None:
+            if night:
+                tradingDay = date + timedelta(1)
+
+            # 周五夜盘和周六凌晨属于下周一
+            weekday = tradingDay.weekday()
+            if weekday == 5:
+                tradingDay += timedelta(2)
+            elif weekday == 6:
+                tradingDay += timedelta(1)
+
+        self.lastDate = date
+        self.lastNight = night
+        self.lastTradingDay = tradingDay
+        return tradingDay
+
+    #----------------------------------------------------------------------
+    def locate(self, dt):
+        """计算时间点所属的交易日（date对象）和交易日内已经过的交易秒数"""
+        seconds = dt.hour * 3600 + dt.minute * 60 + dt.second
+        clock = self.toClock(seconds)
+        tradingDay = self.getTradingDay(dt.date(), clock != seconds)
+
+        # 全天交易
+        if not self.startList:
+            return tradingDay, clock
+
+        i = bisect_right(self.startList, clock) - 1
+
+        # 早于第一个时段，归入第一个时段开始
+        if i < 0:
+            return tradingDay, 0
+
+        # 时段内
+        start = self.startList[i]
+        end = self.endList[i]
+        if clock < end:
+            return tradingDay, self.cumList[i] + clock - start
+
+        # 时段结束后不久或最后一个时段之后，归入该时段的最后一秒
+        if clock - end <= SESSION_END_GRACE or i == len(self.startList) - 1:
+            return tradingDay, self.cumList[i] + end - start - 1
+
+        # 时段之间的间隔，归入下一时段开始
+        return tradingDay, self.cumList[i + 1]
+
+    #----------------------------------------------------------------------
+    def toDatetime(self, tradingDay, elapsed):
+        """locate的逆运算，计算交易日内已经过的交易秒数对应的时间点，用于K线的开始时间"""
+        if not self.startList:
+            clock = elapsed
+            night = clock < 0
+        else:
+            i = bisect_right(self.cumList, elapsed) - 1
+            clock = self.startList[i] + elapsed - self.cumList[i]
+            night = self.startList[i] < 0
+
+        # 交易日时钟以交易日的零点为基准，周一的夜盘（含跨午夜部分）实际从上周五晚上开始，以周六零点为基准
+        base = datetime(tradingDay.year, tradingDay.month, tradingDay.day)
+        if night and tradingDay.weekday() == 0:
+            base -= timedelta(2)
+
+        return base + timedelta(seconds=clock)
+
+    #----------------------------------------------------------------------
+    def locateArray(self, dtArray):
+        """
+        locate的向量化版本，用于批量处理历史数据
+        dtArray为datetime64数组，返回(交易日的datetime64[D]数组, 交易秒数数组)
+        """
+        dtArray = np.asarray(dtArray).astype('datetime64[s]')
+        days = dtArray.astype('datetime64[D]')
+        seconds = (dtArray - days).astype(np.int64)
+
+        if self.dayStart is not None:
+            night = seconds >= self.dayStart
+            clock = np.where(night, seconds - 86400, seconds)
+            tradingDay = days + night.astype(np.int64)
+
+            # 周五夜盘和周六凌晨属于下周一（1970-01-01为周四）
+            weekday = (tradingDay.astype(np.int64) + 3) % 7
+            tradingDay = tradingDay + np.where(weekday == 5, 2, np.where(weekday == 6, 1, 0))
+        else:
+            clock = seconds
+            tradingDay = days
+
+        # 全天交易
+        if not self.startList:
+            return tradingDay, clock
+
+        startArray = np.array(self.startList)
+        endArray = np.array(self.endList)
+        cumArray = np.array(self.cumList)
+        last = len(self.startList) - 1
+
+        i = np.searchsorted(startArray, clock, side='right') - 1
+        j = np.maximum(i, 0)
+        start = startArray[j]
+        end = endArray[j]
+        cum = cumArray[j]
+
+        # 时段结束后不久或最后一个时段之后归入该时段的最后一秒，时段之间的间隔归入下一时段开始
+        afterEnd = np.where((clock - end <= SESSION_END_GRACE) | (j == last),
+                            cum + end - start - 1,
+                            cumArray[np.minimum(j + 1, last)])
+        elapsed = np.where(clock < end, cum + clock - start, afterEnd)
+
+        # 早于第一个时段，归入第一个时段开始
+        elapsed = np.where(i < 0, 0, elapsed)
+
+        return tradingDay, elapsed
+
+
+########################################################################
+class BarWindow(object):
+    """BarGenerator中单个周期的K线合成状态"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, interval, window, onBar):
+        """Constructor"""
+        self.interval = interval
+        self.window = window
+        self.onBar = onBar
+
+        if interval == INTERVAL_DAILY:
+            self.seconds = 0
+        else:
+            self.seconds = INTERVAL_SECONDS[interval] * window
+
+        self.bar = None             # 正在合成的K线
+        self.tradingDay = None      # 正在合成的K线所属交易日
+        self.index = -1             # 正在合成的K线在交易日内的序号
+
+
+########################################################################
+class BarGenerator(object):
+    """
+    通用K线合成器，支持：
+    1. 基于Tick合成多个周期的K线，周期结束后的第一个Tick到来时推送上一根K线
+    2. 基于1分钟K线合成多个周期的K线，K线走完时立即推送
+
+    使用方法：
+    bg = BarGenerator(TradingSession.fromTemplate('COMMODITY_NIGHT_2300'))
+    bg.addBar(INTERVAL_MINUTE, 1, self.onBar)
+    bg.addBar(INTERVAL_MINUTE, 7, self.on7MinBar)
+    bg.addBar(INTERVAL_HOUR, 1, self.onHourBar)
+    bg.addBar(INTERVAL_DAILY, 1, self.onDailyBar)
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, session=None):
+        """Constructor"""
+        if not session:
+            session = TradingSession()
+        self.session = session
+
+        self.windowList = []        # 所有周期的合成状态
+        self.lastVolume = None      # 上一Tick的累计成交量
+
+        self.dateStrDict = {}       # 日期字符串缓存
+
+    #----------------------------------------------------------------------
+    def addBar(self, interval, window, onBar):
+        """增加一个K线周期，交易日K线的window只能为1"""
+        if interval == INTERVAL_DAILY:
+            window = 1
+        self.windowList.append(BarWindow(interval, window, onBar))
+
+    #----------------------------------------------------------------------
+    def updateTick(self, tick):
+        """Tick更新"""
+        tradingDay, elapsed = self.session.locate(tick.datetime)
+        price = tick.lastPrice
+
+        # 计算本Tick的成交量，累计成交量减少说明换日
+        if self.lastVolume is None:
+            volume = 0
+        else:
+            volume = tick.volume - self.lastVolume
+            if volume < 0:
+                volume = tick.volume
+        self.lastVolume = tick.volume
+
+        for w in self.windowList:
+            if w.seconds:
+                index = elapsed // w.seconds
+            else:
+                index = 0
+
+            bar = w.bar
+
+            # 进入新的K线，推送上一根K线
+            if bar is None or index != w.index or tradingDay != w.tradingDay:
+                if bar is not None:
+                    self.finishBar(w)
+
+                bar = VtBarData()
+                bar.vtSymbol = tick.vtSymbol
+                bar.symbol = tick.symbol
+                bar.exchange = tick.exchange
+                bar.open = price
+                bar.high = price
+                bar.low = price
+                bar.datetime = self.getBarDatetime(w, index, tradingDay)
+
+                w.bar = bar
+                w.index = index
+                w.tradingDay = tradingDay
+            else:
+                if price > bar.high:
+                    bar.high = price
+                elif price < bar.low:
+                    bar.low = price
+
+            bar.close = price
+            bar.volume += volume
+            bar.openInterest = tick.openInterest
+
+    #----------------------------------------------------------------------
+    def updateBar(self, bar):
+        """1分钟K线更新（K线的datetime为开始时间）"""
+        tradingDay, elapsed = self.session.locate(bar.datetime)
+        barEnd = elapsed + 60
+
+        for w in self.windowList:
+            if w.seconds:
+                index = elapsed // w.seconds
+                finished = not barEnd % w.seconds or barEnd >= self.session.totalSeconds
+            else:
+                index = 0
+                finished = barEnd >= self.session.totalSeconds
+
+            xbar = w.bar
+
+            # 上一根K线未能按时推送（如数据缺失），在进入新K线时推送
+            if xbar is not None and (index != w.index or tradingDay != w.tradingDay):
+                self.finishBar(w)
+                xbar = None
+
+            if xbar is None:
+                xbar = VtBarData()
+                xbar.vtSymbol = bar.vtSymbol
+                xbar.symbol = bar.symbol
+                xbar.exchange = bar.exchange
+                xbar.open = bar.open
+                xbar.high = bar.high
+                xbar.low = bar.low
+                xbar.datetime = self.getBarDatetime(w, index, tradingDay)
+
+                w.bar = xbar
+                w.index = index
+                w.tradingDay = tradingDay
+            else:
+                xbar.high = max(xbar.high, bar.high)
+                xbar.low = min(xbar.low, bar.low)
+
+            xbar.close = bar.close
+            xbar.openInterest = bar.openInterest
+            xbar.volume += int(bar.volume)
+
+            if finished:
+                self.finishBar(w)
+
+    #----------------------------------------------------------------------
+    def getBarDatetime(self, w, index, tradingDay):
+        """计算K线的时间戳，即K线周期在交易日内的开始时间，而非第一个Tick的时间"""
+        if w.interval == INTERVAL_DAILY:
+            return datetime(tradingDay.year, tradingDay.month, tradingDay.day)
+        else:
+            return self.session.toDatetime(tradingDay, index * w.seconds)
+
+    #----------------------------------------------------------------------
+    def finishBar(self, w):
+        """生成K线的日期时间字符串，并推送K线"""
+        bar = w.bar
+        dt = bar.datetime
+        date = dt.date()
+
+        dateStr = self.dateStrDict.get(date, None)
+        if dateStr is None:
+            dateStr = dt.strftime('%Y%m%d')
+            self.dateStrDict[date] = dateStr
+
+        bar.date = dateStr
+        bar.time = '%02d:%02d:%02d.000000' %(dt.hour, dt.minute, dt.second)
+
+        w.bar = None
+        w.onBar(bar)
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """推送所有正在合成的K线（如收盘后或回测结束时）"""
+        for w in self.windowList:
+            if w.bar is not None:
+                self.finishBar(w)
@@ -29,6 +29,7 @@ POSITION_DB_NAME = 'VnTrader_Position_Db'
 TICK_DB_NAME = 'VnTrader_Tick_Db'
 DAILY_DB_NAME = 'VnTrader_Daily_Db'
 MINUTE_DB_NAME = 'VnTrader_1Min_Db'
+DAILY_AGG_DB_NAME = 'VnTrader_Daily_Agg_Db'     # BarAggregator从1分钟K线合成的交易日K线
 
 # 引擎类型，用于区分当前策略的运行环境
 ENGINETYPE_BACKTESTING = 'backtesting'  # 回测
@@ -0,0 +1,366 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了批量回测工具，用于每日定时重跑大量的（策略、参数、合约）组合：
+1. 回测任务通过任务清单（JSON文件或字典列表）定义
+2. 相同合约的任务分为一组，在进程池的同一个进程中运行，数据只载入一次
+3. 每个任务的统计结果保存到本地结果数据库（sqlite3）中
+4. 输入（策略代码、参数、引擎设置、数据）未发生变化的任务直接跳过
+
+任务清单中每个任务的格式：
+{
+    "name": "AtrRsi_IF",                    # 任务名称，用于和历史结果对比
+    "className": "AtrRsiStrategy",          # 策略类名
+    "setting": {"atrLength": 22},           # 策略参数
+    "dbName": "VnTrader_1Min_Db",
+    "symbol": "IF0000",
+    "mode": "bar",
+    "startDate": "20120101",
+    "initDays": 10,
+    "endDate": "",
+    "capital": 1000000,
+    "slippage": 0.2,
+    "rate": 0.00003,
+    "size": 300,
+    "priceTick": 0.2
+}
+'''
+from __future__ import division
+
+import json
+import traceback
+import multiprocessing
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from time import time
+
+from vnpy.trader.vtObject import VtTickData, VtBarData
+from vnpy.trader.vtFunction import getTempPath
+from vnpy.trader.vtHistoryStore import createHistoryStore, INCLUSIVE_DELTA
+
+from .ctaBase import *
+from .ctaBacktesting import BacktestingEngine
+from .ctaResultStore import (ResultStore, getStrategyHash, getDataFingerprint, getInputKey,
+                             ENGINE_SETTING_KEYS)
+from .strategy import STRATEGY_CLASS
+
+
+# 任务的默认设置
+DEFAULT_JOB = OrderedDict([
+    ('name', ''),
+    ('className', ''),
+    ('setting', {}),
+    ('dbName', MINUTE_DB_NAME),
+    ('symbol', ''),
+    ('mode', BacktestingEngine.BAR_MODE),
+    ('startDate', '20100416'),
+    ('initDays', 10),
+    ('endDate', ''),
+    ('capital', 1000000),
+    ('slippage', 0),
+    ('rate', 0),
+    ('size', 1),
+    ('priceTick', 0)
+])
+
+
+########################################################################
+class BatchBacktestingEngine(BacktestingEngine):
+    """使用预先载入的数据运行的回测引擎，同一进程内的多个任务共享数据"""
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        super(BatchBacktestingEngine, self).__init__()
+
+        self.historyData = []       # 预先载入的数据字典列表
+        self.historyDt = []         # 对应的datetime列表，用于二分查找
+
+    #----------------------------------------------------------------------
+    def output(self, content):
+        """批量回测时不输出每个任务的过程信息"""
+        pass
+
+    #----------------------------------------------------------------------
+    def setHistoryData(self, historyData, historyDt):
+        """设置预先载入的数据"""
+        self.historyData = historyData
+        self.historyDt = historyDt
+
+    #----------------------------------------------------------------------
+    def loadHistoryData(self):
+        """从预先载入的数据中切片出初始化数据和回测数据"""
+        if self.mode == self.BAR_MODE:
+            dataClass = VtBarData
+        else:
+            dataClass = VtTickData
+
+        i = bisect_left(self.historyDt, self.dataStartDate)
+        j = bisect_left(self.historyDt, self.strategyStartDate)
+        if self.dataEndDate:
+            k = bisect_right(self.historyDt, self.dataEndDate)
+        else:
+            k = len(self.historyDt)
+
+        # 数据字典被多个任务共享，因此需要复制
+        self.initData = []
+        for d in self.historyData[i:j]:
+            data = dataClass()
+            data.__dict__ = d.copy()
+            self.initData.append(data)
+
+        historyData = self.historyData
+        self.dbCursor = (historyData[n].copy() for n in xrange(j, k))
+
+
+#----------------------------------------------------------------------
+def getJobDates(job):
+    """获取任务的数据起始、结束时间（datetime对象）"""
+    dataStartDate = datetime.strptime(job['startDate'], '%Y%m%d')
+
+    if job['endDate']:
+        dataEndDate = datetime.strptime(job['endDate'], '%Y%m%d')
+        dataEndDate = dataEndDate.replace(hour=23, minute=59)
+    else:
+        dataEndDate = None
+
+    return dataStartDate, dataEndDate
+
+
+#----------------------------------------------------------------------
+def loadGroupData(jobList):
+    """载入一组任务所需范围内的全部数据，返回(数据字典列表, datetime列表)"""
+    first = jobList[0]
+    dateList = [getJobDates(job) for job in jobList]
+
+    startDate = min([dates[0] for dates in dateList])
+    if all([dates[1] for dates in dateList]):
+        endDate = max([dates[1] for dates in dateList]) + INCLUSIVE_DELTA
+    else:
+        endDate = None
+
+    historyStore = createHistoryStore()
+    try:
+        historyData = list(historyStore.loadRange(first['dbName'], first['symbol'], startDate, endDate))
+    finally:
+        historyStore.close()
+
+    historyDt = [d['datetime'] for d in historyData]
+    return historyData, historyDt
+
+
+#----------------------------------------------------------------------
+def runJobGroup(jobList):
+    """
+    多进程批量回测时跑在每个进程中运行的函数
+    jobList中的任务使用相同的数据库集合，数据只载入一次
+    返回[(任务名称, 输入键, 结果字典)]，数据载入失败时所有任务的结果字典均为{'error': 错误信息}
+    """
+    # 载入所有任务所需的数据范围
+    try:
+        historyData, historyDt = loadGroupData(jobList)
+    except Exception:
+        error = traceback.format_exc()
+        return [(job['name'], job['key'], {'error': error}) for job in jobList]
+
+    # 逐个运行任务
+    resultList = []
+
+    for job in jobList:
+        try:
+            engine = BatchBacktestingEngine()
+            engine.setBacktestingMode(job['mode'])
+            engine.setStartDate(job['startDate'], job['initDays'])
+            engine.setEndDate(job['endDate'])
+            engine.setCapital(job['capital'])
+            engine.setSlippage(job['slippage'])
+            engine.setRate(job['rate'])
+            engine.setSize(job['size'])
+            engine.setPriceTick(job['priceTick'])
+            engine.setDatabase(job['dbName'], job['symbol'])
+            engine.setHistoryData(historyData, historyDt)
+
+            engine.initStrategy(STRATEGY_CLASS[job['className']], job['setting'])
+            engine.runBacktesting()
+            result = engine.calculateResultStatistics()
+        except Exception:
+            result = {'error': traceback.format_exc()}
+
+        resultList.append((job['name'], job['key'], result))
+
+    return resultList
+
+
+########################################################################
+class BatchBacktestingRunner(object):
+    """批量回测运行器"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, storePath='', processes=0):
+        """Constructor"""
+        if not storePath:
+            storePath = getTempPath('BacktestingResult.db')
+
+        self.store = ResultStore(storePath)                     # 结果数据库
+        self.processes = processes or multiprocessing.cpu_count()   # 进程数量
+
+    #----------------------------------------------------------------------
+    def output(self, content):
+        """输出内容"""
+        print str(datetime.now()) + "\t" + content
+
+    #----------------------------------------------------------------------
+    def loadManifest(self, path):
+        """从JSON文件读取任务清单"""
+        with open(path) as f:
+            l = json.load(f)
+
+        return self.normalizeJobList(l)
+
+    #----------------------------------------------------------------------
+    def normalizeJobList(self, l):
+        """补全任务的默认设置，并生成任务名称"""
+        jobList = []
+
+        for d in l:
+            job = DEFAULT_JOB.copy()
+            job.update(d)
+            job['setting'] = dict(job['setting'])
+
+            if not job['name']:
+                job['name'] = '%s_%s_%s' %(job['className'], job['symbol'],
+                                           json.dumps(job['setting'], sort_keys=True))
+
+            jobList.append(job)
+
+        return jobList
+
+    #----------------------------------------------------------------------
+    def getJobKey(self, job, historyStore, fingerprintDict, hashDict):
+        """计算任务的输入键"""
+        className = job['className']
+        if className not in hashDict:
+            hashDict[className] = getStrategyHash(STRATEGY_CLASS[className])
+
+        dataStartDate, dataEndDate = getJobDates(job)
+        dataKey = (job['dbName'], job['symbol'], dataStartDate, dataEndDate)
+        if dataKey not in fingerprintDict:
+            fingerprintDict[dataKey] = getDataFingerprint(job['dbName'], job['symbol'],
+                                                          dataStartDate, dataEndDate,
+                                                          historyStore)
+
+        engineSetting = {k: job[k] for k in ENGINE_SETTING_KEYS}
+        return getInputKey(hashDict[className], job['setting'],
+                           engineSetting, fingerprintDict[dataKey])
+
+    #----------------------------------------------------------------------
+    def run(self, jobList, force=False):
+        """
+        运行批量回测
+        jobList：任务清单（字典列表）
+        force：是否强制重跑输入未变化的任务
+        """
+        start = time()
+        jobList = self.normalizeJobList(jobList)
+
+        # 计算输入键，跳过输入未变化的任务
+        historyStore = createHistoryStore()
+        fingerprintDict = {}
+        hashDict = {}
+
+        groupDict = OrderedDict()
+        skipCount = 0
+        errorCount = 0
+
+        for job in jobList:
+            if job['className'] not in STRATEGY_CLASS:
+                self.output(u'找不到策略类：%s' %job['className'])
+                errorCount += 1
+                continue
+
+            job['key'] = self.getJobKey(job, historyStore, fingerprintDict, hashDict)
+
+            if not force:
+                result = self.store.getResult(job['key'])
+                if result and 'error' not in result and 'sharpeRatio' in result:
+                    # 仍然保存一条记录，便于和前一次运行对比
+                    self.store.saveResult(job['key'], job['name'], result)
+                    skipCount += 1
+                    continue
+
+            groupKey = (job['dbName'], job['symbol'])
+            if groupKey not in groupDict:
+                groupDict[groupKey] = []
+            groupDict[groupKey].append(job)
+
+        historyStore.close()
+
+        runCount = sum([len(l) for l in groupDict.values()])
+        self.output(u'任务总数：%s，跳过：%s，需运行：%s，分组：%s' %(len(jobList), skipCount,
+                                                          runCount, len(groupDict)))
+
+        # 多进程运行，每个合约为一组
+        pool = multiprocessing.Pool(self.processes)
+        asyncList = [pool.apply_async(runJobGroup, (l,)) for l in groupDict.values()]
+        pool.close()
+
+        # 某一组的子进程出错时，该组的任务均记为出错，继续收集其他组的结果
+        finishCount = 0
+        for l, asyncResult in zip(groupDict.values(), asyncList):
+            try:
+                groupResultList = asyncResult.get()
+            except Exception:
+                error = traceback.format_exc()
+                groupResultList = [(job['name'], job['key'], {'error': error}) for job in l]
+
+            for name, key, result in groupResultList:
+                self.store.saveResult(key, name, result)
+                finishCount += 1
+
+                if 'error' in result:
+                    errorCount += 1
+                    self.output(u'任务%s出错：\n%s' %(name, result['error']))
+
+            self.output(u'进度：%s/%s' %(finishCount, runCount))
+
+        pool.join()
+
+        # 统计运行效率
+        elapsed = time() - start
+        if elapsed:
+            jobsPerHour = len(jobList) / elapsed * 3600
+        else:
+            jobsPerHour = 0
+
+        summary = OrderedDict()
+        summary['totalJobs'] = len(jobList)
+        summary['skippedJobs'] = skipCount
+        summary['finishedJobs'] = finishCount
+        summary['errorJobs'] = errorCount
+        summary['elapsed'] = elapsed
+        summary['jobsPerHour'] = jobsPerHour
+
+        self.output(u'批量回测完成，耗时：%.1f秒，效率：%.1f任务/小时' %(elapsed, jobsPerHour))
+        return summary
+
+    #----------------------------------------------------------------------
+    def compareResult(self, jobList, target='sharpeRatio'):
+        """对比每个任务最近两次运行的目标字段，返回[(任务名称, 上次结果, 本次结果)]"""
+        compareList = []
+
+        for job in self.normalizeJobList(jobList):
+            history = self.store.getHistory(job['name'], 2)
+            if not history:
+                continue
+
+            current = history[0][1].get(target, None)
+            if len(history) > 1:
+                previous = history[1][1].get(target, None)
+            else:
+                previous = None
+
+            compareList.append((job['name'], previous, current))
+            self.output(u'%s\t%s -> %s' %(job['name'], previous, current))
+
+        return compareList
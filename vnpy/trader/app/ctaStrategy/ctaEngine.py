@@ -29,9 +29,12 @@ from vnpy.trader.vtEvent import *
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtObject import VtTickData, VtBarData
 from vnpy.trader.vtGateway import VtSubscribeReq, VtOrderReq, VtCancelOrderReq, VtLogData
-from vnpy.trader.vtFunction import todayDate, getJsonPath
+from vnpy.trader.vtFunction import todayDate, getJsonPath, getTempPath
+from vnpy.trader.vtLatency import latencyTracer, STAGE_STRATEGY, STAGE_CTA_SEND
 
 from .ctaBase import *
+from .ctaHistoryCache import HistoryCache
+from .ctaProfiler import StrategyProfiler
 from .strategy import STRATEGY_CLASS
 
 
@@ -43,6 +46,9 @@ class CtaEngine(object):
     settingFileName = 'CTA_setting.json'
     settingfilePath = getJsonPath(settingFileName, __file__)
     
+    historyCacheFileName = 'CtaHistoryCache.vt'
+    historyCacheFilePath = getTempPath(historyCacheFileName)
+    
     STATUS_FINISHED = set([STATUS_REJECTED, STATUS_CANCELLED, STATUS_ALLTRADED])
 
     #----------------------------------------------------------------------
@@ -86,6 +92,18 @@ class CtaEngine(object):
         # 引擎类型为实盘
         self.engineType = ENGINETYPE_TRADING
         
+        # 策略回调性能统计相关
+        self.profileEnabled = False     # 是否启用性能统计
+        self.callbackBudget = 0.005     # 单次回调的耗时预算（秒），超过则记录为慢调用
+        self.profilerDict = {}          # key为策略名称，value为StrategyProfiler对象
+        
+        # 当前正在处理的tick的延时追踪编号，-1表示不追踪
+        self.traceId = -1
+        
+        # 历史数据缓存，多个策略初始化时共享同一合约的数据查询
+        self.historyCache = HistoryCache(self.mainEngine)
+        self.loadHistoryCache()
+        
         # 注册日式事件类型
         self.mainEngine.registerLogEvent(EVENT_CTA_LOG)
         
@@ -110,6 +128,11 @@ class CtaEngine(object):
         # 设计为CTA引擎发出的委托只允许使用限价单
         req.priceType = PRICETYPE_LIMITPRICE    
         
+        # 由tick触发的委托，携带延时追踪编号
+        if self.traceId >= 0:
+            latencyTracer.stamp(self.traceId, STAGE_CTA_SEND)
+            req.traceId = self.traceId
+        
         # CTA委托类型映射
         if orderType == CTAORDER_BUY:
             req.direction = DIRECTION_LONG
@@ -265,6 +288,11 @@ class CtaEngine(object):
     def processTickEvent(self, event):
         """处理行情推送"""
         tick = event.dict_['data']
+        
+        # 延时追踪开启时，记录tick的追踪编号，该tick触发的委托会携带此编号
+        if latencyTracer.active:
+            self.traceId = getattr(tick, 'traceId', -1)
+        
         # 收到tick行情后，先处理本地停止单（检查是否要立即发出）
         self.processStopOrder(tick)
         
@@ -277,12 +305,18 @@ class CtaEngine(object):
                     tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S.%f')
             except ValueError:
                 self.writeCtaLog(traceback.format_exc())
+                self.traceId = -1
                 return
+            
+            if self.traceId >= 0:
+                latencyTracer.stamp(self.traceId, STAGE_STRATEGY)
                 
             # 逐个推送到策略实例中
             l = self.tickStrategyDict[tick.vtSymbol]
             for strategy in l:
                 self.callStrategyFunc(strategy, strategy.onTick, tick)
+        
+        self.traceId = -1
     
     #----------------------------------------------------------------------
     def processOrderEvent(self, event):
@@ -327,12 +361,18 @@ class CtaEngine(object):
             # 保存策略持仓到数据库
             self.savePosition(strategy)              
     
+    #----------------------------------------------------------------------
+    def processTimerEvent(self, event):
+        """定时事件处理，清理过期的历史数据缓存"""
+        self.historyCache.expire()
+    
     #----------------------------------------------------------------------
     def registerEvent(self):
         """注册事件监听"""
         self.eventEngine.register(EVENT_TICK, self.processTickEvent)
         self.eventEngine.register(EVENT_ORDER, self.processOrderEvent)
         self.eventEngine.register(EVENT_TRADE, self.processTradeEvent)
+        self.eventEngine.register(EVENT_TIMER, self.processTimerEvent)
  
     #----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
@@ -344,13 +384,13 @@ class CtaEngine(object):
         """从数据库中读取Bar数据，startDate是datetime对象"""
         startDate = self.today - timedelta(days)
         
-        d = {'datetime':{'$gte':startDate}}
-        barData = self.mainEngine.dbQuery(dbName, collectionName, d, 'datetime')
+        barData = self.historyCache.load(dbName, collectionName, startDate)
         
+        # 缓存中的字典由多个策略共享，因此需要复制
         l = []
         for d in barData:
             bar = VtBarData()
-            bar.__dict__ = d
+            bar.__dict__ = d.copy()
             l.append(bar)
         return l
     
@@ -359,16 +399,31 @@ class CtaEngine(object):
         """从数据库中读取Tick数据，startDate是datetime对象"""
         startDate = self.today - timedelta(days)
         
-        d = {'datetime':{'$gte':startDate}}
-        tickData = self.mainEngine.dbQuery(dbName, collectionName, d, 'datetime')
+        tickData = self.historyCache.load(dbName, collectionName, startDate)
         
         l = []
         for d in tickData:
             tick = VtTickData()
-            tick.__dict__ = d
+            tick.__dict__ = d.copy()
             l.append(tick)
         return l    
     
+    #----------------------------------------------------------------------
+    def loadHistoryCache(self):
+        """从本地快照文件载入历史数据缓存"""
+        try:
+            self.historyCache.loadSnapshot(self.historyCacheFilePath)
+        except Exception:
+            self.writeCtaLog(u'历史数据缓存快照载入失败：\n' + traceback.format_exc())
+    
+    #----------------------------------------------------------------------
+    def saveHistoryCache(self):
+        """保存历史数据缓存到本地快照文件"""
+        try:
+            self.historyCache.saveSnapshot(self.historyCacheFilePath)
+        except Exception:
+            self.writeCtaLog(u'历史数据缓存快照保存失败：\n' + traceback.format_exc())
+    
     #----------------------------------------------------------------------
     def writeCtaLog(self, content):
         """快速发出CTA模块日志事件"""
@@ -481,7 +536,10 @@ class CtaEngine(object):
     def initAll(self):
         """全部初始化"""
         for name in self.strategyDict.keys():
-            self.initStrategy(name)    
+            self.initStrategy(name)
+        
+        # 缓存过期前保存快照，下次启动时预先载入
+        self.saveHistoryCache()
             
     #----------------------------------------------------------------------
     def startAll(self):
@@ -557,11 +615,83 @@ class CtaEngine(object):
         event = Event(EVENT_CTA_STRATEGY+name)
         self.eventEngine.put(event)
         
+    #----------------------------------------------------------------------
+    def getStrategyPerf(self, name):
+        """获取策略回调函数的性能统计字典"""
+        if name in self.strategyDict:
+            profiler = self.profilerDict.get(name, None)
+            if profiler:
+                return profiler.getPerfDict()
+            else:
+                return OrderedDict()
+        else:
+            self.writeCtaLog(u'策略实例不存在：' + name)
+            return None
+    
+    #----------------------------------------------------------------------
+    def setProfileEnabled(self, enabled):
+        """启用或停用策略回调性能统计"""
+        self.profileEnabled = enabled
+        
+        if enabled:
+            for name in self.strategyDict.keys():
+                if name not in self.profilerDict:
+                    self.profilerDict[name] = StrategyProfiler(name)
+            self.writeCtaLog(u'策略性能统计已启用')
+        else:
+            # 停用时同时结束所有的cProfile采样
+            for profiler in self.profilerDict.values():
+                profiler.stopProfile()
+            self.writeCtaLog(u'策略性能统计已停用')
+    
+    #----------------------------------------------------------------------
+    def setCallbackBudget(self, budget):
+        """设置单次回调的耗时预算（毫秒）"""
+        self.callbackBudget = budget / 1000
+    
+    #----------------------------------------------------------------------
+    def clearStrategyPerf(self, name):
+        """清空策略的性能统计数据"""
+        profiler = self.profilerDict.get(name, None)
+        if profiler:
+            profiler.clear()
+    
+    #----------------------------------------------------------------------
+    def startStrategyProfile(self, name):
+        """对策略开启cProfile采样"""
+        if name not in self.strategyDict:
+            self.writeCtaLog(u'策略实例不存在：' + name)
+            return
+        
+        if not self.profileEnabled:
+            self.setProfileEnabled(True)
+        
+        self.profilerDict[name].startProfile()
+        self.writeCtaLog(u'策略%s开始性能采样' %name)
+        
+    #----------------------------------------------------------------------
+    def stopStrategyProfile(self, name):
+        """停止策略的cProfile采样，结果输出到日志并返回"""
+        profiler = self.profilerDict.get(name, None)
+        if not profiler:
+            return ''
+        
+        result = profiler.stopProfile()
+        if result:
+            self.writeCtaLog(u'策略%s性能采样结果：\n%s' %(name, result))
+        return result
+        
     #----------------------------------------------------------------------
     def callStrategyFunc(self, strategy, func, params=None):
         """调用策略的函数，若触发异常则捕捉"""
         try:
-            if params:
+            if self.profileEnabled:
+                profiler = self.profilerDict.get(strategy.name, None)
+                if not profiler:
+                    profiler = StrategyProfiler(strategy.name)
+                    self.profilerDict[strategy.name] = profiler
+                profiler.call(func, params, self.callbackBudget)
+            elif params:
                 func(params)
             else:
                 func()
@@ -614,7 +744,7 @@ class CtaEngine(object):
     #----------------------------------------------------------------------
     def stop(self):
         """停止"""
-        pass
+        self.saveHistoryCache()
     
     #----------------------------------------------------------------------
     def cancelAll(self, name):
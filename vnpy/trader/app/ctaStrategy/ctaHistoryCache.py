@@ -0,0 +1,193 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了CTA引擎使用的历史数据缓存，多个策略在初始化时读取同一合约的
+历史数据时，只需要查询一次数据库：
+1. 缓存以(dbName, collectionName, startDate)为键，保存从startDate开始的全部数据，
+   数据通过主引擎的历史数据存储（HistoryStore）读取
+2. 请求的起始时间不早于某个缓存的起始时间时，直接从该缓存中切片返回，
+   否则查询数据库，新的缓存会替代被其覆盖的同一集合的缓存
+3. 缓存载入超过有效期（TTL）后失效并被移除，CtaEngine每秒清理一次
+4. 缓存数量和数据总量有上限，超过后按最近最少使用（LRU）的顺序移除
+5. 缓存可以保存到本地快照文件，引擎启动时预先载入，首次使用时查询增量数据，
+   在此之前不会因为超过有效期被移除
+6. 查询失败时不创建缓存，下次读取时重新查询
+'''
+
+import shelve
+from bisect import bisect_left
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+
+########################################################################
+class CacheEntry(object):
+    """单个数据集合的缓存"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, startDate, dataList):
+        """Constructor"""
+        self.startDate = startDate      # 缓存数据的起始时间
+        self.dataList = []              # 数据字典列表，按datetime排序
+        self.dtList = []                # datetime列表，用于二分查找
+        self.loadTime = time()          # 载入时间戳，用于判断是否过期
+        self.stale = False              # 从快照载入的缓存，首次使用时需要查询增量数据，之前不会过期
+
+        self.append(dataList)
+
+    #----------------------------------------------------------------------
+    def append(self, dataList):
+        """在缓存后面添加更新的数据"""
+        self.dataList.extend(dataList)
+        self.dtList.extend([d['datetime'] for d in dataList])
+
+    #----------------------------------------------------------------------
+    def slice(self, startDate):
+        """获取从startDate开始的数据"""
+        i = bisect_left(self.dtList, startDate)
+        return self.dataList[i:]
+
+
+########################################################################
+class HistoryCache(object):
+    """历史数据缓存"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, mainEngine, ttl=60, maxSize=20, maxCount=1000000):
+        """
+        Constructor
+        ttl为缓存有效期（秒），maxSize为最多缓存的数量，maxCount为所有缓存的数据总量上限
+        """
+        self.mainEngine = mainEngine
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.maxCount = maxCount
+
+        # 缓存字典，key为(dbName, collectionName, startDate)，value为CacheEntry对象，
+        # 按最近使用的顺序排列，最近使用的在最后
+        self.cacheDict = OrderedDict()
+        self.lock = Lock()
+
+        # 统计数据
+        self.hitCount = 0               # 无需查询数据库的次数
+        self.queryCount = 0             # 查询数据库的次数
+
+    #----------------------------------------------------------------------
+    def query(self, dbName, collectionName, start, end=None):
+        """从历史数据存储中读取[start, end)内的数据，查询失败时返回None"""
+        self.queryCount += 1
+        return self.mainEngine.loadHistory(dbName, collectionName, start, end)
+
+    #----------------------------------------------------------------------
+    def findKey(self, dbName, collectionName, startDate):
+        """查找能够覆盖startDate的缓存中起始时间最晚（数据最少）的一个，找不到返回None"""
+        result = None
+        for key in self.cacheDict.keys():
+            if key[:2] == (dbName, collectionName) and key[2] <= startDate:
+                if not result or key[2] > result[2]:
+                    result = key
+        return result
+
+    #----------------------------------------------------------------------
+    def load(self, dbName, collectionName, startDate):
+        """读取从startDate开始的数据，返回数据字典列表（注意不要修改其中的字典）"""
+        with self.lock:
+            self.removeExpired()
+
+            key = self.findKey(dbName, collectionName, startDate)
+
+            if key:
+                # 移动到最后，标记为最近使用
+                entry = self.cacheDict.pop(key)
+                self.cacheDict[key] = entry
+
+                # 快照中的缓存，从最后一条数据开始查询增量部分
+                # 查询失败时保留过期标记，下次读取时重新查询
+                if entry.stale:
+                    if entry.dtList:
+                        lastDatetime = entry.dtList[-1]
+                        dataList = self.query(dbName, collectionName, lastDatetime)
+                        if dataList is not None:
+                            dataList = [d for d in dataList if d['datetime'] > lastDatetime]
+                    else:
+                        dataList = self.query(dbName, collectionName, entry.startDate)
+
+                    if dataList is not None:
+                        entry.append(dataList)
+                        entry.stale = False
+                        entry.loadTime = time()
+                else:
+                    self.hitCount += 1
+            else:
+                dataList = self.query(dbName, collectionName, startDate)
+                if dataList is None:
+                    return []
+
+                entry = CacheEntry(startDate, dataList)
+
+                # 同一集合中起始时间更晚的缓存已被新缓存覆盖
+                for k in self.cacheDict.keys():
+                    if k[:2] == (dbName, collectionName) and k[2] > startDate:
+                        del self.cacheDict[k]
+
+                self.cacheDict[(dbName, collectionName, startDate)] = entry
+                self.removeOverflow()
+
+            return entry.slice(startDate)
+
+    #----------------------------------------------------------------------
+    def removeExpired(self):
+        """移除超过有效期的缓存，尚未查询增量数据的快照缓存除外"""
+        now = time()
+        for key, entry in self.cacheDict.items():
+            if not entry.stale and now - entry.loadTime > self.ttl:
+                del self.cacheDict[key]
+
+    #----------------------------------------------------------------------
+    def removeOverflow(self):
+        """缓存数量或数据总量超过上限时，移除最近最少使用的缓存"""
+        count = sum([len(entry.dataList) for entry in self.cacheDict.values()])
+
+        while self.cacheDict and (len(self.cacheDict) > self.maxSize or count > self.maxCount):
+            key, entry = self.cacheDict.popitem(last=False)
+            count -= len(entry.dataList)
+
+    #----------------------------------------------------------------------
+    def expire(self):
+        """清理过期的缓存，由CtaEngine定时调用"""
+        with self.lock:
+            self.removeExpired()
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.cacheDict.clear()
+
+    #----------------------------------------------------------------------
+    def saveSnapshot(self, path):
+        """保存缓存到本地快照文件，缓存为空时保留原有的快照"""
+        with self.lock:
+            if not self.cacheDict:
+                return
+
+            f = shelve.open(path)
+            f.clear()
+            for (dbName, collectionName, startDate), entry in self.cacheDict.items():
+                k = '|'.join([dbName, collectionName, startDate.isoformat()])
+                f[k] = (dbName, collectionName, startDate, entry.dataList)
+            f.close()
+
+    #----------------------------------------------------------------------
+    def loadSnapshot(self, path):
+        """从本地快照文件载入缓存，载入的缓存在首次使用时会查询增量数据"""
+        with self.lock:
+            f = shelve.open(path)
+            for dbName, collectionName, startDate, dataList in f.values():
+                entry = CacheEntry(startDate, dataList)
+                entry.stale = True
+                self.cacheDict[(dbName, collectionName, startDate)] = entry
+            f.close()
+
+            self.removeOverflow()
@@ -9,14 +9,18 @@
 
 from datetime import datetime, timedelta
 from time import time
+from multiprocessing import Pool
 from multiprocessing.pool import ThreadPool
 
+import numpy as np
+import pandas as pd
 import pymongo
 
-from vnpy.data.datayes import DatayesApi
+from vnpy.data.datayes import DatayesApi, DATAYES_DOMAIN
 from vnpy.trader.vtGlobal import globalSetting
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtObject import VtBarData
+from vnpy.trader.vtHistoryStore import createHistoryStore
 from .ctaBase import SETTING_DB_NAME, TICK_DB_NAME, MINUTE_DB_NAME, DAILY_DB_NAME
 
 
@@ -28,16 +32,24 @@ VT_TO_DATAYES_EXCHANGE[EXCHANGE_CZCE] = 'XZCE'       # 郑商所
 VT_TO_DATAYES_EXCHANGE[EXCHANGE_DCE] = 'XDCE'       # 大商所
 DATAYES_TO_VT_EXCHANGE = {v:k for k,v in VT_TO_DATAYES_EXCHANGE.items()}
 
+# 从csv文件导入的K线数值字段
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'openInterest']
+
 
 ########################################################################
 class HistoryDataEngine(object):
     """CTA模块用的历史数据引擎"""
 
     #----------------------------------------------------------------------
-    def __init__(self, token):
-        """Constructor"""
+    def __init__(self, token, domain=DATAYES_DOMAIN, rateLimit=0, maxRetry=3):
+        """
+        Constructor
+        domain为通联数据API的主域名（测试时可以指向本地的模拟服务器），
+        rateLimit为每秒最多请求次数（0代表不限制），maxRetry为请求失败后的最大重试次数
+        """
         self.dbClient = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
-        self.datayesClient = DatayesApi(token)
+        self.historyStore = createHistoryStore()        # 行情数据的存储，合约代码等配置仍然保存在MongoDB中
+        self.datayesClient = DatayesApi(token, domain, rateLimit=rateLimit, maxRetry=maxRetry)
         
     #----------------------------------------------------------------------
     def lastTradeDate(self):
@@ -94,21 +106,30 @@ class HistoryDataEngine(object):
         else:
             print u'期货合约代码下载失败'
         
+    #----------------------------------------------------------------------
+    def getLastDate(self, dbName, symbol):
+        """查询已有数据的最后日期（YYYYMMDD），没有数据返回空字符串"""
+        lastDatetime = self.historyStore.lastTimestamp(dbName, symbol)
+        if lastDatetime:
+            return lastDatetime.strftime('%Y%m%d')
+        return ''
+    
+    #----------------------------------------------------------------------
+    def saveBars(self, dbName, symbol, barList):
+        """批量写入K线（按datetime替换，不存在则插入），返回写入的数量"""
+        return self.historyStore.saveBars(dbName, symbol, [bar.__dict__ for bar in barList])
+    
     #----------------------------------------------------------------------
     def downloadFuturesDailyBar(self, symbol):
         """
         下载期货合约的日行情，symbol是合约代码，
         若最后四位为0000（如IF0000），代表下载连续合约。
+        返回写入的K线数量，下载失败返回-1
         """
         print u'开始下载%s日行情' %symbol
         
         # 查询数据库中已有数据的最后日期
-        cl = self.dbClient[DAILY_DB_NAME][symbol]
-        cx = cl.find(sort=[('datetime', pymongo.DESCENDING)])
-        if cx.count():
-            last = cx[0]
-        else:
-            last = ''
+        lastDate = self.getLastDate(DAILY_DB_NAME, symbol)
         
         # 主力合约
         if '0000' in symbol:
@@ -117,25 +138,22 @@ class HistoryDataEngine(object):
             params = {}
             params['contractObject'] = symbol.replace('0000', '')
             params['mainCon'] = 1
-            if last:
-                params['startDate'] = last['date']
+            if lastDate:
+                params['startDate'] = lastDate
         # 交易合约
         else:
             path = 'api/market/getMktFutd.json'
             
             params = {}
             params['ticker'] = symbol
-            if last:
-                params['startDate'] = last['date']
+            if lastDate:
+                params['startDate'] = lastDate
         
         # 开始下载数据
         data = self.datayesClient.downloadData(path, params)
         
         if data:
-            # 创建datetime索引
-            self.dbClient[DAILY_DB_NAME][symbol].ensure_index([('datetime', pymongo.ASCENDING)], 
-                                                                      unique=True)                
-
+            barList = []
             for d in data:
                 bar = VtBarData()
                 bar.vtSymbol = symbol
@@ -151,19 +169,24 @@ class HistoryDataEngine(object):
                     bar.datetime = datetime.strptime(bar.date, '%Y%m%d')
                     bar.volume = d.get('turnoverVol', 0)
                     bar.openInterest = d.get('openInt', 0)
-                except KeyError:
+                except (KeyError, ValueError):
                     print d
-                
-                flt = {'datetime': bar.datetime}
-                self.dbClient[DAILY_DB_NAME][symbol].update_one(flt, {'$set':bar.__dict__}, upsert=True)            
+                    continue
+                barList.append(bar)
             
-                print u'%s下载完成' %symbol
+            count = self.saveBars(DAILY_DB_NAME, symbol, barList)
+            print u'%s下载完成，数据量：%s' %(symbol, count)
+            return count
         else:
             print u'找不到合约%s' %symbol
+            return -1
             
     #----------------------------------------------------------------------
-    def downloadAllFuturesDailyBar(self):
-        """下载所有期货的主力合约日行情"""
+    def downloadAllFuturesDailyBar(self, threadCount=1):
+        """
+        下载所有期货的主力合约日行情
+        threadCount大于1时使用线程池并行下载，请求频率由构造时的rateLimit限制
+        """
         start = time()
         print u'开始下载所有期货的主力合约日行情'
         
@@ -171,17 +194,26 @@ class HistoryDataEngine(object):
         
         print u'代码列表读取成功，产品代码：%s' %productSymbolSet
         
-        # 这里也测试了线程池，但可能由于下载函数中涉及较多的数据格
-        # 式转换，CPU开销较大，多线程效率并无显著改变。
-        #p = ThreadPool(10)
-        #p.map(self.downloadFuturesDailyBar, productSymbolSet)
-        #p.close()
-        #p.join()
+        symbolList = [productSymbol+'0000' for productSymbol in sorted(productSymbolSet)]
         
-        for productSymbol in productSymbolSet:
-            self.downloadFuturesDailyBar(productSymbol+'0000')
-
-        print u'所有期货的主力合约日行情已经全部下载完成, 耗时%s秒' %(time()-start)
+        # 数据转换和写入改为批量操作后，主要耗时在等待http请求上，
+        # 使用线程池可以显著缩短下载时间
+        if threadCount > 1:
+            p = ThreadPool(threadCount)
+            countList = p.map(self.downloadFuturesDailyBar, symbolList)
+            p.close()
+            p.join()
+        else:
+            countList = [self.downloadFuturesDailyBar(symbol) for symbol in symbolList]
+        
+        failedList = [symbol for symbol, count in zip(symbolList, countList) if count < 0]
+        total = sum([count for count in countList if count > 0])
+        
+        print u'所有期货的主力合约日行情已经全部下载完成，数据量：%s，耗时%s秒' %(total, time()-start)
+        if failedList:
+            print u'下载失败的合约：%s' %failedList
+        
+        return failedList
         
     #----------------------------------------------------------------------
     def downloadFuturesIntradayBar(self, symbol):
@@ -200,10 +232,7 @@ class HistoryDataEngine(object):
         if data:
             today = datetime.now().strftime('%Y%m%d')
             
-            # 创建datetime索引
-            self.dbClient[MINUTE_DB_NAME][symbol].ensure_index([('datetime', pymongo.ASCENDING)], 
-                                                                      unique=True)                
-
+            barList = []
             for d in data:
                 bar = VtBarData()
                 bar.vtSymbol = symbol
@@ -219,13 +248,13 @@ class HistoryDataEngine(object):
                     bar.datetime = datetime.strptime(bar.date + ' ' + bar.time, '%Y%m%d %H:%M')
                     bar.volume = d.get('totalVolume', 0)
                     bar.openInterest = 0
-                except KeyError:
+                except (KeyError, ValueError):
                     print d
-                
-                flt = {'datetime': bar.datetime}
-                self.dbClient[MINUTE_DB_NAME][symbol].update_one(flt, {'$set':bar.__dict__}, upsert=True)            
+                    continue
+                barList.append(bar)
             
-            print u'%s下载完成' %symbol
+            count = self.saveBars(MINUTE_DB_NAME, symbol, barList)
+            print u'%s下载完成，数据量：%s' %(symbol, count)
         else:
             print u'找不到合约%s' %symbol   
 
@@ -266,28 +295,20 @@ class HistoryDataEngine(object):
         print u'开始下载%s日行情' %symbol
         
         # 查询数据库中已有数据的最后日期
-        cl = self.dbClient[DAILY_DB_NAME][symbol]
-        cx = cl.find(sort=[('datetime', pymongo.DESCENDING)])
-        if cx.count():
-            last = cx[0]
-        else:
-            last = ''
+        lastDate = self.getLastDate(DAILY_DB_NAME, symbol)
         
         # 开始下载数据
         path = 'api/market/getMktEqud.json'
             
         params = {}
         params['ticker'] = symbol
-        if last:
-            params['beginDate'] = last['date']
+        if lastDate:
+            params['beginDate'] = lastDate
         
         data = self.datayesClient.downloadData(path, params)
         
         if data:
-            # 创建datetime索引
-            self.dbClient[DAILY_DB_NAME][symbol].ensure_index([('datetime', pymongo.ASCENDING)], 
-                                                                unique=True)                
-
+            barList = []
             for d in data:
                 bar = VtBarData()
                 bar.vtSymbol = symbol
@@ -302,13 +323,13 @@ class HistoryDataEngine(object):
                     bar.time = ''
                     bar.datetime = datetime.strptime(bar.date, '%Y%m%d')
                     bar.volume = d.get('turnoverVol', 0)
-                except KeyError:
+                except (KeyError, ValueError):
                     print d
-                
-                flt = {'datetime': bar.datetime}
-                self.dbClient[DAILY_DB_NAME][symbol].update_one(flt, {'$set':bar.__dict__}, upsert=True)            
+                    continue
+                barList.append(bar)
             
-            print u'%s下载完成' %symbol
+            count = self.saveBars(DAILY_DB_NAME, symbol, barList)
+            print u'%s下载完成，数据量：%s' %(symbol, count)
         else:
             print u'找不到合约%s' %symbol    
 
@@ -363,145 +384,184 @@ def downloadEquityDailyBarts(self, symbol):
         print u'找不到合约%s' %symbol
 
 #----------------------------------------------------------------------
-def loadMcCsv(fileName, dbName, symbol):
-    """将Multicharts导出的csv格式的历史数据插入到Mongo数据库中"""
-    import csv
+def formatDatetime(dtSeries, fmt):
+    """将datetime列格式化为字符串列，相同的值只格式化一次"""
+    uniqueArray = dtSeries.unique()
+    strDict = {dt: pd.Timestamp(dt).strftime(fmt) for dt in uniqueArray}
+    return dtSeries.map(strDict)
+
+
+#----------------------------------------------------------------------
+def readMcCsv(fileName):
+    """读取Multicharts导出的csv文件（带表头），返回K线DataFrame"""
+    df = pd.read_csv(fileName, dtype={'Date': str, 'Time': str,
+                                      'Open': np.float64, 'High': np.float64,
+                                      'Low': np.float64, 'Close': np.float64})
     
-    start = time()
-    print u'开始读取CSV文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol)
+    bars = pd.DataFrame({
+        'datetime': pd.to_datetime(df['Date'] + ' ' + df['Time'], format='%Y-%m-%d %H:%M:%S'),
+        'open': df['Open'],
+        'high': df['High'],
+        'low': df['Low'],
+        'close': df['Close'],
+        'volume': df['TotalVolume'],
+        'openInterest': 0
+    })
+    return bars
+
+
+#----------------------------------------------------------------------
+def readTbCsv(fileName):
+    """读取TradeBlazer导出的csv文件（无表头，时间格式为2017/01/03 09:01），返回K线DataFrame"""
+    df = pd.read_csv(fileName, header=None, dtype={0: str, 1: np.float64, 2: np.float64,
+                                                   3: np.float64, 4: np.float64})
     
-    # 锁定集合，并创建索引
-    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort']) 
-    collection = client[dbName][symbol]
-    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)   
+    bars = pd.DataFrame({
+        'datetime': pd.to_datetime(df[0], format='%Y/%m/%d %H:%M'),
+        'open': df[1],
+        'high': df[2],
+        'low': df[3],
+        'close': df[4],
+        'volume': df[5],
+        'openInterest': df[6]
+    })
+    return bars
+
+
+#----------------------------------------------------------------------
+def readTbPlusCsv(fileName):
+    """读取TB极速版导出的csv文件（无表头，日期为20170103，时间为0.0901），返回K线DataFrame"""
+    df = pd.read_csv(fileName, header=None, dtype={0: str, 1: np.float64, 2: np.float64,
+                                                   3: np.float64, 4: np.float64, 5: np.float64})
     
-    # 读取数据和插入到数据库
-    reader = csv.DictReader(file(fileName, 'r'))
-    for d in reader:
-        bar = VtBarData()
-        bar.vtSymbol = symbol
-        bar.symbol = symbol
-        bar.open = float(d['Open'])
-        bar.high = float(d['High'])
-        bar.low = float(d['Low'])
-        bar.close = float(d['Close'])
-        bar.date = datetime.strptime(d['Date'], '%Y-%m-%d').strftime('%Y%m%d')
-        bar.time = d['Time']
-        bar.datetime = datetime.strptime(bar.date + ' ' + bar.time, '%Y%m%d %H:%M:%S')
-        bar.volume = d['TotalVolume']
-
-        flt = {'datetime': bar.datetime}
-        collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)  
-        print bar.date, bar.time
+    hhmm = np.round(df[1].values * 10000).astype(np.int64)
+    seconds = (hhmm // 100) * 3600 + (hhmm % 100) * 60
     
-    print u'插入完毕，耗时：%s' % (time()-start)
+    bars = pd.DataFrame({
+        'datetime': pd.to_datetime(df[0], format='%Y%m%d') + pd.to_timedelta(seconds, unit='s'),
+        'open': df[2],
+        'high': df[3],
+        'low': df[4],
+        'close': df[5],
+        'volume': df[6],
+        'openInterest': df[7]
+    })
+    return bars
+
 
 #----------------------------------------------------------------------
-def loadTbCsv(fileName, dbName, symbol):
-    """将TradeBlazer导出的csv格式的历史分钟数据插入到Mongo数据库中"""
-    import csv
+def readTdxCsv(fileName):
+    """读取通达信导出的csv文件（无表头，日期为2017/01/03，时间为0901），返回K线DataFrame"""
+    df = pd.read_csv(fileName, header=None, dtype={0: str, 1: str, 2: np.float64,
+                                                   3: np.float64, 4: np.float64, 5: np.float64})
     
-    start = time()
-    print u'开始读取CSV文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol)
+    bars = pd.DataFrame({
+        'datetime': pd.to_datetime(df[0] + ' ' + df[1].str.zfill(4), format='%Y/%m/%d %H%M'),
+        'open': df[2],
+        'high': df[3],
+        'low': df[4],
+        'close': df[5],
+        'volume': df[6],
+        'openInterest': df[7]
+    })
+    return bars
+
+
+#----------------------------------------------------------------------
+def saveBarFrame(bars, dbName, symbol, chunkSize=10000):
+    """将K线DataFrame分块写入历史数据存储（按datetime替换，不存在则插入），返回写入的数量"""
+    historyStore = createHistoryStore()
     
-    # 锁定集合，并创建索引
-    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
-    collection = client[dbName][symbol]
-    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)   
+    # 同一时间的K线只保留最后一根，和逐条更新的结果一致
+    bars = bars.drop_duplicates('datetime', keep='last').reset_index(drop=True)
     
-    # 读取数据和插入到数据库
-    reader = csv.reader(file(fileName, 'r'))
-    for d in reader:
-        bar = VtBarData()
-        bar.vtSymbol = symbol
-        bar.symbol = symbol
-        bar.open = float(d[1])
-        bar.high = float(d[2])
-        bar.low = float(d[3])
-        bar.close = float(d[4])
-        bar.date = datetime.strptime(d[0].split(' ')[0], '%Y/%m/%d').strftime('%Y%m%d')
-        bar.time = d[0].split(' ')[1]+":00"
-        bar.datetime = datetime.strptime(bar.date + ' ' + bar.time, '%Y%m%d %H:%M:%S')
-        bar.volume = d[5]
-        bar.openInterest = d[6]
-
-        flt = {'datetime': bar.datetime}
-        collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)  
-        print bar.date, bar.time
+    template = VtBarData().__dict__
+    template['vtSymbol'] = symbol
+    template['symbol'] = symbol
     
-    print u'插入完毕，耗时：%s' % (time()-start)
+    dateList = formatDatetime(bars['datetime'].dt.normalize(), '%Y%m%d').tolist()
+    timeList = formatDatetime(bars['datetime'] - bars['datetime'].dt.normalize()
+                              + pd.Timestamp(0), '%H:%M:%S').tolist()
+    dtList = bars['datetime'].dt.to_pydatetime().tolist()
     
- #----------------------------------------------------------------------
-def loadTbPlusCsv(fileName, dbName, symbol):
-    """将TB极速版导出的csv格式的历史分钟数据插入到Mongo数据库中"""
-    import csv    
+    columnList = [bars[name].tolist() for name in BAR_COLUMNS]
+    total = len(bars)
+    
+    for i in range(0, total, chunkSize):
+        dataList = []
+        for j in range(i, min(i + chunkSize, total)):
+            d = template.copy()
+            for name, column in zip(BAR_COLUMNS, columnList):
+                d[name] = column[j]
+            d['datetime'] = dtList[j]
+            d['date'] = dateList[j]
+            d['time'] = timeList[j]
+            dataList.append(d)
+        
+        historyStore.saveBars(dbName, symbol, dataList)
+        print u'%s：已插入%s/%s' %(symbol, min(i + chunkSize, total), total)
+    
+    historyStore.close()
+    return total
+
 
+#----------------------------------------------------------------------
+def loadCsv(reader, fileName, dbName, symbol):
+    """使用reader读取csv文件，并插入到Mongo数据库中"""
     start = time()
-    print u'开始读取CSV文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol) 
-
-    # 锁定集合，并创建索引
-    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
-    collection = client[dbName][symbol]
-    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)      
-
-    # 读取数据和插入到数据库
-    reader = csv.reader(file(fileName, 'r'))
-    for d in reader:
-        bar = VtBarData()
-        bar.vtSymbol = symbol
-        bar.symbol = symbol
-        bar.open = float(d[2])
-        bar.high = float(d[3])
-        bar.low = float(d[4])
-        bar.close = float(d[5])
-        bar.date = str(d[0])
-        
-        tempstr=str(round(float(d[1])*10000)).split(".")[0].zfill(4)
-        bar.time = tempstr[:2]+":"+tempstr[2:4]+":00"
-        
-        bar.datetime = datetime.strptime(bar.date + ' ' + bar.time, '%Y%m%d %H:%M:%S')
-        bar.volume = d[6]
-        bar.openInterest = d[7]
-        flt = {'datetime': bar.datetime}
-        collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)  
-        print bar.date, bar.time    
-
-    print u'插入完毕，耗时：%s' % (time()-start)
+    print u'开始读取CSV文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol)
+    
+    bars = reader(fileName)
+    count = saveBarFrame(bars, dbName, symbol)
+    
+    print u'%s插入完毕，数据量：%s，耗时：%.2f秒' %(symbol, count, time()-start)
+    return count
+
+
+#----------------------------------------------------------------------
+def loadMcCsv(fileName, dbName, symbol):
+    """将Multicharts导出的csv格式的历史数据插入到Mongo数据库中"""
+    return loadCsv(readMcCsv, fileName, dbName, symbol)
+
+
+#----------------------------------------------------------------------
+def loadTbCsv(fileName, dbName, symbol):
+    """将TradeBlazer导出的csv格式的历史分钟数据插入到Mongo数据库中"""
+    return loadCsv(readTbCsv, fileName, dbName, symbol)
+
+
+#----------------------------------------------------------------------
+def loadTbPlusCsv(fileName, dbName, symbol):
+    """将TB极速版导出的csv格式的历史分钟数据插入到Mongo数据库中"""
+    return loadCsv(readTbPlusCsv, fileName, dbName, symbol)
 
 
 #----------------------------------------------------------------------
 def loadTdxCsv(fileName, dbName, symbol):
     """将通达信导出的csv格式的历史分钟数据插入到Mongo数据库中"""
-    import csv
-    
+    return loadCsv(readTdxCsv, fileName, dbName, symbol)
+
+
+#----------------------------------------------------------------------
+def runLoadTask(task):
+    """执行单个导入任务，供进程池调用"""
+    func, fileName, dbName, symbol = task
+    return func(fileName, dbName, symbol)
+
+
+#----------------------------------------------------------------------
+def loadCsvFiles(taskList, processes=4):
+    """
+    使用多个进程并行导入多个csv文件
+    taskList为[(导入函数, 文件名, 数据库名, 合约代码)]，导入函数如loadMcCsv
+    """
     start = time()
-    print u'开始读取CSV文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol)
-    
-    # 锁定集合，并创建索引
-    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
-    collection = client[dbName][symbol]
-    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)   
     
-    # 读取数据和插入到数据库
-    reader = csv.reader(file(fileName, 'r'))
-    for d in reader:
-        bar = VtBarData()
-        bar.vtSymbol = symbol
-        bar.symbol = symbol
-        bar.open = float(d[2])
-        bar.high = float(d[3])
-        bar.low = float(d[4])
-        bar.close = float(d[5])
-        bar.date = datetime.strptime(d[0], '%Y/%m/%d').strftime('%Y%m%d')
-        bar.time = d[1][:2]+':'+d[1][2:4]+':00'
-        bar.datetime = datetime.strptime(bar.date + ' ' + bar.time, '%Y%m%d %H:%M:%S')
-        bar.volume = d[6]
-        bar.openInterest = d[7]
-
-        flt = {'datetime': bar.datetime}
-        collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)  
-        print bar.date, bar.time
-    
-    print u'插入完毕，耗时：%s' % (time()-start)
-
+    pool = Pool(processes)
+    countList = pool.map(runLoadTask, taskList)
+    pool.close()
+    pool.join()
     
+    print u'全部导入完毕，文件数量：%s，数据量：%s，耗时：%.2f秒' %(len(taskList), sum(countList), 
+                                                              time()-start)
+    return countList
@@ -0,0 +1,253 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了回测结果的蒙特卡洛稳健性分析，基于一次回测的结果重采样生成大量资金曲线：
+1. runTradeShuffle：打乱逐笔交易的顺序（基于TradingResult列表）
+2. runBlockBootstrap：对逐日盈亏进行分块自助抽样（基于逐日统计的DataFrame）
+3. runSlippageJitter：对逐日滑点成本施加随机扰动（基于逐日统计的DataFrame）
+
+每批模拟的资金曲线使用numpy矩阵一次性计算，多批模拟在进程池中并行运行。
+每批模拟的随机数种子由seed和批次编号决定，因此结果和进程数量无关，可以重复。
+'''
+from __future__ import division
+
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+
+# 分析方法
+METHOD_TRADE_SHUFFLE = 'tradeShuffle'
+METHOD_BLOCK_BOOTSTRAP = 'blockBootstrap'
+METHOD_SLIPPAGE_JITTER = 'slippageJitter'
+
+# 统计指标
+METRIC_NAMES = ['totalNetPnl', 'maxDrawdown', 'maxDrawdownPercent', 'sharpeRatio']
+
+
+#----------------------------------------------------------------------
+def calculateCurveStatistics(pnl, capital):
+    """
+    基于盈亏矩阵计算每条资金曲线的统计指标，计算方法和BacktestingEngine的逐日统计一致
+    pnl：二维数组，每行为一条曲线的逐笔（或逐日）净盈亏
+    """
+    balance = np.cumsum(pnl, axis=1) + capital
+    highlevel = np.maximum.accumulate(balance, axis=1)
+    drawdown = balance - highlevel
+
+    # 资金为负时对数收益率无意义，对应的夏普比率为nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logBalance = np.log(balance)
+        returns = np.zeros(balance.shape)
+        returns[:, 1:] = logBalance[:, 1:] - logBalance[:, :-1]
+
+        returnMean = returns.mean(axis=1)
+        returnStd = returns.std(axis=1, ddof=1)
+        sharpeRatio = returnMean / returnStd * np.sqrt(240)
+        sharpeRatio[returnStd == 0] = 0
+
+        maxDrawdownPercent = (drawdown / highlevel).min(axis=1) * 100
+
+    d = OrderedDict()
+    d['totalNetPnl'] = balance[:, -1] - capital
+    d['maxDrawdown'] = drawdown.min(axis=1)
+    d['maxDrawdownPercent'] = maxDrawdownPercent
+    d['sharpeRatio'] = sharpeRatio
+    return d
+
+
+#----------------------------------------------------------------------
+def simulate(method, pnl, slippage, capital, setting, seed, count):
+    """
+    运行一批模拟，多进程分析时在每个进程中运行的函数
+    method：分析方法
+    pnl：原始逐笔（或逐日）净盈亏数组
+    slippage：原始逐笔（或逐日）滑点成本数组
+    setting：分析方法的参数字典
+    seed：本批模拟的随机数种子
+    count：本批模拟的曲线数量
+    """
+    rs = np.random.RandomState(seed)
+    n = len(pnl)
+
+    if method == METHOD_TRADE_SHUFFLE:
+        # 每行一个随机排列：对随机数矩阵按行排序得到排列索引
+        index = np.argsort(rs.random_sample((count, n)), axis=1)
+        simPnl = pnl[index]
+
+    elif method == METHOD_BLOCK_BOOTSTRAP:
+        # 循环分块自助抽样，保留日收益率在blockSize天内的自相关
+        blockSize = max(1, min(setting['blockSize'], n))
+        blockCount = -(-n // blockSize)
+        starts = rs.randint(0, n, size=(count, blockCount))
+        index = (starts[:, :, np.newaxis] + np.arange(blockSize)) % n
+        index = index.reshape(count, blockCount * blockSize)[:, :n]
+        simPnl = pnl[index]
+
+    elif method == METHOD_SLIPPAGE_JITTER:
+        # 每日滑点成本乘以均值为1的随机倍数（不小于0）
+        multiplier = np.maximum(rs.normal(1, setting['jitter'], (count, n)), 0)
+        simPnl = pnl + slippage * (1 - multiplier)
+
+    else:
+        raise ValueError(u'不支持的分析方法：%s' %method)
+
+    return calculateCurveStatistics(simPnl, capital)
+
+
+########################################################################
+class MonteCarloAnalyzer(object):
+    """
+    回测结果蒙特卡洛分析器
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, capital=1000000, seed=0, processes=0, batchSize=500):
+        """Constructor"""
+        self.capital = capital                                      # 起始资金
+        self.seed = seed                                            # 随机数种子
+        self.processes = processes or multiprocessing.cpu_count()   # 进程数量
+        self.batchSize = batchSize                                  # 每批模拟的曲线数量
+
+        self.tradePnl = None            # 逐笔净盈亏
+        self.tradeSlippage = None       # 逐笔滑点成本
+
+        self.dailyPnl = None            # 逐日净盈亏
+        self.dailySlippage = None       # 逐日滑点成本
+
+    #----------------------------------------------------------------------
+    def output(self, content):
+        """输出内容"""
+        print content
+
+    #----------------------------------------------------------------------
+    def setTradingResult(self, resultList):
+        """设置逐笔交易结果（TradingResult列表，可从calculateBacktestingResult结果的resultList获取）"""
+        self.tradePnl = np.array([result.pnl for result in resultList], dtype=float)
+        self.tradeSlippage = np.array([result.slippage for result in resultList], dtype=float)
+
+    #----------------------------------------------------------------------
+    def setDailyResult(self, df):
+        """设置逐日交易结果（calculateDailyResult返回的DataFrame）"""
+        self.dailyPnl = df['netPnl'].values.astype(float)
+        self.dailySlippage = df['slippage'].values.astype(float)
+
+    #----------------------------------------------------------------------
+    def setBacktestingEngine(self, engine):
+        """从已完成回测的BacktestingEngine中读取逐笔和逐日结果"""
+        self.capital = engine.capital
+
+        d = engine.calculateBacktestingResult()
+        if d:
+            self.setTradingResult(d['resultList'])
+
+        if engine.dailyResultDict:
+            self.setDailyResult(engine.calculateDailyResult())
+
+    #----------------------------------------------------------------------
+    def run(self, method, pnl, slippage, count, setting):
+        """分批并行运行模拟，返回统计指标字典，每个指标为长度count的数组"""
+        if pnl is None or not len(pnl):
+            self.output(u'没有用于分析的回测结果')
+            return {}
+
+        # 每批的种子由批次编号决定，和进程数量无关
+        batchList = []
+        for i, start in enumerate(range(0, count, self.batchSize)):
+            batchList.append((method, pnl, slippage, self.capital, setting,
+                              self.seed + i, min(self.batchSize, count - start)))
+
+        if self.processes > 1 and len(batchList) > 1:
+            pool = multiprocessing.Pool(min(self.processes, len(batchList)))
+            l = [pool.apply_async(simulate, args) for args in batchList]
+            pool.close()
+            pool.join()
+            resultList = [res.get() for res in l]
+        else:
+            resultList = [simulate(*args) for args in batchList]
+
+        result = OrderedDict()
+        for name in METRIC_NAMES:
+            result[name] = np.concatenate([d[name] for d in resultList])
+
+        # 原始曲线的指标，用于和模拟的分布对比
+        origin = calculateCurveStatistics(pnl[np.newaxis, :], self.capital)
+        result['origin'] = OrderedDict([(k, v[0]) for k, v in origin.items()])
+
+        return result
+
+    #----------------------------------------------------------------------
+    def runTradeShuffle(self, count=1000):
+        """打乱逐笔交易顺序，分析回撤对交易顺序的敏感度"""
+        return self.run(METHOD_TRADE_SHUFFLE, self.tradePnl, self.tradeSlippage, count, {})
+
+    #----------------------------------------------------------------------
+    def runBlockBootstrap(self, count=1000, blockSize=5):
+        """对逐日盈亏进行分块自助抽样，blockSize为每块的天数"""
+        return self.run(METHOD_BLOCK_BOOTSTRAP, self.dailyPnl, self.dailySlippage, count,
+                        {'blockSize': blockSize})
+
+    #----------------------------------------------------------------------
+    def runSlippageJitter(self, count=1000, jitter=0.5):
+        """对逐日滑点成本施加随机扰动，jitter为滑点倍数的标准差"""
+        return self.run(METHOD_SLIPPAGE_JITTER, self.dailyPnl, self.dailySlippage, count,
+                        {'jitter': jitter})
+
+    #----------------------------------------------------------------------
+    def calculateStatistics(self, result, confidence=0.95):
+        """计算每个指标分布的均值、标准差、置信区间，以及原始结果在分布中的百分位"""
+        lowerPercent = (1 - confidence) / 2 * 100
+        upperPercent = 100 - lowerPercent
+
+        statistics = OrderedDict()
+        for name in METRIC_NAMES:
+            values = result[name]
+            values = values[~np.isnan(values)]
+
+            d = OrderedDict()
+            if len(values):
+                d['mean'] = values.mean()
+                d['std'] = values.std()
+                d['median'] = np.median(values)
+                d['lower'] = np.percentile(values, lowerPercent)
+                d['upper'] = np.percentile(values, upperPercent)
+                d['originPercentile'] = (values <= result['origin'][name]).mean() * 100
+            d['origin'] = result['origin'][name]
+            d['nanCount'] = len(result[name]) - len(values)
+
+            statistics[name] = d
+
+        return statistics
+
+    #----------------------------------------------------------------------
+    def showResult(self, result, title='', confidence=0.95):
+        """显示分析结果的统计和分布"""
+        if not result:
+            return
+
+        statistics = self.calculateStatistics(result, confidence)
+
+        self.output('-' * 30)
+        self.output(u'%s 模拟次数：%s，置信度：%s' %(title, len(result[METRIC_NAMES[0]]), confidence))
+        for name, d in statistics.items():
+            self.output(u'%s\t原始：%.2f\t均值：%.2f\t置信区间：[%.2f, %.2f]' %(
+                name, d['origin'], d.get('mean', np.nan), d.get('lower', np.nan), d.get('upper', np.nan)))
+
+        # 绘图
+        fig = plt.figure(figsize=(10, 12))
+
+        for i, name in enumerate(METRIC_NAMES):
+            values = result[name]
+            values = values[~np.isnan(values)]
+
+            p = plt.subplot(len(METRIC_NAMES), 1, i+1)
+            p.set_title('%s %s' %(title, name))
+            p.hist(values, bins=50)
+            p.axvline(statistics[name]['origin'], color='r')
+
+        plt.tight_layout()
+        plt.show()
+
+        return statistics
@@ -0,0 +1,718 @@
+# encoding: UTF-8
+
+'''
+本文件中包含的是CTA模块的组合回测引擎，支持多个合约、多个策略在同一个
+资金账户下同时回测：
+1. 各个合约的数据从历史数据存储（HistoryStore，和BacktestingEngine相同）或本地列式缓存文件中流式读取，
+   通过堆实现的多路归并按时间顺序回放，内存占用和数据总量无关
+2. 每条数据推送给订阅了该合约的所有策略，策略可以订阅多个合约
+3. 每个合约维护独立的委托簿、合约参数（乘数、手续费、滑点、最小价格变动）
+4. 按日统计的结果在合约层面计算后汇总为组合层面的结果
+
+策略接口和CTA引擎保持一致，单合约策略无需修改即可用于组合回测。
+'''
+from __future__ import division
+
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from heapq import heappush, heappop, heapreplace
+
+import numpy as np
+import pandas as pd
+
+from vnpy.trader.vtObject import VtTickData, VtBarData
+from vnpy.trader.vtConstant import *
+from vnpy.trader.vtGateway import VtOrderData, VtTradeData
+from vnpy.trader.vtHistoryStore import INCLUSIVE_DELTA
+
+from .ctaBase import *
+from .ctaBacktesting import BacktestingEngine, DailyResult
+
+
+########################################################################
+class BacktestingSymbol(object):
+    """组合回测中的单个合约"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, vtSymbol, dbName, collectionName,
+                 size, rate, slippage, priceTick):
+        """Constructor"""
+        self.vtSymbol = vtSymbol                # 合约代码
+        self.dbName = dbName                    # 数据库名
+        self.collectionName = collectionName    # 集合名
+        self.dataPath = ''                      # 本地列式缓存文件目录，设置后不再读取数据库
+
+        self.size = size                        # 合约大小
+        self.rate = rate                        # 佣金比例
+        self.slippage = slippage                # 滑点
+        self.priceTick = priceTick              # 价格最小变动
+
+        self.strategyList = []                  # 订阅了该合约的策略列表
+        self.initData = []                      # 初始化用的数据
+
+        self.workingLimitOrderDict = OrderedDict()  # 活动限价单字典
+        self.workingStopOrderDict = OrderedDict()   # 活动停止单字典
+
+        self.bar = None                         # 最新K线
+        self.tick = None                        # 最新Tick
+
+        self.dailyResultDict = OrderedDict()    # 每日结果字典
+
+    #----------------------------------------------------------------------
+    def roundToPriceTick(self, price):
+        """取整价格到合约最小价格变动"""
+        if not self.priceTick:
+            return price
+
+        newPrice = round(price/self.priceTick, 0) * self.priceTick
+        return newPrice
+
+
+########################################################################
+class PortfolioBacktestingEngine(BacktestingEngine):
+    """
+    CTA组合回测引擎
+    函数接口和策略引擎保持一样，
+    从而实现同一套代码从回测到实盘。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        super(PortfolioBacktestingEngine, self).__init__()
+
+        self.symbolDict = OrderedDict()     # key为vtSymbol，value为BacktestingSymbol对象
+        self.strategyDict = OrderedDict()   # key为策略名称，value为策略对象
+        self.orderStrategyDict = {}         # key为委托号（限价单和停止单），value为策略对象
+
+        self.batchSize = 10000              # 本地列式缓存文件分块读取时每批的数量
+
+    #------------------------------------------------
+    # 参数设置相关
+    #------------------------------------------------
+
+    #----------------------------------------------------------------------
+    def addSymbol(self, vtSymbol, dbName, collectionName='',
+                  size=1, rate=0, slippage=0, priceTick=0):
+        """添加回测合约，collectionName默认和vtSymbol相同"""
+        if not collectionName:
+            collectionName = vtSymbol
+
+        symbol = BacktestingSymbol(vtSymbol, dbName, collectionName,
+                                   size, rate, slippage, priceTick)
+        self.symbolDict[vtSymbol] = symbol
+
+    #----------------------------------------------------------------------
+    def setDataPath(self, vtSymbol, path):
+        """设置合约使用本地列式缓存文件（由cacheData生成）作为数据源"""
+        self.symbolDict[vtSymbol].dataPath = path
+
+    #----------------------------------------------------------------------
+    def addStrategy(self, strategyClass, setting=None, subscribeList=None):
+        """
+        添加策略
+        setting中的vtSymbol为策略交易的合约，
+        subscribeList为策略需要接收数据的合约列表，默认只有交易的合约
+        """
+        strategy = strategyClass(self, setting)
+
+        if not setting or 'name' not in setting:
+            strategy.name = strategy.className
+
+        if strategy.name in self.strategyDict:
+            self.output(u'策略实例重名：%s' %strategy.name)
+            return None
+
+        if strategy.vtSymbol not in self.symbolDict:
+            self.output(u'策略%s的交易合约%s尚未添加' %(strategy.name, strategy.vtSymbol))
+            return None
+
+        if not subscribeList:
+            subscribeList = [strategy.vtSymbol]
+
+        for vtSymbol in subscribeList:
+            self.symbolDict[vtSymbol].strategyList.append(strategy)
+
+        self.strategyDict[strategy.name] = strategy
+        return strategy
+
+    #------------------------------------------------
+    # 数据回放相关
+    #------------------------------------------------
+
+    #----------------------------------------------------------------------
+    def getDataClass(self):
+        """根据回测模式获取数据类"""
+        if self.mode == self.BAR_MODE:
+            return VtBarData
+        else:
+            return VtTickData
+
+    #----------------------------------------------------------------------
+    def loadInitData(self):
+        """载入所有合约的初始化数据"""
+        dataClass = self.getDataClass()
+
+        for symbol in self.symbolDict.values():
+            symbol.initData = []
+
+            for d in self.generateData(symbol, self.dataStartDate, self.strategyStartDate):
+                data = dataClass()
+                data.__dict__ = d
+                data.vtSymbol = symbol.vtSymbol
+                symbol.initData.append(data)
+
+            self.output(u'%s初始化数据量：%s' %(symbol.vtSymbol, len(symbol.initData)))
+
+    #----------------------------------------------------------------------
+    def generateData(self, symbol, startDate, endDate=None):
+        """
+        流式读取合约数据，返回数据字典的生成器
+        数据范围为[startDate, endDate)，endDate为空时读取到最后
+        """
+        if symbol.dataPath:
+            return self.generateFileData(symbol.dataPath, startDate, endDate)
+
+        return self.getHistoryStore().loadRange(symbol.dbName, symbol.collectionName,
+                                                startDate, endDate)
+
+    #----------------------------------------------------------------------
+    def generateFileData(self, path, startDate, endDate=None):
+        """从本地列式缓存文件中分块读取数据，文件以内存映射方式打开"""
+        columnDict = {}
+        for fileName in os.listdir(path):
+            if fileName.endswith('.npy'):
+                name = fileName.replace('.npy', '')
+                columnDict[name] = np.load(os.path.join(path, fileName), mmap_mode='r')
+
+        dtArray = columnDict['datetime']
+        start = np.searchsorted(dtArray, np.datetime64(startDate, 'us'))
+        if endDate:
+            end = np.searchsorted(dtArray, np.datetime64(endDate, 'us'))
+        else:
+            end = len(dtArray)
+
+        nameList = columnDict.keys()
+
+        for i in range(start, end, self.batchSize):
+            j = min(i+self.batchSize, end)
+
+            # 每次只将一块数据转换为Python对象，控制内存占用
+            chunkList = [columnDict[name][i:j].tolist() for name in nameList]
+            for row in zip(*chunkList):
+                yield dict(zip(nameList, row))
+
+    #----------------------------------------------------------------------
+    def cacheData(self, vtSymbol, path):
+        """将合约在历史数据存储中的全部数据保存为本地列式缓存文件（每个字段一个.npy文件）"""
+        symbol = self.symbolDict[vtSymbol]
+
+        valueDict = OrderedDict()
+        for d in self.getHistoryStore().loadRange(symbol.dbName, symbol.collectionName):
+            for k, v in d.items():
+                if k not in valueDict:
+                    valueDict[k] = []
+                valueDict[k].append(v)
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        for name, l in valueDict.items():
+            if name == 'datetime':
+                array = np.array(l, dtype='datetime64[us]')
+            else:
+                array = np.array(l)
+
+            # 无法内存映射的对象类型字段（如rawData）不保存
+            if array.dtype == object or len(array) != len(valueDict['datetime']):
+                continue
+
+            np.save(os.path.join(path, name + '.npy'), array)
+
+        self.output(u'%s缓存数据完成，数据量：%s' %(vtSymbol, len(valueDict.get('datetime', []))))
+
+    #----------------------------------------------------------------------
+    def mergeData(self):
+        """
+        使用堆对所有合约的数据流做多路归并，按时间顺序返回(合约, 数据字典)
+        时间相同时按照合约添加的顺序返回
+        """
+        heap = []
+
+        # 和单合约回测保持一致，回放数据包含结束时间本身
+        endDate = None
+        if self.dataEndDate:
+            endDate = self.dataEndDate + INCLUSIVE_DELTA
+
+        for n, symbol in enumerate(self.symbolDict.values()):
+            iterator = iter(self.generateData(symbol, self.strategyStartDate, endDate))
+            d = next(iterator, None)
+            if d:
+                heappush(heap, (d['datetime'], n, symbol, d, iterator))
+
+        while heap:
+            dt, n, symbol, d, iterator = heap[0]
+            yield symbol, d
+
+            d = next(iterator, None)
+            if d:
+                heapreplace(heap, (d['datetime'], n, symbol, d, iterator))
+            else:
+                heappop(heap)
+
+    #----------------------------------------------------------------------
+    def runBacktesting(self):
+        """运行回测"""
+        self.output(u'开始载入数据')
+        self.loadInitData()
+
+        self.output(u'开始回测')
+
+        for strategy in self.strategyDict.values():
+            strategy.inited = True
+            strategy.onInit()
+        self.output(u'策略初始化完成')
+
+        for strategy in self.strategyDict.values():
+            strategy.trading = True
+            strategy.onStart()
+        self.output(u'策略启动完成')
+
+        self.output(u'开始回放数据')
+
+        dataClass = self.getDataClass()
+        if self.mode == self.BAR_MODE:
+            func = self.newBar
+        else:
+            func = self.newTick
+
+        count = 0
+        for symbol, d in self.mergeData():
+            data = dataClass()
+            data.__dict__ = d
+            data.vtSymbol = symbol.vtSymbol
+            func(symbol, data)
+            count += 1
+
+        self.output(u'数据回放结束，数据量：%s' %count)
+
+    #----------------------------------------------------------------------
+    def newBar(self, symbol, bar):
+        """新的K线"""
+        symbol.bar = bar
+        self.bar = bar
+        self.dt = bar.datetime
+
+        self.crossLimitOrder(symbol)
+        self.crossStopOrder(symbol)
+
+        for strategy in symbol.strategyList:
+            strategy.onBar(bar)
+
+        self.updateDailyClose(symbol, bar.datetime, bar.close)
+
+    #----------------------------------------------------------------------
+    def newTick(self, symbol, tick):
+        """新的Tick"""
+        symbol.tick = tick
+        self.tick = tick
+        self.dt = tick.datetime
+
+        self.crossLimitOrder(symbol)
+        self.crossStopOrder(symbol)
+
+        for strategy in symbol.strategyList:
+            strategy.onTick(tick)
+
+        self.updateDailyClose(symbol, tick.datetime, tick.lastPrice)
+
+    #----------------------------------------------------------------------
+    def crossLimitOrder(self, symbol):
+        """基于合约最新数据撮合该合约的限价单"""
+        if self.mode == self.BAR_MODE:
+            buyCrossPrice = symbol.bar.low
+            sellCrossPrice = symbol.bar.high
+            buyBestCrossPrice = symbol.bar.open
+            sellBestCrossPrice = symbol.bar.open
+        else:
+            buyCrossPrice = symbol.tick.askPrice1
+            sellCrossPrice = symbol.tick.bidPrice1
+            buyBestCrossPrice = symbol.tick.askPrice1
+            sellBestCrossPrice = symbol.tick.bidPrice1
+
+        for orderID, order in symbol.workingLimitOrderDict.items():
+            strategy = self.orderStrategyDict[orderID]
+
+            # 推送委托进入队列（未成交）的状态更新
+            if not order.status:
+                order.status = STATUS_NOTTRADED
+                strategy.onOrder(order)
+
+            buyCross = (order.direction==DIRECTION_LONG and
+                        order.price>=buyCrossPrice and
+                        buyCrossPrice > 0)
+
+            sellCross = (order.direction==DIRECTION_SHORT and
+                         order.price<=sellCrossPrice and
+                         sellCrossPrice > 0)
+
+            if buyCross or sellCross:
+                self.tradeCount += 1
+                tradeID = str(self.tradeCount)
+                trade = VtTradeData()
+                trade.vtSymbol = order.vtSymbol
+                trade.tradeID = tradeID
+                trade.vtTradeID = tradeID
+                trade.orderID = order.orderID
+                trade.vtOrderID = order.orderID
+                trade.direction = order.direction
+                trade.offset = order.offset
+
+                if buyCross:
+                    trade.price = min(order.price, buyBestCrossPrice)
+                    strategy.pos += order.totalVolume
+                else:
+                    trade.price = max(order.price, sellBestCrossPrice)
+                    strategy.pos -= order.totalVolume
+
+                trade.volume = order.totalVolume
+                trade.tradeTime = self.dt.strftime('%H:%M:%S')
+                trade.dt = self.dt
+                strategy.onTrade(trade)
+
+                self.tradeDict[tradeID] = trade
+
+                order.tradedVolume = order.totalVolume
+                order.status = STATUS_ALLTRADED
+                strategy.onOrder(order)
+
+                del symbol.workingLimitOrderDict[orderID]
+
+    #----------------------------------------------------------------------
+    def crossStopOrder(self, symbol):
+        """基于合约最新数据撮合该合约的停止单"""
+        if self.mode == self.BAR_MODE:
+            buyCrossPrice = symbol.bar.high
+            sellCrossPrice = symbol.bar.low
+            bestCrossPrice = symbol.bar.open
+        else:
+            buyCrossPrice = symbol.tick.lastPrice
+            sellCrossPrice = symbol.tick.lastPrice
+            bestCrossPrice = symbol.tick.lastPrice
+
+        for stopOrderID, so in symbol.workingStopOrderDict.items():
+            buyCross = so.direction==DIRECTION_LONG and so.price<=buyCrossPrice
+            sellCross = so.direction==DIRECTION_SHORT and so.price>=sellCrossPrice
+
+            if buyCross or sellCross:
+                strategy = so.strategy
+
+                so.status = STOPORDER_TRIGGERED
+                if stopOrderID in symbol.workingStopOrderDict:
+                    del symbol.workingStopOrderDict[stopOrderID]
+
+                self.tradeCount += 1
+                tradeID = str(self.tradeCount)
+                trade = VtTradeData()
+                trade.vtSymbol = so.vtSymbol
+                trade.tradeID = tradeID
+                trade.vtTradeID = tradeID
+
+                if buyCross:
+                    strategy.pos += so.volume
+                    trade.price = max(bestCrossPrice, so.price)
+                else:
+                    strategy.pos -= so.volume
+                    trade.price = min(bestCrossPrice, so.price)
+
+                self.limitOrderCount += 1
+                orderID = str(self.limitOrderCount)
+                trade.orderID = orderID
+                trade.vtOrderID = orderID
+                trade.direction = so.direction
+                trade.offset = so.offset
+                trade.volume = so.volume
+                trade.tradeTime = self.dt.strftime('%H:%M:%S')
+                trade.dt = self.dt
+
+                self.tradeDict[tradeID] = trade
+
+                order = VtOrderData()
+                order.vtSymbol = so.vtSymbol
+                order.symbol = so.vtSymbol
+                order.orderID = orderID
+                order.vtOrderID = orderID
+                order.direction = so.direction
+                order.offset = so.offset
+                order.price = so.price
+                order.totalVolume = so.volume
+                order.tradedVolume = so.volume
+                order.status = STATUS_ALLTRADED
+                order.orderTime = trade.tradeTime
+
+                self.limitOrderDict[orderID] = order
+                self.orderStrategyDict[orderID] = strategy
+
+                strategy.onStopOrder(so)
+                strategy.onOrder(order)
+                strategy.onTrade(trade)
+
+    #------------------------------------------------
+    # 策略接口相关
+    #------------------------------------------------
+
+    #----------------------------------------------------------------------
+    def sendOrder(self, vtSymbol, orderType, price, volume, strategy):
+        """发单"""
+        symbol = self.symbolDict[vtSymbol]
+
+        self.limitOrderCount += 1
+        orderID = str(self.limitOrderCount)
+
+        order = VtOrderData()
+        order.vtSymbol = vtSymbol
+        order.price = symbol.roundToPriceTick(price)
+        order.totalVolume = volume
+        order.orderID = orderID
+        order.vtOrderID = orderID
+        order.orderTime = self.dt.strftime('%H:%M:%S')
+
+        if orderType == CTAORDER_BUY:
+            order.direction = DIRECTION_LONG
+            order.offset = OFFSET_OPEN
+        elif orderType == CTAORDER_SELL:
+            order.direction = DIRECTION_SHORT
+            order.offset = OFFSET_CLOSE
+        elif orderType == CTAORDER_SHORT:
+            order.direction = DIRECTION_SHORT
+            order.offset = OFFSET_OPEN
+        elif orderType == CTAORDER_COVER:
+            order.direction = DIRECTION_LONG
+            order.offset = OFFSET_CLOSE
+
+        symbol.workingLimitOrderDict[orderID] = order
+        self.limitOrderDict[orderID] = order
+        self.orderStrategyDict[orderID] = strategy
+
+        return [orderID]
+
+    #----------------------------------------------------------------------
+    def cancelOrder(self, vtOrderID):
+        """撤单"""
+        order = self.limitOrderDict.get(vtOrderID, None)
+        if not order:
+            return
+
+        symbol = self.symbolDict[order.vtSymbol]
+        if vtOrderID in symbol.workingLimitOrderDict:
+            order.status = STATUS_CANCELLED
+            order.cancelTime = self.dt.strftime('%H:%M:%S')
+
+            self.orderStrategyDict[vtOrderID].onOrder(order)
+
+            del symbol.workingLimitOrderDict[vtOrderID]
+
+    #----------------------------------------------------------------------
+    def sendStopOrder(self, vtSymbol, orderType, price, volume, strategy):
+        """发停止单（本地实现）"""
+        symbol = self.symbolDict[vtSymbol]
+
+        self.stopOrderCount += 1
+        stopOrderID = STOPORDERPREFIX + str(self.stopOrderCount)
+
+        so = StopOrder()
+        so.vtSymbol = vtSymbol
+        so.price = symbol.roundToPriceTick(price)
+        so.volume = volume
+        so.strategy = strategy
+        so.status = STOPORDER_WAITING
+        so.stopOrderID = stopOrderID
+
+        if orderType == CTAORDER_BUY:
+            so.direction = DIRECTION_LONG
+            so.offset = OFFSET_OPEN
+        elif orderType == CTAORDER_SELL:
+            so.direction = DIRECTION_SHORT
+            so.offset = OFFSET_CLOSE
+        elif orderType == CTAORDER_SHORT:
+            so.direction = DIRECTION_SHORT
+            so.offset = OFFSET_OPEN
+        elif orderType == CTAORDER_COVER:
+            so.direction = DIRECTION_LONG
+            so.offset = OFFSET_CLOSE
+
+        self.stopOrderDict[stopOrderID] = so
+        symbol.workingStopOrderDict[stopOrderID] = so
+
+        strategy.onStopOrder(so)
+
+        return [stopOrderID]
+
+    #----------------------------------------------------------------------
+    def cancelStopOrder(self, stopOrderID):
+        """撤销停止单"""
+        so = self.stopOrderDict.get(stopOrderID, None)
+        if not so:
+            return
+
+        symbol = self.symbolDict[so.vtSymbol]
+        if stopOrderID in symbol.workingStopOrderDict:
+            so.status = STOPORDER_CANCELLED
+            del symbol.workingStopOrderDict[stopOrderID]
+            so.strategy.onStopOrder(so)
+
+    #----------------------------------------------------------------------
+    def cancelAll(self, name):
+        """全部撤单，只撤销该策略发出的委托"""
+        strategy = self.strategyDict[name]
+
+        for symbol in self.symbolDict.values():
+            for orderID in symbol.workingLimitOrderDict.keys():
+                if self.orderStrategyDict[orderID] is strategy:
+                    self.cancelOrder(orderID)
+
+            for stopOrderID, so in symbol.workingStopOrderDict.items():
+                if so.strategy is strategy:
+                    self.cancelStopOrder(stopOrderID)
+
+    #----------------------------------------------------------------------
+    def loadBar(self, dbName, collectionName, days):
+        """返回合约初始化数据中，策略开始日期之前days天内的部分"""
+        symbol = self.symbolDict.get(collectionName, None)
+        if not symbol:
+            return []
+
+        startDate = self.strategyStartDate - timedelta(days)
+        return [data for data in symbol.initData if data.datetime >= startDate]
+
+    #----------------------------------------------------------------------
+    def loadTick(self, dbName, collectionName, days):
+        """返回合约初始化数据中，策略开始日期之前days天内的部分"""
+        return self.loadBar(dbName, collectionName, days)
+
+    #------------------------------------------------
+    # 结果计算相关
+    #------------------------------------------------
+
+    #----------------------------------------------------------------------
+    def calculateBacktestingResult(self):
+        """
+        计算组合的逐笔交易结果，每个合约的成交按各自的合约参数分别配对开平仓，
+        所有交易结果按平仓时间排序后汇总，返回结果和单合约回测相同
+        """
+        self.output(u'计算回测结果')
+
+        resultList = []
+        for symbol in self.symbolDict.values():
+            tradeList = [trade for trade in self.tradeDict.values()
+                         if trade.vtSymbol == symbol.vtSymbol]
+            if not tradeList:
+                continue
+
+            if self.mode == self.BAR_MODE:
+                endPrice = symbol.bar.close
+            else:
+                endPrice = symbol.tick.lastPrice
+
+            l = self.matchTrades(tradeList, endPrice, symbol.size, symbol.rate, symbol.slippage)[0]
+            resultList.extend(l)
+
+        resultList.sort(key=lambda result: result.exitDt)
+
+        # 每笔交易的开仓和平仓时间点，以及对应的持仓方向
+        posList = [0]
+        tradeTimeList = []
+        for result in resultList:
+            if result.volume > 0:
+                posList.extend([1, 0])
+            else:
+                posList.extend([-1, 0])
+            tradeTimeList.extend([result.entryDt, result.exitDt])
+
+        return self.summarizeTradingResult(resultList, posList, tradeTimeList)
+
+    #----------------------------------------------------------------------
+    def clearBacktestingResult(self):
+        """清空之前回测的结果"""
+        super(PortfolioBacktestingEngine, self).clearBacktestingResult()
+
+        self.orderStrategyDict.clear()
+
+        for symbol in self.symbolDict.values():
+            symbol.workingLimitOrderDict.clear()
+            symbol.workingStopOrderDict.clear()
+            symbol.dailyResultDict.clear()
+
+    #----------------------------------------------------------------------
+    def updateDailyClose(self, symbol, dt, price):
+        """更新合约的每日收盘价"""
+        date = dt.date()
+
+        if date not in symbol.dailyResultDict:
+            symbol.dailyResultDict[date] = DailyResult(date, price)
+        else:
+            symbol.dailyResultDict[date].closePrice = price
+
+    #----------------------------------------------------------------------
+    def calculateSymbolDailyResult(self, symbol):
+        """计算单个合约按日统计的交易结果"""
+        for dailyResult in symbol.dailyResultDict.values():
+            dailyResult.tradeList = []
+            dailyResult.tradingPnl = 0
+            dailyResult.turnover = 0
+            dailyResult.commission = 0
+            dailyResult.slippage = 0
+
+        for trade in self.tradeDict.values():
+            if trade.vtSymbol == symbol.vtSymbol:
+                symbol.dailyResultDict[trade.dt.date()].addTrade(trade)
+
+        previousClose = 0
+        openPosition = 0
+        for dailyResult in symbol.dailyResultDict.values():
+            dailyResult.previousClose = previousClose
+            previousClose = dailyResult.closePrice
+
+            dailyResult.calculatePnl(openPosition, symbol.size, symbol.rate, symbol.slippage)
+            openPosition = dailyResult.closePosition
+
+        resultDict = OrderedDict()
+        for dailyResult in symbol.dailyResultDict.values():
+            for k, v in dailyResult.__dict__.items():
+                if k not in resultDict:
+                    resultDict[k] = []
+                resultDict[k].append(v)
+
+        df = pd.DataFrame.from_dict(resultDict)
+        df = df.set_index('date')
+        return df
+
+    #----------------------------------------------------------------------
+    def calculateDailyResult(self):
+        """计算组合按日统计的交易结果，各合约的盈亏、成本按日汇总"""
+        self.output(u'计算按日统计结果')
+
+        columnList = ['tradeCount', 'tradingPnl', 'positionPnl', 'totalPnl',
+                      'turnover', 'commission', 'slippage', 'netPnl']
+
+        dfList = []
+        for symbol in self.symbolDict.values():
+            if not symbol.dailyResultDict:
+                continue
+
+            df = self.calculateSymbolDailyResult(symbol)
+            dfList.append(df[columnList])
+
+        # 某个合约没有数据的交易日不会影响其他合约，因此不会丢失交易日
+        resultDf = pd.concat(dfList).groupby(level=0).sum()
+        resultDf = resultDf.sort_index()
+
+        return resultDf
+
+    #----------------------------------------------------------------------
+    def calculateSymbolResult(self):
+        """计算每个合约按日统计的交易结果，返回以vtSymbol为键的DataFrame字典"""
+        return {vtSymbol: self.calculateSymbolDailyResult(symbol)
+                for vtSymbol, symbol in self.symbolDict.items()
+                if symbol.dailyResultDict}
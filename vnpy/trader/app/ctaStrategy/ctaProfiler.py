@@ -0,0 +1,179 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了CTA策略回调函数的性能统计工具，用于在实盘运行中定位
+耗时较长的策略：
+1. 按策略、按回调函数统计调用次数和耗时分布（直方图）
+2. 对超过耗时预算的回调进行计数和记录
+3. 按需对单个策略开启cProfile采样
+'''
+
+from __future__ import division
+
+import cProfile
+import pstats
+from bisect import bisect_left
+from collections import OrderedDict
+from StringIO import StringIO
+from timeit import default_timer
+
+
+# 耗时直方图的分档上限（单位：微秒），最后一档为无穷大
+LATENCY_BUCKETS = [10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000]
+
+
+########################################################################
+class CallbackStat(object):
+    """单个回调函数的耗时统计"""
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.count = 0                  # 调用次数
+        self.totalTime = 0              # 总耗时（秒）
+        self.maxTime = 0                # 最大耗时（秒）
+        self.lastTime = 0               # 最近一次耗时（秒）
+        self.overBudget = 0             # 超过预算的次数
+
+        # 耗时直方图，长度比分档多1，最后一档为超过最大分档的次数
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    #----------------------------------------------------------------------
+    def update(self, elapsed, budget):
+        """更新统计，elapsed和budget单位均为秒"""
+        self.count += 1
+        self.totalTime += elapsed
+        self.lastTime = elapsed
+
+        if elapsed > self.maxTime:
+            self.maxTime = elapsed
+
+        if budget and elapsed > budget:
+            self.overBudget += 1
+
+        self.histogram[bisect_left(LATENCY_BUCKETS, elapsed * 1000000)] += 1
+
+    #----------------------------------------------------------------------
+    def getAverage(self):
+        """获取平均耗时（秒）"""
+        if not self.count:
+            return 0
+        return self.totalTime / self.count
+
+    #----------------------------------------------------------------------
+    def getPercentile(self, percent):
+        """根据直方图估算分位数耗时，返回对应分档的上限（微秒），超出最大分档返回-1"""
+        if not self.count:
+            return 0
+
+        target = self.count * percent / 100
+        cumulative = 0
+        for i, n in enumerate(self.histogram):
+            cumulative += n
+            if cumulative >= target:
+                if i < len(LATENCY_BUCKETS):
+                    return LATENCY_BUCKETS[i]
+                return -1
+        return -1
+
+
+########################################################################
+class StrategyProfiler(object):
+    """单个策略的性能统计"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, name):
+        """Constructor"""
+        self.name = name                # 策略名称
+        self.statDict = OrderedDict()   # key为回调函数名，value为CallbackStat对象
+        self.slowList = []              # 最近的超预算调用记录，元素为(函数名, 耗时毫秒)
+        self.slowListSize = 20          # 超预算调用记录的最大长度
+
+        self.profile = None             # cProfile对象，仅在开启采样时创建
+
+    #----------------------------------------------------------------------
+    def getStat(self, funcName):
+        """获取回调函数对应的统计对象"""
+        stat = self.statDict.get(funcName, None)
+        if not stat:
+            stat = CallbackStat()
+            self.statDict[funcName] = stat
+        return stat
+
+    #----------------------------------------------------------------------
+    def record(self, funcName, elapsed, budget):
+        """记录一次回调的耗时"""
+        stat = self.getStat(funcName)
+        stat.update(elapsed, budget)
+
+        if budget and elapsed > budget:
+            self.slowList.append((funcName, round(elapsed * 1000, 3)))
+            if len(self.slowList) > self.slowListSize:
+                del self.slowList[0]
+
+    #----------------------------------------------------------------------
+    def startProfile(self):
+        """开启cProfile采样"""
+        if not self.profile:
+            self.profile = cProfile.Profile()
+
+    #----------------------------------------------------------------------
+    def stopProfile(self, sortKey='cumulative', limit=30):
+        """停止cProfile采样，返回统计结果文本"""
+        if not self.profile:
+            return ''
+
+        profile = self.profile
+        self.profile = None
+
+        buf = StringIO()
+        try:
+            stats = pstats.Stats(profile, stream=buf)
+            stats.sort_stats(sortKey).print_stats(limit)
+        except TypeError:
+            # 采样期间没有任何回调时，pstats无法生成结果
+            return ''
+        return buf.getvalue()
+
+    #----------------------------------------------------------------------
+    def call(self, func, params, budget):
+        """调用策略函数并统计耗时"""
+        profile = self.profile
+        start = default_timer()
+
+        try:
+            if profile:
+                if params:
+                    profile.runcall(func, params)
+                else:
+                    profile.runcall(func)
+            else:
+                if params:
+                    func(params)
+                else:
+                    func()
+        finally:
+            elapsed = default_timer() - start
+            self.record(func.__name__, elapsed, budget)
+
+    #----------------------------------------------------------------------
+    def getPerfDict(self):
+        """获取性能统计字典，用于界面显示"""
+        d = OrderedDict()
+
+        for funcName, stat in self.statDict.items():
+            d[funcName + '.count'] = stat.count
+            d[funcName + '.avgUs'] = round(stat.getAverage() * 1000000, 1)
+            d[funcName + '.p99Us'] = stat.getPercentile(99)
+            d[funcName + '.maxUs'] = round(stat.maxTime * 1000000, 1)
+            d[funcName + '.slow'] = stat.overBudget
+
+        d['profiling'] = self.profile is not None
+
+        return d
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空统计数据"""
+        self.statDict.clear()
+        self.slowList = []
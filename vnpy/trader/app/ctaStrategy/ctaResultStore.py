@@ -0,0 +1,136 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了回测结果的本地数据库（基于sqlite3），以及判断回测输入是否
+发生变化所用的指纹函数：
+1. getStrategyHash：策略类源代码的哈希
+2. getDataFingerprint：回测数据范围的指纹（数据量和最后一条数据的时间），通过历史数据存储统计
+3. getInputKey：综合策略、参数、引擎设置和数据指纹生成的回测输入键
+
+回测输入键相同的两次回测，结果必然相同，因此可以直接使用保存的结果。
+'''
+
+import json
+import hashlib
+import inspect
+import sqlite3
+from datetime import datetime
+from threading import Lock
+
+from vnpy.trader.vtHistoryStore import createHistoryStore, INCLUSIVE_DELTA
+
+
+# 影响回测结果的引擎参数，用于生成回测输入键
+ENGINE_SETTING_KEYS = ['mode', 'startDate', 'initDays', 'endDate',
+                       'capital', 'slippage', 'rate', 'size', 'priceTick']
+
+# 统计结果的格式版本，统计字段的含义变化时增加，使之前保存的结果失效
+STATISTICS_VERSION = 2
+
+#----------------------------------------------------------------------
+def getStrategyHash(strategyClass):
+    """获取策略类源代码的哈希，包括其继承的所有父类（模板的修改同样会影响回测结果）"""
+    md5 = hashlib.md5()
+
+    for cls in inspect.getmro(strategyClass):
+        if cls is object:
+            continue
+
+        try:
+            source = inspect.getsource(cls)
+        except (IOError, TypeError):
+            # 无法获取源代码时（如动态生成的类），使用类名代替
+            source = cls.__name__
+
+        md5.update(source.encode('utf-8') if isinstance(source, unicode) else source)
+
+    return md5.hexdigest()
+
+
+#----------------------------------------------------------------------
+def getDataFingerprint(dbName, symbol, startDate, endDate=None, historyStore=None):
+    """
+    获取回测数据范围的指纹，startDate和endDate为datetime对象，范围包含endDate本身，
+    historyStore默认根据VT_setting.json创建
+    """
+    if not historyStore:
+        historyStore = createHistoryStore()
+
+    if endDate:
+        endDate = endDate + INCLUSIVE_DELTA
+
+    count, lastDatetime = historyStore.summarizeRange(dbName, symbol, startDate, endDate)
+
+    return '%s|%s|%s|%s' %(dbName, symbol, count, lastDatetime or '')
+
+
+#----------------------------------------------------------------------
+def getInputKey(strategyHash, setting, engineSetting, dataFingerprint):
+    """
+    生成回测输入键
+    strategyHash：策略源代码哈希
+    setting：策略参数字典
+    engineSetting：引擎参数字典（模式、日期、滑点、手续费、合约大小、价格最小变动等）
+    dataFingerprint：数据指纹
+    """
+    content = json.dumps([STATISTICS_VERSION, strategyHash, setting, engineSetting, dataFingerprint],
+                         sort_keys=True, default=str)
+    return hashlib.md5(content).hexdigest()
+
+
+########################################################################
+class ResultStore(object):
+    """回测结果数据库"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, path):
+        """Constructor"""
+        self.path = path
+        self.lock = Lock()
+
+        # 多进程优化时可能有多个进程同时写入，因此设置较长的锁等待时间
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS result ('
+                          'key TEXT, name TEXT, runTime TEXT, result TEXT)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ix_result_key ON result (key)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ix_result_name ON result (name, runTime)')
+        self.conn.commit()
+
+    #----------------------------------------------------------------------
+    def getResult(self, key):
+        """查询回测输入键对应的最近一次结果，找不到返回None"""
+        with self.lock:
+            cursor = self.conn.execute('SELECT result FROM result WHERE key=? '
+                                       'ORDER BY runTime DESC LIMIT 1', (key,))
+            row = cursor.fetchone()
+
+        if row:
+            return json.loads(row[0])
+        return None
+
+    #----------------------------------------------------------------------
+    def saveResult(self, key, name, result):
+        """保存回测结果，result为统计字典"""
+        runTime = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+        content = json.dumps(result, default=str)
+
+        with self.lock:
+            self.conn.execute('INSERT INTO result VALUES (?, ?, ?, ?)',
+                              (key, name, runTime, content))
+            self.conn.commit()
+
+    #----------------------------------------------------------------------
+    def getHistory(self, name, limit=2):
+        """查询某个回测任务最近几次的结果（用于和前一天对比），按时间倒序返回[(runTime, result)]"""
+        with self.lock:
+            cursor = self.conn.execute('SELECT runTime, result FROM result WHERE name=? '
+                                       'ORDER BY runTime DESC LIMIT ?', (name, limit))
+            rows = cursor.fetchall()
+
+        return [(runTime, json.loads(result)) for runTime, result in rows]
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭数据库"""
+        with self.lock:
+            self.conn.close()
@@ -4,6 +4,8 @@
 本文件包含了CTA引擎中的策略开发用模板，开发策略时需要继承CtaTemplate类。
 '''
 
+from collections import OrderedDict
+
 import numpy as np
 import talib
 
@@ -11,6 +13,8 @@ from vnpy.trader.vtConstant import *
 from vnpy.trader.vtObject import VtBarData
 
 from .ctaBase import *
+from .ctaBarGenerator import (BarGenerator, TradingSession, getBarDbName,
+                              INTERVAL_SECOND, INTERVAL_MINUTE, INTERVAL_HOUR, INTERVAL_DAILY)
 
 
 ########################################################################
@@ -99,6 +103,46 @@ class CtaTemplate(object):
         """收到停止单推送（必须由用户继承实现）"""
         raise NotImplementedError
     
+    #----------------------------------------------------------------------
+    @classmethod
+    def calculateTargetPos(cls, data, setting):
+        """
+        向量化回测用的目标仓位计算（可选实现，用于VectorBacktestingEngine快速筛选参数）
+        data：K线数据字典，包含open、high、low、close、volume的numpy数组
+        setting：策略参数字典，未包含的参数使用类中的默认值
+        返回和K线数量相同的数组，第i个值为第i根K线收盘时的目标仓位
+        """
+        raise NotImplementedError
+    
+    #----------------------------------------------------------------------
+    def getCheckpointState(self):
+        """
+        获取回测断点中保存的策略状态（用于BacktestingEngine的断点保存和恢复）
+        默认保存变量列表中的变量，以及策略中的BarManager、ArrayManager对象（不含回调函数），
+        使用了其他内部状态的策略可以重载该函数和setCheckpointState，返回值需要能被pickle
+        """
+        state = {}
+        
+        for key in self.varList:
+            state[key] = getattr(self, key, None)
+        
+        for key, value in self.__dict__.items():
+            if isinstance(value, (BarManager, ArrayManager)):
+                state[key] = {k: v for k, v in value.__dict__.items() if not callable(v)}
+        
+        return state
+    
+    #----------------------------------------------------------------------
+    def setCheckpointState(self, state):
+        """恢复回测断点中保存的策略状态"""
+        for key, value in state.items():
+            obj = getattr(self, key, None)
+            
+            if isinstance(obj, (BarManager, ArrayManager)):
+                obj.__dict__.update(value)
+            else:
+                setattr(self, key, value)
+    
     #----------------------------------------------------------------------
     def buy(self, price, volume, stop=False):
         """买开"""
@@ -166,9 +210,18 @@ class CtaTemplate(object):
         return self.ctaEngine.loadTick(self.tickDbName, self.vtSymbol, days)
     
     #----------------------------------------------------------------------
-    def loadBar(self, days):
-        """读取bar数据"""
-        return self.ctaEngine.loadBar(self.barDbName, self.vtSymbol, days)
+    def loadBar(self, days, interval=INTERVAL_MINUTE, window=1):
+        """
+        读取bar数据
+        默认读取barDbName中的1分钟K线，其他周期读取BarAggregator合成的K线数据库，
+        合成数据库中尚未走完的最后一根K线（finished为False）不会返回
+        """
+        if interval == INTERVAL_MINUTE and window == 1:
+            return self.ctaEngine.loadBar(self.barDbName, self.vtSymbol, days)
+
+        dbName = getBarDbName(interval, window)
+        barList = self.ctaEngine.loadBar(dbName, self.vtSymbol, days)
+        return [bar for bar in barList if getattr(bar, 'finished', True)]
     
     #----------------------------------------------------------------------
     def writeCtaLog(self, content):
@@ -210,12 +263,15 @@ class TargetPosTemplate(CtaTemplate):
     className = 'TargetPosTemplate'
     author = u'量衍投资'
     
+    STATUS_FINISHED = set([STATUS_REJECTED, STATUS_CANCELLED, STATUS_ALLTRADED])
+    
     # 目标持仓模板的基本变量
     tickAdd = 1             # 委托时相对基准价格的超价
+    requoteTicks = 0        # 两次重新报价之间至少间隔的tick数量，0表示不限制
+    requoteSeconds = 0      # 两次重新报价之间至少间隔的秒数（行情时间），0表示不限制
     lastTick = None         # 最新tick数据
     lastBar = None          # 最新bar数据
     targetPos = EMPTY_INT   # 目标持仓
-    orderList = []          # 委托号列表
 
     # 变量列表，保存了变量的名称
     varList = ['inited',
@@ -228,10 +284,26 @@ class TargetPosTemplate(CtaTemplate):
         """Constructor"""
         super(TargetPosTemplate, self).__init__(ctaEngine, setting)
         
+        # 活动委托字典，key为vtOrderID，value为[委托类型, 价格, 剩余数量]
+        self.orderDict = OrderedDict()
+        self.cancelSet = set()          # 已发出撤单、尚未结束的委托号集合
+        
+        # 重新报价节流相关
+        self.tickCount = 0              # 收到的tick数量
+        self.quoteTickCount = 0         # 上次报价时的tick数量
+        self.quoteTime = None           # 上次报价时的行情时间
+        
+    #----------------------------------------------------------------------
+    @property
+    def orderList(self):
+        """活动委托号列表（兼容之前的版本）"""
+        return self.orderDict.keys()
+        
     #----------------------------------------------------------------------
     def onTick(self, tick):
         """收到行情推送"""
         self.lastTick = tick
+        self.tickCount += 1
         
         # 实盘模式下，启动交易后，需要根据tick的实时推送执行自动开平仓操作
         if self.trading:
@@ -245,8 +317,15 @@ class TargetPosTemplate(CtaTemplate):
     #----------------------------------------------------------------------
     def onOrder(self, order):
         """收到委托推送"""
-        if order.status == STATUS_ALLTRADED or order.status == STATUS_CANCELLED:
-            self.orderList.remove(order.vtOrderID)
+        vtOrderID = order.vtOrderID
+        if vtOrderID not in self.orderDict:
+            return
+        
+        if order.status in self.STATUS_FINISHED:
+            del self.orderDict[vtOrderID]
+            self.cancelSet.discard(vtOrderID)
+        else:
+            self.orderDict[vtOrderID][2] = order.totalVolume - order.tradedVolume
     
     #----------------------------------------------------------------------
     def setTargetPos(self, targetPos):
@@ -256,61 +335,134 @@ class TargetPosTemplate(CtaTemplate):
         self.trade()
         
     #----------------------------------------------------------------------
-    def trade(self):
-        """执行交易"""
-        # 先撤销之前的委托
-        for vtOrderID in self.orderList:
-            self.cancelOrder(vtOrderID)
-        self.orderList = []
-        
-        # 如果目标仓位和实际仓位一致，则不进行任何操作
+    def getTargetOrder(self):
+        """
+        计算达到目标仓位需要的委托，返回(委托类型, 数量)
+        回测模式下，采用合并平仓和反向开仓委托的方式
+        实盘模式下，先发平仓委托，等待成交后，再发送新的开仓委托
+        """
         posChange = self.targetPos - self.pos
-        if not posChange:
-            return
         
-        # 确定委托基准价格，有tick数据时优先使用，否则使用bar
-        longPrice = 0
-        shortPrice = 0
+        if not posChange:
+            return None, 0
         
-        if self.lastTick:
+        if self.getEngineType() == ENGINETYPE_BACKTESTING:
             if posChange > 0:
-                longPrice = self.lastTick.askPrice1 + self.tickAdd
+                return CTAORDER_BUY, posChange
+            else:
+                return CTAORDER_SHORT, -posChange
+        
+        # 买入
+        if posChange > 0:
+            if self.pos < 0:
+                return CTAORDER_COVER, min(-self.pos, posChange)
             else:
-                shortPrice = self.lastTick.bidPrice1 - self.tickAdd
+                return CTAORDER_BUY, posChange
+        # 卖出
         else:
-            if posChange > 0:
-                longPrice = self.lastBar.close + self.tickAdd
+            if self.pos > 0:
+                return CTAORDER_SELL, min(self.pos, -posChange)
+            else:
+                return CTAORDER_SHORT, -posChange
+    
+    #----------------------------------------------------------------------
+    def getBasePrice(self, direction):
+        """获取委托基准价格，有tick数据时优先使用，否则使用bar"""
+        if self.lastTick:
+            if direction == DIRECTION_LONG:
+                return self.lastTick.askPrice1
             else:
-                shortPrice = self.lastBar.close - self.tickAdd
+                return self.lastTick.bidPrice1
+        else:
+            return self.lastBar.close
+    
+    #----------------------------------------------------------------------
+    def checkRequote(self):
+        """检查距离上次报价的间隔是否允许重新报价"""
+        if self.requoteTicks and self.tickCount - self.quoteTickCount < self.requoteTicks:
+            return False
         
-        # 回测模式下，采用合并平仓和反向开仓委托的方式
-        if self.getEngineType() == ENGINETYPE_BACKTESTING:
-            if posChange > 0:
-                l = self.buy(longPrice, abs(posChange))
+        if self.requoteSeconds and self.quoteTime:
+            if self.lastTick:
+                dt = self.lastTick.datetime
             else:
-                l = self.short(shortPrice, abs(posChange))
-            self.orderList.extend(l)
+                dt = self.lastBar.datetime
+            if (dt - self.quoteTime).total_seconds() < self.requoteSeconds:
+                return False
         
-        # 实盘模式下，首先确保之前的委托都已经结束（全成、撤销）
-        # 然后先发平仓委托，等待成交后，再发送新的开仓委托
+        return True
+    
+    #----------------------------------------------------------------------
+    def trade(self):
+        """
+        执行交易
+        保留类型、价格和数量仍然满足目标仓位的活动委托，只撤销多余或者价格已经偏离的委托，
+        再对缺少的数量补发委托。价格偏离的委托按照requoteTicks和requoteSeconds控制重新报价的频率。
+        """
+        orderType, targetVolume = self.getTargetOrder()
+        
+        if orderType == CTAORDER_BUY or orderType == CTAORDER_COVER:
+            direction = DIRECTION_LONG
         else:
-            # 检查之前委托都已结束
-            if self.orderList:
-                return
+            direction = DIRECTION_SHORT
+        
+        # 本次报价的委托价格
+        if orderType:
+            if direction == DIRECTION_LONG:
+                orderPrice = self.getBasePrice(direction) + self.tickAdd
+            else:
+                orderPrice = self.getBasePrice(direction) - self.tickAdd
+        
+        # 检查活动委托，保留的委托数量不超过目标数量
+        requote = self.checkRequote()
+        keepVolume = 0
+        
+        for vtOrderID, (type_, price, volume) in self.orderDict.items():
+            if vtOrderID in self.cancelSet:
+                continue
             
-            # 买入
-            if posChange > 0:
-                if self.pos < 0:
-                    l = self.cover(longPrice, abs(self.pos))
-                else:
-                    l = self.buy(longPrice, abs(posChange))
-            # 卖出
+            # 委托类型不同或者数量多余时直接撤销
+            if type_ != orderType or keepVolume + volume > targetVolume:
+                self.cancelSet.add(vtOrderID)
+                self.cancelOrder(vtOrderID)
+                continue
+            
+            # 价格比本次报价差（买单更低，卖单更高）时，允许重新报价才撤销
+            if direction == DIRECTION_LONG:
+                priceValid = price >= orderPrice
             else:
-                if self.pos > 0:
-                    l = self.sell(shortPrice, abs(self.pos))
-                else:
-                    l = self.short(shortPrice, abs(posChange))
-            self.orderList.extend(l)
+                priceValid = price <= orderPrice
+            
+            if not priceValid and requote:
+                self.cancelSet.add(vtOrderID)
+                self.cancelOrder(vtOrderID)
+                continue
+            
+            keepVolume += volume
+        
+        # 补发缺少的数量
+        volume = targetVolume - keepVolume
+        if volume <= 0:
+            return
+        
+        # 实盘模式下，需要等待之前的委托都已经结束（全成、撤销），避免撤单过程中成交导致超出目标仓位
+        if self.getEngineType() != ENGINETYPE_BACKTESTING and self.orderDict:
+            return
+        
+        l = self.sendOrder(orderType, orderPrice, volume)
+        
+        # 委托被拆分（例如平今平昨）时，数量先记录在第一个委托上，收到委托推送后更新
+        for i, vtOrderID in enumerate(l):
+            if i == 0:
+                self.orderDict[vtOrderID] = [orderType, orderPrice, volume]
+            else:
+                self.orderDict[vtOrderID] = [orderType, orderPrice, 0]
+        
+        self.quoteTickCount = self.tickCount
+        if self.lastTick:
+            self.quoteTime = self.lastTick.datetime
+        elif self.lastBar:
+            self.quoteTime = self.lastBar.datetime
     
     
 ########################################################################
@@ -319,6 +471,8 @@ class BarManager(object):
     K线合成器，支持：
     1. 基于Tick合成1分钟K线
     2. 基于1分钟K线合成X分钟K线（X可以是2、3、5、10、15、30、60）
+    
+    需要秒级、小时、交易日K线或者按交易时段对齐的K线时，请使用ctaBarGenerator中的BarGenerator
     """
 
     #----------------------------------------------------------------------
@@ -0,0 +1,209 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了向量化回测引擎，用于参数的快速粗筛：
+1. 策略类实现calculateTargetPos，基于整段历史的OHLCV数组一次性计算每根K线收盘时的目标仓位
+2. 目标仓位的变化在下一根K线的开盘价成交，手续费、滑点、合约乘数的计算和BacktestingEngine一致
+3. 逐日结果的DataFrame格式和BacktestingEngine一致，可以直接使用showDailyResult和优化功能
+
+注意：向量化回测假设所有委托都在下一根K线开盘成交，不考虑限价单未成交、停止单触发价等细节，
+筛选出的参数请再使用BacktestingEngine进行事件驱动的回测确认。
+'''
+from __future__ import division
+
+from collections import OrderedDict
+
+import pymongo
+import numpy as np
+import pandas as pd
+
+from vnpy.trader.vtGlobal import globalSetting
+
+from .ctaBacktesting import BacktestingEngine
+
+
+########################################################################
+class VectorBacktestingEngine(BacktestingEngine):
+    """
+    向量化回测引擎
+    只支持K线模式，参数设置函数和BacktestingEngine相同
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        super(VectorBacktestingEngine, self).__init__()
+
+        self.strategyClass = None       # 策略类
+        self.setting = {}               # 策略参数
+
+        self.data = {}                  # K线数据数组字典
+        self.dataKey = None             # 已载入数据对应的数据库、合约和日期，用于优化时复用数据
+
+        self.posArray = None            # 每根K线收盘时的持仓
+        self.dailyDf = None             # 逐日统计结果
+
+    #----------------------------------------------------------------------
+    def initStrategy(self, strategyClass, setting=None):
+        """设置策略类和参数"""
+        self.strategyClass = strategyClass
+        self.setting = setting or {}
+
+    #----------------------------------------------------------------------
+    def clearBacktestingResult(self):
+        """清空之前回测的结果"""
+        super(VectorBacktestingEngine, self).clearBacktestingResult()
+
+        self.posArray = None
+        self.dailyDf = None
+
+    #----------------------------------------------------------------------
+    def loadHistoryData(self):
+        """载入历史数据到numpy数组，数据范围未变化时直接复用"""
+        dataKey = (self.dbName, self.symbol, self.dataStartDate, self.dataEndDate)
+        if dataKey == self.dataKey:
+            return
+
+        self.output(u'开始载入数据')
+
+        self.dbClient = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
+        collection = self.dbClient[self.dbName][self.symbol]
+
+        if not self.dataEndDate:
+            flt = {'datetime':{'$gte':self.dataStartDate}}
+        else:
+            flt = {'datetime':{'$gte':self.dataStartDate,
+                               '$lte':self.dataEndDate}}
+
+        fields = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+        projection = {k: 1 for k in fields}
+        projection['_id'] = 0
+
+        cursor = collection.find(flt, projection).sort('datetime')
+        df = pd.DataFrame(list(cursor), columns=fields)
+
+        self.data = {k: df[k].values.astype(float) for k in fields[1:]}
+        self.data['datetime'] = df['datetime'].values.astype('datetime64[us]')
+        self.dataKey = dataKey
+
+        self.output(u'载入完成，数据量：%s' %len(df))
+
+    #----------------------------------------------------------------------
+    def runBacktesting(self):
+        """运行回测"""
+        if self.mode != self.BAR_MODE:
+            self.output(u'向量化回测只支持K线模式')
+            return
+
+        self.loadHistoryData()
+
+        if not len(self.data.get('close', [])):
+            self.output(u'没有历史数据')
+            return
+
+        self.output(u'开始计算目标仓位')
+        targetPos = self.strategyClass.calculateTargetPos(self.data, self.setting)
+        targetPos = np.nan_to_num(np.asarray(targetPos, dtype=float))
+
+        # 初始化数据阶段不交易
+        start = np.searchsorted(self.data['datetime'], np.datetime64(self.strategyStartDate, 'us'))
+        targetPos[:start] = 0
+
+        # 第i根K线收盘时的目标仓位在第i+1根K线开盘时成交，因此持仓滞后一根K线
+        pos = np.zeros(len(targetPos))
+        pos[1:] = targetPos[:-1]
+        self.posArray = pos
+
+        self.dailyDf = self.calculateVectorResult(pos)
+        self.output(u'数据回放结束')
+
+    #----------------------------------------------------------------------
+    def calculateVectorResult(self, pos):
+        """基于持仓数组计算逐日结果"""
+        openPrice = self.data['open']
+        closePrice = self.data['close']
+        size = self.size
+
+        # 上一根K线的持仓和收盘价
+        prePos = np.zeros(len(pos))
+        prePos[1:] = pos[:-1]
+        preClose = np.zeros(len(closePrice))
+        preClose[1:] = closePrice[:-1]
+
+        # 成交数量，开盘时反手视为平仓和开仓两笔成交
+        posChange = pos - prePos
+        volume = np.abs(posChange)
+        tradeCount = (posChange != 0).astype(int) + ((prePos * pos) < 0).astype(int)
+
+        # 持仓盈亏以上根K线收盘价为基准，交易盈亏以成交价（开盘价）为基准
+        positionPnl = prePos * (closePrice - preClose) * size
+        positionPnl[0] = 0
+        tradingPnl = posChange * (closePrice - openPrice) * size
+
+        turnover = volume * openPrice * size
+        commission = turnover * self.rate
+        slippage = volume * size * self.slippage
+
+        dates = pd.DatetimeIndex(self.data['datetime']).date
+        df = pd.DataFrame({
+            'date': dates,
+            'closePrice': closePrice,
+            'tradeCount': tradeCount,
+            'positionPnl': positionPnl,
+            'tradingPnl': tradingPnl,
+            'turnover': turnover,
+            'commission': commission,
+            'slippage': slippage
+        })
+
+        # 按日汇总
+        grouped = df.groupby('date')
+        resultDf = grouped[['tradeCount', 'positionPnl', 'tradingPnl',
+                            'turnover', 'commission', 'slippage']].sum()
+        resultDf['closePrice'] = grouped['closePrice'].last()
+        resultDf['closePosition'] = pd.Series(pos, index=df.index).groupby(df['date']).last()
+
+        resultDf['totalPnl'] = resultDf['tradingPnl'] + resultDf['positionPnl']
+        resultDf['netPnl'] = resultDf['totalPnl'] - resultDf['commission'] - resultDf['slippage']
+
+        # 只保留策略启动后的交易日，和BacktestingEngine一致
+        resultDf = resultDf[resultDf.index >= self.strategyStartDate.date()]
+
+        return resultDf
+
+    #----------------------------------------------------------------------
+    def getEngineSetting(self):
+        """获取影响回测结果的引擎参数，增加引擎类型以区分事件驱动回测的结果"""
+        d = super(VectorBacktestingEngine, self).getEngineSetting()
+        d['engine'] = 'vector'
+        return d
+
+    #----------------------------------------------------------------------
+    def getOptimizeEngineClass(self):
+        """并行优化时子进程中同样使用向量化回测，结果和保存时使用的回测输入键一致"""
+        return self.__class__
+
+    #----------------------------------------------------------------------
+    def calculateDailyResult(self):
+        """计算按日统计的交易结果"""
+        return self.dailyDf.copy()
+
+    #----------------------------------------------------------------------
+    def calculateBacktestingResult(self):
+        """向量化回测没有逐笔成交，不计算逐笔统计结果"""
+        return {}
+
+    #----------------------------------------------------------------------
+    def calculateResultStatistics(self):
+        """计算回测统计结果（逐日统计的数值部分）"""
+        result = OrderedDict()
+
+        if self.dailyDf is not None and len(self.dailyDf):
+            df, d = self.calculateDailyStatistics(self.calculateDailyResult())
+            self.mergeDailyStatistics(result, d)
+
+        for k, v in result.items():
+            if isinstance(v, np.generic):
+                result[k] = v.item()
+
+        return result
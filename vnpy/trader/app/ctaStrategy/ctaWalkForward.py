@@ -0,0 +1,260 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了滚动窗口（Walk-Forward）优化引擎：
+1. 从策略启动日期开始，按照样本内天数和样本外天数划分滚动窗口，每次向后滚动样本外天数
+2. 所有窗口的样本内优化（窗口 x 参数组合）在进程池中并行运行
+3. 每个窗口使用样本内最优的参数，在紧随其后的样本外区间回测
+4. 将各个窗口样本外的逐日结果拼接为完整的样本外资金曲线
+
+全部区间的数据只从数据库载入一次，每个进程启动时获得一份，各窗口的回测从中切片。
+每个窗口的回测都从空仓开始，窗口结束时的持仓不做平仓处理（逐日盈亏计算到最后一个交易日收盘）。
+'''
+from __future__ import division
+
+import multiprocessing
+from collections import OrderedDict
+from datetime import timedelta
+
+import pandas as pd
+
+from vnpy.trader.vtHistoryStore import INCLUSIVE_DELTA
+
+from .ctaBacktesting import BacktestingEngine
+from .ctaBatchBacktesting import BatchBacktestingEngine
+
+
+# 进程中的历史数据，由initWorker设置
+workerData = {}
+
+
+#----------------------------------------------------------------------
+def initWorker(historyData, historyDt):
+    """进程池中每个进程启动时运行的函数，保存全部区间的历史数据"""
+    workerData['historyData'] = historyData
+    workerData['historyDt'] = historyDt
+
+
+#----------------------------------------------------------------------
+def runWindow(strategyClass, setting, engineSetting, startDate, endDate, targetName, daily=False):
+    """
+    在一个窗口上运行回测，多进程时跑在每个进程中运行的函数
+    startDate：窗口开始日期（策略启动日期），datetime对象
+    endDate：窗口结束日期（不包含），datetime对象
+    daily：是否同时返回逐日结果的DataFrame
+    返回(目标值, 逐日结果)
+    """
+    initDays = engineSetting['initDays']
+    dataStartDate = startDate - timedelta(initDays)
+    dataEndDate = endDate - timedelta(1)
+
+    engine = BatchBacktestingEngine()
+    engine.setBacktestingMode(engineSetting['mode'])
+    engine.setStartDate(dataStartDate.strftime('%Y%m%d'), initDays)
+    engine.setEndDate(dataEndDate.strftime('%Y%m%d'))
+    engine.setCapital(engineSetting['capital'])
+    engine.setSlippage(engineSetting['slippage'])
+    engine.setRate(engineSetting['rate'])
+    engine.setSize(engineSetting['size'])
+    engine.setPriceTick(engineSetting['priceTick'])
+    engine.setDatabase(engineSetting['dbName'], engineSetting['symbol'])
+    engine.setHistoryData(workerData['historyData'], workerData['historyDt'])
+
+    engine.initStrategy(strategyClass, setting)
+    engine.runBacktesting()
+
+    d = engine.calculateResultStatistics()
+    targetValue = d.get(targetName, 0)
+
+    df = None
+    if daily and engine.dailyResultDict:
+        df = engine.calculateDailyResult()
+
+    return targetValue, df
+
+
+########################################################################
+class WalkForwardEngine(BacktestingEngine):
+    """
+    滚动窗口优化引擎
+    参数设置函数和BacktestingEngine相同，setStartDate中的initDays为每个窗口回测前用于初始化的天数
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        super(WalkForwardEngine, self).__init__()
+
+        self.inSampleDays = 0       # 样本内天数
+        self.outSampleDays = 0      # 样本外天数，同时也是窗口滚动的天数
+        self.processes = 0          # 进程数量，0表示使用CPU核心数量
+
+        self.historyData = []       # 全部区间的数据字典列表
+        self.historyDt = []         # 对应的datetime列表
+
+        self.windowList = []        # 窗口列表
+        self.resultList = []        # 每个窗口的结果
+        self.resultDf = None        # 拼接后的样本外逐日结果
+
+    #----------------------------------------------------------------------
+    def setWindow(self, inSampleDays, outSampleDays):
+        """设置样本内和样本外的天数"""
+        self.inSampleDays = inSampleDays
+        self.outSampleDays = outSampleDays
+
+    #----------------------------------------------------------------------
+    def setProcesses(self, processes):
+        """设置进程数量"""
+        self.processes = processes
+
+    #----------------------------------------------------------------------
+    def loadHistoryData(self):
+        """载入全部区间的历史数据"""
+        self.output(u'开始载入数据')
+
+        # 通过历史数据存储读取，压缩存储的Tick数据会被解码
+        if not self.dataEndDate:
+            end = None
+        else:
+            end = self.dataEndDate + INCLUSIVE_DELTA
+
+        self.historyData = list(self.getHistoryStore().loadRange(self.dbName, self.symbol,
+                                                                 self.dataStartDate, end))
+        self.historyDt = [d['datetime'] for d in self.historyData]
+
+        self.output(u'载入完成，数据量：%s' %len(self.historyData))
+
+    #----------------------------------------------------------------------
+    def generateWindows(self):
+        """生成窗口列表[(样本内开始, 样本外开始, 样本外结束)]，结束日期不包含"""
+        self.windowList = []
+
+        if not self.historyDt or not self.inSampleDays or not self.outSampleDays:
+            return self.windowList
+
+        # 数据结束日期的次日，作为最后一个窗口的结束
+        if self.dataEndDate:
+            lastDate = self.dataEndDate
+        else:
+            lastDate = self.historyDt[-1]
+        endDate = lastDate.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(1)
+
+        start = self.strategyStartDate
+        while True:
+            outStart = start + timedelta(self.inSampleDays)
+            if outStart >= endDate:
+                break
+
+            outEnd = min(outStart + timedelta(self.outSampleDays), endDate)
+            self.windowList.append((start, outStart, outEnd))
+
+            start += timedelta(self.outSampleDays)
+
+        return self.windowList
+
+    #----------------------------------------------------------------------
+    def getWorkerEngineSetting(self):
+        """获取传给各进程的引擎设置"""
+        d = self.getEngineSetting()
+        d['dbName'] = self.dbName
+        d['symbol'] = self.symbol
+        return d
+
+    #----------------------------------------------------------------------
+    def runTasks(self, taskList):
+        """运行回测任务列表，返回结果列表"""
+        processes = self.processes or multiprocessing.cpu_count()
+
+        if processes > 1 and len(taskList) > 1:
+            pool = multiprocessing.Pool(processes, initWorker,
+                                        (self.historyData, self.historyDt))
+            l = [pool.apply_async(runWindow, task) for task in taskList]
+            pool.close()
+            pool.join()
+            return [res.get() for res in l]
+        else:
+            initWorker(self.historyData, self.historyDt)
+            return [runWindow(*task) for task in taskList]
+
+    #----------------------------------------------------------------------
+    def runWalkForward(self, strategyClass, optimizationSetting):
+        """运行滚动窗口优化，返回每个窗口的结果列表"""
+        settingList = optimizationSetting.generateSetting()
+        targetName = optimizationSetting.optimizeTarget
+
+        if not settingList or not targetName:
+            self.output(u'优化设置有问题，请检查')
+            return []
+
+        self.loadHistoryData()
+        self.generateWindows()
+        if not self.windowList:
+            self.output(u'数据不足以生成任何窗口，请检查日期和窗口设置')
+            return []
+
+        self.output(u'窗口数量：%s，参数组合：%s' %(len(self.windowList), len(settingList)))
+        engineSetting = self.getWorkerEngineSetting()
+
+        # 所有窗口的样本内优化并行运行
+        self.output(u'开始样本内优化')
+        taskList = []
+        for inStart, outStart, outEnd in self.windowList:
+            for setting in settingList:
+                taskList.append((strategyClass, setting, engineSetting,
+                                 inStart, outStart, targetName))
+        inResultList = self.runTasks(taskList)
+
+        # 选出每个窗口的最优参数
+        bestList = []
+        n = len(settingList)
+        for i in range(len(self.windowList)):
+            targetList = [result[0] for result in inResultList[i*n:(i+1)*n]]
+            j = max(range(n), key=lambda k: targetList[k])
+            bestList.append((settingList[j], targetList[j]))
+
+        # 使用最优参数进行样本外回测
+        self.output(u'开始样本外回测')
+        taskList = []
+        for (inStart, outStart, outEnd), (setting, inTarget) in zip(self.windowList, bestList):
+            taskList.append((strategyClass, setting, engineSetting,
+                             outStart, outEnd, targetName, True))
+        outResultList = self.runTasks(taskList)
+
+        # 汇总结果
+        self.resultList = []
+        dfList = []
+        for window, best, outResult in zip(self.windowList, bestList, outResultList):
+            d = OrderedDict()
+            d['inSampleStart'] = window[0]
+            d['outSampleStart'] = window[1]
+            d['outSampleEnd'] = window[2]
+            d['setting'] = best[0]
+            d['inSampleTarget'] = best[1]
+            d['outSampleTarget'] = outResult[0]
+            self.resultList.append(d)
+
+            if outResult[1] is not None:
+                dfList.append(outResult[1])
+
+        if dfList:
+            self.resultDf = pd.concat(dfList)
+        else:
+            self.resultDf = None
+
+        return self.resultList
+
+    #----------------------------------------------------------------------
+    def showWalkForwardResult(self):
+        """显示每个窗口的结果和拼接后的样本外资金曲线"""
+        self.output('-' * 30)
+        self.output(u'滚动窗口结果：')
+        for d in self.resultList:
+            self.output(u'%s - %s - %s\t%s\t样本内：%s\t样本外：%s' %(
+                d['inSampleStart'].date(), d['outSampleStart'].date(), d['outSampleEnd'].date(),
+                d['setting'], d['inSampleTarget'], d['outSampleTarget']))
+
+        if self.resultDf is None:
+            self.output(u'样本外无交易结果')
+            return
+
+        self.showDailyResult(self.resultDf.copy())
@@ -11,8 +11,12 @@ LOAD_STRATEGY = u'加载策略'
 INIT_ALL = u'全部初始化'
 START_ALL = u'全部启动'
 STOP_ALL = u'全部停止'
+PROFILE_ENABLED = u'性能统计'
 SAVE_POSITION_DATA = u'保存持仓'
 
 STRATEGY_LOADED = u'策略加载成功'
 
-SAVE_POSITION_QUESTION = u'是否要保存策略持仓数据到数据库？'
\ No newline at end of file
+SAVE_POSITION_QUESTION = u'是否要保存策略持仓数据到数据库？'
+
+START_PROFILE = u'开始采样'
+STOP_PROFILE = u'停止采样'
\ No newline at end of file
@@ -11,8 +11,12 @@ LOAD_STRATEGY = u'Load Strategy'
 INIT_ALL = u'Init All'
 START_ALL = u'Start All'
 STOP_ALL = u'Stop All'
+PROFILE_ENABLED = u'Profiling'
 SAVE_POSITION_DATA = u'Save Position Data'
 
 STRATEGY_LOADED = u'Strategy loaded.'
 
-SAVE_POSITION_QUESTION = u'Do you want to save strategy position data into database?'
\ No newline at end of file
+SAVE_POSITION_QUESTION = u'Do you want to save strategy position data into database?'
+
+START_PROFILE = u'Start Profile'
+STOP_PROFILE = u'Stop Profile'
\ No newline at end of file
@@ -13,6 +13,10 @@
 
 from __future__ import division
 
+import numpy as np
+import pandas as pd
+import talib
+
 #from vnpy.trader.vtObject import VtBarData
 from vnpy.trader.vtConstant import EMPTY_STRING, EMPTY_FLOAT
 from vnpy.trader.app.ctaStrategy.ctaTemplate import (CtaTemplate, 
@@ -153,4 +157,30 @@ class DoubleMaStrategy(CtaTemplate):
     #----------------------------------------------------------------------
     def onStopOrder(self, so):
         """停止单推送"""
-        pass    
+        pass
+        
+    #----------------------------------------------------------------------
+    @classmethod
+    def calculateTargetPos(cls, data, setting):
+        """向量化回测用的目标仓位计算，金叉持有1手多头，死叉持有1手空头"""
+        fastWindow = setting.get('fastWindow', cls.fastWindow)
+        slowWindow = setting.get('slowWindow', cls.slowWindow)
+        
+        close = data['close']
+        fastMa = talib.SMA(close, fastWindow)
+        slowMa = talib.SMA(close, slowWindow)
+        
+        fastMa1 = np.roll(fastMa, 1)
+        slowMa1 = np.roll(slowMa, 1)
+        fastMa1[0] = np.nan
+        slowMa1[0] = np.nan
+        
+        crossOver = (fastMa > slowMa) & (fastMa1 < slowMa1)
+        crossBelow = (fastMa < slowMa) & (fastMa1 > slowMa1)
+        
+        # 金叉、死叉时设置目标仓位，其余K线保持之前的仓位
+        signal = np.full(len(close), np.nan)
+        signal[crossOver] = 1
+        signal[crossBelow] = -1
+        
+        return pd.Series(signal).ffill().fillna(0).values
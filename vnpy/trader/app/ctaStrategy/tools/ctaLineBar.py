@@ -7,6 +7,7 @@ from vtConstant import *
 from vnpy.trader.vtObject import VtBarData
 
 from datetime import datetime
+from collections import deque
 
 import talib as ta
 import numpy
@@ -170,15 +171,70 @@ class CtaLineBar(object):
 
         if setting:
             self.setParam(setting)
+        else:
+            self.__initLines()
+
+    def __initLines(self):
+        """根据参数创建定长的K线、指标队列和收盘价、成交量的数组缓存，参数修改后保留已有的数据"""
+        maxInputLen = max(self.inputPreLen, self.inputEma1Len, self.inputEma2Len,
+                          self.inputDmiLen, self.inputAtr1Len, self.inputAtr2Len,
+                          self.inputAtr3Len, self.inputVolLen, self.inputRsiLen,
+                          self.inputCmiLen, self.inputBollLen, 7)
+
+        # K线队列，超出长度后自动移除最早的K线（原先为列表del [0]，复杂度O(n)）
+        self.lineBar = deque(self.lineBar, maxlen=max(60 * 8 + 1, maxInputLen + 3))
+
+        # 指标队列，长度和原先列表del [0]时的上限一致
+        self.preHigh = deque(self.preHigh, maxlen=self.inputPreLen * 8 + 1)
+        self.preLow = deque(self.preLow, maxlen=self.inputPreLen * 8 + 1)
+
+        self.lineEma1 = deque(self.lineEma1, maxlen=self.inputEma1Len * 8 + 1)
+        self.lineEma2 = deque(self.lineEma2, maxlen=self.inputEma1Len * 8 + 1)
+
+        self.linePdi = deque(self.linePdi, maxlen=self.inputDmiLen + 2)
+        self.lineMdi = deque(self.lineMdi, maxlen=self.inputDmiLen + 2)
+        self.lineDx = deque(self.lineDx, maxlen=self.inputDmiLen + 2)
+        self.lineAdx = deque(self.lineAdx, maxlen=self.inputDmiLen + 2)
+        self.lineAdxr = deque(self.lineAdxr, maxlen=self.inputDmiLen + 2)
+
+        self.lineAtr1 = deque(self.lineAtr1, maxlen=self.inputAtr1Len + 2)
+        self.lineAtr2 = deque(self.lineAtr2, maxlen=self.inputAtr2Len + 2)
+        self.lineAtr3 = deque(self.lineAtr3, maxlen=self.inputAtr3Len + 2)
+
+        self.lineRsi = deque(self.lineRsi, maxlen=self.inputRsiLen * 8 + 1)
+        self.lineRsiTop = deque(self.lineRsiTop, maxlen=self.inputRsiLen + 1)
+        self.lineRsiButtom = deque(self.lineRsiButtom, maxlen=self.inputRsiLen + 1)
+
+        self.lineCmi = deque(self.lineCmi, maxlen=self.inputCmiLen + 1)
+
+        # 已完成K线的TR、PDM、MDM缓存，用于DMI的增量计算，周期修改后需要从lineBar重新计算
+        self.trCache = deque(maxlen=max(self.inputDmiLen, 1))
+        self.pdmCache = deque(maxlen=max(self.inputDmiLen, 1))
+        self.mdmCache = deque(maxlen=max(self.inputDmiLen, 1))
+
+        for i in range(max(len(self.lineBar) - 1 - self.trCache.maxlen, 1), len(self.lineBar) - 1):
+            self.__appendDmCache(self.lineBar[i], self.lineBar[i - 1])
+
+        # 最近K线的收盘价、成交量数组，最后一个元素对应lineBar[-1]，避免每根K线重建列表
+        self.arraySize = maxInputLen + 3
+        self.closeArray = numpy.zeros(self.arraySize)
+        self.volumeArray = numpy.zeros(self.arraySize)
+
+        n = min(len(self.lineBar), self.arraySize)
+        for i in range(1, n + 1):
+            self.closeArray[-i] = self.lineBar[-i].close
+            self.volumeArray[-i] = self.lineBar[-i].volume
 
     def setParam(self, setting):
-        """设置参数"""
+        """设置参数，周期参数修改后按新的长度重建队列和数组缓存"""
         d = self.__dict__
         for key in self.paramList:
             if key in setting:
 
                 d[key] = setting[key]
 
+        self.__initLines()
+
     def onTick(self, tick):
         """行情更新
         :type tick: object
@@ -223,6 +279,10 @@ class CtaLineBar(object):
 
     def onBar(self, bar):
         """OnBar事件"""
+        # 更新数组缓存和DMI缓存（每次调用onBar前，lineBar中都新增了一根K线）
+        self.__updateArray()
+        self.__updateDmCache()
+
         # 计算相关数据
         self.__recountPreHighLow()
         self.__recountEma()
@@ -238,6 +298,50 @@ class CtaLineBar(object):
         self.onBarFunc(bar)
 
 
+    def __updateArray(self):
+        """更新收盘价、成交量数组，lineBar[-2]此时已完成，需要用最终值覆盖"""
+        self.closeArray[:-1] = self.closeArray[1:]
+        self.volumeArray[:-1] = self.volumeArray[1:]
+
+        self.closeArray[-1] = self.lineBar[-1].close
+        self.volumeArray[-1] = self.lineBar[-1].volume
+
+        if len(self.lineBar) >= 2:
+            self.closeArray[-2] = self.lineBar[-2].close
+            self.volumeArray[-2] = self.lineBar[-2].volume
+
+    def __updateDmCache(self):
+        """计算刚完成的K线（lineBar[-2]）的TR、PDM、MDM，并加入缓存"""
+        if len(self.lineBar) < 3:
+            return
+
+        self.__appendDmCache(self.lineBar[-2], self.lineBar[-3])
+
+    def __appendDmCache(self, bar, preBar):
+        """计算一根K线相对上一根K线的TR、PDM、MDM，并加入缓存"""
+        self.trCache.append(float(max(bar.high - bar.low,
+                                      abs(bar.high - preBar.close),
+                                      abs(bar.low - preBar.close))))
+
+        high_prehigh_spread = bar.high - preBar.high
+        low_prelow_spread = preBar.low - bar.low
+
+        if high_prehigh_spread > 0 and high_prehigh_spread > low_prelow_spread:
+            self.pdmCache.append(high_prehigh_spread)
+        else:
+            self.pdmCache.append(0)
+
+        if low_prelow_spread > 0 and low_prelow_spread > high_prehigh_spread:
+            self.mdmCache.append(low_prelow_spread)
+        else:
+            self.mdmCache.append(0)
+
+    def __copyBar(self, bar):
+        """复制K线（K线的属性均为不可变对象，无需deepcopy）"""
+        newBar = VtBarData()
+        newBar.__dict__.update(bar.__dict__)
+        return newBar
+
     def __firstTick(self,tick):
         """ K线的第一个Tick数据"""
         self.bar = VtBarData()                  # 创建新的K线
@@ -275,9 +379,7 @@ class CtaLineBar(object):
             self.onBar(self.bar)
             return
 
-        # 清除8交易小时前的数据，
-        if l1 > 60 * 8:
-            del self.lineBar[0]
+        # lineBar为定长队列，8交易小时前的数据会被自动清除
 
         # 与最后一个BAR的时间比对，判断是否超过5分钟
         lastBar = self.lineBar[-1]
@@ -304,7 +406,7 @@ class CtaLineBar(object):
 
                 # 生成砖块递增K线,减小ATR变动
                 for i in range(0, jumpBars, 1):
-                    upbar = copy.deepcopy(lastBar)
+                    upbar = self.__copyBar(lastBar)
                     upbar.open = priceInYesterday + float(i * priceInBar)
                     upbar.low = upbar.open
                     upbar.close = priceInYesterday + float((i+1) * priceInBar)
@@ -318,7 +420,7 @@ class CtaLineBar(object):
                 # 生成递减K线,减小ATR变动
                 for i in range(0, jumpBars, 1):
 
-                    downbar = copy.deepcopy(lastBar)
+                    downbar = self.__copyBar(lastBar)
                     downbar.open = priceInYesterday - float(i * priceInBar)
                     downbar.high = downbar.open
                     downbar.close = priceInYesterday - float((i+1) * priceInBar)
@@ -330,7 +432,7 @@ class CtaLineBar(object):
 
             # 生成平移K线，减小Pdi，Mdi、ADX变动
             for i in range(0, jumpBars*2, 1):
-                equalbar=copy.deepcopy(self.lineBar[-1])
+                equalbar = self.__copyBar(self.lineBar[-1])
                 equalbar.volume = 0
                 self.lineBar.append(equalbar)
                 self.onBar(equalbar)
@@ -408,13 +510,7 @@ class CtaLineBar(object):
                 preLow = self.lineBar[i].low     # 前InputPreLen周期低点
 
         # 保存
-        if len(self.preHigh) > self.inputPreLen * 8:
-            del self.preHigh[0]
         self.preHigh.append(preHigh)
-
-        # 保存
-        if len(self.preLow)> self.inputPreLen * 8:
-            del self.preLow[0]
         self.preLow.append(preLow)
 
     #----------------------------------------------------------------------
@@ -439,14 +535,10 @@ class CtaLineBar(object):
                 ema1Len = self.inputEma1Len
 
             # 3、获取前InputN周期(不包含当前周期）的自适应均线
-            listClose=[x.close for x in self.lineBar[-ema1Len - 1:-1]]
-
-            barEma1 = ta.EMA(numpy.array(listClose, dtype=float), ema1Len)[-1]
+            barEma1 = ta.EMA(self.closeArray[-ema1Len - 1:-1], ema1Len)[-1]
 
             barEma1 = round(float(barEma1), 3)
 
-            if len(self.lineEma1) > self.inputEma1Len*8:
-                del self.lineEma1[0]
             self.lineEma1.append(barEma1)
 
         # 计算第二条EMA均线
@@ -458,13 +550,10 @@ class CtaLineBar(object):
                 ema2Len = self.inputEma2Len
 
             # 3、获取前InputN周期(不包含当前周期）的自适应均线
-            listClose=[x.close for x in self.lineBar[-ema2Len - 1:-1]]
-            barEma2 = ta.EMA(numpy.array(listClose, dtype=float), ema2Len)[-1]
+            barEma2 = ta.EMA(self.closeArray[-ema2Len - 1:-1], ema2Len)[-1]
 
             barEma2 = round(float(barEma2), 3)
 
-            if len(self.lineEma2) > self.inputEma1Len*8:
-                del self.lineEma2[0]
             self.lineEma2.append(barEma2)
 
 
@@ -485,32 +574,42 @@ class CtaLineBar(object):
         barPdm = EMPTY_FLOAT      # InputP周期内的做多价差之和
         barMdm = EMPTY_FLOAT      # InputP周期内的做空价差之和
 
-        for i in range(len(self.lineBar)-2, len(self.lineBar)-2-self.inputDmiLen, -1):  # 周期 inputDmiLen
-            # 3.1、计算TR1
+        if len(self.lineBar) == self.inputDmiLen+1:
+            # 首次计算时周期内最早的K线没有上一根K线，沿用原先的逐根计算（lineBar[-1]作为其上一根K线）
+            for i in range(len(self.lineBar)-2, len(self.lineBar)-2-self.inputDmiLen, -1):  # 周期 inputDmiLen
+                # 3.1、计算TR1
 
-            # 当前周期最高与最低的价差
-            high_low_spread = self.lineBar[i].high - self.lineBar[i].low
-            # 当前周期最高与昨收价的价差
-            high_preclose_spread = abs(self.lineBar[i].high - self.lineBar[i - 1].close)
-            # 当前周期最低与昨收价的价差
-            low_preclose_spread = abs(self.lineBar[i].low - self.lineBar[i - 1].close)
+                # 当前周期最高与最低的价差
+                high_low_spread = self.lineBar[i].high - self.lineBar[i].low
+                # 当前周期最高与昨收价的价差
+                high_preclose_spread = abs(self.lineBar[i].high - self.lineBar[i - 1].close)
+                # 当前周期最低与昨收价的价差
+                low_preclose_spread = abs(self.lineBar[i].low - self.lineBar[i - 1].close)
 
-            # 最大价差
-            max_spread = max(high_low_spread, high_preclose_spread, low_preclose_spread)
-            barTr1 = barTr1 + float(max_spread)
+                # 最大价差
+                max_spread = max(high_low_spread, high_preclose_spread, low_preclose_spread)
+                barTr1 = barTr1 + float(max_spread)
 
-            # 今高与昨高的价差
-            high_prehigh_spread = self.lineBar[i].high - self.lineBar[i - 1].high
-            # 昨低与今低的价差
-            low_prelow_spread = self.lineBar[i - 1].low - self.lineBar[i].low
+                # 今高与昨高的价差
+                high_prehigh_spread = self.lineBar[i].high - self.lineBar[i - 1].high
+                # 昨低与今低的价差
+                low_prelow_spread = self.lineBar[i - 1].low - self.lineBar[i].low
 
-            # 3.2、计算周期内的做多价差之和
-            if high_prehigh_spread > 0 and high_prehigh_spread > low_prelow_spread:
-                barPdm = barPdm + high_prehigh_spread
+                # 3.2、计算周期内的做多价差之和
+                if high_prehigh_spread > 0 and high_prehigh_spread > low_prelow_spread:
+                    barPdm = barPdm + high_prehigh_spread
 
-            # 3.3、计算周期内的做空价差之和
-            if low_prelow_spread > 0 and low_prelow_spread > high_prehigh_spread:
-                barMdm = barMdm + low_prelow_spread
+                # 3.3、计算周期内的做空价差之和
+                if low_prelow_spread > 0 and low_prelow_spread > high_prehigh_spread:
+                    barMdm = barMdm + low_prelow_spread
+        else:
+            # 使用缓存的每根K线TR、PDM、MDM，按照从近到远的顺序累加（和逐根计算的结果完全一致）
+            for tr in list(self.trCache)[::-1]:
+                barTr1 = barTr1 + tr
+            for pdm in list(self.pdmCache)[::-1]:
+                barPdm = barPdm + pdm
+            for mdm in list(self.mdmCache)[::-1]:
+                barMdm = barMdm + mdm
 
         # 6、计算上升动向指标，即做多的比率
         if barTr1 == 0:
@@ -518,9 +617,6 @@ class CtaLineBar(object):
         else:
             self.barPdi = barPdm * 100 / barTr1
 
-        if len(self.linePdi) > self.inputDmiLen+1:
-            del self.linePdi[0]
-
         self.linePdi.append(self.barPdi)
 
         # 7、计算下降动向指标，即做空的比率
@@ -535,14 +631,7 @@ class CtaLineBar(object):
         else:
             dx = 100 * abs(self.barMdi - self.barPdi) / (self.barMdi + self.barPdi)
 
-        if len(self.lineMdi) > self.inputDmiLen+1:
-            del self.lineMdi[0]
-
         self.lineMdi.append(self.barMdi)
-
-        if len(self.lineDx) > self.inputDmiLen+1:
-            del self.lineDx[0]
-
         self.lineDx.append(dx)
 
         # 平均趋向指标，MA计算
@@ -552,9 +641,6 @@ class CtaLineBar(object):
             self.barAdx = ta.EMA(numpy.array(self.lineDx, dtype=float), self.inputDmiLen)[-1]
 
         # 保存Adx值
-        if len(self.lineAdx) > self.inputDmiLen+1:
-            del self.lineAdx[0]
-
         self.lineAdx.append(self.barAdx)
 
         # 趋向平均值，为当日ADX值与1周期前的ADX值的均值
@@ -564,8 +650,6 @@ class CtaLineBar(object):
             self.barAdxr = (self.lineAdx[-1] + self.lineAdx[-2]) / 2
 
         # 保存Adxr值
-        if len(self.lineAdxr) > self.inputDmiLen+1:
-            del self.lineAdxr[0]
         self.lineAdxr.append(self.barAdxr)
 
         # 7、计算A，ADX值持续高于前一周期时，市场行情将维持原趋势
@@ -669,8 +753,6 @@ class CtaLineBar(object):
             else:
                 self.barAtr1 = round((self.lineAtr1[-1]*(self.inputAtr1Len -1) + barTr1) / self.inputAtr1Len, 3)
 
-            if len(self.lineAtr1) > self. inputAtr1Len+1 :
-                del self.lineAtr1[0]
             self.lineAtr1.append(self.barAtr1)
 
         if self.inputAtr2Len > 0:
@@ -679,8 +761,6 @@ class CtaLineBar(object):
             else:
                 self.barAtr2 = round((self.lineAtr2[-1]*(self.inputAtr2Len -1) + barTr2) / self.inputAtr2Len, 3)
 
-            if len(self.lineAtr2) > self. inputAtr2Len+1:
-                del self.lineAtr2[0]
             self.lineAtr2.append(self.barAtr2)
 
         if self.inputAtr3Len > 0:
@@ -689,9 +769,6 @@ class CtaLineBar(object):
             else:
                 self.barAtr3 = round((self.lineAtr3[-1]*(self.inputAtr3Len -1) + barTr3) / self.inputAtr3Len, 3)
 
-            if len(self.lineAtr3) > self. inputAtr3Len+1:
-                del self.lineAtr3[0]
-
             self.lineAtr3.append(self.barAtr3)
 
     #----------------------------------------------------------------------
@@ -707,9 +784,7 @@ class CtaLineBar(object):
                              format(len(self.lineBar), self.inputVolLen+1))
             return
 
-        listVol = [x.volume for x in self.lineBar[-self.inputVolLen-1: -1]]
-
-        sumVol = ta.SUM(numpy.array(listVol, dtype=float), timeperiod=self.inputVolLen)[-1]
+        sumVol = ta.SUM(self.volumeArray[-self.inputVolLen-1: -1], timeperiod=self.inputVolLen)[-1]
 
         avgVol = round(sumVol/self.inputVolLen, 0)
 
@@ -728,14 +803,10 @@ class CtaLineBar(object):
             return
 
         # 3、inputRsiLen(包含当前周期）的相对强弱
-        listClose=[x.close for x in self.lineBar[-self.inputRsiLen - 2:]]
-        barRsi = ta.RSI(numpy.array(listClose, dtype=float), self.inputRsiLen)[-1]
+        barRsi = ta.RSI(self.closeArray[-self.inputRsiLen - 2:], self.inputRsiLen)[-1]
         barRsi = round(float(barRsi), 3)
 
         l = len(self.lineRsi)
-        if l > self.inputRsiLen*8:
-            del self.lineRsi[0]
-
         self.lineRsi.append(barRsi)
 
         if l > 3:
@@ -748,9 +819,6 @@ class CtaLineBar(object):
                 t["Close"] = self.lineBar[-2].close
 
 
-                if len(self.lineRsiTop) > self.inputRsiLen:
-                    del self.lineRsiTop[0]
-
                 self.lineRsiTop.append( t )
                 self.lastRsiTopButtom = self.lineRsiTop[-1]
 
@@ -762,8 +830,6 @@ class CtaLineBar(object):
                 b["RSI"] = self.lineRsi[-2]
                 b["Close"] = self.lineBar[-2].close
 
-                if len(self.lineRsiButtom) > self.inputRsiLen:
-                    del self.lineRsiButtom[0]
                 self.lineRsiButtom.append(b)
                 self.lastRsiTopButtom = self.lineRsiButtom[-1]
 
@@ -787,7 +853,7 @@ class CtaLineBar(object):
                              format(len(self.lineBar), self.inputCmiLen))
             return
 
-        listClose =[x.close for x in self.lineBar[-self.inputCmiLen:]]
+        listClose = [self.lineBar[i].close for i in range(-self.inputCmiLen, 0)]
         hhv = max(listClose)
         llv = min(listClose)
 
@@ -798,9 +864,6 @@ class CtaLineBar(object):
 
         cmi = round(cmi, 2)
 
-        if len(self.lineCmi) > self.inputCmiLen:
-            del self.lineCmi[0]
-
         self.lineCmi.append(cmi)
 
     def __recountBoll(self):
@@ -820,9 +883,7 @@ class CtaLineBar(object):
             bollLen = self.inputBollLen
 
         # 不包含当前最新的Bar
-        listClose=[x.close for x in self.lineBar[-bollLen - 1:-1]]
-        #
-        upper, middle, lower = ta.BBANDS(numpy.array(listClose, dtype=float),
+        upper, middle, lower = ta.BBANDS(self.closeArray[-bollLen - 1:-1],
                                          timeperiod=bollLen, nbdevup=self.inputBollStdRate,
                                          nbdevdn=self.inputBollStdRate, matype=0)
 
@@ -9,6 +9,8 @@ same as CTA engine. Real trading code can be directly used for backtesting.
 
 from __future__ import division
 
+import numpy as np
+
 from vnpy.trader.vtObject import VtTickData, VtBarData
 from ctaBacktesting import *
 
@@ -24,6 +26,12 @@ class BacktestEngineMultiTF(BacktestingEngine):
         self.infobar        = {}        # Dict, 放置辅助品种最新一个K线数据
         self.MultiOn        = False     # Boolean, 判断是否传入了辅助品种
 
+        # 辅助品种数据和执行品种K线的预先对齐结果
+        # Information data aligned to execution bars once before backtesting
+        self.infoData       = {}        # Dict, 辅助品种的全部回测数据字典列表
+        self.infoIndex      = {}        # Dict, 每根执行品种K线对应推送的辅助品种数据位置, -1表示不推送
+        self.barIndex       = -1        # Int, 当前执行品种K线的位置
+
     # ----------------------------------------------------------------------
     def setDatabase(self, dbName, symbol, **kwargs):
         """set database that provide historical data"""
@@ -102,14 +110,16 @@ class BacktestEngineMultiTF(BacktestingEngine):
         else:
             flt = {'datetime': {'$gte': self.strategyStartDate,
                                 '$lte': self.dataEndDate}}
-        self.dbCursor = collection.find(flt)
+        self.dbCursor = collection.find(flt).sort('datetime')
 
         if self.MultiOn is True:
             for db in info_collection:
-                self.InfoCursor[db] = info_collection[db].find(flt)
+                self.InfoCursor[db] = info_collection[db].find(flt).sort('datetime')
+
+            self.alignInformationData(collection, flt)
             self.output(
                 "Data loading completed, data volumn: %s" % (self.initCursor.count() + self.dbCursor.count() + \
-                                                             sum([i.count() for i in self.InfoCursor.values()])))
+                                                             sum([len(i) for i in self.infoData.values()])))
         else:
             self.output("Data loading completed, data volumn: %s" % (self.initCursor.count() + self.dbCursor.count()))
 
@@ -136,7 +146,9 @@ class BacktestEngineMultiTF(BacktestingEngine):
 
         dataClass = self.dataClass
         func = self.func
+        self.barIndex = -1
         for d in self.dbCursor:
+            self.barIndex += 1
             data = dataClass()
             data.__dict__ = d
             func(data)
@@ -144,33 +156,51 @@ class BacktestEngineMultiTF(BacktestingEngine):
         self.output("No more historical data")
 
     # ----------------------------------------------------------------------
-    def checkInformationData(self):
-        """Update information symbols' data"""
+    def alignInformationData(self, collection, flt):
+        """
+        回测开始前一次性对齐辅助品种数据和执行品种K线（按datetime的as-of对齐）
+        Align information data to execution bars once, with an as-of join on datetime
 
-        # If infobar is empty, which means it is the first time calling this method
-        if self.infobar == {}:
-            for info_symbol in self.InfoCursor:
-                try:
-                    self.infobar[info_symbol] = next(self.InfoCursor[info_symbol])
-                except StopIteration:
-                    print "Data of information symbols is empty! Input must be a list, not str."
-                    raise
+        辅助品种的每根K线在时间戳不早于它的第一根执行品种K线推送, 每根执行品种K线每个辅助品种
+        最多推送一根, 多根辅助品种K线对应同一根执行品种K线时顺延到后续的K线, 和逐根检查的结果一致
+        """
+        # 执行品种K线的时间戳, 只读取datetime字段
+        cursor = collection.find(flt, {'datetime': 1, '_id': 0}).sort('datetime')
+        barDt = np.array([d['datetime'] for d in cursor], dtype='datetime64[us]')
 
-        temp = {}
-        for info_symbol in self.infobar:
+        for info_symbol in self.InfoCursor:
+            dataList = list(self.InfoCursor[info_symbol])
+            infoDt = np.array([d['datetime'] for d in dataList], dtype='datetime64[us]')
+
+            # 每根辅助品种K线最早可以推送的执行品种K线位置
+            pos = np.searchsorted(barDt, infoDt, side='left')
 
-            data = self.infobar[info_symbol]
+            # 每根执行品种K线最多推送一根, 顺延到后续K线: pos[j] = max(pos[j], pos[j-1] + 1)
+            n = np.arange(len(pos))
+            if len(pos):
+                pos = np.maximum.accumulate(pos - n) + n
 
-            # Update data only when Time Stamp is matched
-            if (data is not None) and (data['datetime'] <= self.dt):
+            index = np.full(len(barDt), -1, dtype=int)
+            valid = pos < len(barDt)
+            index[pos[valid]] = n[valid]
+
+            self.infoData[info_symbol] = dataList
+            self.infoIndex[info_symbol] = index
+
+            if not len(dataList):
+                self.output("Data of information symbol %s is empty!" % info_symbol)
+
+    # ----------------------------------------------------------------------
+    def checkInformationData(self):
+        """Update information symbols' data"""
+        # 使用预先对齐的结果, 直接查找当前K线对应的辅助品种数据
+        temp = {}
+        for info_symbol, index in self.infoIndex.items():
+            i = index[self.barIndex]
 
-                try:
-                    temp[info_symbol] = VtBarData()
-                    temp[info_symbol].__dict__ = data
-                    self.infobar[info_symbol] = next(self.InfoCursor[info_symbol])
-                except StopIteration:
-                    self.infobar[info_symbol] = None
-                    self.output("No more data in information database.")
+            if i >= 0:
+                temp[info_symbol] = VtBarData()
+                temp[info_symbol].__dict__ = self.infoData[info_symbol][i]
             else:
                 temp[info_symbol] = None
 
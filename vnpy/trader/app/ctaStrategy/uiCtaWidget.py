@@ -40,6 +40,11 @@ class CtaValueMonitor(QtWidgets.QTableWidget):
     #----------------------------------------------------------------------
     def updateData(self, data):
         """更新数据"""
+        # 数据字段发生变化时（如性能统计中新增了回调函数），重新初始化表头
+        if self.inited and len(data) != len(self.keyCellDict):
+            self.keyCellDict = {}
+            self.inited = False
+        
         if not self.inited:
             self.setColumnCount(len(data))
             self.setHorizontalHeaderLabels(data.keys())
@@ -83,10 +88,13 @@ class CtaStrategyManager(QtWidgets.QGroupBox):
         
         self.paramMonitor = CtaValueMonitor(self)
         self.varMonitor = CtaValueMonitor(self)
+        self.perfMonitor = CtaValueMonitor(self)
         
         height = 65
         self.paramMonitor.setFixedHeight(height)
         self.varMonitor.setFixedHeight(height)
+        self.perfMonitor.setFixedHeight(height)
+        self.perfMonitor.setVisible(False)
         
         buttonInit = QtWidgets.QPushButton(text.INIT)
         buttonStart = QtWidgets.QPushButton(text.START)
@@ -95,10 +103,15 @@ class CtaStrategyManager(QtWidgets.QGroupBox):
         buttonStart.clicked.connect(self.start)
         buttonStop.clicked.connect(self.stop)
         
+        self.buttonProfile = QtWidgets.QPushButton(text.START_PROFILE)
+        self.buttonProfile.setCheckable(True)
+        self.buttonProfile.clicked.connect(self.switchProfile)
+        
         hbox1 = QtWidgets.QHBoxLayout()     
         hbox1.addWidget(buttonInit)
         hbox1.addWidget(buttonStart)
         hbox1.addWidget(buttonStop)
+        hbox1.addWidget(self.buttonProfile)
         hbox1.addStretch()
         
         hbox2 = QtWidgets.QHBoxLayout()
@@ -111,6 +124,7 @@ class CtaStrategyManager(QtWidgets.QGroupBox):
         vbox.addLayout(hbox1)
         vbox.addLayout(hbox2)
         vbox.addLayout(hbox3)
+        vbox.addWidget(self.perfMonitor)
 
         self.setLayout(vbox)
         
@@ -125,6 +139,14 @@ class CtaStrategyManager(QtWidgets.QGroupBox):
         if varDict:
             self.varMonitor.updateData(varDict)        
             
+    #----------------------------------------------------------------------
+    def updatePerf(self):
+        """显示策略回调的性能统计"""
+        perfDict = self.ctaEngine.getStrategyPerf(self.name)
+        if perfDict:
+            self.perfMonitor.setVisible(True)
+            self.perfMonitor.updateData(perfDict)
+            
     #----------------------------------------------------------------------
     def registerEvent(self):
         """注册事件监听"""
@@ -145,12 +167,23 @@ class CtaStrategyManager(QtWidgets.QGroupBox):
     def stop(self):
         """停止策略"""
         self.ctaEngine.stopStrategy(self.name)
+        
+    #----------------------------------------------------------------------
+    def switchProfile(self, checked):
+        """开启或停止cProfile采样"""
+        if checked:
+            self.ctaEngine.startStrategyProfile(self.name)
+            self.buttonProfile.setText(text.STOP_PROFILE)
+        else:
+            self.ctaEngine.stopStrategyProfile(self.name)
+            self.buttonProfile.setText(text.START_PROFILE)
 
 
 ########################################################################
 class CtaEngineManager(QtWidgets.QWidget):
     """CTA引擎管理组件"""
     signal = QtCore.Signal(type(Event()))
+    signalTimer = QtCore.Signal(type(Event()))
 
     #----------------------------------------------------------------------
     def __init__(self, ctaEngine, eventEngine, parent=None):
@@ -161,6 +194,11 @@ class CtaEngineManager(QtWidgets.QWidget):
         self.eventEngine = eventEngine
         
         self.strategyLoaded = False
+        self.strategyManagerList = []
+        
+        # 性能统计界面刷新计时
+        self.perfCount = 0
+        self.perfTrigger = 5        # 每5秒刷新一次
         
         self.initUi()
         self.registerEvent()
@@ -184,6 +222,11 @@ class CtaEngineManager(QtWidgets.QWidget):
         startAllButton.clicked.connect(self.startAll)
         stopAllButton.clicked.connect(self.stopAll)
         
+        # 性能统计开关
+        self.profileCheck = QtWidgets.QCheckBox(text.PROFILE_ENABLED)
+        self.profileCheck.setChecked(self.ctaEngine.profileEnabled)
+        self.profileCheck.clicked.connect(self.switchProfileEnabled)
+        
         # 滚动区域，放置所有的CtaStrategyManager
         self.scrollArea = QtWidgets.QScrollArea()
         self.scrollArea.setWidgetResizable(True)
@@ -199,6 +242,7 @@ class CtaEngineManager(QtWidgets.QWidget):
         hbox2.addWidget(initAllButton)
         hbox2.addWidget(startAllButton)
         hbox2.addWidget(stopAllButton)
+        hbox2.addWidget(self.profileCheck)
         hbox2.addStretch()
         
         vbox = QtWidgets.QVBoxLayout()
@@ -216,6 +260,7 @@ class CtaEngineManager(QtWidgets.QWidget):
         for name in self.ctaEngine.strategyDict.keys():
             strategyManager = CtaStrategyManager(self.ctaEngine, self.eventEngine, name)
             vbox.addWidget(strategyManager)
+            self.strategyManagerList.append(strategyManager)
         
         vbox.addStretch()
         
@@ -237,6 +282,25 @@ class CtaEngineManager(QtWidgets.QWidget):
         """全部停止"""
         self.ctaEngine.stopAll()
             
+    #----------------------------------------------------------------------
+    def switchProfileEnabled(self, checked):
+        """启用或停用性能统计"""
+        self.ctaEngine.setProfileEnabled(checked)
+        
+    #----------------------------------------------------------------------
+    def updatePerf(self, event):
+        """定时刷新策略性能统计"""
+        if not self.ctaEngine.profileEnabled:
+            return
+        
+        self.perfCount += 1
+        if self.perfCount < self.perfTrigger:
+            return
+        self.perfCount = 0
+        
+        for strategyManager in self.strategyManagerList:
+            strategyManager.updatePerf()
+            
     #----------------------------------------------------------------------
     def load(self):
         """加载策略"""
@@ -258,6 +322,9 @@ class CtaEngineManager(QtWidgets.QWidget):
         """注册事件监听"""
         self.signal.connect(self.updateCtaLog)
         self.eventEngine.register(EVENT_CTA_LOG, self.signal.emit)
+        
+        self.signalTimer.connect(self.updatePerf)
+        self.eventEngine.register(EVENT_TIMER, self.signalTimer.emit)
 
     
     
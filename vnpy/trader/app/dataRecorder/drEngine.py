@@ -12,16 +12,17 @@ import os
 import copy
 from collections import OrderedDict
 from datetime import datetime, timedelta
-from Queue import Queue, Empty
-from threading import Thread
 
 from vnpy.event import Event
 from vnpy.trader.vtEvent import *
-from vnpy.trader.vtFunction import todayDate, getJsonPath
+from vnpy.trader.vtFunction import todayDate, getJsonPath, getTempPath
 from vnpy.trader.vtObject import VtSubscribeReq, VtLogData, VtBarData, VtTickData
+from vnpy.trader.vtJournal import (Journal, JournalFile, listJournalFiles,
+                                   JOURNAL_TICK, JOURNAL_BAR)
 from vnpy.trader.app.ctaStrategy.ctaTemplate import BarManager
 
 from .drBase import *
+from .drWriter import DrWriter
 from .language import text
 
 
@@ -53,10 +54,22 @@ class DrEngine(object):
         # 配置字典
         self.settingDict = OrderedDict()
         
-        # 负责执行数据库插入的单独线程相关
+        # 负责执行数据库插入的线程相关，按集合名的哈希值分配到writerCount个写入线程
         self.active = False                     # 工作状态
-        self.queue = Queue()                    # 队列
-        self.thread = Thread(target=self.run)   # 线程
+        self.writerCount = 1                    # 写入线程数量
+        self.writerList = []                    # 写入线程列表
+        self.partitionDict = {}                 # 集合名对应的写入线程编号缓存
+        
+        # 批量写入相关，队列中的数据积累到batchSize条，或者最早的数据等待超过batchLatency秒后写入
+        self.batchSize = 1000                   # 每批最大数据量
+        self.batchLatency = 0.5                 # 每批最大等待时间（秒）
+        
+        # 本地日志文件相关，启用后数据先追加到本地日志文件，再由后台线程定期批量载入数据库，
+        # 未启用时批量写入失败的数据也保存到日志文件目录中，同样由后台线程重新载入
+        self.journal = None                     # Journal对象，为None表示不启用
+        self.journalPath = ''                   # 日志文件根目录
+        self.journalPathSet = set()             # 需要载入数据库的日志文件路径集合
+        self.compactInterval = 5                # 载入数据库的间隔（秒）
         
         # 载入设置，订阅行情
         self.loadSetting()
@@ -73,6 +86,16 @@ class DrEngine(object):
         with open(self.settingFilePath) as f:
             drSetting = json.load(f)
 
+            # 批量写入设置
+            self.batchSize = drSetting.get('batchSize', self.batchSize)
+            self.batchLatency = drSetting.get('batchLatency', self.batchLatency)
+            self.writerCount = max(1, drSetting.get('writerCount', self.writerCount))
+            
+            # 本地日志文件设置
+            self.journalPath = drSetting.get('journalPath', '') or getTempPath('journal')
+            self.compactInterval = drSetting.get('compactInterval', self.compactInterval)
+            self.initJournal(drSetting.get('journal', False))
+
             # 如果working设为False则不启动行情记录功能
             working = drSetting['working']
             if not working:
@@ -226,31 +249,86 @@ class DrEngine(object):
     #----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
         """插入数据到数据库（这里的data可以是VtTickData或者VtBarData）"""
-        self.queue.put((dbName, collectionName, data.__dict__))
+        # 启用本地日志文件时，先追加到日志文件
+        if self.journal:
+            self.insertJournal(dbName, collectionName, data)
+            return
+        
+        d = data.__dict__
+        
+        # 延时追踪编号只在运行时有意义，不保存到数据库
+        if 'traceId' in d:
+            d = {k: v for k, v in d.items() if k != 'traceId'}
+        
+        self.writerList[self.getPartition(collectionName)].put(dbName, collectionName, d)
+        
+    #----------------------------------------------------------------------
+    def initJournal(self, enabled):
+        """启用本地日志文件，之前运行中尚未载入数据库的文件（包括写入失败时保存的数据）都会在后台载入"""
+        if enabled:
+            self.journal = Journal(self.journalPath)
+        
+        for filePath in listJournalFiles(self.journalPath):
+            journalFile = JournalFile(filePath)
+            if journalFile.getLoadedCount() < journalFile.getCount():
+                self.journalPathSet.add(filePath)
+            journalFile.close()
         
     #----------------------------------------------------------------------
-    def run(self):
-        """运行插入线程"""
-        while self.active:
-            try:
-                dbName, collectionName, d = self.queue.get(block=True, timeout=1)
-                flt = {'datetime': d['datetime']}
-                self.mainEngine.dbUpdate(dbName, collectionName, d, flt, True)
-            except Empty:
-                pass
+    def insertJournal(self, dbName, collectionName, data):
+        """追加数据到本地日志文件"""
+        if isinstance(data, VtTickData):
+            dataType = JOURNAL_TICK
+        else:
+            dataType = JOURNAL_BAR
+        
+        journalFile = self.journal.append(dbName, collectionName, data, dataType)
+        self.journalPathSet.add(journalFile.path)
+        
+    #----------------------------------------------------------------------
+    def getPartition(self, collectionName):
+        """获取集合对应的写入线程编号，同一个集合总是由同一个线程写入"""
+        partition = self.partitionDict.get(collectionName, None)
+        if partition is None:
+            partition = hash(collectionName) % self.writerCount
+            self.partitionDict[collectionName] = partition
+        return partition
+    
+    #----------------------------------------------------------------------
+    def getMetrics(self):
+        """获取写入线程的统计，数量类指标为各线程之和，延时类指标为各线程的最大值"""
+        d = OrderedDict()
+        d['writerCount'] = self.writerCount
+        d['queueSize'] = sum([writer.queue.qsize() for writer in self.writerList])
+        d['lastBatchSize'] = sum([writer.lastBatchSize for writer in self.writerList])
+        d['lastWriteLag'] = max([writer.lastWriteLag for writer in self.writerList])
+        d['maxWriteLag'] = max([writer.maxWriteLag for writer in self.writerList])
+        d['batchCount'] = sum([writer.batchCount for writer in self.writerList])
+        d['writeCount'] = sum([writer.writeCount for writer in self.writerList])
+        
+        d['spillCount'] = sum([writer.spillCount for writer in self.writerList])
+        d['journalPending'] = sum([writer.journalPending for writer in self.writerList])
+        return d
             
     #----------------------------------------------------------------------
     def start(self):
         """启动"""
         self.active = True
-        self.thread.start()
+        
+        self.writerList = [DrWriter(self, i) for i in range(self.writerCount)]
+        for writer in self.writerList:
+            writer.start()
         
     #----------------------------------------------------------------------
     def stop(self):
         """退出"""
         if self.active:
             self.active = False
-            self.thread.join()
+            for writer in self.writerList:
+                writer.stop()
+        
+        if self.journal:
+            self.journal.close()
         
     #----------------------------------------------------------------------
     def writeDrLog(self, content):
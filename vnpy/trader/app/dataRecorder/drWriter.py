@@ -0,0 +1,275 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了行情记录引擎的数据写入线程。
+
+DrEngine按照集合名的哈希值将数据分配到多个写入线程，同一个集合的数据总是由同一个线程
+按顺序写入，每个线程使用独立的历史数据存储（MongoDB连接或本地文件），不同集合的写入可以并行。
+
+批量写入失败的数据不会丢弃，而是保存到本地日志文件目录中（格式和日志文件模式相同），
+由写入线程每隔compactInterval秒尝试重新载入数据库，程序重启后也会继续载入。
+'''
+
+from time import time, sleep
+from collections import OrderedDict
+from Queue import Queue, Empty
+from threading import Thread
+import os
+
+from vnpy.trader.vtObject import VtTickData, VtBarData
+from vnpy.trader.vtJournal import Journal, JournalFile, JOURNAL_TICK, JOURNAL_BAR
+from vnpy.trader.vtHistoryStore import createHistoryStore, HISTORY_STORE_ERRORS
+
+from .drBase import TICK_DB_NAME
+from .language import text
+
+
+########################################################################
+class DrWriter(object):
+    """数据写入线程，负责一部分集合的批量写入"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, drEngine, index):
+        """Constructor"""
+        self.drEngine = drEngine
+        self.index = index                      # 分区编号
+
+        self.active = False                     # 工作状态
+        self.queue = Queue()                    # 队列
+        self.thread = Thread(target=self.run)   # 线程
+        self.historyStore = None                # 独立的历史数据存储
+        self.spillJournal = None                # 保存写入失败数据的日志文件管理器
+
+        # 写入统计
+        self.lastBatchSize = 0                  # 最近一批的数据量
+        self.lastWriteLag = 0                   # 最近一批中最早的数据从入队到写入完成的耗时（秒）
+        self.maxWriteLag = 0                    # 最大写入延时（秒）
+        self.batchCount = 0                     # 写入批数
+        self.writeCount = 0                     # 写入数据量
+        self.spillCount = 0                     # 写入失败后保存到日志文件的数据量
+        self.journalPending = 0                 # 本分区尚未载入数据库的日志数据量
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动"""
+        self.active = True
+        self.thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止，等待剩余数据写入完成"""
+        if self.active:
+            self.active = False
+            self.thread.join()
+
+        if self.historyStore:
+            self.historyStore.close()
+            self.historyStore = None
+
+        if self.spillJournal:
+            self.spillJournal.close()
+            self.spillJournal = None
+
+    #----------------------------------------------------------------------
+    def put(self, dbName, collectionName, d):
+        """数据放入队列"""
+        self.queue.put((dbName, collectionName, d, time()))
+
+    #----------------------------------------------------------------------
+    def bulkUpdate(self, dbName, collectionName, dataList):
+        """使用本线程的历史数据存储批量更新数据（不存在则插入）"""
+        if not self.historyStore:
+            self.historyStore = createHistoryStore()
+
+        if dbName == TICK_DB_NAME:
+            self.historyStore.saveTicks(dbName, collectionName, dataList)
+        else:
+            self.historyStore.saveBars(dbName, collectionName, dataList)
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """运行写入线程"""
+        if self.drEngine.journal:
+            self.runCompactor()
+        else:
+            self.runQueue()
+
+    #----------------------------------------------------------------------
+    def runQueue(self):
+        """从队列中批量获取数据写入"""
+        batchSize = self.drEngine.batchSize
+        batchLatency = self.drEngine.batchLatency
+        lastCompactTime = time()
+
+        while self.active:
+            # 定期重新载入之前写入失败的数据
+            if self.drEngine.journalPathSet and time() - lastCompactTime >= self.drEngine.compactInterval:
+                self.compactJournal()
+                lastCompactTime = time()
+
+            try:
+                batch = [self.queue.get(block=True, timeout=1)]
+            except Empty:
+                continue
+
+            # 继续从队列中获取数据，直到达到批量上限或者最大等待时间
+            deadline = batch[0][3] + batchLatency
+            while len(batch) < batchSize:
+                timeout = deadline - time()
+                try:
+                    if timeout > 0:
+                        batch.append(self.queue.get(block=True, timeout=timeout))
+                    else:
+                        batch.append(self.queue.get(block=False))
+                except Empty:
+                    break
+
+            self.writeBatch(batch)
+
+        # 退出前写入队列中剩余的数据
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get(block=False))
+            except Empty:
+                break
+
+            if len(batch) >= batchSize:
+                self.writeBatch(batch)
+                batch = []
+
+        if batch:
+            self.writeBatch(batch)
+
+        if self.drEngine.journalPathSet:
+            self.compactJournal()
+
+    #----------------------------------------------------------------------
+    def writeBatch(self, batch):
+        """按集合分组后批量写入一批数据"""
+        # 同一集合中datetime相同的数据只保留最后一条，和逐条upsert的结果一致
+        groupDict = OrderedDict()
+        for dbName, collectionName, d, putTime in batch:
+            key = (dbName, collectionName)
+            if key not in groupDict:
+                groupDict[key] = OrderedDict()
+            groupDict[key][d['datetime']] = d
+
+        for (dbName, collectionName), dataDict in groupDict.items():
+            try:
+                self.bulkUpdate(dbName, collectionName, dataDict.values())
+            except HISTORY_STORE_ERRORS as e:
+                self.drEngine.writeDrLog(text.BULK_WRITE_FAILED.format(collection=collectionName, error=e))
+                self.spillData(dbName, collectionName, dataDict.values())
+
+        # 更新统计
+        writeLag = time() - batch[0][3]
+        self.lastBatchSize = len(batch)
+        self.lastWriteLag = writeLag
+        self.maxWriteLag = max(self.maxWriteLag, writeLag)
+        self.batchCount += 1
+        self.writeCount += len(batch)
+
+    #----------------------------------------------------------------------
+    def spillData(self, dbName, collectionName, dataList):
+        """将写入失败的数据保存到本地日志文件，由compactJournal重新载入数据库"""
+        if dbName == TICK_DB_NAME:
+            dataClass = VtTickData
+            dataType = JOURNAL_TICK
+        else:
+            dataClass = VtBarData
+            dataType = JOURNAL_BAR
+
+        try:
+            if not self.spillJournal:
+                self.spillJournal = Journal(self.drEngine.journalPath)
+
+            for d in dataList:
+                data = dataClass()
+                data.__dict__.update(d)
+                journalFile = self.spillJournal.append(dbName, collectionName, data, dataType)
+                self.drEngine.journalPathSet.add(journalFile.path)
+
+            self.spillJournal.flush()
+        except (IOError, OSError, ValueError) as e:
+            self.drEngine.writeDrLog(text.SPILL_FAILED.format(collection=collectionName,
+                                                              count=len(dataList), error=e))
+            return
+
+        self.spillCount += len(dataList)
+        self.drEngine.writeDrLog(text.BATCH_SPILLED.format(collection=collectionName,
+                                                           count=len(dataList)))
+
+    #----------------------------------------------------------------------
+    def runCompactor(self):
+        """定期将本分区的日志文件载入数据库"""
+        while self.active:
+            self.compactJournal()
+
+            # 分段等待，保证停止时及时退出
+            for i in range(int(self.drEngine.compactInterval * 10)):
+                if not self.active:
+                    break
+                sleep(0.1)
+
+        # 退出前载入剩余的数据
+        self.compactJournal()
+
+    #----------------------------------------------------------------------
+    def compactJournal(self):
+        """将本分区日志文件中尚未载入的数据批量载入数据库"""
+        drEngine = self.drEngine
+        batchSize = drEngine.batchSize
+        pending = 0
+
+        # 仍在写入的文件（包括本线程保存写入失败数据的文件）载入完成后也不能移除
+        writingSet = set()
+        if drEngine.journal:
+            writingSet |= drEngine.journal.getWritingPaths()
+        if self.spillJournal:
+            writingSet |= self.spillJournal.getWritingPaths()
+
+        for path in list(drEngine.journalPathSet):
+            # 路径为 根目录/数据库名/日期/集合名.jnl
+            folder, fileName = os.path.split(path)
+            dbName = os.path.basename(os.path.dirname(folder))
+            collectionName = os.path.splitext(fileName)[0]
+
+            if drEngine.getPartition(collectionName) != self.index:
+                continue
+
+            journalFile = JournalFile(path)
+            remaining = 0
+            try:
+                loaded = journalFile.getLoadedCount()
+                count = journalFile.getCount()
+
+                while loaded < count:
+                    end = min(count, loaded + batchSize)
+
+                    # datetime相同的数据只保留最后一条，和逐条upsert的结果一致
+                    dataDict = OrderedDict()
+                    for d in journalFile.read(loaded, end):
+                        dataDict[d['datetime']] = d
+
+                    self.bulkUpdate(dbName, collectionName, dataDict.values())
+
+                    loaded = end
+                    journalFile.setLoadedCount(loaded)
+                    self.batchCount += 1
+                    self.writeCount += len(dataDict)
+
+                remaining = count - loaded
+            except HISTORY_STORE_ERRORS as e:
+                drEngine.writeDrLog(text.BULK_WRITE_FAILED.format(collection=collectionName, error=e))
+                remaining = journalFile.getCount() - journalFile.getLoadedCount()
+            finally:
+                journalFile.close()
+
+            pending += remaining
+
+            # 已经全部载入、且不再写入的文件不需要再检查
+            if not remaining and path not in writingSet:
+                drEngine.journalPathSet.discard(path)
+
+        self.journalPending = pending
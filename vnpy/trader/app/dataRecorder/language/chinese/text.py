@@ -13,4 +13,8 @@ DOMINANT_CONTRACT = u'主力合约'
 DOMINANT_SYMBOL = u'主力代码'
 
 TICK_LOGGING_MESSAGE = u'记录Tick数据{symbol}，时间:{time}, last:{last}, bid:{bid}, ask:{ask}'
-BAR_LOGGING_MESSAGE = u'记录分钟线数据{symbol}，时间:{time}, O:{open}, H:{high}, L:{low}, C:{close}'
\ No newline at end of file
+BAR_LOGGING_MESSAGE = u'记录分钟线数据{symbol}，时间:{time}, O:{open}, H:{high}, L:{low}, C:{close}'
+
+BULK_WRITE_FAILED = u'批量写入数据库{collection}失败：{error}'
+BATCH_SPILLED = u'{collection}写入失败的{count}条数据已保存到本地日志文件，将在后台重新载入数据库'
+SPILL_FAILED = u'{collection}写入失败的{count}条数据保存到本地日志文件失败：{error}'
\ No newline at end of file
@@ -12,4 +12,8 @@ DOMINANT_CONTRACT = u'Dominant Contract'
 DOMINANT_SYMBOL = u'Dominant Symbol'
 
 TICK_LOGGING_MESSAGE = u'Record Tick Data {symbol}, Time:{time}, last:{last}, bid:{bid}, ask:{ask}'
-BAR_LOGGING_MESSAGE = u'Record Bar Data {symbol}, Time:{time}, O:{open}, H:{high}, L:{low}, C:{close}'
\ No newline at end of file
+BAR_LOGGING_MESSAGE = u'Record Bar Data {symbol}, Time:{time}, O:{open}, H:{high}, L:{low}, C:{close}'
+
+BULK_WRITE_FAILED = u'Bulk write to {collection} failed: {error}'
+BATCH_SPILLED = u'{count} failed records of {collection} are saved to the local journal and will be reloaded in background'
+SPILL_FAILED = u'Failed to save {count} failed records of {collection} to the local journal: {error}'
\ No newline at end of file
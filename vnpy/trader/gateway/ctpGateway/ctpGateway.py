@@ -17,6 +17,7 @@ from vnpy.api.ctp import MdApi, TdApi, defineDict
 from vnpy.trader.vtGateway import *
 from vnpy.trader.vtFunction import getJsonPath, getTempPath
 from vnpy.trader.vtConstant import GATEWAYTYPE_FUTURES
+from vnpy.trader.vtLatency import latencyTracer
 from .language import text
 
 
@@ -344,6 +345,10 @@ class CtpMdApi(MdApi):
         tick = VtTickData()
         tick.gatewayName = self.gatewayName
         
+        # 延时追踪开启时，记录收到行情的时间
+        if latencyTracer.active:
+            tick.traceId = latencyTracer.newTrace()
+        
         tick.symbol = data['InstrumentID']
         tick.exchange = symbolExchangeDict.get(tick.symbol, EXCHANGE_UNKNOWN)
         tick.vtSymbol = tick.symbol #'.'.join([tick.symbol, tick.exchange])
@@ -1452,6 +1457,10 @@ class CtpTdApi(TdApi):
         
         self.reqOrderInsert(req, self.reqID)
         
+        # 延时追踪，记录委托发出的时间
+        if orderReq.traceId >= 0:
+            latencyTracer.finish(orderReq.traceId)
+        
         # 返回订单号（字符串），便于某些算法进行动态管理
         vtOrderID = '.'.join([self.gatewayName, str(self.orderRef)])
         return vtOrderID
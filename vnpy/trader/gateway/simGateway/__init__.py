@@ -0,0 +1,10 @@
+# encoding: UTF-8
+
+from vnpy.trader import vtConstant
+from simGateway import SimGateway
+
+gatewayClass = SimGateway
+gatewayName = 'SIM'
+gatewayDisplayName = u'模拟交易所'
+gatewayType = vtConstant.GATEWAYTYPE_FUTURES
+gatewayQryEnabled = True
@@ -0,0 +1,663 @@
+# encoding: UTF-8
+
+'''
+本地模拟交易所接口，用于在没有柜台连接的情况下对整个交易系统进行端到端的压力测试：
+
+* 行情来自历史数据存储（HistoryStore，支持压缩存储的Tick数据）中录制的Tick数据或本地CSV文件，
+  按照设置的倍速回放（speed为0时全速回放，同时限制事件引擎中尚未处理完的Tick数量）
+
+* 委托在接口的回放线程中撮合：委托发出后经过latency秒（回放时间）进入模拟交易所，
+  之后基于回放Tick的买卖一档价格和数量撮合，限价单以对手价成交，可能部分成交
+
+* 持仓全部视为今仓，账户资金按照合约乘数、手续费率和保证金比例计算
+
+* 接口统计Tick推送数量和吞吐量，以及从Tick推送到收到委托的延时（即整个交易链路的耗时），
+  吞吐量按照事件引擎中策略等处理函数处理完成的Tick计算，回放结束时等待所有Tick处理完成后
+  输出到日志，也可以通过getStatistics获取
+'''
+
+
+import csv
+import json
+import time
+import heapq
+from copy import copy
+from collections import OrderedDict
+from datetime import datetime
+from threading import Thread, Lock
+from Queue import Queue, Empty
+
+import numpy as np
+
+from vnpy.trader.vtGateway import *
+from vnpy.trader.vtFunction import getJsonPath
+from vnpy.trader.vtLatency import latencyTracer
+from vnpy.trader.vtHistoryStore import createHistoryStore, INCLUSIVE_DELTA
+
+
+# CSV文件中需要转换类型的字段
+FLOAT_FIELDS = set(['lastPrice', 'openPrice', 'highPrice', 'lowPrice', 'preClosePrice',
+                    'upperLimit', 'lowerLimit',
+                    'bidPrice1', 'bidPrice2', 'bidPrice3', 'bidPrice4', 'bidPrice5',
+                    'askPrice1', 'askPrice2', 'askPrice3', 'askPrice4', 'askPrice5'])
+INT_FIELDS = set(['lastVolume', 'volume', 'openInterest',
+                  'bidVolume1', 'bidVolume2', 'bidVolume3', 'bidVolume4', 'bidVolume5',
+                  'askVolume1', 'askVolume2', 'askVolume3', 'askVolume4', 'askVolume5'])
+
+# 全速回放时，已推送但尚未被事件引擎处理完的Tick数量上限
+MAX_PENDING_TICKS = 1000
+
+
+########################################################################
+class SimGateway(VtGateway):
+    """本地模拟交易所接口"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, eventEngine, gatewayName='SIM'):
+        """Constructor"""
+        super(SimGateway, self).__init__(eventEngine, gatewayName)
+
+        self.fileName = self.gatewayName + '_connect.json'
+        self.filePath = getJsonPath(self.fileName, __file__)
+
+        self.qryEnabled = False         # 是否要启动循环查询
+
+        # 回放设置
+        self.source = 'mongo'           # 数据来源，mongo（历史数据存储）或csv
+        self.dbName = ''                # Tick数据库名
+        self.symbolList = []            # 回放的合约（数据库集合名）
+        self.startDate = None           # 回放开始日期
+        self.endDate = None             # 回放结束日期
+        self.csvPath = ''               # CSV文件路径
+        self.speed = 0                  # 回放倍速，0表示全速回放
+        self.latency = 0                # 委托从发出到进入交易所的延时（秒，回放时间）
+
+        # 账户设置
+        self.capital = 0                # 起始资金
+        self.rate = 0                   # 手续费率
+        self.marginRatio = 0            # 保证金比例
+        self.contractDict = {}          # 合约设置字典
+
+        # 回放线程
+        self.active = False
+        self.thread = None
+
+        # 委托相关，发单和撤单请求通过队列传给回放线程处理
+        self.requestQueue = Queue()
+        self.orderID = 0
+        self.tradeID = 0
+        self.orderLock = Lock()
+
+        self.workingOrderList = []      # 已进入交易所的活动委托
+        self.pendingOrderList = []      # 尚未进入交易所的委托[(进入时间, 委托)]
+        self.orderDict = {}             # 所有委托
+
+        self.tickDict = {}              # 最新的Tick
+
+        # 持仓和资金相关，由回放线程修改，查询时加锁读取
+        self.accountLock = Lock()
+        self.posDict = {}               # 持仓字典，key为vtPositionName
+        self.commission = 0             # 累计手续费
+        self.closeProfit = 0            # 累计平仓盈亏
+
+        # 性能统计
+        self.tickCount = 0              # 已推送的Tick数量
+        self.processedCount = 0         # 已被事件引擎处理完的Tick数量
+        self.lastProcessTime = 0        # 最近一个Tick处理完成的时间（系统时间）
+        self.replayStartTime = 0        # 回放开始时间（系统时间）
+        self.replayEndTime = 0          # 回放结束时间（系统时间）
+        self.lastTickTime = {}          # 每个合约最新Tick的推送时间（系统时间）
+        self.latencyList = []           # 委托延时列表（秒）
+
+    #----------------------------------------------------------------------
+    def writeLog(self, content):
+        """输出日志"""
+        log = VtLogData()
+        log.gatewayName = self.gatewayName
+        log.logContent = content
+        self.onLog(log)
+
+    #----------------------------------------------------------------------
+    def connect(self):
+        """连接，读取配置，推送合约并启动回放线程"""
+        try:
+            f = file(self.filePath)
+        except IOError:
+            self.writeLog(u'读取连接配置出错，请检查')
+            return
+
+        setting = json.load(f)
+        try:
+            self.source = str(setting['source'])
+            self.dbName = str(setting.get('dbName', ''))
+            self.symbolList = [str(symbol) for symbol in setting.get('symbolList', [])]
+            self.csvPath = setting.get('csvPath', '')
+            self.speed = float(setting['speed'])
+            self.latency = float(setting['latency'])
+            self.capital = float(setting['capital'])
+            self.rate = float(setting['rate'])
+            self.marginRatio = float(setting['marginRatio'])
+            self.contractDict = setting['contract']
+
+            if setting.get('startDate', ''):
+                self.startDate = datetime.strptime(setting['startDate'], '%Y%m%d')
+            if setting.get('endDate', ''):
+                self.endDate = datetime.strptime(setting['endDate'], '%Y%m%d')
+                self.endDate = self.endDate.replace(hour=23, minute=59, second=59)
+        except KeyError:
+            self.writeLog(u'连接配置缺少字段，请检查')
+            return
+
+        # 推送合约信息
+        for vtSymbol, d in self.contractDict.items():
+            contract = VtContractData()
+            contract.gatewayName = self.gatewayName
+            contract.symbol = vtSymbol
+            contract.exchange = d.get('exchange', EXCHANGE_UNKNOWN)
+            contract.vtSymbol = vtSymbol
+            contract.name = d.get('name', vtSymbol)
+            contract.productClass = PRODUCT_FUTURES
+            contract.size = d['size']
+            contract.priceTick = d['priceTick']
+            self.onContract(contract)
+
+        self.writeLog(u'合约信息推送完成')
+
+        # 统计处理完成的Tick，接口连接时注册，在已注册的策略等处理函数之后调用
+        self.eventEngine.register(EVENT_TICK, self.processTickEvent)
+
+        # 启动回放线程
+        self.active = True
+        self.thread = Thread(target=self.run)
+        self.thread.start()
+
+        self.writeLog(u'模拟交易所启动，开始回放行情')
+
+        self.initQuery()
+
+    #----------------------------------------------------------------------
+    def subscribe(self, subscribeReq):
+        """订阅行情，模拟交易所推送所有回放的行情"""
+        pass
+
+    #----------------------------------------------------------------------
+    def sendOrder(self, orderReq):
+        """发单"""
+        # 记录从Tick推送到收到委托的延时
+        tickTime = self.lastTickTime.get(orderReq.vtSymbol, 0)
+        if tickTime:
+            self.latencyList.append(time.time() - tickTime)
+
+        with self.orderLock:
+            self.orderID += 1
+            orderID = str(self.orderID)
+
+        order = VtOrderData()
+        order.gatewayName = self.gatewayName
+        order.symbol = orderReq.symbol
+        order.exchange = orderReq.exchange
+        order.vtSymbol = orderReq.vtSymbol
+        order.orderID = orderID
+        order.vtOrderID = '.'.join([self.gatewayName, orderID])
+        order.direction = orderReq.direction
+        order.offset = orderReq.offset
+        order.price = orderReq.price
+        order.totalVolume = orderReq.volume
+        order.priceType = orderReq.priceType
+        order.status = STATUS_UNKNOWN
+
+        self.requestQueue.put(('send', order))
+
+        # 延时追踪，记录委托发出的时间
+        if orderReq.traceId >= 0:
+            latencyTracer.finish(orderReq.traceId)
+
+        return order.vtOrderID
+
+    #----------------------------------------------------------------------
+    def cancelOrder(self, cancelOrderReq):
+        """撤单"""
+        self.requestQueue.put(('cancel', cancelOrderReq.orderID))
+
+    #----------------------------------------------------------------------
+    def qryAccount(self):
+        """查询账户资金"""
+        with self.accountLock:
+            account = self.getAccount()
+        self.onAccount(account)
+
+    #----------------------------------------------------------------------
+    def qryPosition(self):
+        """查询持仓"""
+        with self.accountLock:
+            posList = [copy(pos) for pos in self.posDict.values()]
+
+        for pos in posList:
+            self.onPosition(pos)
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭"""
+        self.active = False
+        if self.thread and self.thread.isAlive():
+            self.thread.join()
+
+        self.eventEngine.unregister(EVENT_TICK, self.processTickEvent)
+
+    #----------------------------------------------------------------------
+    def initQuery(self):
+        """初始化连续查询"""
+        if self.qryEnabled:
+            self.qryFunctionList = [self.qryAccount, self.qryPosition]
+
+            self.qryCount = 0           # 查询触发倒计时
+            self.qryTrigger = 2         # 查询触发点
+            self.qryNextFunction = 0    # 上次运行的查询函数索引
+
+            self.eventEngine.register(EVENT_TIMER, self.query)
+
+    #----------------------------------------------------------------------
+    def query(self, event):
+        """注册到事件处理引擎上的查询函数"""
+        self.qryCount += 1
+
+        if self.qryCount > self.qryTrigger:
+            self.qryCount = 0
+
+            function = self.qryFunctionList[self.qryNextFunction]
+            function()
+
+            self.qryNextFunction += 1
+            if self.qryNextFunction == len(self.qryFunctionList):
+                self.qryNextFunction = 0
+
+    #----------------------------------------------------------------------
+    def setQryEnabled(self, qryEnabled):
+        """设置是否要启动循环查询"""
+        self.qryEnabled = qryEnabled
+
+    #------------------------------------------------
+    # 行情回放相关
+    #------------------------------------------------
+
+    #----------------------------------------------------------------------
+    def loadStoreData(self):
+        """从历史数据存储读取Tick数据（压缩存储的数据会被解码），多个合约按时间合并，返回字典的生成器"""
+        historyStore = createHistoryStore()
+
+        end = None
+        if self.endDate:
+            end = self.endDate + INCLUSIVE_DELTA
+
+        generatorList = []
+        for i, symbol in enumerate(self.symbolList):
+            dataIter = historyStore.loadRange(self.dbName, symbol, self.startDate, end)
+            generatorList.append(((d['datetime'], i, d) for d in dataIter))
+
+        try:
+            for dt, i, d in heapq.merge(*generatorList):
+                yield d
+        finally:
+            historyStore.close()
+
+    #----------------------------------------------------------------------
+    def loadCsvData(self):
+        """从CSV文件读取Tick数据（表头为VtTickData的字段名，按时间排序），返回字典的生成器"""
+        with open(self.csvPath) as f:
+            reader = csv.DictReader(f)
+
+            for row in reader:
+                d = {}
+                for k, v in row.items():
+                    if k in FLOAT_FIELDS:
+                        d[k] = float(v or 0)
+                    elif k in INT_FIELDS:
+                        d[k] = int(float(v or 0))
+                    else:
+                        d[k] = v
+
+                if 'datetime' in d:
+                    d['datetime'] = datetime.strptime(d['datetime'], '%Y-%m-%d %H:%M:%S.%f')
+                else:
+                    d['datetime'] = datetime.strptime(' '.join([d['date'], d['time']]),
+                                                      '%Y%m%d %H:%M:%S.%f')
+
+                if self.startDate and d['datetime'] < self.startDate:
+                    continue
+                if self.endDate and d['datetime'] > self.endDate:
+                    break
+
+                yield d
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """回放线程中运行的函数"""
+        if self.source == 'csv':
+            dataGenerator = self.loadCsvData()
+        else:
+            dataGenerator = self.loadStoreData()
+
+        self.replayStartTime = time.time()
+        firstDt = None
+        gatewayName = self.gatewayName
+
+        for d in dataGenerator:
+            if not self.active:
+                break
+
+            tick = VtTickData()
+            tick.__dict__.update(d)
+            tick.gatewayName = gatewayName
+
+            # 按照倍速控制回放节奏
+            if self.speed:
+                if firstDt is None:
+                    firstDt = tick.datetime
+
+                targetTime = self.replayStartTime + (tick.datetime - firstDt).total_seconds() / self.speed
+                waitTime = targetTime - time.time()
+                if waitTime > 0:
+                    time.sleep(waitTime)
+
+            # 先处理请求和撮合，再推送行情
+            self.processRequest(tick.datetime)
+            self.crossOrder(tick)
+
+            self.tickDict[tick.vtSymbol] = tick
+            self.lastTickTime[tick.vtSymbol] = time.time()
+            self.tickCount += 1
+
+            # 延时追踪开启时，记录推送行情的时间
+            if latencyTracer.active:
+                tick.traceId = latencyTracer.newTrace()
+            self.onTick(tick)
+
+            # 全速回放时没有节奏控制，需要等待事件引擎处理，避免队列无限增长
+            while self.active and self.tickCount - self.processedCount >= MAX_PENDING_TICKS:
+                time.sleep(0.001)
+
+        # 等待已推送的Tick全部处理完成，回放耗时计算到最后一个Tick处理完成
+        while self.active and self.processedCount < self.tickCount:
+            time.sleep(0.001)
+
+        if self.processedCount:
+            self.replayEndTime = self.lastProcessTime
+        else:
+            self.replayEndTime = time.time()
+        self.active = False
+
+        self.writeLog(u'行情回放结束')
+        for k, v in self.getStatistics().items():
+            self.writeLog(u'%s：%s' %(k, v))
+
+    #------------------------------------------------
+    # 委托撮合相关
+    #------------------------------------------------
+
+    #----------------------------------------------------------------------
+    def processRequest(self, dt):
+        """处理发单、撤单请求，委托经过延时后进入交易所"""
+        while True:
+            try:
+                action, data = self.requestQueue.get(block=False)
+            except Empty:
+                break
+
+            if action == 'send':
+                order = data
+                self.orderDict[order.orderID] = order
+                self.pendingOrderList.append((dt, order))
+            else:
+                order = self.orderDict.get(data, None)
+                if order and order.status in (STATUS_UNKNOWN, STATUS_NOTTRADED, STATUS_PARTTRADED):
+                    # 已进入交易所的平仓委托，解冻未成交部分
+                    if order.status != STATUS_UNKNOWN and order.offset != OFFSET_OPEN:
+                        with self.accountLock:
+                            pos = self.getClosePosition(order)
+                            pos.frozen -= order.totalVolume - order.tradedVolume
+                    
+                    order.status = STATUS_CANCELLED
+                    order.cancelTime = dt.strftime('%H:%M:%S')
+                    self.onOrder(copy(order))
+
+        # 到达进入时间的委托加入活动委托列表
+        pendingOrderList = []
+        for sendDt, order in self.pendingOrderList:
+            if order.status == STATUS_CANCELLED:
+                continue
+
+            if (dt - sendDt).total_seconds() >= self.latency:
+                order.orderTime = dt.strftime('%H:%M:%S')
+
+                # 平仓委托检查并冻结可平数量，不足则拒单
+                rejected = False
+                if order.offset != OFFSET_OPEN:
+                    with self.accountLock:
+                        pos = self.getClosePosition(order)
+                        if pos.position - pos.frozen < order.totalVolume:
+                            rejected = True
+                        else:
+                            pos.frozen += order.totalVolume
+
+                if rejected:
+                    order.status = STATUS_REJECTED
+                    self.writeLog(u'委托%s平仓数量超过可平持仓，拒单' %order.vtOrderID)
+                else:
+                    order.status = STATUS_NOTTRADED
+                    self.workingOrderList.append(order)
+
+                self.onOrder(copy(order))
+            else:
+                pendingOrderList.append((sendDt, order))
+
+        self.pendingOrderList = pendingOrderList
+
+    #----------------------------------------------------------------------
+    def crossOrder(self, tick):
+        """基于Tick的买卖一档撮合活动委托"""
+        if not self.workingOrderList:
+            return
+
+        # 本Tick可成交的数量，多个委托依次消耗
+        askVolume = tick.askVolume1
+        bidVolume = tick.bidVolume1
+
+        workingOrderList = []
+        for order in self.workingOrderList:
+            if order.status == STATUS_CANCELLED:
+                continue
+
+            if order.vtSymbol != tick.vtSymbol:
+                workingOrderList.append(order)
+                continue
+
+            if order.direction == DIRECTION_LONG:
+                cross = (tick.askPrice1 > 0 and askVolume > 0 and
+                         (order.priceType == PRICETYPE_MARKETPRICE or order.price >= tick.askPrice1))
+                price = tick.askPrice1
+            else:
+                cross = (tick.bidPrice1 > 0 and bidVolume > 0 and
+                         (order.priceType == PRICETYPE_MARKETPRICE or order.price <= tick.bidPrice1))
+                price = tick.bidPrice1
+
+            if not cross:
+                workingOrderList.append(order)
+                continue
+
+            # 成交数量受对手盘数量限制
+            if order.direction == DIRECTION_LONG:
+                volume = min(order.totalVolume - order.tradedVolume, askVolume)
+                askVolume -= volume
+            else:
+                volume = min(order.totalVolume - order.tradedVolume, bidVolume)
+                bidVolume -= volume
+
+            self.tradeID += 1
+            trade = VtTradeData()
+            trade.gatewayName = self.gatewayName
+            trade.symbol = order.symbol
+            trade.exchange = order.exchange
+            trade.vtSymbol = order.vtSymbol
+            trade.tradeID = str(self.tradeID)
+            trade.vtTradeID = '.'.join([self.gatewayName, trade.tradeID])
+            trade.orderID = order.orderID
+            trade.vtOrderID = order.vtOrderID
+            trade.direction = order.direction
+            trade.offset = order.offset
+            trade.price = price
+            trade.volume = volume
+            trade.tradeTime = tick.datetime.strftime('%H:%M:%S')
+
+            order.tradedVolume += volume
+            if order.tradedVolume == order.totalVolume:
+                order.status = STATUS_ALLTRADED
+            else:
+                order.status = STATUS_PARTTRADED
+                workingOrderList.append(order)
+
+            self.onOrder(copy(order))
+            self.onTrade(trade)
+            self.updateTrade(trade)
+
+        self.workingOrderList = workingOrderList
+
+    #------------------------------------------------
+    # 持仓资金相关
+    #------------------------------------------------
+
+    #----------------------------------------------------------------------
+    def getPosition(self, vtSymbol, direction):
+        """获取持仓对象，不存在则创建"""
+        vtPositionName = '.'.join([vtSymbol, direction])
+
+        if vtPositionName not in self.posDict:
+            pos = VtPositionData()
+            pos.gatewayName = self.gatewayName
+            pos.symbol = vtSymbol
+            pos.vtSymbol = vtSymbol
+            pos.direction = direction
+            pos.vtPositionName = vtPositionName
+            self.posDict[vtPositionName] = pos
+
+        return self.posDict[vtPositionName]
+
+    #----------------------------------------------------------------------
+    def getClosePosition(self, order):
+        """获取平仓委托（或成交）对应的反方向持仓"""
+        if order.direction == DIRECTION_LONG:
+            return self.getPosition(order.vtSymbol, DIRECTION_SHORT)
+        else:
+            return self.getPosition(order.vtSymbol, DIRECTION_LONG)
+
+    #----------------------------------------------------------------------
+    def updateTrade(self, trade):
+        """基于成交更新持仓和资金"""
+        size = self.contractDict.get(trade.vtSymbol, {}).get('size', 1)
+
+        with self.accountLock:
+            self.commission += trade.price * trade.volume * size * self.rate
+
+            if trade.offset == OFFSET_OPEN:
+                pos = self.getPosition(trade.vtSymbol, trade.direction)
+                cost = pos.price * pos.position + trade.price * trade.volume
+                pos.position += trade.volume
+                pos.price = cost / pos.position
+            else:
+                # 平仓成交对应反方向的持仓
+                pos = self.getClosePosition(trade)
+                if trade.direction == DIRECTION_LONG:
+                    self.closeProfit += (pos.price - trade.price) * trade.volume * size
+                else:
+                    self.closeProfit += (trade.price - pos.price) * trade.volume * size
+
+                pos.position -= trade.volume
+                pos.frozen -= trade.volume
+                if not pos.position:
+                    pos.price = 0
+
+            pos.positionProfit = self.calculatePositionProfit(pos)
+            posData = copy(pos)
+            account = self.getAccount()
+
+        self.onPosition(posData)
+        self.onAccount(account)
+
+    #----------------------------------------------------------------------
+    def calculatePositionProfit(self, pos):
+        """计算持仓盈亏"""
+        tick = self.tickDict.get(pos.vtSymbol, None)
+        if not tick or not pos.position:
+            return 0
+
+        size = self.contractDict.get(pos.vtSymbol, {}).get('size', 1)
+        if pos.direction == DIRECTION_LONG:
+            return (tick.lastPrice - pos.price) * pos.position * size
+        else:
+            return (pos.price - tick.lastPrice) * pos.position * size
+
+    #----------------------------------------------------------------------
+    def getAccount(self):
+        """生成账户资金数据，调用时需要持有accountLock"""
+        positionProfit = 0
+        margin = 0
+
+        for pos in self.posDict.values():
+            pos.positionProfit = self.calculatePositionProfit(pos)
+            positionProfit += pos.positionProfit
+
+            tick = self.tickDict.get(pos.vtSymbol, None)
+            if tick:
+                size = self.contractDict.get(pos.vtSymbol, {}).get('size', 1)
+                margin += tick.lastPrice * pos.position * size * self.marginRatio
+
+        account = VtAccountData()
+        account.gatewayName = self.gatewayName
+        account.accountID = self.gatewayName
+        account.vtAccountID = '.'.join([self.gatewayName, account.accountID])
+        account.preBalance = self.capital
+        account.balance = self.capital + self.closeProfit + positionProfit - self.commission
+        account.available = account.balance - margin
+        account.commission = self.commission
+        account.margin = margin
+        account.closeProfit = self.closeProfit
+        account.positionProfit = positionProfit
+
+        return account
+
+    #------------------------------------------------
+    # 性能统计相关
+    #------------------------------------------------
+
+    #----------------------------------------------------------------------
+    def processTickEvent(self, event):
+        """Tick事件处理完成（在策略等处理函数之后调用）"""
+        self.processedCount += 1
+        self.lastProcessTime = time.time()
+
+    #----------------------------------------------------------------------
+    def getStatistics(self):
+        """获取回放的吞吐量和委托延时统计"""
+        if self.replayEndTime:
+            elapsed = self.replayEndTime - self.replayStartTime
+        elif self.replayStartTime:
+            elapsed = time.time() - self.replayStartTime
+        else:
+            elapsed = 0
+
+        d = OrderedDict()
+        d['tickCount'] = self.tickCount
+        d['processedCount'] = self.processedCount
+        d['elapsed'] = elapsed
+        d['ticksPerSecond'] = self.processedCount / elapsed if elapsed else 0
+        d['orderCount'] = self.orderID
+        d['tradeCount'] = self.tradeID
+
+        # 委托延时（毫秒）
+        if self.latencyList:
+            latencyArray = np.array(self.latencyList) * 1000
+            d['latencyMean'] = latencyArray.mean()
+            d['latency50'] = np.percentile(latencyArray, 50)
+            d['latency99'] = np.percentile(latencyArray, 99)
+            d['latencyMax'] = latencyArray.max()
+
+        return d
@@ -136,4 +136,5 @@ DATABASE_CONNECTING_COMPLETED = u'MongoDB is connected.'
 DATABASE_CONNECTING_FAILED = u'Failed to connect to MongoDB.'
 DATA_INSERT_FAILED = u'Data insert failed，please connect MongoDB first.'
 DATA_QUERY_FAILED = u'Data query failed, please connect MongoDB first.'
-DATA_UPDATE_FAILED = u'Data update failed, please connect MongoDB first.'
\ No newline at end of file
+DATA_UPDATE_FAILED = u'Data update failed, please connect MongoDB first.'
+HISTORY_QUERY_FAILED = u'History data query failed: {error}'
\ No newline at end of file
@@ -16,6 +16,7 @@ from vnpy.trader.vtEvent import *
 from vnpy.trader.vtGateway import *
 from vnpy.trader.language import text
 from vnpy.trader.vtFunction import getTempPath
+from vnpy.trader.vtHistoryStore import createHistoryStore, HISTORY_STORE_ERRORS
 
 
 
@@ -39,6 +40,9 @@ class MainEngine(object):
         # MongoDB数据库相关
         self.dbClient = None    # MongoDB客户端对象
         
+        # 历史行情数据存储（MongoDB或本地列式文件，见VT_setting.json中的historyStore）
+        self.historyStore = createHistoryStore()
+        
         # 接口实例
         self.gatewayDict = OrderedDict()
         self.gatewayDetailList = []
@@ -241,6 +245,18 @@ class MainEngine(object):
             self.writeLog(text.DATA_QUERY_FAILED)   
             return []
         
+    #----------------------------------------------------------------------
+    def loadHistory(self, dbName, collectionName, start=None, end=None):
+        """
+        从历史数据存储中读取[start, end)内的行情数据，返回按datetime排序的数据字典列表，
+        查询失败时返回None（和没有数据的空列表区分）
+        """
+        try:
+            return list(self.historyStore.loadRange(dbName, collectionName, start, end))
+        except HISTORY_STORE_ERRORS as e:
+            self.writeLog(text.HISTORY_QUERY_FAILED.format(error=e))
+            return None
+        
     #----------------------------------------------------------------------
     def dbUpdate(self, dbName, collectionName, d, flt, upsert=False):
         """向MongoDB中更新数据，d是具体数据，flt是过滤条件，upsert代表若无是否要插入"""
@@ -0,0 +1,812 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了历史行情数据的存储接口HistoryStore，以及两种后端：
+
+1. MongoHistoryStore：保存到MongoDB，每个合约一个集合，读取时自动解码Tick压缩数据块
+2. LocalHistoryStore：保存到本地的列式文件，不需要运行MongoDB，适合研究使用
+   路径为 根目录/数据库名/合约代码/日期/数据段.seg，每个数据段一个文件，其中各字段
+   按列连续保存，读取时使用内存映射（mmap），只有用到的部分才会从磁盘读入；
+   写入只追加新的数据段，数据段按分层规则合并，也可以使用compact手动合并；
+   字符串字段（合约代码、交易所等）使用字典编码逐条保存，
+   date和time字段在读取时根据datetime重新生成
+
+通过VT_setting.json中的historyStore（mongo或local）和historyPath选择后端，
+使用createHistoryStore创建。所有接口中的时间范围均为[start, end)，
+数据均为和MongoDB中格式相同的数据字典。
+'''
+
+import os
+import json
+import shutil
+import struct
+import mmap as mmapModule
+from datetime import datetime, timedelta
+from threading import Lock
+from time import sleep
+
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReplaceOne
+from pymongo.errors import PyMongoError, OperationFailure
+
+from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtTickCodec import widenFilter, decodeDocuments
+
+
+# 后端类型
+STORE_MONGO = 'mongo'
+STORE_LOCAL = 'local'
+
+# 读写历史数据时可能出现的异常，调用方据此记录日志后继续运行
+HISTORY_STORE_ERRORS = (PyMongoError, IOError, OSError)
+
+# 本地存储的文件名
+META_FILE_NAME = 'meta.json'
+SEGMENT_FORMAT = '%06d-%06d.seg'
+SEGMENT_ALIGN = 64          # 数据段文件中每列数据的起始位置对齐的字节数
+READ_RETRY = 10             # 读取时数据段被合并删除后的重试次数
+DATETIME_FIELD = 'datetime'
+DATETIME_DTYPE = np.dtype('datetime64[us]')
+
+# MongoDB中的时间精度为毫秒，结束时间加上1毫秒即可在[start, end)中包含结束时间本身
+INCLUSIVE_DELTA = timedelta(milliseconds=1)
+
+
+#----------------------------------------------------------------------
+def createHistoryStore(setting=None):
+    """根据配置创建历史数据存储，setting默认使用VT_setting.json中的全局配置"""
+    if setting is None:
+        setting = globalSetting
+
+    if setting.get('historyStore', STORE_MONGO) == STORE_LOCAL:
+        return LocalHistoryStore(setting.get('historyPath', 'history'))
+    else:
+        return MongoHistoryStore(setting.get('mongoHost', 'localhost'),
+                                 setting.get('mongoPort', 27017))
+
+
+########################################################################
+class HistoryStore(object):
+    """历史数据存储接口"""
+
+    #----------------------------------------------------------------------
+    def saveBars(self, dbName, symbol, dataList):
+        """保存K线数据字典列表（按datetime替换，不存在则插入），返回保存的数量"""
+        raise NotImplementedError
+
+    #----------------------------------------------------------------------
+    def saveTicks(self, dbName, symbol, dataList):
+        """保存Tick数据字典列表（按datetime替换，不存在则插入），返回保存的数量"""
+        raise NotImplementedError
+
+    #----------------------------------------------------------------------
+    def loadRange(self, dbName, symbol, start=None, end=None):
+        """读取[start, end)内的数据，返回按datetime排序的数据字典迭代器，start和end为None代表不限制"""
+        raise NotImplementedError
+
+    #----------------------------------------------------------------------
+    def lastTimestamp(self, dbName, symbol):
+        """查询最后一条数据的datetime，没有数据返回None"""
+        raise NotImplementedError
+
+    #----------------------------------------------------------------------
+    def summarizeRange(self, dbName, symbol, start=None, end=None):
+        """统计[start, end)内的数据，返回(数据量, 最后一条数据的datetime)，没有数据时datetime为None"""
+        count = 0
+        lastDatetime = None
+        for d in self.loadRange(dbName, symbol, start, end):
+            count += 1
+            lastDatetime = d[DATETIME_FIELD]
+        return count, lastDatetime
+
+    #----------------------------------------------------------------------
+    def deleteRange(self, dbName, symbol, start, end):
+        """删除[start, end)内的数据，返回删除的数量"""
+        return self.deleteRanges(dbName, symbol, [(start, end)])
+
+    #----------------------------------------------------------------------
+    def deleteRanges(self, dbName, symbol, rangeList):
+        """删除多个时间段[(start, end)]内的数据，返回删除的数量"""
+        raise NotImplementedError
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """释放资源"""
+        pass
+
+    #----------------------------------------------------------------------
+    def loadFrame(self, dbName, symbol, start=None, end=None):
+        """读取[start, end)内的数据，返回以datetime为索引的DataFrame"""
+        df = pd.DataFrame(list(self.loadRange(dbName, symbol, start, end)))
+        if not df.empty:
+            df = df.set_index(DATETIME_FIELD)
+        return df
+
+
+########################################################################
+class MongoHistoryStore(HistoryStore):
+    """MongoDB历史数据存储，每个合约一个集合"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, mongoHost='localhost', mongoPort=27017, dbClient=None):
+        """Constructor，可以传入已有的MongoClient共用连接池"""
+        if not dbClient:
+            # 服务器选择超时设为1秒，数据库不可用时尽快返回
+            dbClient = MongoClient(mongoHost, mongoPort, connectTimeoutMS=500,
+                                   serverSelectionTimeoutMS=1000)
+        self.dbClient = dbClient
+        self.indexSet = set()       # 已经确认创建datetime索引的集合
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭数据库连接"""
+        self.dbClient.close()
+
+    #----------------------------------------------------------------------
+    def getCollection(self, dbName, symbol):
+        """获取集合，首次访问时确保datetime索引存在"""
+        collection = self.dbClient[dbName][symbol]
+
+        key = (dbName, symbol)
+        if key not in self.indexSet:
+            # 已有数据中存在重复的datetime时无法创建唯一索引，直接使用已有数据
+            try:
+                collection.create_index([(DATETIME_FIELD, ASCENDING)], unique=True)
+            except OperationFailure:
+                pass
+            self.indexSet.add(key)
+
+        return collection
+
+    #----------------------------------------------------------------------
+    def saveData(self, dbName, symbol, dataList):
+        """批量替换数据（不存在则插入）"""
+        if not dataList:
+            return 0
+
+        requests = [ReplaceOne({DATETIME_FIELD: d[DATETIME_FIELD]}, d, upsert=True) for d in dataList]
+        self.getCollection(dbName, symbol).bulk_write(requests, ordered=False)
+        return len(requests)
+
+    #----------------------------------------------------------------------
+    def saveBars(self, dbName, symbol, dataList):
+        """保存K线数据"""
+        return self.saveData(dbName, symbol, dataList)
+
+    #----------------------------------------------------------------------
+    def saveTicks(self, dbName, symbol, dataList):
+        """保存Tick数据"""
+        return self.saveData(dbName, symbol, dataList)
+
+    #----------------------------------------------------------------------
+    def loadRange(self, dbName, symbol, start=None, end=None):
+        """读取数据，Tick压缩数据块解码为数据字典"""
+        flt = getRangeFilter(start, end)
+        cursor = self.getCollection(dbName, symbol).find(widenFilter(flt), {'_id': False})
+        return decodeDocuments(cursor.sort(DATETIME_FIELD, ASCENDING), flt)
+
+    #----------------------------------------------------------------------
+    def summarizeRange(self, dbName, symbol, start=None, end=None):
+        """
+        普通文档在数据库中统计，压缩数据块完全在范围内时直接使用块中的数据量，
+        跨越范围边界的数据块解码后统计
+        """
+        flt = getRangeFilter(start, end)
+        collection = self.getCollection(dbName, symbol)
+
+        plainFilter = dict(flt, codec={'$exists': False})
+        count = collection.find(plainFilter).count()
+        d = collection.find_one(plainFilter, sort=[(DATETIME_FIELD, DESCENDING)],
+                                projection={DATETIME_FIELD: True})
+        lastDatetime = d[DATETIME_FIELD] if d else None
+
+        blockFilter = dict(widenFilter(flt), codec={'$exists': True})
+        projection = {DATETIME_FIELD: True, 'startDatetime': True, 'count': True}
+        for block in collection.find(blockFilter, projection):
+            if (not start or block['startDatetime'] >= start) and (not end or block[DATETIME_FIELD] < end):
+                count += block['count']
+                blockDatetime = block[DATETIME_FIELD]
+            else:
+                doc = collection.find_one({'_id': block['_id']})
+                dtList = [d[DATETIME_FIELD] for d in decodeDocuments([doc], flt)]
+                count += len(dtList)
+                blockDatetime = dtList[-1] if dtList else None
+
+            if blockDatetime and (not lastDatetime or blockDatetime > lastDatetime):
+                lastDatetime = blockDatetime
+
+        return count, lastDatetime
+
+    #----------------------------------------------------------------------
+    def lastTimestamp(self, dbName, symbol):
+        """查询最后一条数据的datetime（压缩数据块的datetime即为块中最后一条数据的时间）"""
+        d = self.getCollection(dbName, symbol).find_one(sort=[(DATETIME_FIELD, DESCENDING)],
+                                                        projection={DATETIME_FIELD: True})
+        if d:
+            return d[DATETIME_FIELD]
+        return None
+
+    #----------------------------------------------------------------------
+    def deleteRanges(self, dbName, symbol, rangeList):
+        """使用一次delete_many删除多个时间段，压缩数据块无法部分删除，因此不处理"""
+        if not rangeList:
+            return 0
+
+        flt = {
+            '$or': [{DATETIME_FIELD: {'$gte': s, '$lt': e}} for s, e in rangeList],
+            'codec': {'$exists': False}
+        }
+        result = self.dbClient[dbName][symbol].delete_many(flt)
+        return result.deleted_count
+
+
+########################################################################
+class LocalHistoryStore(HistoryStore):
+    """
+    本地列式文件历史数据存储，按合约和自然日分区
+
+    每次写入在分区中追加一个数据段（文件名为 起始序号-结束序号.seg），不改写已有的文件；
+    最后两个数据段中前一个的数据量不超过后一个时合并为一个（分层合并），
+    因此一天内的写入总开销为O(n log n)，数据段数量为O(log n)；
+    合并后的数据段文件名覆盖被合并的序号范围，读取时忽略被覆盖的数据段，
+    写入中断也不会读到重复或不完整的数据。compact可将分区合并为单个数据段。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, rootPath):
+        """Constructor"""
+        self.rootPath = rootPath
+        self.lock = Lock()          # 同一分区的写入和合并需要互斥
+
+    #----------------------------------------------------------------------
+    def getSymbolPath(self, dbName, symbol):
+        """合约的目录"""
+        return os.path.join(self.rootPath, dbName, symbol)
+
+    #----------------------------------------------------------------------
+    def getPartitionPath(self, dbName, symbol, date):
+        """分区的目录"""
+        return os.path.join(self.rootPath, dbName, symbol, date)
+
+    #----------------------------------------------------------------------
+    def getDateList(self, dbName, symbol):
+        """合约已有数据的日期列表（YYYYMMDD，升序）"""
+        path = self.getSymbolPath(dbName, symbol)
+        if not os.path.isdir(path):
+            return []
+        return sorted([name for name in os.listdir(path) if name.isdigit()])
+
+    #----------------------------------------------------------------------
+    def loadMeta(self, dbName, symbol):
+        """读取合约的时间格式和空值字段，不存在返回空字典"""
+        path = os.path.join(self.getSymbolPath(dbName, symbol), META_FILE_NAME)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    #----------------------------------------------------------------------
+    def saveMeta(self, dbName, symbol, meta):
+        """保存合约的时间格式和空值字段"""
+        path = os.path.join(self.getSymbolPath(dbName, symbol), META_FILE_NAME)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        replaceFile(path + '.tmp', path)
+
+    #----------------------------------------------------------------------
+    def getSegmentList(self, path):
+        """
+        分区中的有效数据段列表[(起始序号, 结束序号, 文件路径)]，按写入顺序排列，
+        以及被合并后尚未删除（被覆盖）的数据段列表
+        """
+        allList = []
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                l = os.path.splitext(name)[0].split('-')
+                if name.endswith('.seg') and len(l) == 2 and l[0].isdigit() and l[1].isdigit():
+                    allList.append((int(l[0]), int(l[1]), os.path.join(path, name)))
+
+        segmentList = []
+        coveredList = []
+        for segment in allList:
+            first, last = segment[:2]
+            if [1 for other in allList if other is not segment and other[0] <= first and last <= other[1]]:
+                coveredList.append(segment)
+            else:
+                segmentList.append(segment)
+
+        segmentList.sort()
+        return segmentList, coveredList
+
+    #----------------------------------------------------------------------
+    def writeSegment(self, path, first, last, columnDict):
+        """写入数据段，先写入临时文件再重命名，重命名后立即对读取可见"""
+        segmentPath = os.path.join(path, SEGMENT_FORMAT %(first, last))
+        writeSegmentFile(segmentPath + '.tmp', columnDict)
+        replaceFile(segmentPath + '.tmp', segmentPath)
+        return segmentPath
+
+    #----------------------------------------------------------------------
+    def loadPartition(self, dbName, symbol, date, mmap=True, fieldList=None):
+        """读取某一日期的分区，合并所有数据段后返回{字段名: 数组}，不存在返回None"""
+        path = self.getPartitionPath(dbName, symbol, date)
+
+        # 读取过程中数据段可能被其他线程合并删除，先打开全部文件（已打开的文件删除后仍可读取），
+        # 打开失败时重新获取数据段列表后重试
+        for n in range(READ_RETRY):
+            segmentList = self.getSegmentList(path)[0]
+            if not segmentList:
+                return None
+
+            fileList = []
+            try:
+                for segment in segmentList:
+                    fileList.append(open(segment[2], 'rb'))
+            except (IOError, OSError):
+                for f in fileList:
+                    f.close()
+                if n == READ_RETRY - 1:
+                    raise
+                sleep(0.001 * (n + 1))
+                continue
+
+            try:
+                columnList = [readSegmentFile(f, mmap, fieldList) for f in fileList]
+            finally:
+                for f in fileList:
+                    f.close()
+            break
+
+        if len(columnList) == 1:
+            return columnList[0]
+        return mergeColumns(columnList)
+
+    #----------------------------------------------------------------------
+    def appendSegment(self, path, columnDict):
+        """在分区中追加数据段，然后按分层规则合并最后的数据段"""
+        segmentList, coveredList = self.getSegmentList(path)
+        removeSegments(coveredList)
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        seq = segmentList[-1][1] + 1 if segmentList else 1
+        segmentPath = self.writeSegment(path, seq, seq, columnDict)
+
+        segmentList = [(first, last, p, None) for first, last, p in segmentList]
+        segmentList.append((seq, seq, segmentPath, len(columnDict[DATETIME_FIELD])))
+
+        while len(segmentList) >= 2:
+            a, b = segmentList[-2:]
+            countA = a[3] if a[3] is not None else readSegmentCount(a[2])
+            if countA > b[3]:
+                break
+
+            merged = mergeColumns([readSegmentPath(a[2]), readSegmentPath(b[2])])
+            mergedPath = self.writeSegment(path, a[0], b[1], merged)
+            removeSegments([a, b])
+            segmentList[-2:] = [(a[0], b[1], mergedPath, len(merged[DATETIME_FIELD]))]
+
+    #----------------------------------------------------------------------
+    def rewritePartition(self, dbName, symbol, date, columnDict):
+        """用单个数据段替换分区中的全部数据段，数据为空时删除分区"""
+        path = self.getPartitionPath(dbName, symbol, date)
+        segmentList, coveredList = self.getSegmentList(path)
+
+        if not len(columnDict.get(DATETIME_FIELD, [])):
+            shutil.rmtree(path, ignore_errors=True)
+            return
+
+        # 新数据段的序号范围覆盖原有的全部数据段
+        first = segmentList[0][0] if segmentList else 1
+        last = segmentList[-1][1] + 1 if segmentList else 1
+        self.writeSegment(path, first, last, columnDict)
+
+        removeSegments(segmentList + coveredList)
+
+    #----------------------------------------------------------------------
+    def saveData(self, dbName, symbol, dataList):
+        """按日期分组后追加到分区中，datetime相同的数据以新数据为准"""
+        if not dataList:
+            return 0
+
+        groupDict = {}
+        for d in dataList:
+            groupDict.setdefault(d[DATETIME_FIELD].strftime('%Y%m%d'), []).append(d)
+
+        with self.lock:
+            for date, l in groupDict.items():
+                columnDict, nullList = buildColumns(l)
+
+                # 每个数据段内部按datetime排序且不重复
+                columnDict = mergeColumns([columnDict])
+                self.appendSegment(self.getPartitionPath(dbName, symbol, date), columnDict)
+
+            # 时间格式和只有空值的字段保存在meta.json中，发生变化时才写入
+            meta = self.loadMeta(dbName, symbol)
+            newMeta = dict(meta)
+            if 'time' in dataList[-1]:
+                newMeta['timeFormat'] = getTimeFormat(dataList[-1]['time'])
+            newMeta['nullFields'] = sorted(set(meta.get('nullFields', [])) | set(nullList))
+            if newMeta != meta:
+                self.saveMeta(dbName, symbol, newMeta)
+
+        return len(dataList)
+
+    #----------------------------------------------------------------------
+    def saveBars(self, dbName, symbol, dataList):
+        """保存K线数据"""
+        return self.saveData(dbName, symbol, dataList)
+
+    #----------------------------------------------------------------------
+    def saveTicks(self, dbName, symbol, dataList):
+        """保存Tick数据"""
+        return self.saveData(dbName, symbol, dataList)
+
+    #----------------------------------------------------------------------
+    def compact(self, dbName, symbol, start=None, end=None):
+        """将[start, end)内各日期的分区合并为单个数据段，减少读取时的文件数量"""
+        startDate = start.strftime('%Y%m%d') if start else ''
+        endDate = end.strftime('%Y%m%d') if end else ''
+
+        with self.lock:
+            for date in self.getDateList(dbName, symbol):
+                if date < startDate or (endDate and date > endDate):
+                    continue
+
+                path = self.getPartitionPath(dbName, symbol, date)
+                segmentList, coveredList = self.getSegmentList(path)
+                if len(segmentList) > 1 or coveredList:
+                    columnDict = self.loadPartition(dbName, symbol, date, mmap=False)
+                    self.rewritePartition(dbName, symbol, date, columnDict)
+
+    #----------------------------------------------------------------------
+    def iterPartitions(self, dbName, symbol, start=None, end=None, fieldList=None):
+        """遍历和[start, end)有交集的分区，返回(日期, {字段名: 数组})，数组已经截取到时间范围内"""
+        startDate = start.strftime('%Y%m%d') if start else ''
+        endDate = end.strftime('%Y%m%d') if end else ''
+
+        for date in self.getDateList(dbName, symbol):
+            if date < startDate or (endDate and date > endDate):
+                continue
+
+            columnDict = self.loadPartition(dbName, symbol, date, fieldList=fieldList)
+            if not columnDict:
+                continue
+
+            dtArray = columnDict[DATETIME_FIELD]
+            i = np.searchsorted(dtArray, np.datetime64(start, 'us')) if start else 0
+            j = np.searchsorted(dtArray, np.datetime64(end, 'us')) if end else len(dtArray)
+            if i >= j:
+                continue
+
+            yield date, {name: array[i:j] for name, array in columnDict.items()}
+
+    #----------------------------------------------------------------------
+    def loadRange(self, dbName, symbol, start=None, end=None):
+        """按分区逐日读取数据字典"""
+        meta = self.loadMeta(dbName, symbol)
+        template = dict.fromkeys(meta.get('nullFields', []))
+        timeFormat = meta.get('timeFormat', '')
+
+        for date, columnDict in self.iterPartitions(dbName, symbol, start, end):
+            nameList = [name for name in columnDict if name != DATETIME_FIELD]
+            valueList = [columnToList(columnDict[name]) for name in nameList]
+
+            for values in zip(columnDict[DATETIME_FIELD].tolist(), *valueList):
+                dt = values[0]
+                d = template.copy()
+                d.update(zip(nameList, values[1:]))
+                d[DATETIME_FIELD] = dt
+                d['date'] = date
+                d['time'] = formatTime(dt, timeFormat)
+                yield d
+
+    #----------------------------------------------------------------------
+    def loadFrame(self, dbName, symbol, start=None, end=None):
+        """直接拼接各字段的数组，不生成数据字典"""
+        frameList = []
+        for date, columnDict in self.iterPartitions(dbName, symbol, start, end):
+            dtArray = columnDict.pop(DATETIME_FIELD).astype('datetime64[ns]')
+            index = pd.DatetimeIndex(dtArray, name=DATETIME_FIELD)
+            frameList.append(pd.DataFrame({name: np.asarray(array) for name, array in columnDict.items()},
+                                          index=index))
+
+        if not frameList:
+            return pd.DataFrame()
+        return pd.concat(frameList)
+
+    #----------------------------------------------------------------------
+    def summarizeRange(self, dbName, symbol, start=None, end=None):
+        """只读取datetime字段统计"""
+        count = 0
+        lastDatetime = None
+        for date, columnDict in self.iterPartitions(dbName, symbol, start, end, fieldList=[]):
+            dtArray = columnDict[DATETIME_FIELD]
+            count += len(dtArray)
+            lastDatetime = dtArray[-1].tolist()
+        return count, lastDatetime
+
+    #----------------------------------------------------------------------
+    def lastTimestamp(self, dbName, symbol):
+        """最后一个分区中的最后一条数据"""
+        dateList = self.getDateList(dbName, symbol)
+        if not dateList:
+            return None
+
+        columnDict = self.loadPartition(dbName, symbol, dateList[-1], fieldList=[])
+        return columnDict[DATETIME_FIELD][-1].tolist()
+
+    #----------------------------------------------------------------------
+    def deleteRanges(self, dbName, symbol, rangeList):
+        """将受影响的分区重写为单个数据段"""
+        if not rangeList:
+            return 0
+
+        count = 0
+        with self.lock:
+            for date in self.getDateList(dbName, symbol):
+                dayStart = datetime.strptime(date, '%Y%m%d')
+                dayEnd = dayStart.replace(hour=23, minute=59, second=59, microsecond=999999)
+                if not [1 for s, e in rangeList if s <= dayEnd and e > dayStart]:
+                    continue
+
+                columnDict = self.loadPartition(dbName, symbol, date, mmap=False)
+                if not columnDict:
+                    continue
+                dtArray = columnDict[DATETIME_FIELD]
+
+                mask = np.zeros(len(dtArray), dtype=bool)
+                for s, e in rangeList:
+                    mask |= (dtArray >= np.datetime64(s, 'us')) & (dtArray < np.datetime64(e, 'us'))
+
+                n = int(mask.sum())
+                if n:
+                    self.rewritePartition(dbName, symbol, date,
+                                          {name: array[~mask] for name, array in columnDict.items()})
+                    count += n
+
+        return count
+
+
+#----------------------------------------------------------------------
+def getRangeFilter(start=None, end=None):
+    """生成[start, end)的MongoDB查询条件"""
+    dtFilter = {}
+    if start:
+        dtFilter['$gte'] = start
+    if end:
+        dtFilter['$lt'] = end
+
+    if dtFilter:
+        return {DATETIME_FIELD: dtFilter}
+    return {}
+
+
+#----------------------------------------------------------------------
+def buildColumns(dataList):
+    """
+    将数据字典列表转换为列数据，返回({字段名: 数组}, 只有空值的字段列表)
+    字段类型根据所有数据判断：全部为数值的字段保存为数值数组（空值为NaN），
+    其他字段保存为object数组（空值为None，非字符串的值转换为字符串）
+    """
+    keySet = set()
+    for d in dataList:
+        keySet.update(d)
+    keySet -= set([DATETIME_FIELD, 'date', 'time', '_id'])
+
+    columnDict = {DATETIME_FIELD: np.array([d[DATETIME_FIELD] for d in dataList], dtype=DATETIME_DTYPE)}
+    nullList = []
+
+    for key in keySet:
+        values = [d.get(key, None) for d in dataList]
+        typed = [v for v in values if v is not None]
+
+        if not typed:
+            nullList.append(key)
+        elif all([isinstance(v, (int, long, float)) for v in typed]):
+            if len(typed) < len(values):
+                columnDict[key] = np.array([np.nan if v is None else v for v in values], dtype=float)
+            else:
+                columnDict[key] = np.array(values)
+        else:
+            array = np.empty(len(values), dtype=object)
+            array[:] = [v if v is None or isinstance(v, basestring) else unicode(v) for v in values]
+            columnDict[key] = array
+
+    return columnDict, nullList
+
+
+#----------------------------------------------------------------------
+def mergeColumns(columnList):
+    """
+    按顺序合并多组列数据，按datetime排序，datetime相同的数据以后面的为准，
+    某组中缺少的字段，数值字段补NaN，字符串字段补None
+    """
+    nameSet = set()
+    for columnDict in columnList:
+        nameSet.update(columnDict)
+
+    result = {}
+    for name in nameSet:
+        isObject = any([columnDict[name].dtype == object for columnDict in columnList if name in columnDict])
+
+        arrayList = []
+        for columnDict in columnList:
+            if name in columnDict:
+                arrayList.append(columnDict[name])
+            else:
+                n = len(columnDict[DATETIME_FIELD])
+                arrayList.append(np.full(n, None, dtype=object) if isObject else np.full(n, np.nan))
+        result[name] = np.concatenate(arrayList)
+
+    # 稳定排序后，相同datetime中最后一条为后面的数据
+    dtArray = result[DATETIME_FIELD]
+    order = np.argsort(dtArray, kind='mergesort')
+    dtArray = dtArray[order]
+    keep = np.ones(len(dtArray), dtype=bool)
+    keep[:-1] = dtArray[1:] != dtArray[:-1]
+
+    return {name: array[order][keep] for name, array in result.items()}
+
+
+#----------------------------------------------------------------------
+def writeSegmentFile(filePath, columnDict):
+    """
+    写入数据段文件：开头8字节为文件头长度，然后是JSON格式的文件头（数据量和各列的
+    类型、相对数据区的位置），之后对齐后的数据区中依次保存各列的数据；
+    字符串列使用字典编码，保存编码数组，字典保存在文件头中
+    """
+    count = len(columnDict[DATETIME_FIELD])
+    columnList = []
+    arrayList = []
+
+    for name, array in columnDict.items():
+        column = {'name': name}
+        if array.dtype == object:
+            valueList = sorted(set([toUnicode(v) for v in array if v is not None]))
+            indexDict = {v: i for i, v in enumerate(valueList)}
+            array = np.array([-1 if v is None else indexDict[toUnicode(v)] for v in array], dtype=np.int32)
+            column['dictionary'] = valueList
+
+        array = np.ascontiguousarray(array)
+        column['dtype'] = array.dtype.str
+        columnList.append(column)
+        arrayList.append(array)
+
+    offset = 0
+    for column, array in zip(columnList, arrayList):
+        column['offset'] = offset
+        offset = alignOffset(offset + array.nbytes)
+
+    header = json.dumps({'count': count, 'columns': columnList})
+    dataOffset = alignOffset(8 + len(header))
+
+    with open(filePath, 'wb') as f:
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for column, array in zip(columnList, arrayList):
+            f.write('\0' * (dataOffset + column['offset'] - f.tell()))
+            f.write(array.tostring())
+
+
+#----------------------------------------------------------------------
+def readSegmentHeader(f):
+    """读取数据段文件头，返回(文件头, 数据区的位置)"""
+    n = struct.unpack('<Q', f.read(8))[0]
+    return json.loads(f.read(n)), alignOffset(8 + n)
+
+
+#----------------------------------------------------------------------
+def readSegmentFile(f, mmap=True, fieldList=None):
+    """
+    读取已打开的数据段文件，返回{字段名: 数组}，字符串字段解码为object数组，
+    fieldList为None时读取全部字段，使用内存映射时文件关闭后数组仍然有效
+    """
+    header, dataOffset = readSegmentHeader(f)
+    if mmap:
+        buf = mmapModule.mmap(f.fileno(), 0, access=mmapModule.ACCESS_READ)
+    else:
+        f.seek(0)
+        buf = f.read()
+
+    count = header['count']
+    columnDict = {}
+    for column in header['columns']:
+        name = str(column['name'])
+        if fieldList is not None and name != DATETIME_FIELD and name not in fieldList:
+            continue
+
+        array = np.frombuffer(buf, np.dtype(str(column['dtype'])), count, dataOffset + column['offset'])
+        if 'dictionary' in column:
+            array = decodeStrings(array, column['dictionary'])
+        columnDict[name] = array
+    return columnDict
+
+
+#----------------------------------------------------------------------
+def readSegmentPath(filePath):
+    """读取数据段文件的全部数据到内存"""
+    with open(filePath, 'rb') as f:
+        return readSegmentFile(f, mmap=False)
+
+
+#----------------------------------------------------------------------
+def readSegmentCount(filePath):
+    """读取数据段的数据量，只读取文件头"""
+    with open(filePath, 'rb') as f:
+        return readSegmentHeader(f)[0]['count']
+
+
+#----------------------------------------------------------------------
+def removeSegments(segmentList):
+    """删除数据段文件，文件仍被占用时（Windows下正在读取）保留，之后作为被覆盖的数据段再次删除"""
+    for segment in segmentList:
+        try:
+            os.remove(segment[2])
+        except OSError:
+            pass
+
+
+#----------------------------------------------------------------------
+def alignOffset(offset):
+    """对齐到SEGMENT_ALIGN字节"""
+    return (offset + SEGMENT_ALIGN - 1) // SEGMENT_ALIGN * SEGMENT_ALIGN
+
+
+#----------------------------------------------------------------------
+def decodeStrings(codes, dictionary):
+    """解码字典编码的字符串数组，返回object数组，编码-1为None"""
+    array = np.full(len(codes), None, dtype=object)
+    valid = codes >= 0
+    if valid.any():
+        array[valid] = np.array(dictionary, dtype=object)[codes[valid]]
+    return array
+
+
+#----------------------------------------------------------------------
+def toUnicode(value):
+    """转换为unicode字符串"""
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+
+#----------------------------------------------------------------------
+def columnToList(array):
+    """数组转换为Python对象列表，数值字段中的NaN还原为None"""
+    l = array.tolist()
+    if array.dtype.kind == 'f' and np.isnan(array).any():
+        l = [None if v != v else v for v in l]
+    return l
+
+
+#----------------------------------------------------------------------
+def getTimeFormat(value):
+    """根据time字段的内容判断格式：Tick带毫秒，K线不带，日线为空"""
+    if not value:
+        return ''
+    elif '.' in value:
+        return '%H:%M:%S.%f'
+    else:
+        return '%H:%M:%S'
+
+
+#----------------------------------------------------------------------
+def formatTime(dt, timeFormat):
+    """根据格式生成time字段，避免逐条调用strftime"""
+    if not timeFormat:
+        return ''
+    elif timeFormat == '%H:%M:%S':
+        return '%02d:%02d:%02d' %(dt.hour, dt.minute, dt.second)
+    else:
+        return '%02d:%02d:%02d.%06d' %(dt.hour, dt.minute, dt.second, dt.microsecond)
+
+
+#----------------------------------------------------------------------
+def replaceFile(src, dst):
+    """用src替换dst（Windows下rename不能覆盖已有文件）"""
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
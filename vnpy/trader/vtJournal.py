@@ -0,0 +1,380 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了行情数据的本地日志文件（Journal），用于行情记录时先落地到本地磁盘：
+
+1. 每个数据库、每个日期、每个合约一个文件，路径为 根目录/数据库名/日期/合约代码.jnl
+2. 文件由固定长度的文件头和定长的二进制记录组成，通过内存映射（mmap）追加写入，
+   每条记录写入完成后才更新文件头中的记录数量，进程崩溃后重新打开即可从记录数量处继续追加
+3. 文件头中同时保存已经载入数据库的记录数量，后台线程只需要将两者之间的记录（已经写完、
+   不会再修改的部分）批量载入数据库
+4. loadJournalData按照和数据库相同的格式读取数据，可以直接用于回测
+
+Tick记录保存成交、常规行情和五档行情的数值字段，K线记录保存OHLCV和持仓量，
+成交量和持仓量统一使用浮点数保存（兼容数字货币的小数成交量），rawData不保存。
+'''
+
+from __future__ import division
+
+import os
+import mmap
+from datetime import datetime, timedelta
+from operator import attrgetter
+
+import numpy as np
+
+
+# 记录类型
+JOURNAL_TICK = 1
+JOURNAL_BAR = 2
+
+JOURNAL_MAGIC = 'VNJ1'
+JOURNAL_SUFFIX = '.jnl'
+
+# 文件头，固定256字节
+HEADER_SIZE = 256
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('dataType', '<i4'),
+    ('recordSize', '<i4'),
+    ('capacity', '<i8'),
+    ('count', '<i8'),               # 已经写入的记录数量
+    ('loadedCount', '<i8'),         # 已经载入数据库的记录数量
+    ('symbol', 'S32'),
+    ('exchange', 'S32'),
+    ('vtSymbol', 'S64'),
+    ('gatewayName', 'S32')
+])
+
+# 记录中的数值字段
+TICK_FIELDS = ['lastPrice', 'lastVolume', 'volume', 'openInterest',
+               'openPrice', 'highPrice', 'lowPrice', 'preClosePrice',
+               'upperLimit', 'lowerLimit',
+               'bidPrice1', 'bidPrice2', 'bidPrice3', 'bidPrice4', 'bidPrice5',
+               'askPrice1', 'askPrice2', 'askPrice3', 'askPrice4', 'askPrice5',
+               'bidVolume1', 'bidVolume2', 'bidVolume3', 'bidVolume4', 'bidVolume5',
+               'askVolume1', 'askVolume2', 'askVolume3', 'askVolume4', 'askVolume5']
+BAR_FIELDS = ['open', 'high', 'low', 'close', 'volume', 'openInterest']
+
+FIELDS_MAP = {
+    JOURNAL_TICK: TICK_FIELDS,
+    JOURNAL_BAR: BAR_FIELDS
+}
+
+# 记录格式，datetime为1970-01-01以来的微秒数（不做时区转换）
+DTYPE_MAP = {k: np.dtype([('datetime', '<i8')] + [(name, '<f8') for name in v])
+             for k, v in FIELDS_MAP.items()}
+
+GETTER_MAP = {k: attrgetter(*v) for k, v in FIELDS_MAP.items()}
+
+EPOCH = datetime(1970, 1, 1)
+
+# 新建文件的默认容量（记录数量），写满后容量翻倍
+DEFAULT_CAPACITY = 100000
+
+
+#----------------------------------------------------------------------
+def datetimeToInt(dt):
+    """datetime转换为微秒数"""
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+#----------------------------------------------------------------------
+def intToDatetime(n):
+    """微秒数转换为datetime"""
+    return EPOCH + timedelta(microseconds=n)
+
+
+#----------------------------------------------------------------------
+def getJournalPath(root, dbName, date, collectionName):
+    """获取日志文件路径，date为YYYYMMDD格式的字符串"""
+    return os.path.join(root, dbName, date, collectionName + JOURNAL_SUFFIX)
+
+
+########################################################################
+class JournalFile(object):
+    """
+    单个日志文件
+    写入和载入数据库可以在不同的线程中使用不同的JournalFile对象操作同一个文件：
+    写入方只修改count，载入方只修改loadedCount
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, path, dataType=JOURNAL_TICK, capacity=DEFAULT_CAPACITY):
+        """
+        打开日志文件，文件不存在时使用dataType和capacity创建
+        """
+        self.path = path
+        self.f = None
+        self.mm = None
+        self.header = None
+        self.records = None
+
+        if not os.path.exists(path):
+            self.create(dataType, capacity)
+
+        self.open()
+
+    #----------------------------------------------------------------------
+    def create(self, dataType, capacity):
+        """创建新文件"""
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'] = JOURNAL_MAGIC
+        header['dataType'] = dataType
+        header['recordSize'] = DTYPE_MAP[dataType].itemsize
+        header['capacity'] = capacity
+
+        # 先写入临时文件再重命名，避免出现只有部分文件头的文件
+        tempPath = self.path + '.tmp'
+        with open(tempPath, 'wb') as f:
+            f.write(header.tobytes().ljust(HEADER_SIZE, '\0'))
+            f.truncate(HEADER_SIZE + DTYPE_MAP[dataType].itemsize * capacity)
+        os.rename(tempPath, self.path)
+
+    #----------------------------------------------------------------------
+    def open(self):
+        """打开文件并建立内存映射"""
+        self.f = open(self.path, 'r+b')
+        self.mm = mmap.mmap(self.f.fileno(), 0)
+
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.mm)
+        if self.header['magic'].item() != JOURNAL_MAGIC:
+            self.close()
+            raise ValueError(u'不是有效的日志文件：%s' %self.path)
+
+        self.dataType = int(self.header['dataType'])
+        self.dtype = DTYPE_MAP[self.dataType]
+        self.getter = GETTER_MAP[self.dataType]
+
+        # 容量以实际的文件大小为准（扩容过程中文件头可能尚未更新）
+        self.capacity = min(int(self.header['capacity']),
+                            (len(self.mm) - HEADER_SIZE) // self.dtype.itemsize)
+        self.records = np.ndarray((self.capacity,), dtype=self.dtype,
+                                  buffer=self.mm, offset=HEADER_SIZE)
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭文件，需要先释放所有基于内存映射的数组"""
+        self.header = None
+        self.records = None
+
+        if self.mm:
+            self.mm.flush()
+            self.mm.close()
+            self.mm = None
+
+        if self.f:
+            self.f.close()
+            self.f = None
+
+    #----------------------------------------------------------------------
+    def grow(self):
+        """容量翻倍"""
+        capacity = self.capacity * 2
+        self.close()
+
+        with open(self.path, 'r+b') as f:
+            f.truncate(HEADER_SIZE + self.dtype.itemsize * capacity)
+
+        self.open()
+        self.header['capacity'] = capacity
+        self.capacity = capacity
+        self.records = np.ndarray((self.capacity,), dtype=self.dtype,
+                                  buffer=self.mm, offset=HEADER_SIZE)
+
+    #----------------------------------------------------------------------
+    def append(self, data):
+        """追加一条数据（VtTickData或VtBarData）"""
+        count = int(self.header['count'])
+        if count >= self.capacity:
+            self.grow()
+
+        # 第一条数据写入时保存代码相关的字符串
+        header = self.header
+        if not count:
+            header['symbol'] = data.symbol
+            header['exchange'] = data.exchange
+            header['vtSymbol'] = data.vtSymbol
+            header['gatewayName'] = data.gatewayName
+
+        self.records[count] = (datetimeToInt(data.datetime),) + self.getter(data)
+        header['count'] = count + 1
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """将内存映射的内容写入磁盘"""
+        if self.mm:
+            self.mm.flush()
+
+    #----------------------------------------------------------------------
+    def getCount(self):
+        """获取已写入的记录数量"""
+        return min(int(self.header['count']), self.capacity)
+
+    #----------------------------------------------------------------------
+    def getLoadedCount(self):
+        """获取已载入数据库的记录数量"""
+        return int(self.header['loadedCount'])
+
+    #----------------------------------------------------------------------
+    def setLoadedCount(self, n):
+        """设置已载入数据库的记录数量"""
+        self.header['loadedCount'] = n
+
+    #----------------------------------------------------------------------
+    def readArray(self, start=0, end=None):
+        """读取记录数组（复制），end为None表示到最后一条已写入的记录"""
+        count = self.getCount()
+        if end is None or end > count:
+            end = count
+        return self.records[start:end].copy()
+
+    #----------------------------------------------------------------------
+    def read(self, start=0, end=None):
+        """读取记录，返回和数据库中格式相同的数据字典列表"""
+        array = self.readArray(start, end)
+        return self.arrayToDict(array)
+
+    #----------------------------------------------------------------------
+    def arrayToDict(self, array):
+        """记录数组转换为数据字典列表"""
+        header = self.header
+        base = {
+            'symbol': header['symbol'].item().decode('utf-8'),
+            'exchange': header['exchange'].item().decode('utf-8'),
+            'vtSymbol': header['vtSymbol'].item().decode('utf-8'),
+            'gatewayName': header['gatewayName'].item().decode('utf-8'),
+            'rawData': None
+        }
+
+        names = array.dtype.names
+        l = []
+        for values in array.tolist():
+            d = dict(zip(names, values))
+            dt = intToDatetime(d['datetime'])
+            d['datetime'] = dt
+            d['date'] = dt.strftime('%Y%m%d')
+            if self.dataType == JOURNAL_TICK:
+                d['time'] = dt.strftime('%H:%M:%S.') + str(dt.microsecond // 100000)
+            else:
+                d['time'] = dt.strftime('%H:%M:%S.%f')
+            d.update(base)
+            l.append(d)
+        return l
+
+
+########################################################################
+class Journal(object):
+    """
+    日志文件管理器，按照(数据库名, 集合名)维护当前日期正在写入的文件
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, root, capacity=DEFAULT_CAPACITY):
+        """Constructor"""
+        self.root = root
+        self.capacity = capacity
+
+        # key为(数据库名, 集合名)，value为(日期, JournalFile对象)
+        self.fileDict = {}
+
+    #----------------------------------------------------------------------
+    def append(self, dbName, collectionName, data, dataType):
+        """追加数据，日期变化时自动切换到新的文件，返回写入的JournalFile对象"""
+        key = (dbName, collectionName)
+        date = data.datetime.date()
+
+        l = self.fileDict.get(key, None)
+        if not l or l[0] != date:
+            if l:
+                l[1].close()
+            path = getJournalPath(self.root, dbName, date.strftime('%Y%m%d'), collectionName)
+            l = (date, JournalFile(path, dataType, self.capacity))
+            self.fileDict[key] = l
+
+        l[1].append(data)
+        return l[1]
+
+    #----------------------------------------------------------------------
+    def getWritingPaths(self):
+        """获取正在写入的文件路径集合"""
+        return set([journalFile.path for date, journalFile in self.fileDict.values()])
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """写入磁盘"""
+        for date, journalFile in self.fileDict.values():
+            journalFile.flush()
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭所有文件"""
+        for date, journalFile in self.fileDict.values():
+            journalFile.close()
+        self.fileDict.clear()
+
+
+#----------------------------------------------------------------------
+def listJournalFiles(root, dbName='', collectionName=''):
+    """列出根目录下的日志文件路径，可以按照数据库名和集合名过滤，按日期排序"""
+    l = []
+    if not os.path.isdir(root):
+        return l
+
+    dbNameList = [dbName] if dbName else sorted(os.listdir(root))
+    for db in dbNameList:
+        dbPath = os.path.join(root, db)
+        if not os.path.isdir(dbPath):
+            continue
+
+        for date in sorted(os.listdir(dbPath)):
+            datePath = os.path.join(dbPath, date)
+            if not os.path.isdir(datePath):
+                continue
+
+            for fileName in sorted(os.listdir(datePath)):
+                if not fileName.endswith(JOURNAL_SUFFIX):
+                    continue
+                if collectionName and fileName != collectionName + JOURNAL_SUFFIX:
+                    continue
+                l.append(os.path.join(datePath, fileName))
+
+    return l
+
+
+#----------------------------------------------------------------------
+def loadJournalData(root, dbName, collectionName, startDate=None, endDate=None):
+    """
+    从日志文件中读取数据，返回按时间排序的数据字典列表，格式和数据库中相同
+    startDate：开始时间（包含），endDate：结束时间（包含），均为datetime对象或None
+    """
+    l = []
+
+    for path in listJournalFiles(root, dbName, collectionName):
+        # 根据目录名的日期跳过范围之外的文件
+        date = datetime.strptime(os.path.basename(os.path.dirname(path)), '%Y%m%d')
+        if startDate and date + timedelta(1) <= startDate:
+            continue
+        if endDate and date > endDate:
+            continue
+
+        journalFile = JournalFile(path)
+        try:
+            array = journalFile.readArray()
+
+            if startDate:
+                array = array[array['datetime'] >= datetimeToInt(startDate)]
+            if endDate:
+                array = array[array['datetime'] <= datetimeToInt(endDate)]
+
+            l.extend(journalFile.arrayToDict(array))
+        finally:
+            journalFile.close()
+
+    l.sort(key=lambda d: d['datetime'])
+    return l
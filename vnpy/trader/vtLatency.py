@@ -0,0 +1,291 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了从行情到委托的全链路延时追踪：
+
+1. 接口收到行情时从环形缓冲区中分配一个追踪编号，保存在tick.traceId上
+2. 事件引擎入队、出队，CTA引擎调用策略，CtaEngine.sendOrder，以及接口发出委托时
+   分别在该编号对应的时间戳列表中记录时间（每个阶段只记录第一次）
+3. 委托请求通过VtOrderReq.traceId携带追踪编号，接口发出委托后统计各阶段的耗时
+4. 各阶段耗时的直方图按计时器事件定期输出到日志和CSV文件，输出后清空重新统计
+
+追踪默认关闭，关闭时各处只增加一次布尔判断。时间戳保存在预先分配的列表中，
+追踪过程中不创建新的容器对象。一个tick触发多笔委托时，只统计第一笔委托。
+'''
+
+from __future__ import division
+
+import csv
+import os
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from itertools import count
+from timeit import default_timer
+
+from vnpy.event import Event
+from vnpy.trader.vtEvent import EVENT_LOG, EVENT_TIMER
+from vnpy.trader.vtObject import VtLogData
+from vnpy.trader.vtFunction import getTempPath
+
+
+# 追踪阶段
+STAGE_GATEWAY = 0           # 接口收到行情
+STAGE_ENQUEUE = 1           # 行情事件存入事件队列
+STAGE_DEQUEUE = 2           # 行情事件从事件队列取出
+STAGE_STRATEGY = 3          # CTA引擎调用策略的onTick
+STAGE_CTA_SEND = 4          # CtaEngine.sendOrder
+STAGE_GATEWAY_SEND = 5      # 接口发出委托
+
+STAGE_NAMES = ['gateway', 'enqueue', 'dequeue', 'strategy', 'ctaSend', 'gatewaySend']
+
+# 耗时统计的名称，每个阶段统计和上一个阶段的时间差，total为全链路耗时
+STAT_NAMES = ['%s-%s' %(STAGE_NAMES[i-1], STAGE_NAMES[i]) for i in range(1, len(STAGE_NAMES))]
+STAT_NAMES.append('total')
+
+# 耗时直方图的分档上限（单位：微秒），最后一档为无穷大
+LATENCY_BUCKETS = [5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000, 100000]
+
+# 导出文件的字段
+EXPORT_FIELDS = ['datetime', 'stage', 'count', 'average', 'p50', 'p90', 'p99', 'max']
+
+
+########################################################################
+class LatencyStat(object):
+    """单个阶段的耗时统计"""
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.count = 0                  # 次数
+        self.totalTime = 0              # 总耗时（秒）
+        self.maxTime = 0                # 最大耗时（秒）
+
+        # 耗时直方图，长度比分档多1，最后一档为超过最大分档的次数
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    #----------------------------------------------------------------------
+    def update(self, elapsed):
+        """更新统计，elapsed单位为秒"""
+        self.count += 1
+        self.totalTime += elapsed
+
+        if elapsed > self.maxTime:
+            self.maxTime = elapsed
+
+        self.histogram[bisect_left(LATENCY_BUCKETS, elapsed * 1000000)] += 1
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空统计"""
+        self.count = 0
+        self.totalTime = 0
+        self.maxTime = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    #----------------------------------------------------------------------
+    def getAverage(self):
+        """获取平均耗时（微秒）"""
+        if not self.count:
+            return 0
+        return self.totalTime / self.count * 1000000
+
+    #----------------------------------------------------------------------
+    def getPercentile(self, percent):
+        """根据直方图估算分位数耗时，返回对应分档的上限（微秒），超出最大分档返回-1"""
+        if not self.count:
+            return 0
+
+        target = self.count * percent / 100
+        cumulative = 0
+        for i, n in enumerate(self.histogram):
+            cumulative += n
+            if cumulative >= target:
+                if i < len(LATENCY_BUCKETS):
+                    return LATENCY_BUCKETS[i]
+                return -1
+        return -1
+
+
+########################################################################
+class LatencyTracer(object):
+    """
+    全链路延时追踪器
+    行情接口线程调用newTrace，其余阶段均在事件引擎线程中记录
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, size=4096):
+        """Constructor"""
+        self.active = False             # 追踪开关
+
+        # 时间戳环形缓冲区，每个追踪编号对应一个长度为阶段数量的列表
+        # 第一个元素（收到行情的时间）为0表示该编号的追踪已经结束
+        self.size = size
+        self.slotList = [[0.0] * len(STAGE_NAMES) for i in range(size)]
+        self.emptySlot = [0.0] * len(STAGE_NAMES)
+        self.counter = count()          # itertools.count在GIL下是原子操作
+
+        # 各阶段的耗时统计
+        self.statDict = OrderedDict()
+        for name in STAT_NAMES:
+            self.statDict[name] = LatencyStat()
+
+        # 定期输出相关
+        self.eventEngine = None
+        self.exportInterval = 60        # 输出间隔（秒）
+        self.exportCount = 0            # 计时器事件计数
+        self.exportPath = ''            # CSV文件路径
+
+    #----------------------------------------------------------------------
+    def start(self, eventEngine, interval=60, path=''):
+        """
+        启动追踪
+        eventEngine：用于记录事件入队出队时间，以及定期输出统计
+        interval：输出间隔（秒），为0则不定期输出
+        path：CSV文件路径，为空则使用临时目录下的latency_日期.csv
+        """
+        self.eventEngine = eventEngine
+        self.exportInterval = interval
+        self.exportCount = 0
+        self.exportPath = path or getTempPath('latency_%s.csv' %datetime.now().strftime('%Y%m%d'))
+
+        eventEngine.setTracer(self)
+        if interval:
+            eventEngine.register(EVENT_TIMER, self.processTimerEvent)
+
+        self.active = True
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止追踪"""
+        self.active = False
+
+        if self.eventEngine:
+            self.eventEngine.setTracer(None)
+            self.eventEngine.unregister(EVENT_TIMER, self.processTimerEvent)
+            self.eventEngine = None
+
+    #----------------------------------------------------------------------
+    def newTrace(self):
+        """分配追踪编号并记录收到行情的时间"""
+        traceId = next(self.counter) % self.size
+        slot = self.slotList[traceId]
+        slot[:] = self.emptySlot
+        slot[STAGE_GATEWAY] = default_timer()
+        return traceId
+
+    #----------------------------------------------------------------------
+    def stamp(self, traceId, stage):
+        """记录阶段时间，追踪已结束或该阶段已记录过时忽略"""
+        slot = self.slotList[traceId]
+        if slot[STAGE_GATEWAY] and not slot[stage]:
+            slot[stage] = default_timer()
+
+    #----------------------------------------------------------------------
+    def finish(self, traceId):
+        """记录接口发出委托的时间，统计各阶段耗时并结束追踪"""
+        slot = self.slotList[traceId]
+        if not slot[STAGE_GATEWAY]:
+            return
+        slot[STAGE_GATEWAY_SEND] = default_timer()
+
+        # 阶段之间的耗时，跳过没有记录的阶段（例如停止单触发的委托不经过策略回调）
+        statList = self.statDict.values()
+        for i in range(1, len(STAGE_NAMES)):
+            if slot[i] and slot[i-1]:
+                statList[i-1].update(slot[i] - slot[i-1])
+        statList[-1].update(slot[STAGE_GATEWAY_SEND] - slot[STAGE_GATEWAY])
+
+        slot[STAGE_GATEWAY] = 0
+
+    #----------------------------------------------------------------------
+    def onEventPut(self, event):
+        """事件存入队列时由事件引擎调用"""
+        traceId = getattr(event.dict_.get('data', None), 'traceId', -1)
+        if traceId >= 0:
+            self.stamp(traceId, STAGE_ENQUEUE)
+
+    #----------------------------------------------------------------------
+    def onEventProcess(self, event):
+        """事件从队列取出时由事件引擎调用"""
+        traceId = getattr(event.dict_.get('data', None), 'traceId', -1)
+        if traceId >= 0:
+            self.stamp(traceId, STAGE_DEQUEUE)
+
+    #----------------------------------------------------------------------
+    def getStatistics(self):
+        """获取各阶段的耗时统计（微秒）"""
+        result = OrderedDict()
+        for name, stat in self.statDict.items():
+            d = OrderedDict()
+            d['count'] = stat.count
+            d['average'] = round(stat.getAverage(), 1)
+            d['p50'] = stat.getPercentile(50)
+            d['p90'] = stat.getPercentile(90)
+            d['p99'] = stat.getPercentile(99)
+            d['max'] = round(stat.maxTime * 1000000, 1)
+            result[name] = d
+        return result
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空统计"""
+        for stat in self.statDict.values():
+            stat.clear()
+
+    #----------------------------------------------------------------------
+    def processTimerEvent(self, event):
+        """计时器事件，达到输出间隔时输出统计"""
+        self.exportCount += 1
+        if self.exportCount < self.exportInterval:
+            return
+        self.exportCount = 0
+
+        self.export()
+
+    #----------------------------------------------------------------------
+    def export(self):
+        """输出本周期的统计到日志和CSV文件，然后清空统计"""
+        result = self.getStatistics()
+        total = result['total']
+        if not total['count']:
+            return
+
+        # CSV文件，每个阶段一行
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        newFile = not os.path.exists(self.exportPath)
+
+        with open(self.exportPath, 'ab') as f:
+            writer = csv.DictWriter(f, EXPORT_FIELDS)
+            if newFile:
+                writer.writeheader()
+            for name, d in result.items():
+                row = dict(d)
+                row['datetime'] = now
+                row['stage'] = name
+                writer.writerow(row)
+
+        # 日志
+        content = u'全链路延时（微秒）：%s次，平均%s，p50 %s，p99 %s，最大%s' %(
+            total['count'], total['average'], total['p50'], total['p99'], total['max'])
+        self.writeLog(content)
+
+        self.clear()
+
+    #----------------------------------------------------------------------
+    def writeLog(self, content):
+        """发出日志事件"""
+        if not self.eventEngine:
+            return
+
+        log = VtLogData()
+        log.logContent = content
+        log.gatewayName = 'LATENCY_TRACER'
+        event = Event(type_=EVENT_LOG)
+        event.dict_['data'] = log
+        self.eventEngine.put(event)
+
+
+# 全局的追踪器对象
+latencyTracer = LatencyTracer()
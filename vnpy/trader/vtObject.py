@@ -309,6 +309,9 @@ class VtOrderReq(object):
         self.lastTradeDateOrContractMonth = EMPTY_STRING   # 合约月,IB专用
         self.multiplier = EMPTY_STRING                     # 乘数,IB专用
         
+        # 延时追踪编号，-1表示不追踪（见vtLatency）
+        self.traceId = -1
+        
 
 ########################################################################
 class VtCancelOrderReq(object):
@@ -0,0 +1,285 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了Tick数据的压缩存储格式，用于降低行情数据库的体积并提高读取速度：
+
+1. 同一合约的Tick按照时间段（每分钟或每小时）打包为一个数据块文档，代码、交易所、
+   接口名称等字符串字段每个数据块只保存一次，date、time在解码时根据datetime生成，rawData不保存
+2. 按照接口的字段配置（例如CTP只推送一档行情）只保存有效的字段，数据块内全部为0的字段也不保存
+3. 数值字段按列保存：自动推断小数位数转换为整数，再除以全列的最大公约数（通常即为最小价格变动），
+   然后做差分，并使用能容纳差分值的最小整数类型，无法无损转换为整数的列直接保存浮点数
+4. 全部列拼接后使用zlib压缩
+
+数据块文档的datetime为块内最后一个Tick的时间，startDatetime为第一个Tick的时间，
+因此按datetime下限查询时不会漏掉跨越下限的数据块，按上限查询时需要用widenFilter放宽上限。
+读取时使用decodeDocuments统一处理，普通的Tick文档原样返回，因此读取方不需要关心集合使用的格式
+（同一集合中不应混用两种格式，否则返回的数据不保证按时间排序）。
+'''
+
+from __future__ import division
+
+import zlib
+from datetime import timedelta
+
+import numpy as np
+from bson.binary import Binary
+
+from vnpy.trader.vtObject import VtTickData
+from vnpy.trader.vtJournal import TICK_FIELDS, datetimeToInt, intToDatetime
+
+
+# 数据格式版本，保存在数据块文档的codec字段中，用于识别数据块
+CODEC_VERSION = 1
+
+# 数据块的时间跨度
+BLOCK_MINUTE = 60
+BLOCK_HOUR = 3600
+
+# 数据块的最大时间跨度，用于放宽查询上限
+MAX_BLOCK_SPAN = timedelta(seconds=BLOCK_HOUR)
+
+# 推断小数位数时尝试的最大位数
+MAX_DECIMALS = 8
+
+# 差分值可以使用的整数类型，从小到大
+INT_DTYPES = [np.dtype('<i1'), np.dtype('<i2'), np.dtype('<i4'), np.dtype('<i8')]
+FLOAT_DTYPE = np.dtype('<f8')
+
+# 各接口需要保存的字段，不在其中的接口保存全部字段
+LEVEL1_FIELDS = ['lastPrice', 'lastVolume', 'volume', 'openInterest',
+                 'openPrice', 'highPrice', 'lowPrice', 'preClosePrice',
+                 'upperLimit', 'lowerLimit',
+                 'bidPrice1', 'askPrice1', 'bidVolume1', 'askVolume1']
+
+GATEWAY_PROFILE_DICT = {
+    'CTP': LEVEL1_FIELDS
+}
+
+# 解码时使用的Tick字段模板
+TICK_TEMPLATE = VtTickData().__dict__.copy()
+TICK_TEMPLATE.pop('traceId', None)
+
+
+#----------------------------------------------------------------------
+def encodeColumn(values):
+    """
+    编码一列数值，返回(列描述, 二进制数据)
+    列描述为[小数位数, 公约数, 首个值, 数据类型, 是否浮点数]，小数位数为-1表示直接保存浮点数
+    """
+    # 解码时需要还原数值类型，避免Python 2中整数除法的问题
+    isFloat = not all([isinstance(v, (int, long)) for v in values])
+    array = np.array(values, dtype=FLOAT_DTYPE)
+
+    if np.all(np.isfinite(array)) and np.all(np.abs(array) < 2**52):
+        for decimals in range(MAX_DECIMALS + 1):
+            ints = np.round(array * 10**decimals).astype(np.int64)
+
+            # 只有能够无损还原的小数位数才使用
+            if not np.array_equal(ints.astype(FLOAT_DTYPE) / 10.0**decimals, array):
+                continue
+
+            divisor = int(np.gcd.reduce(ints)) or 1
+            ints //= divisor
+
+            deltas = np.diff(ints)
+            dtype = getIntDtype(deltas)
+            return [decimals, divisor, int(ints[0]), dtype.str, isFloat], deltas.astype(dtype).tostring()
+
+    return [-1, 1, 0, FLOAT_DTYPE.str, True], array.tostring()
+
+
+#----------------------------------------------------------------------
+def decodeColumn(column, buf, offset, count):
+    """解码一列数值，返回(数值列表, 新的偏移量)"""
+    decimals, divisor, first, dtypeStr, isFloat = column
+    dtype = np.dtype(str(dtypeStr))
+
+    if decimals < 0:
+        size = dtype.itemsize * count
+        array = np.frombuffer(buf, dtype, count, offset)
+        return array.tolist(), offset + size
+
+    size = dtype.itemsize * (count - 1)
+    deltas = np.frombuffer(buf, dtype, count - 1, offset)
+
+    ints = np.empty(count, dtype=np.int64)
+    ints[0] = first
+    np.cumsum(deltas, out=ints[1:])
+    ints[1:] += first
+    ints *= divisor
+
+    if decimals or isFloat:
+        values = (ints.astype(FLOAT_DTYPE) / 10.0**decimals).tolist()
+    else:
+        values = ints.tolist()
+    return values, offset + size
+
+
+#----------------------------------------------------------------------
+def getIntDtype(array):
+    """获取能容纳数组全部数值的最小整数类型"""
+    if not len(array):
+        return INT_DTYPES[0]
+
+    low = array.min()
+    high = array.max()
+    for dtype in INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return INT_DTYPES[-1]
+
+
+#----------------------------------------------------------------------
+def encodeBlock(dataList, level=6):
+    """
+    将同一合约的Tick数据字典列表（按时间排序）编码为一个数据块文档
+    level为zlib的压缩级别
+    """
+    first = dataList[0]
+    fieldList = GATEWAY_PROFILE_DICT.get(first.get('gatewayName', ''), TICK_FIELDS)
+
+    columnList = []
+    bufList = []
+
+    # 时间列，单位为微秒
+    column, buf = encodeColumn([datetimeToInt(d['datetime']) for d in dataList])
+    columnList.append(['datetime'] + column)
+    bufList.append(buf)
+
+    # 数值列，全部为0的列不保存
+    for name in fieldList:
+        values = [d.get(name, 0) or 0 for d in dataList]
+        if not any(values):
+            continue
+
+        column, buf = encodeColumn(values)
+        columnList.append([name] + column)
+        bufList.append(buf)
+
+    doc = {
+        'datetime': dataList[-1]['datetime'],
+        'startDatetime': first['datetime'],
+        'codec': CODEC_VERSION,
+        'count': len(dataList),
+        'symbol': first.get('symbol', ''),
+        'exchange': first.get('exchange', ''),
+        'vtSymbol': first.get('vtSymbol', ''),
+        'gatewayName': first.get('gatewayName', ''),
+        'columns': columnList,
+        'data': Binary(zlib.compress(''.join(bufList), level))
+    }
+    return doc
+
+
+#----------------------------------------------------------------------
+def decodeBlock(doc):
+    """将数据块文档解码为Tick数据字典列表"""
+    count = doc['count']
+    buf = zlib.decompress(doc['data'])
+
+    base = TICK_TEMPLATE.copy()
+    base['symbol'] = doc['symbol']
+    base['exchange'] = doc['exchange']
+    base['vtSymbol'] = doc['vtSymbol']
+    base['gatewayName'] = doc['gatewayName']
+
+    names = []
+    valuesList = []
+    offset = 0
+    for column in doc['columns']:
+        values, offset = decodeColumn(column[1:], buf, offset, count)
+        names.append(column[0])
+        valuesList.append(values)
+
+    l = []
+    for row in zip(*valuesList):
+        d = base.copy()
+        d.update(zip(names, row))
+
+        dt = intToDatetime(d['datetime'])
+        d['datetime'] = dt
+        d['date'] = dt.strftime('%Y%m%d')
+        d['time'] = dt.strftime('%H:%M:%S.') + str(dt.microsecond // 100000)
+        l.append(d)
+    return l
+
+
+#----------------------------------------------------------------------
+def splitBlocks(dataList, blockSpan=BLOCK_MINUTE):
+    """将按时间排序的Tick数据字典列表按照时间段切分，返回数据字典列表的生成器"""
+    block = []
+    blockKey = None
+
+    for d in dataList:
+        dt = d['datetime']
+        key = (dt.date(), (dt.hour * 3600 + dt.minute * 60 + dt.second) // blockSpan)
+
+        if key != blockKey and block:
+            yield block
+            block = []
+
+        blockKey = key
+        block.append(d)
+
+    if block:
+        yield block
+
+
+#----------------------------------------------------------------------
+def encodeTicks(dataList, blockSpan=BLOCK_MINUTE, level=6):
+    """将按时间排序的Tick数据字典列表编码为数据块文档列表"""
+    return [encodeBlock(block, level) for block in splitBlocks(dataList, blockSpan)]
+
+
+#----------------------------------------------------------------------
+def widenFilter(flt):
+    """
+    放宽查询条件中datetime的上限，保证能查到跨越上限的数据块
+    查询结果需要再用原始的查询条件调用decodeDocuments过滤
+    """
+    dtFilter = flt.get('datetime', None)
+    if not isinstance(dtFilter, dict):
+        return flt
+
+    newFilter = dtFilter.copy()
+    for op in ['$lt', '$lte']:
+        if op in newFilter:
+            newFilter[op] = newFilter[op] + MAX_BLOCK_SPAN
+
+    flt = flt.copy()
+    flt['datetime'] = newFilter
+    return flt
+
+
+#----------------------------------------------------------------------
+def matchDatetime(dt, dtFilter):
+    """检查时间是否满足datetime查询条件"""
+    if '$gte' in dtFilter and dt < dtFilter['$gte']:
+        return False
+    if '$gt' in dtFilter and dt <= dtFilter['$gt']:
+        return False
+    if '$lt' in dtFilter and dt >= dtFilter['$lt']:
+        return False
+    if '$lte' in dtFilter and dt > dtFilter['$lte']:
+        return False
+    return True
+
+
+#----------------------------------------------------------------------
+def decodeDocuments(docs, flt=None):
+    """
+    解码查询结果，返回数据字典的生成器
+    数据块文档解码为Tick数据字典，普通文档原样返回，均按原始查询条件中的datetime范围过滤
+    """
+    dtFilter = (flt or {}).get('datetime', None)
+    if not isinstance(dtFilter, dict):
+        dtFilter = {}
+
+    for doc in docs:
+        if 'codec' in doc:
+            for d in decodeBlock(doc):
+                if matchDatetime(d['datetime'], dtFilter):
+                    yield d
+        elif matchDatetime(doc['datetime'], dtFilter):
+            yield doc